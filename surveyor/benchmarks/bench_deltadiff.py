@@ -0,0 +1,105 @@
+#=============================================================================
+'''
+    Benchmark for delta line diffs
+
+    The text files in a folder are joined into one large file, which gets
+    random edits (lines from the file added, deleted or replaced), and the
+    delta lines of each version are timed with:
+
+      unified   difflib.unified_diff over the lines, where delta lines came
+                from before framework/deltadiff.py
+      difflib   deltadiff with the DELTA_DIFFLIB option, which gives the
+                same delta lines
+      minimal   deltadiff's default minimal diff
+
+    The number of delta lines each finds (including deleted lines) is
+    reported with the times; minimal can find fewer.
+
+        python benchmarks/bench_deltadiff.py [folder] [-e 20 300 1500] [-r repeats]
+
+    Without a folder, the surveyor source is used.
+'''
+#=============================================================================
+import os
+import sys
+import time
+import random
+import difflib
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from framework import deltadiff
+
+FILE_TYPES = ('.py', '.c', '.h', '.cpp', '.cs', '.java', '.js', '.code')
+
+
+def folder_lines(folder):
+    lines = []
+    for dirPath, dirNames, fileNames in os.walk(folder):
+        dirNames.sort()
+        for fileName in sorted(fileNames):
+            if os.path.splitext(fileName)[1] in FILE_TYPES:
+                with open(os.path.join(dirPath, fileName), encoding='utf-8',
+                          errors='replace') as textFile:
+                    lines.extend(textFile.readlines())
+    return lines
+
+
+def edited(rand, lines, numEdits):
+    lines = list(lines)
+    for _edit in range(numEdits):
+        pos = rand.randint(0, len(lines))
+        choice = rand.random()
+        if choice < 0.4:
+            lines[pos:pos] = [rand.choice(lines) for _line in range(rand.randint(1, 5))]
+        elif choice < 0.8:
+            del lines[pos:pos + rand.randint(1, 5)]
+        else:
+            lines[pos:pos + 2] = [rand.choice(lines)]
+    return lines
+
+
+def unified_delta_lines(oldLines, newLines):
+    return [line[2:] for line in difflib.unified_diff(oldLines, newLines)
+            if line.startswith('+') or line.startswith('-')]
+
+
+def time_diff(diff, oldLines, newLines, repeats):
+    best = None
+    for _repeat in range(repeats):
+        start = time.perf_counter()
+        deltaLines = diff(oldLines, newLines)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, len(deltaLines)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('folder', nargs='?')
+    parser.add_argument('-e', '--edits', type=int, nargs='+', default=[20, 300, 1500])
+    parser.add_argument('-r', '--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    folder = args.folder or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    oldLines = folder_lines(folder)
+    print("{0}: {1} lines".format(folder, len(oldLines)))
+    diffs = (
+        ('unified', unified_delta_lines),
+        ('difflib', lambda old, new: deltadiff.delta_lines(old, new, True, useDifflib=True)),
+        ('minimal', lambda old, new: deltadiff.delta_lines(old, new, True)),
+        )
+    rand = random.Random(1)
+    for numEdits in args.edits:
+        newLines = edited(rand, oldLines, numEdits)
+        print("  {0} edits:".format(numEdits))
+        unifiedSeconds = None
+        for label, diff in diffs:
+            seconds, numLines = time_diff(diff, oldLines, newLines, args.repeats)
+            unifiedSeconds = unifiedSeconds or seconds
+            print("    {0:>8}: {1:.3f}s ({2:.1f}x)  {3} delta lines".format(
+                    label, seconds, unifiedSeconds / seconds, numLines))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+#=============================================================================
+'''
+    Benchmark for handing work packages to workers and getting results back
+
+    Runs jobs on a tree of small files with small work packages, so the
+    time spent passing packages and results between processes is a large
+    share of the job, and reports the median wall time, CPU time of the
+    job and its workers, and the latency of each package: time from the
+    job putting it on the task queue to the output of its last file
+    getting to the application.
+
+        python benchmarks/bench_dispatch.py [folder] [-w 1 4] [-r runs] [-p items]
+                                            [-b surveyorDir ...]
+
+    Each job runs in its own process. -b adds another surveyor folder to
+    compare, e.g., a worktree of the commit before framework/dispatch.py:
+
+        git worktree add /tmp/polling <commit>
+        python benchmarks/bench_dispatch.py -b /tmp/polling/surveyor
+
+    Runs of the designs are interleaved. Without a folder, 2000 small
+    Python files in 40 folders are made in a temp folder.
+'''
+#=============================================================================
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+
+SURVEYOR_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_small_tree(root, numFolders=40, filesPerFolder=50, rand=random.Random(1)):
+    content = "# comment\nimport os\n\ndef f(x):\n    return x + 1\n"
+    for folderNum in range(numFolders):
+        folder = os.path.join(root, 'd{0:02}'.format(folderNum))
+        os.makedirs(folder)
+        for fileNum in range(filesPerFolder):
+            with open(os.path.join(folder, 'f{0}.py'.format(fileNum)), 'w') as outFile:
+                outFile.write(content * rand.randint(1, 4))
+
+
+def run_one(surveyorDir, folder, numWorkers, packageItems):
+    '''
+    Run a job in this process with surveyor imported from surveyorDir, and
+    print its stats as JSON. Package sends are hooked where the surveyor
+    version puts them: on the dispatcher's task channel, or in the Job for
+    versions before the dispatcher
+    '''
+    sys.path.insert(0, surveyorDir)
+    from framework import cmdlineapp
+    from framework import job
+
+    packagesSent = []
+    def package_sent(workPackage):
+        packagesSent.append((time.perf_counter(),
+                [os.path.join(workItem[0], workItem[2]) for workItem in workPackage]))
+
+    try:
+        from framework import dispatch
+        from framework import scheduler
+    except ImportError:
+        job.QUEUE_PACKAGE_MAX_ITEMS = packageItems
+        send_current_package = job.Job._send_current_package
+        def send_current_package_hook(self):
+            package_sent(self._workPackage.items())
+            return send_current_package(self)
+        job.Job._send_current_package = send_current_package_hook
+    else:
+        scheduler.PACKAGE_MAX_ITEMS = packageItems
+        put_task = dispatch.Dispatcher.put_task
+        def put_task_hook(self, workPackage):
+            package_sent(workPackage)
+            return put_task(self, workPackage)
+        dispatch.Dispatcher.put_task = put_task_hook
+
+    fileTimes = {}
+    file_measured_callback = cmdlineapp.SurveyorCmdLine.file_measured_callback
+    def file_measured_hook(self, filePath, outputList, errorList):
+        fileTimes[filePath] = time.perf_counter()
+        return file_measured_callback(self, filePath, outputList, errorList)
+    cmdlineapp.SurveyorCmdLine.file_measured_callback = file_measured_hook
+
+    start = time.perf_counter()
+    cmdlineapp.run_job([os.path.join(surveyorDir, 'surveyor.py'), folder, '-q', '-t',
+                        '-w', str(numWorkers)], io.StringIO())
+    wallSeconds = time.perf_counter() - start
+
+    latencies = []
+    for sentTime, filePaths in packagesSent:
+        doneTimes = [fileTimes[filePath] for filePath in filePaths if filePath in fileTimes]
+        if doneTimes:
+            latencies.append(max(doneTimes) - sentTime)
+    cpuSeconds = sum(getattr(resource.getrusage(who), field)
+            for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)
+            for field in ('ru_utime', 'ru_stime'))
+    print(json.dumps({'wall': wallSeconds, 'cpu': cpuSeconds, 'latencies': latencies}))
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('folder', nargs='?')
+    parser.add_argument('-w', '--workers', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('-r', '--runs', type=int, default=3)
+    parser.add_argument('-p', '--package-items', type=int, default=8)
+    parser.add_argument('-b', '--baseline', action='append', default=[])
+    parser.add_argument('--run-one', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one is not None:
+        run_one(args.run_one, args.folder, args.workers[0], args.package_items)
+        return
+
+    tempRoot = None
+    folder = args.folder
+    if folder is None:
+        tempRoot = tempfile.mkdtemp()
+        folder = os.path.join(tempRoot, 'tree')
+        make_small_tree(folder)
+    surveyorDirs = [os.path.abspath(surveyorDir) for surveyorDir in args.baseline] + [SURVEYOR_DIR]
+    try:
+        print("  workers  p50/p99 latency (ms)  wall (s)  cpu (s)  surveyor")
+        for numWorkers in args.workers:
+            runs = dict((surveyorDir, []) for surveyorDir in surveyorDirs)
+            for _run in range(args.runs):
+                for surveyorDir in surveyorDirs:
+                    output = subprocess.check_output([sys.executable, os.path.abspath(__file__),
+                            os.path.abspath(folder), '-w', str(numWorkers),
+                            '-p', str(args.package_items), '--run-one', surveyorDir],
+                            cwd=tempfile.gettempdir(), universal_newlines=True)
+                    runs[surveyorDir].append(json.loads(output.strip().splitlines()[-1]))
+            for surveyorDir in surveyorDirs:
+                latencies = [latency for run in runs[surveyorDir] for latency in run['latencies']]
+                walls = sorted(run['wall'] for run in runs[surveyorDir])
+                cpus = sorted(run['cpu'] for run in runs[surveyorDir])
+                print("  {0:>7}  {1:>8.0f} / {2:<8.0f}  {3:>8.2f}  {4:>7.2f}  {5}".format(
+                        numWorkers, percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000,
+                        walls[len(walls) // 2], cpus[len(cpus) // 2], surveyorDir))
+    finally:
+        if tempRoot is not None:
+            shutil.rmtree(tempRoot)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#=============================================================================
+'''
+    Benchmark for NBNC detector regex prefilters
+
+    Surveys the files in each folder line by line with the csmodules
+    surveyor.code gives them, with the detector regexes wrapped by
+    framework/prefilter.py and without, and reports microseconds per line
+    for each. Only survey time is counted, not reading files. Measures and
+    analysis items that differ between the two are counted.
+
+        python benchmarks/bench_nbnc_prefilter.py folder [folder ...] [-r repeats]
+
+    Without a folder, the surveyor source is used.
+'''
+#=============================================================================
+import os
+import sys
+import time
+import argparse
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from framework import configstack
+from framework import fileext
+from framework import utils
+from csmodules import NBNC
+
+CONFIG_NAME = 'surveyor.code'
+
+
+def folder_files(folder):
+    '''
+    Lines of each file in folder surveyed by an NBNC-based csmodule,
+    with the config entries that survey it
+    '''
+    stack = configstack.ConfigStack(CONFIG_NAME, None)
+    files = []
+    for dirPath, dirNames, fileNames in os.walk(folder):
+        dirNames.sort()
+        _fileFilters, activeConfigItems, _configPath = stack.get_configuration(dirPath, fileNames)
+        for fileName in sorted(fileNames):
+            configEntrys = [configEntry
+                    for fileFilter, entrys in activeConfigItems.items()
+                    if fileext.file_matches_filters(fileName, [fileFilter])
+                    for configEntry in entrys
+                    if isinstance(configEntry.module, NBNC.NBNC)]
+            if not configEntrys:
+                continue
+            filePath = os.path.join(dirPath, fileName)
+            with utils.open_chardet(filePath) as fileObject:
+                if 'b' in fileObject.mode:
+                    continue
+                files.append((filePath, fileObject.readlines(), configEntrys))
+    return files
+
+
+def survey_files(files):
+    '''
+    Seconds to survey the files, and the measures and analysis of each
+    '''
+    results = []
+    seconds = 0
+    for filePath, lines, configEntrys in files:
+        for configEntry in configEntrys:
+            configEntry.module._currentPath = utils.SurveyorPathParser(filePath)
+            measurements = {}
+            analysis = []
+            start = time.perf_counter()
+            configEntry.module._survey(lines, configEntry, measurements, analysis)
+            seconds += time.perf_counter() - start
+            results.append((measurements, analysis))
+    return seconds, results
+
+
+def time_folder(folder, repeats):
+    files = folder_files(folder)
+    best = None
+    for _repeat in range(repeats):
+        seconds, results = survey_files(files)
+        best = seconds if best is None else min(best, seconds)
+    return files, best, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('folders', nargs='*')
+    parser.add_argument('-r', '--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    utils.init_surveyor_dir(os.path.join(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))), 'surveyor.py'))
+    folders = args.folders or [utils.surveyor_dir()]
+
+    # The line loop is timed, so the whole-file survey isn't used
+    with mock.patch.object(NBNC.NBNC, '_bulk_survey_ok', lambda self: False):
+        for folder in folders:
+            # Modules are loaded for each run; in the raw one their
+            # regexes are never wrapped
+            with mock.patch.object(NBNC.NBNC, '_prefilter_detectors', lambda self: None):
+                files, rawSeconds, rawResults = time_folder(folder, args.repeats)
+            files, seconds, results = time_folder(folder, args.repeats)
+            numLines = sum(len(lines) for _filePath, lines, _configEntrys in files)
+            differ = sum(raw != prefiltered for raw, prefiltered in zip(rawResults, results))
+            print("{0}: {1} files, {2} lines".format(folder, len(files), numLines))
+            for label, labelSeconds in (('raw', rawSeconds), ('prefiltered', seconds)):
+                print("  {0:>12}: {1:.1f} us per line".format(label, labelSeconds / max(numLines, 1) * 1e6))
+            print("  Surveys with different results: {0}".format(differ))
+
+
+if __name__ == '__main__':
+    main()
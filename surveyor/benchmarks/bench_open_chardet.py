@@ -0,0 +1,119 @@
+#=============================================================================
+'''
+    Benchmark for utils.open_chardet
+
+    Opens every file in a tree the way a measure module does (open_chardet,
+    the start read for is_noncode_file, is_text_file, then read) and reports
+    files per second, for the open_chardet from before the single-open fast
+    path and the current one. Files the two open in a different mode are counted.
+
+        python benchmarks/bench_open_chardet.py [folder] [-r repeats]
+
+    Without a folder, a mixed tree of Python, C in latin-1 and UTF-16,
+    compiled Python and random binary files is made in a temp folder.
+'''
+#=============================================================================
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+import chardet
+import magic
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from framework import filetype
+from framework import utils
+
+
+def open_chardet_before(fpath):
+    '''
+    open_chardet before the fast path: a libmagic handle per file, and the
+    file opened three times
+    '''
+    myMagic = magic.Magic(mime=True, uncompress=True)
+    if not myMagic.from_file(fpath).startswith('text/'):
+        return open(fpath, 'rb')
+    with open(fpath, 'rb') as fh:
+        res = chardet.detect(fh.read(16 * 1024))
+    if res.get('encoding') is None or res.get('confidence') < utils.ENCODING_DETECTION_THRESHHOLD:
+        return open(fpath, 'rb')
+    return open(fpath, 'r', encoding=res.get('encoding'), errors="surrogateescape")
+
+
+def make_mixed_tree(root, numFolders=20, rand=random.Random(5)):
+    pyLines = ['import os\n', 'def f(a, b):\n', '    return a + b\n', '# comment\n', '\n',
+               'class C(object):\n', '    pass\n', 'VALUE = "text"\n']
+    cLines = ['/* Commentaire: caf\xe9, \xe9l\xe8ve, for\xeat */\n', 'int main(void) {\n',
+              '    return 0;\n', '}\n', '#include <stdio.h>\n', '\n']
+    for folderNum in range(numFolders):
+        folder = os.path.join(root, 'f{0}'.format(folderNum))
+        os.makedirs(folder)
+        for fileNum in range(50):
+            kind = fileNum % 5
+            numLines = rand.randint(10, 600)
+            if kind <= 1:
+                name, content = 'm{0}.py', ''.join(rand.choice(pyLines) for _ in range(numLines)).encode()
+            elif kind == 2:
+                name, content = 'c{0}.c', ''.join(rand.choice(cLines) for _ in range(numLines)).encode('latin-1')
+            elif kind == 3:
+                name, content = 'w{0}.c', ''.join(rand.choice(cLines) for _ in range(numLines)).encode('utf-16')
+            else:
+                name = rand.choice(['m{0}.pyc', 'd{0}.dat'])
+                content = bytes(rand.getrandbits(8) for _ in range(rand.randint(100, 20000)))
+            with open(os.path.join(folder, name.format(fileNum)), 'wb') as outFile:
+                outFile.write(content)
+
+
+def tree_files(root):
+    for dirPath, _dirNames, fileNames in os.walk(root):
+        for fileName in sorted(fileNames):
+            yield os.path.join(dirPath, fileName)
+
+
+def open_and_read(open_file, filePaths):
+    modes = []
+    for filePath in filePaths:
+        with open_file(filePath) as fileObject:
+            utils.get_raw_file_start(fileObject, 30)
+            filetype.is_text_file(fileObject)
+            fileObject.read()
+            modes.append(fileObject.mode)
+    return modes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('folder', nargs='?')
+    parser.add_argument('-r', '--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    tempRoot = None
+    root = args.folder
+    if root is None:
+        root = tempRoot = tempfile.mkdtemp()
+        make_mixed_tree(root)
+    try:
+        filePaths = list(tree_files(root))
+        results = {}
+        for label, open_file in (('before', open_chardet_before), ('open_chardet', utils.open_chardet)):
+            best = None
+            for _repeat in range(args.repeats):
+                start = time.perf_counter()
+                modes = open_and_read(open_file, filePaths)
+                seconds = time.perf_counter() - start
+                best = seconds if best is None else min(best, seconds)
+            results[label] = modes
+            print("{0:>14}: {1} files, {2:.0f} files/s".format(label, len(filePaths), len(filePaths) / best))
+        differ = sum(before != now for before, now in zip(results['before'], results['open_chardet']))
+        print("Files opened in a different mode: {0}".format(differ))
+    finally:
+        if tempRoot is not None:
+            shutil.rmtree(tempRoot)
+
+
+if __name__ == '__main__':
+    main()
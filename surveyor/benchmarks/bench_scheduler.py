@@ -0,0 +1,222 @@
+#=============================================================================
+'''
+    Benchmark for work package scheduling
+
+    How long the job takes with N workers depends on how files are spread
+    across them, which a machine with fewer cores can't show directly. So
+    each file of a tree is measured once by a single-worker job, and the
+    measure.Time of each file is replayed on N simulated workers, with:
+
+      walk order  Packages of up to 256 files or 256000 bytes, made in
+                  folder walk order and all queued as the walk finds them,
+                  as jobs did before the scheduler
+      scheduler   Packages from scheduler.Scheduler, fed as packages are
+                  measured, with workers sharing the rest of their package
+                  when others are idle (jobworker.Worker._share_package)
+
+    The walk is taken to be done before the first file is measured. For
+    each worker count the time until the last worker is done is reported,
+    along with the ideal (total time spread evenly, or the longest file),
+    and the tail: time from the first worker running out of work to the last.
+
+        python benchmarks/bench_scheduler.py [folder] [-w 4 8 16]
+
+    Without a folder, a skewed tree is made in a temp folder: small and
+    medium Python files in 30 folders, then a last folder with three
+    large generated files.
+'''
+#=============================================================================
+import io
+import os
+import csv
+import sys
+import heapq
+import types
+import random
+import shutil
+import argparse
+import tempfile
+import collections
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from framework import basemodule
+from framework import cmdlineapp
+from framework import jobworker
+from framework import scheduler
+
+# Package limits used in walk order, before the scheduler
+WALK_PACKAGE_MAX_ITEMS = 256
+WALK_PACKAGE_MAX_BYTES = 256000
+
+PY_LINES = [
+    'import os\n', 'def f(a, b):\n', '    if a and b:\n', '        return a + b\n',
+    '    for x in range(a):\n', '        y = x * 2  # double\n', '# comment\n', '\n',
+    'class C(object):\n', '    """Docstring"""\n', '    pass\n', 'VALUE = "text"\n',
+    ]
+
+
+def make_skewed_tree(root, numFolders=30, filesPerFolder=60, numLarge=3,
+                     largeBytes=2 * 1024 * 1024, rand=random.Random(3)):
+    def write(filePath, numBytes):
+        lines = []
+        while numBytes > 0:
+            lines.append(rand.choice(PY_LINES))
+            numBytes -= len(lines[-1])
+        with open(filePath, 'w') as outFile:
+            outFile.write(''.join(lines))
+    for folderNum in range(numFolders):
+        folder = os.path.join(root, 'f{0:02}'.format(folderNum))
+        os.makedirs(folder)
+        for fileNum in range(filesPerFolder):
+            write(os.path.join(folder, 'm{0}.py'.format(fileNum)),
+                  int(rand.paretovariate(1.5) * 2000))
+    folder = os.path.join(root, 'zz_generated')
+    os.makedirs(folder)
+    for fileNum in range(numLarge):
+        write(os.path.join(folder, 'gen{0}.py'.format(fileNum)), largeBytes)
+
+
+def measure_files(root, outDir):
+    '''
+    Returns work items of (filePath, seconds, cost) for each file measured
+    by a single-worker job, in walk order, and the size of each file
+    '''
+    outPath = os.path.join(outDir, 'out.csv')
+    outputStream = io.StringIO()
+    if not cmdlineapp.run_job(['surveyor.py', root, '-q', '-w', '1', '-m', 'a', '-o', outPath],
+                              outputStream):
+        raise SystemExit(outputStream.getvalue())
+    seconds = collections.OrderedDict()
+    numEntrys = collections.Counter()
+    with open(outPath, newline='') as outFile:
+        for row in csv.DictReader(outFile):
+            filePath = row[basemodule.METADATA_ABSPATH]
+            seconds[filePath] = seconds.get(filePath, 0) + float(row[basemodule.METADATA_TIMING] or 0)
+            numEntrys[filePath] += 1
+    workItems = []
+    fileSizes = {}
+    for filePath, fileSeconds in seconds.items():
+        fileSizes[filePath] = os.path.getsize(filePath)
+        workItems.append((filePath, fileSeconds,
+                          scheduler.file_cost(fileSizes[filePath], numEntrys[filePath])))
+    return workItems, fileSizes
+
+
+def walk_order_packages(workItems, fileSizes):
+    packages = []
+    workPackage = []
+    packageBytes = 0
+    for workItem in workItems:
+        workPackage.append(workItem)
+        packageBytes += fileSizes[workItem[0]]
+        if len(workPackage) >= WALK_PACKAGE_MAX_ITEMS or packageBytes >= WALK_PACKAGE_MAX_BYTES:
+            packages.append(workPackage)
+            workPackage = []
+            packageBytes = 0
+    if workPackage:
+        packages.append(workPackage)
+    return packages
+
+
+def simulate(numWorkers, workItems, fileSizes, useScheduler):
+    '''
+    Returns the time each worker ran out of work
+    '''
+    taskQueue = collections.deque()
+    counts = {'sent': 0, 'received': 0}
+    if useScheduler:
+        jobScheduler = scheduler.Scheduler(numWorkers)
+        for workItem in workItems:
+            jobScheduler.add(workItem, workItem[-1])
+        jobScheduler.walk_done()
+    else:
+        taskQueue.extend(walk_order_packages(workItems, fileSizes))
+
+    def send_packages():
+        if useScheduler:
+            for workPackage, _packageCost in jobScheduler.packages(
+                    counts['sent'] - counts['received'], lambda outstanding: False):
+                taskQueue.append(workPackage)
+                counts['sent'] += 1
+
+    # The sharing worker puts the items it gives up on the task queue
+    sharer = types.SimpleNamespace(_dispatch=types.SimpleNamespace(put_shared_task=taskQueue.append))
+
+    # Events are (time, workerNum) for when a worker finishes its current item
+    workers = [{'package': None} for _worker in range(numWorkers)]
+    idleWorkers = set(range(numWorkers))
+    doneTimes = [0.0] * numWorkers
+    events = []
+
+    def start_idle_workers(now):
+        for workerNum in sorted(idleWorkers):
+            if not taskQueue:
+                break
+            idleWorkers.discard(workerNum)
+            worker = workers[workerNum]
+            worker.update(package=taskQueue.popleft(), numItems=1, start=now)
+            heapq.heappush(events, (now + worker['package'][0][1], workerNum))
+
+    send_packages()
+    start_idle_workers(0.0)
+    while events:
+        now, workerNum = heapq.heappop(events)
+        worker = workers[workerNum]
+        workPackage = worker['package']
+        numItems = worker['numItems']
+        if numItems < len(workPackage):
+            othersIdle = bool(idleWorkers) and not taskQueue and (
+                    not useScheduler or not jobScheduler.num_pending())
+            if useScheduler and len(workPackage) - numItems > 1 and othersIdle:
+                worker['package'] = workPackage = jobworker.Worker._share_package(
+                        sharer, workPackage, numItems)
+                start_idle_workers(now)
+            worker['numItems'] += 1
+            heapq.heappush(events, (now + workPackage[numItems][1], workerNum))
+            continue
+
+        counts['received'] += 1
+        if useScheduler:
+            jobScheduler.package_measured(workerNum, sum(workItem[-1] for workItem in workPackage),
+                                          now - worker['start'])
+        send_packages()
+        worker['package'] = None
+        idleWorkers.add(workerNum)
+        doneTimes[workerNum] = now
+        start_idle_workers(now)
+    return doneTimes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('folder', nargs='?')
+    parser.add_argument('-w', '--workers', type=int, nargs='+', default=[4, 8, 16])
+    args = parser.parse_args()
+
+    tempRoot = tempfile.mkdtemp()
+    try:
+        root = args.folder
+        if root is None:
+            root = os.path.join(tempRoot, 'tree')
+            make_skewed_tree(root)
+        outDir = os.path.join(tempRoot, 'out')
+        os.makedirs(outDir)
+        workItems, fileSizes = measure_files(os.path.abspath(root), outDir)
+    finally:
+        shutil.rmtree(tempRoot)
+
+    totalSeconds = sum(workItem[1] for workItem in workItems)
+    longestSeconds = max(workItem[1] for workItem in workItems)
+    print("{0} files, {1:.2f}s measuring with one worker, longest file {2:.2f}s".format(
+            len(workItems), totalSeconds, longestSeconds))
+    print("  workers  design      makespan  ideal   tail")
+    for numWorkers in args.workers:
+        ideal = max(totalSeconds / numWorkers, longestSeconds)
+        for label, useScheduler in (('walk order', False), ('scheduler', True)):
+            doneTimes = simulate(numWorkers, workItems, fileSizes, useScheduler)
+            print("  {0:>7}  {1:<10} {2:>8.2f}s {3:>6.2f}s {4:>6.2f}s".format(
+                    numWorkers, label, max(doneTimes), ideal, max(doneTimes) - min(doneTimes)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+#=============================================================================
+'''
+    Benchmark for the Xml writer
+
+    Writes the same files and routine analysis items with the Xml writer
+    as it was with minidom (each element built and pretty printed) and the
+    current streaming one, and reports MB/s of output for each, and
+    whether the two outputs are the same.
+
+        python benchmarks/bench_xml_writer.py [-f files] [-i items] [-r repeats]
+'''
+#=============================================================================
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from xml.dom import minidom
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from framework import utils
+from framework import writer
+
+
+class MinidomXml( writer.Xml ):
+    '''
+    Xml.write_items as it was with minidom; elements are made by a
+    Document, as minidom needs one for them on Python 3.8 and later
+    '''
+    _doc = minidom.Document()
+
+    def write_items(self, measures, analysisResults):
+        outputFile, fileName, isNewFile = self._get_output_file(measures)
+        fileNode = self._doc.createElement("file")
+        for itemName, itemValue in measures.items():
+            fileNode.setAttribute(itemName, utils.safe_ascii_string(itemValue))
+        itemNum = 1
+        for item in analysisResults:
+            itemNode = self._doc.createElement("item" + str(itemNum))
+            for itemName, itemValue in item.items():
+                itemNode.setAttribute(itemName, utils.safe_ascii_string(itemValue))
+            itemNum += 1
+            fileNode.appendChild(itemNode)
+        outputFile.write(fileNode.toprettyxml(indent="  "))
+
+
+def make_file_items(numFiles, numItems, rand=random.Random(9)):
+    '''
+    Measures for each file, with routine items spread over the files
+    '''
+    fileItems = []
+    for fileNum in range(numFiles):
+        measures = {
+            'file.fullName': 'mod{0}.c'.format(fileNum),
+            'file.fileType': 'c',
+            'file.dir': os.path.join('src', 'pkg{0}'.format(fileNum % 40)),
+            'file.nbnc': str(rand.randint(10, 5000)),
+            'file.comment': str(rand.randint(0, 800)),
+            'file.blank': str(rand.randint(0, 300)),
+            }
+        routines = []
+        for routineNum in range(rand.randint(0, 2 * numItems // numFiles)):
+            routines.append({
+                'routine.name': 'func_{0}_{1}'.format(fileNum, routineNum),
+                'routine.line': str(rand.randint(1, 5000)),
+                'routine.code': str(rand.randint(1, 200)),
+                'routine.decision': str(rand.randint(0, 40)),
+                'routine.text': 'int func(a < b && "c")' if routineNum % 7 == 0 else 'int func(void)',
+                })
+        fileItems.append((measures, routines))
+    return fileItems
+
+
+def write_xml(writer_class, outDir, fileItems):
+    xmlWriter = writer_class(lambda *args: None, outDir, 'out.xml', False)
+    start = time.perf_counter()
+    for measures, analysisResults in fileItems:
+        xmlWriter.write_items(measures, analysisResults)
+    xmlWriter.close_files()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-f', '--files', type=int, default=20000)
+    parser.add_argument('-i', '--items', type=int, default=300000)
+    parser.add_argument('-r', '--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    fileItems = make_file_items(args.files, args.items)
+    numItems = sum(len(analysisResults) for _measures, analysisResults in fileItems)
+    tempRoot = tempfile.mkdtemp()
+    try:
+        outputs = {}
+        for label, writer_class in (('minidom', MinidomXml), ('streaming', writer.Xml)):
+            outDir = os.path.join(tempRoot, label)
+            os.makedirs(outDir)
+            best = min(write_xml(writer_class, outDir, fileItems) for _repeat in range(args.repeats))
+            outPath = os.path.join(outDir, 'out.xml')
+            megabytes = os.path.getsize(outPath) / 1024 / 1024
+            with open(outPath, 'rb') as outFile:
+                outputs[label] = outFile.read()
+            print("{0:>10}: {1} files, {2} items, {3:.1f} MB, {4:.1f} MB/s".format(
+                    label, len(fileItems), numItems, megabytes, megabytes / best))
+        print("Same output: {0}".format(outputs['minidom'] == outputs['streaming']))
+    finally:
+        shutil.rmtree(tempRoot)
+
+
+if __name__ == '__main__':
+    main()
@@ -13,6 +13,7 @@ import zlib
 from framework import utils
 from framework import trace
 from framework import basemodule
+from framework import chunks
 from .NBNC import NBNC
 from .searchMixin import _searchMixin
 
@@ -427,6 +428,7 @@ class Code( _searchMixin, NBNC ):
         self.counts['Semicolons']       = [0] * len(self.blockDetectors)
         self.counts['Preprocessor']     = [0] * len(self.blockDetectors)
         self.counts['nbncCRC']          = [0] * len(self.blockDetectors)
+        self.counts['nbncBytes']        = [0] * len(self.blockDetectors)
         self.totalNbncAtLastRoutine     = [0] * len(self.blockDetectors)
         self.totalCommentsAtLastRoutine = [0] * len(self.blockDetectors)
 
@@ -435,6 +437,7 @@ class Code( _searchMixin, NBNC ):
 
         # Track a file-CRC based on all lines
         self._fileCrc = 0
+        self._fileCrcBytes = 0
 
 
     def _survey_end(self, measurements, analysis):
@@ -460,7 +463,10 @@ class Code( _searchMixin, NBNC ):
         writeOutput = True
 
         if self.VERB_MEASURE == configEntry.verb:
-            self._survey_lines(linesToSurvey, [],  measurements, analysis)
+            if isinstance(linesToSurvey, chunks.ChunkedLines):
+                self._survey_chunked(linesToSurvey, measurements, analysis)
+            else:
+                self._survey_lines(linesToSurvey, [],  measurements, analysis)
 
         elif self.VERB_TEMPLATE_MEASURE == configEntry.verb:
             self._matchTemplateLines = True
@@ -491,7 +497,9 @@ class Code( _searchMixin, NBNC ):
         '''
         Create a file CRC based on the raw lines
         '''
-        self._fileCrc = zlib.adler32(bytearray(rawLine, 'utf8', errors="surrogateescape"), self._fileCrc)
+        lineBytes = bytearray(rawLine, 'utf8', errors="surrogateescape")
+        self._fileCrc = zlib.adler32(lineBytes, self._fileCrc)
+        self._fileCrcBytes += len(lineBytes)
         return super(Code, self)._alternate_line_processing(rawLine)
 
 
@@ -570,14 +578,63 @@ class Code( _searchMixin, NBNC ):
         pass
 
 
+    #-------------------------------------------------------------------------
+    #  Chunked survey, for the measure verb (see NBNC)
+
+    CHUNK_SURVEY_METHODS = NBNC.CHUNK_SURVEY_METHODS + (
+            '_measure_line_impl', '_analyze_line_impl', '_save_measures',
+            '_save_routine_info', '_measuring_block',
+            '_has_inline_comment', '_strip_inlines')
+
+    def can_survey_chunks(self, configEntry):
+        return (configEntry.verb == self.VERB_MEASURE and
+                not self._traceLevel and
+                not self._metaDataOnly and
+                self._line_methods_from(Code))
+
+    def survey_chunk(self, filePath, chunkReader, start, end, configEntry):
+        self.searching = False
+        self.measuringRoutines = False
+        return super(Code, self).survey_chunk(filePath, chunkReader, start, end, configEntry)
+
+    def _chunk_counts(self):
+        '''
+        The file CRC is kept outside counts since it isn't per block
+        '''
+        counts = super(Code, self)._chunk_counts()
+        counts['FileCRC'] = [self._fileCrc]
+        counts['FileBytes'] = [self._fileCrcBytes]
+        return counts
+
+    def _add_chunk_counts(self, counts, segmentCounts):
+        '''
+        CRCs of segments are combined rather than added
+        '''
+        crcs = {}
+        for crcName, bytesName in (('nbncCRC', 'nbncBytes'), ('FileCRC', 'FileBytes')):
+            crcs[crcName] = [utils.adler32_combine(crc, segmentCrc, segmentBytes) for
+                             crc, segmentCrc, segmentBytes in zip(
+                             counts[crcName], segmentCounts[crcName], segmentCounts[bytesName])]
+        super(Code, self)._add_chunk_counts(counts, segmentCounts)
+        counts.update(crcs)
+
+    def _use_chunk_counts(self, counts):
+        counts = dict(counts)
+        self._fileCrc = counts.pop('FileCRC')[0]
+        self._fileCrcBytes = counts.pop('FileBytes')[0]
+        super(Code, self)._use_chunk_counts(counts)
+
+
     #-------------------------------------------------------------------------
     #  Code measurement processing
 
     def _measure_line_impl(self, line, strippedLine):
 
         # Take a CRC value from the line with whitespace reduced
+        nbncBytes = bytearray(' '.join(line.split()), 'utf8', errors="surrogateescape")
         self.counts['nbncCRC'][self._activeBlock] = zlib.adler32(
-                bytearray(' '.join(line.split()), 'utf8', errors="surrogateescape"), self.counts['nbncCRC'][self._activeBlock])
+                nbncBytes, self.counts['nbncCRC'][self._activeBlock])
+        self.counts['nbncBytes'][self._activeBlock] += len(nbncBytes)
 
         # Capture some additional per-line metrics
         self.counts['Semicolons'][self._activeBlock] += strippedLine.count(';')
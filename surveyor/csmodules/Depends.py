@@ -19,6 +19,8 @@ class Depends( Code ):
     Specialize Code implementaiton to focus on collecting information on
     lines that have import/include statements
     '''
+    # Analysis items name the file and folder
+    OUTPUT_FROM_CONTENT = False
 
     def __init__(self, options):
         super(Depends, self).__init__(options)
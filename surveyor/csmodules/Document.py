@@ -48,6 +48,9 @@ class Document( basemodule._BaseModule ):
     DOC_PAGES =   "doc.pages"
     DOC_CHARS =   "doc.chars"
     NO_MEASURE = "-"
+
+    # Measures are chosen by file extension
+    OUTPUT_FROM_CONTENT = False
     
     # Optimization for checking debug level in tight loops
     _traceLevel = None
@@ -19,6 +19,9 @@ class DupeLines( Code ):
     '''
     Identifies duplicate lines in a file based on CRC
     '''
+    # Analysis items name the file and folder
+    OUTPUT_FROM_CONTENT = False
+
     def __init__(self, options):
         super(DupeLines, self).__init__(options)
 
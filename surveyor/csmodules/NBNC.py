@@ -37,10 +37,13 @@
 #=============================================================================
 import re
 import sys
+import itertools
 
 from framework import utils
 from framework import trace
 from framework import basemodule
+from framework import chunks
+from framework import prefilter
 
 class NBNC( basemodule._BaseModule ):
     '''
@@ -81,6 +84,24 @@ class NBNC( basemodule._BaseModule ):
     # a safety valve
     MAX_LINE_LENGTH_DEFAULT = 255
 
+    # Default true blank and string literal detectors
+    TRUE_BLANK_LINE = r'^ \s* $'
+    STRING_LITERAL = r''' (["](?!["]) .+? ["]) | (['](?![']) .+? [']) '''
+
+    # Line processing methods the whole-file survey stands in for; if a
+    # derived class overrides one, files are surveyed line by line
+    BULK_SURVEY_METHODS = (
+            '_survey_lines', '_survey_line_loop', '_survey_start', '_survey_end',
+            '_alternate_line_processing', '_preprocess_line',
+            '_detect_line_comment', '_strip_string_literals',
+            '_detect_blank_line', '_measure_line', '_analyze_line')
+
+    # Line processing methods surveying chunks relies on; if a derived class
+    # overrides one, files aren't surveyed in chunks
+    CHUNK_SURVEY_METHODS = BULK_SURVEY_METHODS + (
+            '_survey', '_survey_bulk', '_survey_bulk_lines',
+            '_detect_block_change', '_block_change_event')
+
     ConfigOptions_NBNC = {
         'ADD_LINE_SEP': (
             '''self.addLineSep = optValue''',
@@ -166,11 +187,11 @@ self.reMultiLineCommentsClose = re.compile('=end', self._reFlags)''',
         # String literal detector
         # Used to remove string literal from some types of searches
         # (note need to except Python triple-quote comments)
-        self.reStringLiteral = re.compile(r''' (["](?!["]) .+? ["]) | (['](?![']) .+? [']) ''', re.VERBOSE)
+        self.reStringLiteral = re.compile(self.STRING_LITERAL, re.VERBOSE)
 
         # Blank line detectors
         # Count common open/closure elements on their own line as blank lines
-        self.reTrueBlankLine = re.compile(r'^ \s* $', self._reFlags)
+        self.reTrueBlankLine = re.compile(self.TRUE_BLANK_LINE, self._reFlags)
         self.reBlankLine = re.compile(r'''
                 ^ [ \s \\ \+ \. , ; = \- / \* ' ` " # ! % {} \(\) \[\] <> \| ]* $
                 ''', self._reFlags)
@@ -226,12 +247,25 @@ self.reMultiLineCommentsClose = re.compile('=end', self._reFlags)''',
 
         self._sameLineMultiCloseAsComment = True
 
+        # Shared line text cache for detector prefilters, set on first survey
+        self._lineTexts = None
+
+        # Whole-file survey detectors, or False if config needs the line loop;
+        # set on first survey
+        self._bulkSurvey = None
+
 
     def _survey(self, linesToSurvey, _configEntry, measurements, _analysis):
         '''
         Basemodule delegate to us to survey a collection of lines.
+        Counting can be done for the whole file at once if the config allows
         '''
-        self._survey_lines(linesToSurvey, [],  measurements, [])
+        if isinstance(linesToSurvey, chunks.ChunkedLines):
+            self._survey_chunked(linesToSurvey, measurements, [])
+        elif self._bulk_survey_ok():
+            self._survey_bulk(linesToSurvey, [], measurements, [])
+        else:
+            self._survey_lines(linesToSurvey, [],  measurements, [])
 
         # We always write output, to support metadataOnly runs and providing
         # measure rows for empty files, binaries, etc.
@@ -272,6 +306,7 @@ self.reMultiLineCommentsClose = re.compile('=end', self._reFlags)''',
              - Peform line processing (searches, routines, etc.)
         '''
         # Setup dictionary for measures and searches we'll do
+        self._prefilter_detectors()
         self._survey_start(params)
 
         # If no lines to process, we may still want to output empty measures
@@ -279,8 +314,17 @@ self.reMultiLineCommentsClose = re.compile('=end', self._reFlags)''',
             linesToSurvey = []
 
         # Track whether we are inside a multi-line comment - we ignore nesting
-        scanningMultiLine = False
+        self._survey_line_loop(linesToSurvey, analysis, False)
+
+        # Package results
+        self._survey_end(measurements, analysis)
+
 
+    def _survey_line_loop(self, linesToSurvey, analysis, scanningMultiLine):
+        '''
+        Survey lines starting in the given multi-line comment state, and
+        return the state after the last line
+        '''
         # If we have a line seperator, apply it
         for bufferLine in linesToSurvey:
             self.counts['RawLines'][self._activeBlock] += 1
@@ -335,10 +379,347 @@ self.reMultiLineCommentsClose = re.compile('=end', self._reFlags)''',
                         "Problem processing line: {0} with module: {1}\n{2}".format(
                         str(sum(self.counts['RawLines'])), self.__class__.__name__, str(e)))
 
-        # Package results
+        return scanningMultiLine
+
+
+    def _prefilter_detectors(self):
+        '''
+        Wrap our detector regexes so each only runs on lines it could match
+        (see framework/prefilter.py). Done on the first survey, once config
+        options and derived class constructors have set the regexes
+        '''
+        if self._lineTexts is not None:
+            return
+        self._lineTexts = prefilter.LineTexts()
+        for name, value in list(vars(self).items()):
+            if name.startswith('re') and isinstance(value, re.Pattern):
+                setattr(self, name, prefilter.prefilter(value, self._lineTexts))
+        self.blockDetectors = [
+                [   type(detector)(prefilter.prefilter(regex, self._lineTexts) for regex in detector)
+                    for detector in blockDetector ]
+                for blockDetector in self.blockDetectors ]
+
+
+    #-------------------------------------------------------------------------
+    #  Whole-file survey
+    #  Gives the same counts as _survey_lines, without the per-line method
+    #  calls. Blank lines are found by mapping the blank regexes over all
+    #  lines. Comment state can only change on lines where a comment regex
+    #  could match, so _detect_line_comment is run on just those lines; any
+    #  other line is a comment if and only if it is inside a multi-line comment
+
+    def _bulk_survey_ok(self):
+        '''
+        Use whole-file survey when only NBNC line processing is in play (no
+        blocks, line splitting, ignored lines or tracing), and the comment
+        regexes have required literals we can look for.
+        Modules that measure each line, like Code, need the line loop
+        '''
+        if self._bulkSurvey is None:
+            self._prefilter_detectors()
+            self._bulkSurvey = False
+            if (not self._traceLevel and
+                    self.addLineSep is None and
+                    self.reIgnoreLine is None and
+                    len(self.blockDetectors) == 1 and
+                    all(getattr(type(self), name) is getattr(NBNC, name)
+                        for name in self.BULK_SURVEY_METHODS)):
+                self._bulkSurvey = self._bulk_comment_candidates() or False
+            trace.cc(2, "{0} whole-file survey: {1}".format(
+                    self.__class__.__name__, bool(self._bulkSurvey)))
+        return bool(self._bulkSurvey)
+
+
+    def _bulk_comment_candidates(self):
+        '''
+        Returns (singleRe, searchRes) used on stripped lines to find lines a
+        comment regex could match: single-line comments must start with one
+        of their prefixes, and multi-line open and close must contain one of
+        their literals. Comment regexes run on the line with string literals
+        removed, so the candidate regexes allow the characters of a literal
+        to be split by what could have been a string
+        '''
+        singleLiterals, singlePrefixes = prefilter.requirements(self.reSingleLineComments)
+        openLiterals, _prefixes = prefilter.requirements(self.reMultiLineCommentsOpen)
+        closeLiterals, _prefixes = prefilter.requirements(self.reMultiLineCommentsClose)
+        if not (singleLiterals and openLiterals and closeLiterals):
+            return None
+
+        if self._pythonFile:
+            gap = ''
+            lead = ''
+        elif (self.reStringLiteral.pattern == self.STRING_LITERAL and
+                self.reStringLiteral.flags & re.VERBOSE):
+            # Strings STRING_LITERAL removes are the same as these, and strip()
+            # also removes whitespace between strings at the start of a line.
+            # Possessive repeats (Python 3.11 on) take strings as removal does,
+            # without backtracking into them
+            possessive = '+' if sys.version_info >= (3, 11) else ''
+            strings = r'''["][^"\n]+{0}["]|['][^'\n]+{0}[']'''.format(possessive)
+            gap = '(?:' + strings + ')*' + possessive
+            lead = r'(?:\s|' + strings + ')*' + possessive
+        else:
+            gap = r'[^\n]*'
+            lead = r'[^\n]*'
+        if not singlePrefixes:
+            lead = r'[^\n]*'
+
+        singleRe = self._bulk_candidate_re(
+                singlePrefixes or singleLiterals, gap, lead, self.reSingleLineComments)
+        if (self._bulk_case_flags(self.reMultiLineCommentsOpen) ==
+                self._bulk_case_flags(self.reMultiLineCommentsClose)):
+            searchRes = (self._bulk_candidate_re(
+                    openLiterals | closeLiterals, gap, '', self.reMultiLineCommentsOpen),)
+        else:
+            searchRes = (
+                self._bulk_candidate_re(openLiterals, gap, '', self.reMultiLineCommentsOpen),
+                self._bulk_candidate_re(closeLiterals, gap, '', self.reMultiLineCommentsClose))
+        return singleRe, searchRes
+
+
+    def _bulk_candidate_re(self, literals, gap, lead, regex):
+        return re.compile(lead + self._bulk_literals_re(literals, gap),
+                self._bulk_case_flags(regex))
+
+    def _bulk_literals_re(self, literals, gap):
+        '''
+        Regex for any of literals, with gap allowed between characters.
+        Literals are merged into a tree on common leading characters, so
+        each gap is only tried once where literals start the same
+        '''
+        tails = {}
+        for literal in literals:
+            tails.setdefault(literal[0], set()).add(literal[1:])
+        alternatives = []
+        for char, charTails in sorted(tails.items()):
+            if '' in charTails:
+                alternatives.append(re.escape(char))
+            else:
+                alternatives.append(re.escape(char) + gap + self._bulk_literals_re(charTails, gap))
+        if len(alternatives) == 1:
+            return alternatives[0]
+        return '(?:' + '|'.join(alternatives) + ')'
+
+    @staticmethod
+    def _bulk_case_flags(regex):
+        return regex.flags & (re.IGNORECASE | re.ASCII)
+
+
+    def _survey_bulk(self, linesToSurvey, params, measurements, analysis):
+        '''
+        Whole-file alternative to _survey_lines
+        '''
+        self._survey_start(params)
+        if linesToSurvey is None:
+            linesToSurvey = []
+        self._survey_bulk_lines(linesToSurvey, False)
         self._survey_end(measurements, analysis)
 
 
+    def _survey_bulk_lines(self, linesToSurvey, scanningMultiLine):
+        '''
+        Count lines starting in the given multi-line comment state, and
+        return the state after the last line
+        '''
+        lines = list(linesToSurvey)
+        if lines and max(map(len, lines)) > self.maxLineLength:
+            lines = [line[:self.maxLineLength] for line in lines]
+        if '\00' in ''.join(lines):
+            lines = list(map(utils.strip_null_chars, lines))
+
+        try:
+            singleRe, searchRes = self._bulkSurvey
+
+            # True blank lines drop out, the rest go through comment and blank detection
+            if (self.reTrueBlankLine.pattern == self.TRUE_BLANK_LINE and
+                    self.reTrueBlankLine.flags & re.VERBOSE):
+                stripLines = list(map(str.strip, lines))
+                codeLines = list(itertools.compress(lines, stripLines))
+                stripLines = list(filter(None, stripLines))
+            else:
+                codeLines = list(itertools.filterfalse(self.reTrueBlankLine.match, lines))
+                stripLines = list(map(str.strip, codeLines))
+
+            # Blank lines; list of match objects, None for non-blank lines
+            blankMatches = list(map(self.reBlankLine.match, codeLines))
+            for blankRe in (self.blankXmlLines and self.reBlankXmlLine, self.reBlankLineAdd):
+                if blankRe:
+                    blankMatches = [match or otherMatch for match, otherMatch in
+                                    zip(blankMatches, map(blankRe.match, codeLines))]
+            numBlank = len(codeLines) - blankMatches.count(None)
+
+            # Lines that may change comment state
+            candidates = set(itertools.compress(
+                    itertools.count(), map(singleRe.match, stripLines)))
+            for searchRe in searchRes:
+                candidates.update(itertools.compress(
+                        itertools.count(), map(searchRe.search, stripLines)))
+
+            numComment = 0
+            lineNum = 0
+            for candidate in sorted(candidates):
+                if scanningMultiLine:
+                    numComment += blankMatches[lineNum:candidate].count(None)
+                onCommentLine, scanningMultiLine = self._detect_line_comment(
+                        codeLines[candidate], scanningMultiLine)
+                if onCommentLine and blankMatches[candidate] is None:
+                    numComment += 1
+                lineNum = candidate + 1
+            if scanningMultiLine:
+                numComment += blankMatches[lineNum:].count(None)
+
+        except Exception as e:
+            trace.traceback()
+            raise utils.FileMeasureError(
+                    "Problem processing file with module: {0}\n{1}".format(
+                    self.__class__.__name__, str(e)))
+
+        self.counts['RawLines'][0] = len(lines)
+        self.counts['TotalLines'][0] = len(lines)
+        self.counts['TrueBlankLines'][0] = len(lines) - len(codeLines)
+        self.counts['BlankLines'][0] = numBlank
+        self.counts['CommentLines'][0] = numComment
+        self.counts['MeasureLines'][0] = len(codeLines) - numBlank - numComment
+        return scanningMultiLine
+
+
+    #-------------------------------------------------------------------------
+    #  Chunked survey
+    #  Large files can be surveyed in chunks by several workers (see
+    #  framework/chunks.py). Each segment of a chunk is surveyed from a
+    #  state: the multi-line comment and block detection state carried
+    #  from line to line. Counts for segments add up to counts for the
+    #  file, so merging surveys segments again only where the state they
+    #  started in was wrong.
+
+    def can_survey_chunks(self, configEntry):
+        '''
+        Measure verb, with our line processing (a derived class may track
+        other state between lines) and without tracing line numbers or
+        skipping the file contents
+        '''
+        return (configEntry.verb == self.VERB_MEASURE and
+                not self._traceLevel and
+                not self._metaDataOnly and
+                self._line_methods_from(NBNC))
+
+    def _line_methods_from(self, cls):
+        return all(getattr(type(self), name) is getattr(cls, name)
+                   for name in self.CHUNK_SURVEY_METHODS)
+
+
+    def survey_chunk(self, filePath, chunkReader, start, end, configEntry):
+        '''
+        Survey the lines of a chunk of filePath, from byte offsets start to
+        end, returning (start, end, startState, counts, endState) for each
+        segment. A chunk after the first is assumed to start in the state
+        the start of the file leaves us in if that lasts to the end of the
+        file (a block without an end), which is how generated files are
+        usually marked; otherwise it is assumed to start as the file does.
+        '''
+        self._currentPath = utils.SurveyorPathParser(filePath)
+        try:
+            self._prefilter_detectors()
+            self._survey_start([])
+            state = self._survey_state(False)
+            if start > 0:
+                for _start, _end, lines in chunkReader.segments(0, chunks.START_STATE_BYTES):
+                    _counts, state = self._survey_segment(lines, state)
+                state = self._lasting_state(state)
+
+            segments = []
+            for segmentStart, segmentEnd, lines in chunkReader.segments(start, end):
+                counts, endState = self._survey_segment(lines, state)
+                segments.append((segmentStart, segmentEnd, state, counts, endState))
+                state = endState
+            return segments
+        finally:
+            self._currentPath = None
+
+
+    def _survey_chunked(self, chunkedLines, measurements, analysis):
+        '''
+        Merge segment results from chunks into measures for the file,
+        surveying segments again from the state the file was really in
+        '''
+        self._prefilter_detectors()
+        self._survey_start([])
+        counts = self._chunk_counts()
+        state = self._survey_state(False)
+        numSurveyed = 0
+        for start, end, startState, segmentCounts, endState in chunkedLines.segments:
+            if startState != state:
+                segmentCounts, endState = self._survey_segment(
+                        chunkedLines.read_lines(start, end), state)
+                numSurveyed += 1
+            self._add_chunk_counts(counts, segmentCounts)
+            state = endState
+        trace.file(1, "Merged {0} segments, {1} surveyed again: {2}".format(
+                len(chunkedLines.segments), numSurveyed, self._currentPath.filePath))
+
+        self._survey_start([])
+        self._use_chunk_counts(counts)
+        self._set_survey_state(state)
+        self._survey_end(measurements, analysis)
+
+
+    def _survey_segment(self, lines, startState):
+        '''
+        Survey lines from startState the way the whole file would be,
+        returning their counts and the state after them
+        '''
+        self._survey_start([])
+        scanningMultiLine = self._set_survey_state(startState)
+        if self._bulk_survey_ok():
+            scanningMultiLine = self._survey_bulk_lines(lines, scanningMultiLine)
+        else:
+            scanningMultiLine = self._survey_line_loop(lines, [], scanningMultiLine)
+        return self._chunk_counts(), self._survey_state(scanningMultiLine)
+
+
+    def _survey_state(self, scanningMultiLine):
+        '''
+        State carried between lines, with the block end regex given by its
+        position in the active block's detectors so it can be compared
+        '''
+        endPos = None
+        if self._activeBlockEndRe is not None:
+            endPos = [detector[self.BLOCK_END] for detector in
+                      self.blockDetectors[self._activeBlock]].index(self._activeBlockEndRe)
+        return (scanningMultiLine, self._activeBlock, endPos, self._activeBlockIsSingleLine)
+
+    def _set_survey_state(self, state):
+        scanningMultiLine, self._activeBlock, endPos, self._activeBlockIsSingleLine = state
+        self._activeBlockEndRe = None
+        if endPos is not None:
+            self._activeBlockEndRe = self.blockDetectors[self._activeBlock][endPos][self.BLOCK_END]
+        return scanningMultiLine
+
+    def _lasting_state(self, state):
+        '''
+        The state a chunk is assumed to start in, given the state at the
+        end of the start of the file
+        '''
+        _scanningMultiLine, activeBlock, endPos, isSingleLine = state
+        if activeBlock and endPos is None and not isSingleLine:
+            return (False, activeBlock, None, False)
+        return (False, 0, None, False)
+
+
+    def _chunk_counts(self):
+        '''
+        Counts from surveying a segment; lists are replaced by _survey_start
+        '''
+        return dict(self.counts)
+
+    def _add_chunk_counts(self, counts, segmentCounts):
+        for name, values in segmentCounts.items():
+            counts[name] = [count + segmentCount for count, segmentCount in zip(counts[name], values)]
+
+    def _use_chunk_counts(self, counts):
+        self.counts = counts
+
+
     def _survey_end(self, measurements, _unused_analysis):
         '''
         Capture summary metrics for this file
@@ -22,6 +22,9 @@ class customPowerBuilder( Code ):
     We override line processing to split out binary parts from the
     various types of code sections
     '''
+    # .pbl files are handled differently, and out files are written by path
+    OUTPUT_FROM_CONTENT = False
+
     ConfigOptions_PowerBuilder = {
         'PB_OUTFILES': (
             'self.createOutFiles = True',
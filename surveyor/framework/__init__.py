@@ -7,20 +7,44 @@
     hold 2-3 closely related classes. 
 
                cmdlineapp.py        Presentation, dupe, aggregates
+                 |   aggregates.py  Aggregate storage, spilled to disk for big jobs
                  |     writer.py    Writes output  
+                 |   writerproc.py  Runs writer.py in its own process (-ow)
+                 |   shards.py      Output written by workers and merged at job end (-os)
+                 |   columnar.py    Columnar output file format used by writer.py
              job.py                 Core application loop in main process
     jobworker.py   \                Child processes that call csmodules
            |       jobout.py        Main process thread that collects output    
      basemodule.py                  Base implementation for csmodules
 
+      dispatch.py   Channels between job.py, jobworker.py, and jobout.py
+     scheduler.py   Used by job.py to decide what files go in work packages
+        chunks.py   Very large files measured in chunks across workers (-wc)
+      registry.py   Config entries sent to workers once and referred to by ID
+     transport.py   Compact encoding of results sent from workers to jobout.py
+
+        daemon.py   Runs command line jobs in a preloaded process (surveyord.py)
+    workerpool.py   Workers and config files kept between jobs by daemon.py
+           rpc.py   Messages between the command line and daemon.py
+
     folderwalk.py   Used by job.py to walk folder tree and handle filtering
+     deltadiff.py   Used by basemodule.py to diff files for delta measures (-d)
+    filesource.py   Trees of files walked in place of folders, e.g., files in memory
+     gitsource.py   Git revisions read for delta measures in place of folders (-dg)
+ archivesource.py   Zip and tar archives walked in place of folders
+       history.py   Used by job.py to measure each commit in a git range (-l)
+    checkpoint.py   Used by job.py to save progress and resume stopped jobs (-j)
+  measurecache.py   Cache of results used by jobworker.py for unchanged files
       filetype.py   Shared code for determining file types
+     prefilter.py   Used by NBNC csmodules to skip regexes that can't match a line
        fileext.py   Extensions to fnmatch file filtering
 
    configstack.py   Interface to and caching of config information 
    configentry.py   Represents one line in a config file 
   configreader.py   Reading and parsing of config files
+   configcache.py   Cache of config files read, for later jobs (-ck)
        modules.py   Loading and caching csmodules for configreader.py
+    regexcheck.py   Used by configreader.py to flag regexes prone to backtracking (-cr)
 
          utils.py   General shared functionality
          trace.py   Implements debug tracing functionality
@@ -39,22 +63,29 @@
     The main process also spawns a separate thread (jobout.py) to collect output 
     from the jobworkers, write output file(s), and update the UI display. 
     
-    Three queues are used to communicate between the 2 main process threads and
-    the child processes, as diagramed below:
+    Queues and an event (dispatch.py) are used to communicate between
+    the 2 main process threads and the child processes, as diagramed below:
     
-        INPUT -- Main thread puts work packages, workers process
+        CONFIG -- Main thread sends each config entry once to every worker
+        TASK -- Main thread puts work packages, workers process (and share)
         OUTPUT -- Workers put results, output thread grabs them
-        CONTROL -- Used to handle errors, ctrl-c, and ensure clean shut down
+        JOB -- Workers and output thread report errors and exceptions to job,
+               and workers send results for chunks of very large files
+        EXIT -- Event set by the job to handle ctrl-c and errors
+
+    Each queue has one reader that blocks on it, so there is no polling.
+    Clean shut down is done by putting an empty package on the task queue
+    for each worker and on the output queue once all output is received.
 
                             SurveyorApplication
                          (creates)            \
                           /                  (callback) 
                MainProcess-Job  (spawns)->  MainProcess-OutThread 
-                   (put)     \              /      (get)
-                     |        \            /         |
-                    INPUT     CONTROL QUEUE      OUTPUT        
-                       \            |            /           
-                      (get)         |        (put)
+                 (put)  |  (get)  (set)          (get)
+                   |    |    \      |              |
+                 TASK  JOB QUEUE  EXIT           OUTPUT        
+                   \        |      |             /           
+                  (get)   (put)  (check)     (put)
                         ChildProcesses-JobWorker 
 '''
 #=============================================================================
@@ -0,0 +1,356 @@
+#=============================================================================
+'''
+    Surveyor Aggregates
+
+    Storage for the -g aggregate option, which folds analysis results that
+    share a key value (e.g., the same dupe line or dependency name) into one
+    aggregate row per key.
+
+    Aggregates are kept in memory in dicts, as they always were, until an
+    estimate of their size passes the memory budget. Then every aggregate
+    set is spilled to disk as a run of partial aggregates sorted by key hash,
+    and memory starts over. When the job is done the runs (and whatever is
+    still in memory) are merged key by key, in the order they were written,
+    so list values are extended in the same order and string values end with
+    the same last value as the in-memory path. Float totals are added up
+    in a different grouping, so can differ from it in their last digits.
+    Rows are returned in the order each key was first seen, which takes
+    a second pass through runs sorted on first-seen order.
+
+    Runs are pickled in batches to anonymous temporary files, which the
+    OS removes however the job exits.
+'''
+#=============================================================================
+# Copyright 2004-2012, Matt Peloquin and Construx. This file is part of Code
+# Surveyor, covered under GNU GPL v3 and is distributed WITHOUT ANY WARRANTY.
+#=============================================================================
+import gc
+import heapq
+import pickle
+import tempfile
+from numbers import Number
+
+from framework import trace
+
+# Default memory budget for in-memory aggregates, in MB
+DEFAULT_MEMORY_MB = 1024
+
+# Entries pickled together in spill files, and the most runs merged at once;
+# merging holds about one batch per run in memory
+SPILL_BATCH_SIZE = 256
+MERGE_FAN_IN = 32
+
+# Rough CPython object sizes used to estimate aggregate memory
+_SIZE_ENTRY = 240
+_SIZE_DICT_ITEM = 100
+_SIZE_LIST_ITEM = 8
+_SIZE_SCALAR = 32
+_SIZE_STR = 49
+
+_NUMBER_TYPES = (int, float)
+
+
+def aggregate_update(itemName, item, aggregate):
+    '''
+    Updates an aggreate dictionary in place, based on type of newItem
+    Exact types are checked first, because isinstance() against the Number
+    ABC is slow and this is called for every item of every aggregate update
+    '''
+    itemType = type(item)
+
+    # Strings are overwritten
+    if itemType is str:
+        aggregate[itemName] = item
+
+    # Numbers are added
+    elif itemType in _NUMBER_TYPES or (
+            itemType is not list and itemType is not dict and isinstance(item, Number)):
+        currentValue = aggregate.get(itemName, 0)
+        try:
+            aggregate[itemName] = currentValue + item
+        except TypeError:
+            # If a number and string are confused, treat as a string
+            aggregate[itemName] = str(item)
+
+    # Lists are extended
+    elif isinstance(item, list):
+        currentList = aggregate.get(itemName, [])
+        currentList.extend(item)
+        aggregate[itemName] = currentList
+
+    # Dicts are opened and updated recursively
+    elif isinstance(item, dict):
+        currentDict = aggregate.get(itemName, {})
+        for key, value in item.items():
+            aggregate_update(key, value, currentDict)
+        aggregate[itemName] = currentDict
+
+    # Otherwise we overwrite as string
+    else:
+        aggregate[itemName] = str(item)
+
+
+def approx_size(item):
+    '''
+    Estimate of the memory an item adds when it is stored in an aggregate
+    Common leaf types are sized inline, since this is called for every
+    aggregate update when there is a memory budget
+    '''
+    itemType = type(item)
+    if itemType is str:
+        return _SIZE_STR + len(item)
+    elif itemType is list or isinstance(item, list):
+        size = _SIZE_LIST_ITEM * (len(item) + 8)
+        for value in item:
+            valueType = type(value)
+            if valueType in _NUMBER_TYPES:
+                size += _SIZE_SCALAR
+            elif valueType is str:
+                size += _SIZE_STR + len(value)
+            else:
+                size += approx_size(value)
+        return size
+    elif itemType is dict or isinstance(item, dict):
+        size = _SIZE_DICT_ITEM * (len(item) + 2)
+        for key, value in item.items():
+            size += _SIZE_STR + len(key) if type(key) is str else approx_size(key)
+            valueType = type(value)
+            if valueType in _NUMBER_TYPES:
+                size += _SIZE_SCALAR
+            elif valueType is str:
+                size += _SIZE_STR + len(value)
+            else:
+                size += approx_size(value)
+        return size
+    elif isinstance(item, str):
+        return _SIZE_STR + len(item)
+    else:
+        return _SIZE_SCALAR
+
+
+def approx_growth(itemName, item, aggregate):
+    '''
+    Estimate of how much aggregate_update(itemName, item, aggregate) will
+    grow the aggregate; lists and dicts grow, other values are replaced
+    '''
+    if itemName not in aggregate:
+        return _SIZE_DICT_ITEM + approx_size(itemName) + approx_size(item)
+    elif isinstance(item, list):
+        return sum(map(approx_size, item), _SIZE_LIST_ITEM * len(item))
+    elif isinstance(item, dict):
+        current = aggregate[itemName]
+        if not isinstance(current, dict):
+            return approx_size(item)
+        growth = 0
+        for key, value in item.items():
+            growth += approx_growth(key, value, current)
+        return growth
+    else:
+        return 0
+
+
+class Aggregates( object ):
+    '''
+    Aggregate sets, keyed on the aggregate key name from the command line.
+    Each set maps key values to [firstSeen, aggregate dict].
+    '''
+    def __init__(self, memoryBudgetMB=DEFAULT_MEMORY_MB, spillDir=None):
+        self._memoryBudget = memoryBudgetMB * 1024 * 1024 if memoryBudgetMB else None
+        self._spillDir = spillDir
+        self._sets = {}
+        self._runs = {}
+        self._memoryUsed = 0
+        self._numUpdates = 0
+        self.numSpills = 0
+
+    def update(self, aggKey, keyValue, result, namesToAggregate):
+        '''
+        Fold the names from one analysis result into the aggregate for keyValue
+        '''
+        aggregateSet = self._sets.setdefault(aggKey, {})
+        entry = aggregateSet.get(keyValue)
+        if entry is None:
+            entry = aggregateSet[keyValue] = [self._numUpdates, {'aggregate.count': 0}]
+            self._memoryUsed += _SIZE_ENTRY + approx_size(keyValue)
+        aggregate = entry[1]
+        for itemName in namesToAggregate:
+            item = result[itemName]
+            if self._memoryBudget is not None:
+                self._memoryUsed += approx_growth(itemName, item, aggregate)
+            aggregate_update(itemName, item, aggregate)
+        aggregate['aggregate.count'] += 1
+        self._numUpdates += 1
+
+        if self._memoryBudget is not None and self._memoryUsed > self._memoryBudget:
+            self._spill()
+
+    def rows(self, aggKey):
+        '''
+        Generator of aggregate dicts for aggKey in the order keys were first seen
+        '''
+        aggregateSet = self._sets.get(aggKey, {})
+        runs = self._runs.get(aggKey)
+        if not runs:
+            for _firstSeen, aggregate in aggregateSet.values():
+                yield aggregate
+            return
+
+        # Merge the runs by key, then put the merged entries back in
+        # first-seen order, spilling again if they don't fit in memory
+        runs.append(_SpillRun.sorted_from(aggregateSet, self._spillDir))
+        self._sets[aggKey] = {}
+        self._memoryUsed = 0
+        runs = self._reduce_runs(runs, _merge_key_entries)
+        ordered = []
+        orderedRuns = []
+        orderedSize = 0
+        for firstSeen, keyValue, aggregate in _merge_runs(runs):
+            ordered.append((firstSeen, aggregate))
+            orderedSize += _SIZE_ENTRY + approx_size(aggregate)
+            if self._memoryBudget is not None and orderedSize > self._memoryBudget:
+                orderedRuns.append(_SpillRun(sorted(ordered, key=_first_seen), self._spillDir))
+                ordered = []
+                orderedSize = 0
+        for run in runs:
+            run.close()
+        self._runs[aggKey] = []
+
+        ordered.sort(key=_first_seen)
+        if not orderedRuns:
+            for _firstSeen, aggregate in ordered:
+                yield aggregate
+        else:
+            orderedRuns.append(_SpillRun(ordered, self._spillDir))
+            orderedRuns = self._reduce_runs(orderedRuns, _merge_ordered_entries)
+            for _firstSeen, aggregate in _merge_ordered_entries(orderedRuns):
+                yield aggregate
+            for run in orderedRuns:
+                run.close()
+
+    def close(self):
+        for runs in self._runs.values():
+            for run in runs:
+                run.close()
+        self._runs = {}
+        self._sets = {}
+
+    def _reduce_runs(self, runs, merge_entries):
+        '''
+        Merge the oldest runs until there are few enough to merge at once,
+        rewriting no more runs than needed; merging neighbors keeps partial
+        aggregates in arrival order
+        '''
+        while len(runs) > MERGE_FAN_IN:
+            numToMerge = min(MERGE_FAN_IN, len(runs) - MERGE_FAN_IN + 1)
+            trace.msg(1, "Merging {0} of {1} aggregate runs".format(numToMerge, len(runs)))
+            group = runs[:numToMerge]
+            mergedRun = _SpillRun(merge_entries(group), self._spillDir)
+            for run in group:
+                run.close()
+            runs = [mergedRun] + runs[numToMerge:]
+        return runs
+
+    def _spill(self):
+        trace.msg(1, "Spilling aggregates: {0} MB estimated in {1} keys".format(
+                self._memoryUsed // (1024 * 1024),
+                sum(len(aggregateSet) for aggregateSet in self._sets.values())))
+        for aggKey, aggregateSet in self._sets.items():
+            if aggregateSet:
+                self._runs.setdefault(aggKey, []).append(
+                        _SpillRun.sorted_from(aggregateSet, self._spillDir))
+        self._sets = {}
+        self._memoryUsed = 0
+        self.numSpills += 1
+
+
+def _first_seen(entry):
+    return entry[0]
+
+def _key_hash(entry):
+    return entry[0]
+
+
+def _merge_key_entries(runs):
+    for firstSeen, keyValue, aggregate in _merge_runs(runs):
+        yield hash(keyValue), keyValue, firstSeen, aggregate
+
+def _merge_ordered_entries(runs):
+    return heapq.merge(*runs, key=_first_seen)
+
+def _merge_runs(runs):
+    '''
+    Generator of (firstSeen, keyValue, aggregate) for each distinct key
+    across the runs, which are sorted on key hash. Runs are in the order
+    they were written, and heapq.merge keeps that order for equal hashes,
+    so partial aggregates for a key are folded together in arrival order
+    '''
+    hashGroup = []
+    groupHash = None
+    for keyHash, keyValue, firstSeen, aggregate in heapq.merge(*runs, key=_key_hash):
+        if keyHash != groupHash:
+            yield from _merge_hash_group(hashGroup)
+            hashGroup = []
+            groupHash = keyHash
+        hashGroup.append((keyValue, firstSeen, aggregate))
+    yield from _merge_hash_group(hashGroup)
+
+def _merge_hash_group(hashGroup):
+    merged = []
+    for keyValue, firstSeen, aggregate in hashGroup:
+        for entry in merged:
+            if entry[1] == keyValue:
+                for itemName, item in aggregate.items():
+                    aggregate_update(itemName, item, entry[2])
+                break
+        else:
+            merged.append([firstSeen, keyValue, aggregate])
+    for entry in merged:
+        yield tuple(entry)
+
+
+class _SpillRun( object ):
+    '''
+    A sorted run of entries pickled to a temporary file in batches;
+    iterating reads the entries back in order
+    '''
+    def __init__(self, entries, spillDir):
+        self._file = tempfile.TemporaryFile(prefix='_surveyor_agg', dir=spillDir)
+        batch = []
+        for entry in entries:
+            batch.append(entry)
+            if len(batch) >= SPILL_BATCH_SIZE:
+                pickle.dump(batch, self._file, pickle.HIGHEST_PROTOCOL)
+                batch = []
+        if batch:
+            pickle.dump(batch, self._file, pickle.HIGHEST_PROTOCOL)
+        self._file.flush()
+
+    @classmethod
+    def sorted_from(cls, aggregateSet, spillDir):
+        entries = [(hash(keyValue), keyValue, firstSeen, aggregate)
+                        for keyValue, (firstSeen, aggregate) in aggregateSet.items()]
+        entries.sort(key=_key_hash)
+        return cls(entries, spillDir)
+
+    def __iter__(self):
+        '''
+        Unpickling makes many containers that all survive, so cyclic garbage
+        collection is held off while each batch loads, which would otherwise
+        run over and over for nothing
+        '''
+        self._file.seek(0)
+        while True:
+            gcEnabled = gc.isenabled()
+            gc.disable()
+            try:
+                batch = pickle.load(self._file)
+            except EOFError:
+                return
+            finally:
+                if gcEnabled:
+                    gc.enable()
+            yield from batch
+
+    def close(self):
+        self._file.close()
+
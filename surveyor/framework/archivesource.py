@@ -0,0 +1,340 @@
+#=============================================================================
+'''
+    Surveyor Archive Source
+
+    Zip files, tar files (plain or gzipped), and single gzipped files can
+    be measured in place of a folder, without extracting them. When the
+    walk gets to an archive given as a path to measure, its members are
+    listed as a folder tree under the archive's path (ArchiveTree), so
+    files in "drop.tgz" are measured as, e.g., "drop.tgz/src/main.c".
+    Config files in the archive apply to the folders they are in, as they
+    would once extracted.
+
+    Each file goes to workers with an ArchiveFile in place of a delta path,
+    and workers read its content from the archive, which they keep open
+    for the job. Nothing is written to disk:
+
+      - Zip members, and members of plain tar files, are read directly
+      - A gzipped tar can only be read by decompressing it from the start.
+        Workers take files in order of cost rather than the order they're
+        in the archive, so the decompressor's state (about 40KB) is saved
+        every CHECKPOINT_BYTES of the tar as a worker reads through it, and
+        each member is decompressed from the checkpoint before it
+
+    Only regular files are listed; links, devices, and sparse files are
+    skipped, as are members with paths that would be outside the archive.
+    Files have the modified time recorded for them in the archive.
+'''
+#=============================================================================
+# Copyright 2004-2012, Matt Peloquin and Construx. This file is part of Code
+# Surveyor, covered under GNU GPL v3 and is distributed WITHOUT ANY WARRANTY.
+#=============================================================================
+import os
+import gzip
+import stat
+import time
+import zlib
+import bisect
+import tarfile
+import zipfile
+
+from framework import filesource
+from framework import uistrings
+from framework import utils
+from framework import trace
+
+# Archive formats
+ZIP_FORMAT = 'zip'
+TAR_FORMAT = 'tar'
+GZIP_TAR_FORMAT = 'tar.gz'
+GZIP_FORMAT = 'gz'
+
+# Formats by file extension, checked in order
+ArchiveExtensions = [
+    ('.tar.gz', GZIP_TAR_FORMAT), ('.tgz', GZIP_TAR_FORMAT),
+    ('.tar', TAR_FORMAT),
+    ('.zip', ZIP_FORMAT),
+    ('.gz', GZIP_FORMAT),
+    ]
+
+# tarfile stream modes for tar formats
+TarModes = {
+    TAR_FORMAT: 'r|',
+    GZIP_TAR_FORMAT: 'r|gz',
+    }
+
+# Errors reading a damaged or unsupported archive
+ArchiveErrors = (OSError, EOFError, RuntimeError, NotImplementedError,
+                 zlib.error, tarfile.TarError, zipfile.BadZipFile)
+
+# Content of a gzip file decompressed between saving the decompressor's
+# state, and size of reads from the file
+CHECKPOINT_BYTES = 1024 * 1024
+GZIP_READ_BYTES = 32 * 1024
+
+# zlib window bits for a gzip header and trailer
+GZIP_WBITS = zlib.MAX_WBITS | 16
+
+
+def archive_format(filePath):
+    '''
+    Format of an archive file, or None if filePath isn't one
+    '''
+    lowerPath = filePath.lower()
+    for fileExt, archiveFormat in ArchiveExtensions:
+        if lowerPath.endswith(fileExt):
+            return archiveFormat if os.path.isfile(filePath) else None
+    return None
+
+
+def member_path(memberName):
+    '''
+    Path of a member relative to the top of the archive, or None if it
+    would be outside it
+    '''
+    names = [name for name in memberName.split('/') if name and name != os.curdir]
+    if os.pardir in names:
+        return None
+    return '/'.join(names)
+
+
+class ArchiveTree( filesource.ListedTree ):
+    '''
+    The members of the archive at archivePath, listed when it is created;
+    the tree reads config files from the archive through its own reader
+    '''
+    def __init__(self, archivePath):
+        super(ArchiveTree, self).__init__(archivePath)
+        self._archiveFormat = archive_format(archivePath)
+        self._reader = None
+        try:
+            if self._archiveFormat == ZIP_FORMAT:
+                self._list_zip()
+            elif self._archiveFormat == GZIP_FORMAT:
+                self._list_gzip()
+            else:
+                self._list_tar()
+        except ArchiveErrors as e:
+            raise utils.InputException(uistrings.STR_ErrorArchive.format(archivePath, str(e)))
+        trace.msg(1, "Archive {0}: {1} folders".format(archivePath, len(self._folders)))
+
+    def close(self):
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    def _read_source_file(self, archiveFile):
+        if self._reader is None:
+            self._reader = open_reader(self.rootPath, self._archiveFormat)
+        return read_member(self._reader, archiveFile)
+
+    def _list_tar(self):
+        with tarfile.open(self.rootPath, TarModes[self._archiveFormat]) as tar:
+            for member in tar:
+                relPath = member_path(member.name)
+                if not relPath:
+                    continue
+                if member.isdir():
+                    self.add_folder(relPath)
+                elif member.isreg() and not member.issparse():
+                    self.add_file(relPath, ArchiveFile(self.rootPath, self._archiveFormat,
+                            member.name, member.offset_data, member.size, member.mtime))
+
+    def _list_zip(self):
+        with zipfile.ZipFile(self.rootPath) as archive:
+            for info in archive.infolist():
+                relPath = member_path(info.filename)
+                if not relPath:
+                    continue
+                if info.is_dir():
+                    self.add_folder(relPath)
+                elif not stat.S_ISLNK(info.external_attr >> 16):
+                    self.add_file(relPath, ArchiveFile(self.rootPath, self._archiveFormat,
+                            info.filename, None, info.file_size,
+                            time.mktime(info.date_time + (0, 0, -1))))
+
+    def _list_gzip(self):
+        '''
+        A gzipped file is a tree of one file, named without the .gz
+        '''
+        fileName = os.path.basename(self.rootPath)[:-len('.gz')]
+        fileSize = 0
+        with gzip.open(self.rootPath, 'rb') as gzipFile:
+            while True:
+                data = gzipFile.read(CHECKPOINT_BYTES)
+                if not data:
+                    break
+                fileSize += len(data)
+            fileTime = gzipFile.mtime or os.path.getmtime(self.rootPath)
+        self.add_file(fileName, ArchiveFile(self.rootPath, self._archiveFormat,
+                fileName, 0, fileSize, fileTime))
+
+
+class ArchiveFile( filesource.SourceFile ):
+    '''
+    A member of an archive, read by name from zip files, and from its
+    offset in the tar (or gzipped file's content) for others
+    '''
+    __slots__ = ('archivePath', 'archiveFormat', 'member', 'offset', 'time')
+
+    def __init__(self, archivePath, archiveFormat, member, offset, size, fileTime):
+        super(ArchiveFile, self).__init__(size)
+        self.archivePath = archivePath
+        self.archiveFormat = archiveFormat
+        self.member = member
+        self.offset = offset
+        self.time = fileTime
+
+    def __repr__(self):
+        return "ArchiveFile({0}, {1})".format(self.archivePath, self.member)
+
+    def content_id(self):
+        return self.archivePath + ':' + self.member
+
+    def read(self):
+        reader = filesource.process_reader(self.archivePath,
+                lambda: open_reader(self.archivePath, self.archiveFormat))
+        return read_member(reader, self)
+
+
+#-----------------------------------------------------------------------------
+#  Archive readers
+
+def open_reader(archivePath, archiveFormat):
+    try:
+        if archiveFormat == ZIP_FORMAT:
+            return ZipReader(archivePath)
+        elif archiveFormat in (GZIP_TAR_FORMAT, GZIP_FORMAT):
+            return GzipReader(archivePath)
+        else:
+            return TarReader(archivePath)
+    except ArchiveErrors as e:
+        raise utils.FileMeasureError(uistrings.STR_ErrorArchive.format(archivePath, str(e)))
+
+
+def read_member(reader, archiveFile):
+    try:
+        return reader.read_member(archiveFile)
+    except ArchiveErrors as e:
+        raise utils.FileMeasureError(uistrings.STR_ErrorArchive.format(
+                archiveFile.archivePath, "{0}: {1}".format(archiveFile.member, str(e))))
+
+
+class ZipReader( object ):
+
+    def __init__(self, archivePath):
+        self._zip = zipfile.ZipFile(archivePath)
+
+    def read_member(self, archiveFile):
+        return self._zip.read(archiveFile.member)
+
+    def close(self):
+        self._zip.close()
+
+
+class TarReader( object ):
+    '''
+    Reads members of a tar file from their offset
+    '''
+    def __init__(self, archivePath):
+        self._file = open(archivePath, 'rb')
+
+    def read_member(self, archiveFile):
+        self._file.seek(archiveFile.offset)
+        content = self._file.read(archiveFile.size)
+        if len(content) != archiveFile.size:
+            raise EOFError("Archive ended in member")
+        return content
+
+    def close(self):
+        self._file.close()
+
+
+class GzipReader( object ):
+    '''
+    Reads byte ranges of the content of a gzip file. Checkpoints of the
+    decompressor's state are saved as content is read, and a range before
+    the last one read is decompressed from the checkpoint before it.
+    Concatenated gzip streams are read as one, as gzip does.
+    '''
+    def __init__(self, archivePath):
+        self._file = open(archivePath, 'rb')
+
+        # Content offset of each checkpoint, and the file offset and a copy
+        # of the decompressor for it; the decompressor is None at the start
+        self._checkpointOffsets = [0]
+        self._checkpoints = [(0, None)]
+
+        # Content decompressed and not yet read starts at _position, and
+        # _input has been read from the file but not decompressed
+        self._position = 0
+        self._output = b''
+        self._input = b''
+        self._decompressor = None
+        self._restore(0)
+
+    def read_member(self, archiveFile):
+        content = self.read(archiveFile.offset, archiveFile.size)
+        if len(content) != archiveFile.size:
+            raise EOFError("Archive ended in member")
+        return content
+
+    def read(self, offset, size):
+        checkpoint = bisect.bisect_right(self._checkpointOffsets, offset) - 1
+        if offset < self._position or self._checkpointOffsets[checkpoint] > self._position:
+            self._restore(checkpoint)
+        content = []
+        while size > 0:
+            if not self._output:
+                self._output = self._decompress()
+                if not self._output:
+                    break
+            skip = min(offset - self._position, len(self._output))
+            part = self._output[skip:skip + size]
+            self._output = self._output[skip + len(part):]
+            self._position += skip + len(part)
+            offset += len(part)
+            size -= len(part)
+            if part:
+                content.append(part)
+        return b''.join(content)
+
+    def close(self):
+        self._file.close()
+
+    def _restore(self, checkpoint):
+        fileOffset, decompressor = self._checkpoints[checkpoint]
+        self._file.seek(fileOffset)
+        self._position = self._checkpointOffsets[checkpoint]
+        self._output = b''
+        self._input = b''
+        if decompressor is None:
+            self._decompressor = zlib.decompressobj(GZIP_WBITS)
+        else:
+            self._decompressor = decompressor.copy()
+
+    def _decompress(self):
+        '''
+        Next content from the file, or nothing at its end. A checkpoint
+        is saved when all the input read has been decompressed.
+        '''
+        while True:
+            if not self._input:
+                self._input = self._file.read(GZIP_READ_BYTES)
+                if not self._input:
+                    return b''
+            if self._decompressor.eof:
+                # Another gzip stream may follow, after zero padding
+                self._input = self._input.lstrip(b'\0')
+                if not self._input:
+                    continue
+                self._decompressor = zlib.decompressobj(GZIP_WBITS)
+            output = self._decompressor.decompress(self._input)
+            self._input = self._decompressor.unused_data
+            outputEnd = self._position + len(self._output) + len(output)
+            if (not self._input and not self._decompressor.eof and
+                    outputEnd >= self._checkpointOffsets[-1] + CHECKPOINT_BYTES):
+                self._checkpointOffsets.append(outputEnd)
+                self._checkpoints.append((self._file.tell(), self._decompressor.copy()))
+            if output:
+                return output
@@ -28,11 +28,13 @@
 #=============================================================================
 import re
 import os
-import filecmp
-import difflib
+import time
 
 from framework import configentry
+from framework import deltadiff
 from framework import filetype
+from framework import filesource
+from framework import gitsource
 from framework import uistrings
 from framework import utils
 from framework import trace
@@ -76,6 +78,11 @@ class _BaseModule( object ):
             ( utils.MAX_RANK, "100+" ),
             ]
 
+    # Output depends on the path only through path metadata (see
+    # update_path_metadata), so history jobs can replay it for the same
+    # content at other paths; modules that use the path set this False
+    OUTPUT_FROM_CONTENT = True
+
     # Config-file overrideable options
     # The basemodule implements a framework for defining options that can
     # be overrideen in config files. Some of these can also be set by the
@@ -124,6 +131,9 @@ class _BaseModule( object ):
         'DELTA_INCL_DELETED': (
             '''self._deltaIncludeDeleted = True''',
             'Include deleted lines in delta counts'),
+        'DELTA_DIFFLIB': (
+            '''self._deltaDifflib = True''',
+            'Delta lines from difflib, as in earlier versions; slow on large, much changed files'),
         'CASE_SENSITIVE': (
             '''self._reFlags &= ~re.IGNORECASE''',
             'Make code searching (comments, decisions, etc.) case-sensitive'),
@@ -170,11 +180,13 @@ class _BaseModule( object ):
         self._measureFilter = None
         self._writeEmptyMeasures = False
         self._deltaFilePath = None
+        self._sourceFile = None
         self._sizeThreshold = 0
         self._ignoreBinary = True
         self._ignoreNonCode = False
         self._ignorePath = None
         self._deltaIncludeDeleted = False
+        self._deltaDifflib = False
 
     @classmethod
     def _cs_config_options(cls):
@@ -215,13 +227,19 @@ class _BaseModule( object ):
         We create and return a file handle, if one matches the given criteria
         Note that fileHandle may actually just be an iterable list
         If none is returned, only file metadata will be considered
+        For files from a source tree, e.g., a git tree or archive, deltaPath
+        is a filesource.SourceFile that the file is read from, even if it is
+        new or there is no delta
         '''
+        self._sourceFile = deltaPath if isinstance(deltaPath, filesource.SourceFile) else None
         if self._metaDataOnly:
             return None
         if self._ignorePath is not None:
             if self._ignorePath in filePath:
                 return None
-        if deltaPath is not None:
+        if self._sourceFile is not None and not self._sourceFile.is_delta():
+            return self._open_file(filePath, existingFileHandle)
+        elif deltaPath is not None:
             return self._get_delta_lines(filePath, deltaPath)
         else:
             return self._open_file(filePath, existingFileHandle)
@@ -240,54 +258,56 @@ class _BaseModule( object ):
         trace.file(2, "process_file: {0} {1}".format(self.__class__.__name__, filePath))
         trace.file(3, "  config: {0}".format(str(configEntry)))
 
-        # Stash path for error handling in derived classes
+        # Stash path for error handling in derived classes; cleared even if
+        # the measure fails, so it doesn't carry over to the next file
         self._currentPath = utils.SurveyorPathParser(filePath)
-
-        # Does the config measure filter need to be overridden?
-        if self._measureFilter is not None:
-            configEntry.new_measure_filter(self._measureFilter)
-
-        # Measurements (whole file metrics) will be stored in a dictionary
-        # Pack measurement data with file metadata
-        measurements = {}
-        self._pack_metadata_into_measures(configEntry, numSameFiles, measurements)
-
-        # Analysis items (per line items) are a list of dictionaries
-        analysis = []
-
-        #
-        # Delegate the survey work to specializations
-        #
-        measureResults = {}
-        analysisResults = []
-        if self._survey(fileLines, configEntry, measurements, analysis):
-
-            # Pack measurements that match our measure filter
-            for measureName, measure in measurements.items():
-                if self.match_measure(measureName, configEntry.measureFilters):
-                    measureResults[measureName] = measure
-
-            # Pack analysis items into a list of dictionaries for return to app
-            # We only send analysis items that match filter
-            for analysisItem in analysis:
-                analysisRow = {}
-                for itemName, itemValue in analysisItem.items():
-                    if self.match_measure(itemName, configEntry.measureFilters):
-                        analysisRow[itemName] = itemValue
-                if analysisRow:
-                    analysisResults.append(analysisRow)
-
-            # If this is a delta comparison and there are no lines, it means the
-            # delta file is an exact dupe
-            if not fileLines and self._deltaFilePath:
-                measureResults[METADATA_DUPE_PATH] = self._deltaFilePath
-
-            # Add timing info
-            if self.match_measure(METADATA_TIMING, configEntry.measureFilters):
-                measureResults[METADATA_TIMING] = "{0:.4f}".format(utils.timing_get('FILE_MEASURE_TIME'))
-
-        self._currentPath = None
-        self._deltaFilePath = None
+        try:
+            # Does the config measure filter need to be overridden?
+            if self._measureFilter is not None:
+                configEntry.new_measure_filter(self._measureFilter)
+
+            # Measurements (whole file metrics) will be stored in a dictionary
+            # Pack measurement data with file metadata
+            measurements = {}
+            self._pack_metadata_into_measures(configEntry, numSameFiles, measurements)
+
+            # Analysis items (per line items) are a list of dictionaries
+            analysis = []
+
+            #
+            # Delegate the survey work to specializations
+            #
+            measureResults = {}
+            analysisResults = []
+            if self._survey(fileLines, configEntry, measurements, analysis):
+
+                # Pack measurements that match our measure filter
+                for measureName, measure in measurements.items():
+                    if self.match_measure(measureName, configEntry.measureFilters):
+                        measureResults[measureName] = measure
+
+                # Pack analysis items into a list of dictionaries for return to app
+                # We only send analysis items that match filter
+                for analysisItem in analysis:
+                    analysisRow = {}
+                    for itemName, itemValue in analysisItem.items():
+                        if self.match_measure(itemName, configEntry.measureFilters):
+                            analysisRow[itemName] = itemValue
+                    if analysisRow:
+                        analysisResults.append(analysisRow)
+
+                # If this is a delta comparison and there are no lines, it means the
+                # delta file is an exact dupe
+                if not fileLines and self._deltaFilePath:
+                    measureResults[METADATA_DUPE_PATH] = self._deltaFilePath
+
+                # Add timing info
+                if self.match_measure(METADATA_TIMING, configEntry.measureFilters):
+                    measureResults[METADATA_TIMING] = "{0:.4f}".format(utils.timing_get('FILE_MEASURE_TIME'))
+        finally:
+            self._currentPath = None
+            self._deltaFilePath = None
+            self._sourceFile = None
 
         # Send data back to the caller (jobworker.Worker in default framework)
         file_measured_callback(filePath, measureResults, analysisResults)
@@ -324,6 +344,22 @@ class _BaseModule( object ):
                 break
         return measureMatch
 
+
+    def can_survey_chunks(self, configEntry):
+        '''
+        Modules that can survey a large file in chunks on several workers
+        override this and survey_chunk (see framework/chunks.py); results
+        for chunks are merged in _survey, given chunks.ChunkedLines
+        '''
+        return False
+
+    def survey_chunk(self, filePath, chunkReader, start, end, configEntry):
+        '''
+        Returns results for the lines of filePath from byte offsets start
+        to end, as a list of (start, end, ...) for segments from chunkReader
+        '''
+        raise utils.AbstractMethod(self)
+
     #-------------------------------------------------------------------------
 
     def _open_file(self, filePath, oldFileHandle=None):
@@ -339,7 +375,7 @@ class _BaseModule( object ):
             tryToOpen = False
         # Check for size threshold
         elif self._sizeThreshold > 0:
-            fileSize = utils.get_file_size(filePath)
+            fileSize = self._file_size(filePath)
             if self._sizeThreshold < fileSize:
                 trace.file(1, "Skipping, file too big {0:,} bytes: {1}".format(fileSize, filePath))
                 tryToOpen = False
@@ -348,7 +384,10 @@ class _BaseModule( object ):
             # Open the file if it hasn't been opened, otherwise reset it
             if not oldFileHandle:
                 # open with automagic charset (or binary) detection - use default buffering
-                newFileHandle = utils.open_chardet(filePath)
+                if self._sourceFile is not None:
+                    newFileHandle = utils.open_chardet_bytes(self._sourceFile.read(), filePath)
+                else:
+                    newFileHandle = utils.open_chardet(filePath)
             else:
                 newFileHandle = oldFileHandle
                 newFileHandle.seek(0)    # Reset the file
@@ -375,34 +414,60 @@ class _BaseModule( object ):
         Return a line buffer that represents additional lines relative to the
         delta path. We are not doing a full diff, only taking into account new
         files, and lines in existing files that are new/modified.
+        For a file from a git tree, deltaFilePath is its gitsource.GitFile,
+        which has the blob to compare with, if any.
         '''
-        self._deltaFilePath = deltaFilePath
+        self._deltaFilePath = str(deltaFilePath)
         deltaLines = None
         # If no correpsonding file exists in delta, we do a normal file open
-        if not os.path.exists(deltaFilePath):
+        if not self._delta_file_exists(deltaFilePath):
             trace.file(1, "Delta file doesn't exist for: {0}".format(deltaFilePath))
             deltaLines = self._open_file(filePath)
 
         # We only do a diff if there is an identical file name that has been modified
-        elif not filecmp.cmp(deltaFilePath, filePath):
+        elif not self._same_as_delta_file(filePath, deltaFilePath):
             fileToMeasure = self._open_file(filePath)
             if fileToMeasure is not None:
                 measureFileLines = fileToMeasure.readlines()
                 fileToMeasure.close()
                 deltaFileLines = None
-                with utils.open_chardet(deltaFilePath) as deltaFile:
+                with self._open_delta_file(deltaFilePath) as deltaFile:
                     deltaFileLines = deltaFile.readlines()
-                diffLines = difflib.unified_diff(deltaFileLines, measureFileLines)
-                if diffLines:
-                    deltaLines = []
-                    for line in diffLines:
-                        if line.startswith('+') or (self._deltaIncludeDeleted and line.startswith('-')):
-                           deltaLines.append(line[2:])
-            trace.file(1, "{0} delta lines with: {1}".format(len(deltaLines), deltaFilePath))
+                deltaLines = deltadiff.delta_lines(
+                        deltaFileLines, measureFileLines, self._deltaIncludeDeleted,
+                        self._deltaDifflib)
+                trace.file(1, "{0} delta lines with: {1}".format(len(deltaLines), deltaFilePath))
         else:
             trace.file(1, "Delta skip: {0} == {1}".format(filePath, deltaFilePath))
         return deltaLines
 
+    def _delta_file_exists(self, deltaFilePath):
+        if isinstance(deltaFilePath, gitsource.GitFile):
+            return deltaFilePath.deltaSha is not None
+        return os.path.exists(deltaFilePath)
+
+    def _same_as_delta_file(self, filePath, deltaFilePath):
+        # Blobs with the same SHA have the same content
+        if isinstance(deltaFilePath, gitsource.GitFile):
+            return deltaFilePath.is_unchanged()
+        return deltadiff.same_file(deltaFilePath, filePath)
+
+    def _open_delta_file(self, deltaFilePath):
+        if isinstance(deltaFilePath, gitsource.GitFile):
+            return utils.open_chardet_bytes(deltaFilePath.read_delta(), str(deltaFilePath))
+        return utils.open_chardet(deltaFilePath)
+
+    def _file_size(self, filePath):
+        if self._sourceFile is not None:
+            return self._sourceFile.size
+        return utils.get_file_size(filePath)
+
+    def _file_mod_time_str(self, filePath, dateFormat):
+        # Files from a source tree have its time for them, e.g., the commit time
+        if self._sourceFile is not None:
+            return time.strftime(dateFormat, time.localtime(self._sourceFile.time))
+        return utils.get_file_mod_time_str(filePath, dateFormat)
+
 
     def _pack_metadata_into_measures(self, configEntry, numSameFiles, measures):
         '''
@@ -431,7 +496,7 @@ class _BaseModule( object ):
                     if len(optValue) > 1:
                         suffix = str(dateCol)
                     measures[METADATA_FILEDATE + suffix] = (
-                            utils.get_file_mod_time_str(self._currentPath.filePath, dateCol))
+                            self._file_mod_time_str(self._currentPath.filePath, dateCol))
 
             elif optKey in ('FOLDER'):
                 measures[METADATA_DIRFILES] = numSameFiles
@@ -445,7 +510,7 @@ class _BaseModule( object ):
                 measures[METADATA_ABSPATH] = os.path.abspath(self._currentPath.filePath)
 
             if optKey in ('SIZE', 'DUPE'):
-                measures[METADATA_FILESIZE] = utils.get_file_size(self._currentPath.filePath)
+                measures[METADATA_FILESIZE] = self._file_size(self._currentPath.filePath)
 
             if optKey in ('FULLNAME', 'DUPE'):
                 measures[METADATA_FULLNAME] = self._currentPath.fileName
@@ -475,3 +540,27 @@ def add_dir_list_to_measures(path, prefix, depth, measures):
         else:
             measures[prefix + str(dirNum)] = ''
 
+
+def update_path_metadata(filePath, numSameFiles, measures):
+    '''
+    Set the metadata in measures that comes from a file's path and folder,
+    for output replayed from a file with the same content (history.py);
+    only metadata already in measures is set
+    '''
+    path = utils.SurveyorPathParser(filePath)
+    if METADATA_FILENAME in measures:
+        measures[METADATA_FILENAME] = path.fileNameNoExt
+    if METADATA_FILETYPE in measures:
+        measures[METADATA_FILETYPE] = path.fileExt if path.fileExt else uistrings.NO_EXTENSION_NAME
+    dirDepth = sum(1 for name in measures if
+                   name.startswith(METADATA_DIR) and name[len(METADATA_DIR):].isdigit())
+    add_dir_list_to_measures(path, METADATA_DIR, dirDepth, measures)
+    if METADATA_DIRFILES in measures:
+        measures[METADATA_DIRFILES] = numSameFiles
+    if METADATA_DIRFILES_RANK in measures:
+        measures[METADATA_DIRFILES_RANK] = utils.match_ranking_label(
+                _BaseModule.SameFilesInFolderRanks, numSameFiles)
+    if METADATA_ABSPATH in measures:
+        measures[METADATA_ABSPATH] = os.path.abspath(filePath)
+    if METADATA_FULLNAME in measures:
+        measures[METADATA_FULLNAME] = path.fileName
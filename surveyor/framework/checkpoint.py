@@ -0,0 +1,198 @@
+#=============================================================================
+'''
+    Surveyor Job Checkpoints
+
+    A long job can save checkpoints as it goes (-j), so if it is stopped it
+    can be resumed (-jr) from the last checkpoint rather than started over.
+
+    Checkpoints are taken by the job's output thread between the packages
+    of output it hands to the application, so the output files hold rows
+    for exactly the files measured so far. Output files are flushed to disk,
+    and the checkpoint records:
+
+      - The last folder in walk order that it and every folder before it
+        has been fully measured; the walk is sorted and top-down, so this
+        one folder marks all of them
+      - Files measured in folders after that one; workers take files in
+        order of cost rather than walk order, so there are usually many
+      - The size of each output file, with what its writer needs to carry
+        on appending to it (e.g., delimited columns)
+      - Job and application counters, totals, errors, and dupe tracking,
+        so the summary at the end covers the whole job
+
+    On resume, folders up to the checkpoint are skipped without listing
+    folder trees that were finished (see folderwalk.py), files measured in
+    later folders are skipped as they are walked, and output files are cut
+    back to their checkpoint size, dropping rows written after it, before
+    the job carries on appending to them.
+
+    Checkpoints are written to a temp file that replaces the last one, so
+    a job stopped while saving one still has the one before. Once the job
+    finishes the checkpoint is removed.
+'''
+#=============================================================================
+# Copyright 2004-2012, Matt Peloquin and Construx. This file is part of Code
+# Surveyor, covered under GNU GPL v3 and is distributed WITHOUT ANY WARRANTY.
+#=============================================================================
+import os
+import time
+import pickle
+import threading
+import collections
+
+from framework import uistrings
+from framework import utils
+from framework import trace
+
+FILE_EXT = '.checkpoint'
+
+# Checkpoints saved by a different layout of this file aren't used
+CHECKPOINT_VERSION = 2
+
+
+class JobCheckpoint( object ):
+    '''
+    Saves and loads checkpoints for a job. jobKey identifies the job (its
+    paths and output) so a checkpoint is only resumed by the same job.
+    '''
+    def __init__(self, path, intervalMinutes, jobKey):
+        self.path = path
+        self._interval = intervalMinutes * 60
+        self._jobKey = jobKey
+        self._lastSaveTime = time.monotonic()
+
+        # State from the checkpoint being resumed, if any
+        self.resumeState = None
+
+        # Set once the checkpoint file holds this job's progress, i.e., it
+        # was loaded to resume or saved by this run; a file left by another
+        # run doesn't count
+        self.saved = False
+
+
+    def load(self):
+        '''
+        Load the checkpoint to resume from, which must have been saved by
+        this job
+        '''
+        try:
+            with open(self.path, 'rb') as checkpointFile:
+                version, jobKey, state = pickle.load(checkpointFile)
+        except FileNotFoundError:
+            raise utils.InputException(uistrings.STR_ErrorCheckpointMissing.format(self.path))
+        except Exception as e:
+            raise utils.InputException(uistrings.STR_ErrorCheckpointRead.format(self.path, str(e)))
+        if version != CHECKPOINT_VERSION or jobKey != self._jobKey:
+            raise utils.InputException(uistrings.STR_ErrorCheckpointMismatch.format(self.path))
+        self.resumeState = state
+        self.saved = True
+        trace.msg(1, "Loaded checkpoint: {0}".format(self.path))
+
+
+    def is_due(self):
+        return time.monotonic() - self._lastSaveTime >= self._interval
+
+
+    def save(self, state):
+        tempPath = self.path + '.tmp'
+        with open(tempPath, 'wb') as checkpointFile:
+            pickle.dump((CHECKPOINT_VERSION, self._jobKey, state),
+                        checkpointFile, pickle.HIGHEST_PROTOCOL)
+            checkpointFile.flush()
+            os.fsync(checkpointFile.fileno())
+        os.replace(tempPath, self.path)
+        self._lastSaveTime = time.monotonic()
+        self.saved = True
+
+
+    def remove(self):
+        self.saved = False
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class WalkProgress( object ):
+    '''
+    Tracks which folders from the walk have had all their files measured.
+    Folders and files are added by the job as they are walked, and files
+    are marked done on the output thread once the application has them.
+    Job counters from each folder are kept so a checkpoint can save them
+    as they were for the folders it marks as finished.
+    '''
+    class Folder( object ):
+        __slots__ = ('position', 'numOpen', 'walked', 'counters', 'doneFiles')
+        def __init__(self, position):
+            self.position = position
+            self.numOpen = 0
+            self.walked = False
+            self.counters = None
+            self.doneFiles = []
+
+    def __init__(self, resumeState=None):
+        self._lock = threading.Lock()
+        self._folders = collections.deque()
+        self._currentFolder = None
+        self._openFiles = {}
+
+        # Walk position and counters up to the last finished folder
+        self._finishedPosition = None
+        self._finishedCounters = collections.Counter()
+
+        # Files measured before the checkpoint being resumed
+        self._resumeDoneFiles = set()
+        if resumeState is not None:
+            self._finishedPosition = resumeState['position']
+            self._finishedCounters.update(resumeState['counters'])
+            self._resumeDoneFiles.update(resumeState['doneFiles'])
+
+    def start_folder(self, position):
+        with self._lock:
+            self._currentFolder = self.Folder(position)
+            self._folders.append(self._currentFolder)
+
+    def add_file(self, filePath):
+        '''
+        Returns False if the file was measured before the checkpoint being
+        resumed, so shouldn't be measured again
+        '''
+        with self._lock:
+            if filePath in self._resumeDoneFiles:
+                self._resumeDoneFiles.remove(filePath)
+                self._currentFolder.doneFiles.append(filePath)
+                return False
+            self._currentFolder.numOpen += 1
+            self._openFiles[filePath] = self._currentFolder
+            return True
+
+    def end_folder(self, counters):
+        with self._lock:
+            self._currentFolder.walked = True
+            self._currentFolder.counters = counters
+            self._advance()
+
+    def file_done(self, filePath):
+        with self._lock:
+            folder = self._openFiles.pop(filePath, None)
+            if folder is not None:
+                folder.numOpen -= 1
+                folder.doneFiles.append(filePath)
+                self._advance()
+
+    def state(self):
+        with self._lock:
+            doneFiles = list(self._resumeDoneFiles)
+            for folder in self._folders:
+                doneFiles.extend(folder.doneFiles)
+            return {
+                'position': self._finishedPosition,
+                'counters': dict(self._finishedCounters),
+                'doneFiles': doneFiles,
+                }
+
+    def _advance(self):
+        while self._folders and self._folders[0].walked and self._folders[0].numOpen == 0:
+            folder = self._folders.popleft()
+            self._finishedPosition = folder.position
+            self._finishedCounters.update(folder.counters)
@@ -0,0 +1,217 @@
+#=============================================================================
+'''
+    Surveyor File Chunks
+
+    A very large file would otherwise be measured by one worker while the
+    others sit idle. If every config entry for the file can measure it in
+    parts (csmodule can_survey_chunks), the job splits it into chunks that
+    workers survey in parallel. Once all chunks are in, the job sends a
+    finish item for the file, where the chunk results are merged into the
+    measures a single worker would have reported for the whole file.
+
+    Chunks are byte ranges of the file, with each end moved to just after
+    a newline so chunks hold whole lines. Workers read and survey their
+    chunk in segments of about SEGMENT_BYTES, and decode each segment as
+    the file would be read in text mode. Only files read as ascii or UTF-8
+    are surveyed in chunks, since a newline byte can't be part of another
+    character in them.
+
+    How a line is counted can depend on the lines before it, e.g., if it
+    is inside a multi-line comment or a block of machine code. A worker
+    doesn't know that state at the start of its chunk, so it guesses, and
+    records the state each segment started and ended in. Merging goes
+    through the segments in file order; a segment that started in the
+    wrong state is read again and surveyed from the right one, until a
+    segment ends in the state the next segment started in. Results from
+    there on are the same as surveying the file from the start, so when
+    guesses are right or a wrong guess is soon corrected (a comment closes)
+    little is surveyed twice.
+
+    Anything that stops a worker from surveying a chunk leaves it without
+    results, and the file is measured whole when it is finished, e.g., if
+    the file isn't ascii or UTF-8, or was changed while it was measured.
+'''
+#=============================================================================
+# Copyright 2004-2012, Matt Peloquin and Construx. This file is part of Code
+# Surveyor, covered under GNU GPL v3 and is distributed WITHOUT ANY WARRANTY.
+#=============================================================================
+import io
+import os
+import codecs
+
+# Files of at least this size are measured in chunks by default
+DEFAULT_CHUNK_FILE_MB = 64
+
+# Chunks are no smaller than this, however many workers there are
+MIN_CHUNK_BYTES = 4 * 1024 * 1024
+
+# Size of the segments chunks are surveyed in, which is also the most
+# that is surveyed again at a time when merging
+SEGMENT_BYTES = 1024 * 1024
+
+# Bytes from the start of the file surveyed to guess the state a chunk
+# starts in, enough for the header comments that mark generated files
+START_STATE_BYTES = 64 * 1024
+
+# Encodings a file can be read in chunks with
+ChunkEncodings = ('ascii', 'utf-8', 'utf-8-sig')
+
+
+class FileChunk( object ):
+    '''
+    Sent in the work item for a chunk; fileKey identifies the file to the
+    job, and start and end are byte offsets before they are moved to the
+    start of a line
+    '''
+    __slots__ = ('fileKey', 'num', 'start', 'end')
+
+    def __init__(self, fileKey, num, start, end):
+        self.fileKey = fileKey
+        self.num = num
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return "FileChunk({0}, {1}, {2}, {3})".format(self.fileKey, self.num, self.start, self.end)
+
+
+class ChunkedFile( object ):
+    '''
+    Used by the job to split a file into chunks and collect results for
+    them, and sent in the finish item for the file once all are in
+    '''
+    def __init__(self, fileKey, fileSize, numWorkers):
+        self.fileSize = fileSize
+        numChunks = max(2, min(numWorkers, fileSize // MIN_CHUNK_BYTES))
+        chunkSize = -(-fileSize // numChunks)
+        self.chunks = [
+                FileChunk(fileKey, num, num * chunkSize, min(fileSize, (num + 1) * chunkSize))
+                for num in range(numChunks) ]
+        self._results = [None] * numChunks
+        self._numReceived = 0
+
+    def add_results(self, chunkNum, results):
+        '''
+        Results for a chunk are (encoding, segments for each config entry),
+        or None if the worker couldn't survey it. Returns True once all the
+        chunks are in.
+        '''
+        self._results[chunkNum] = results
+        self._numReceived += 1
+        return self._numReceived == len(self.chunks)
+
+    def file_lines(self, entryIndex, fileObject):
+        '''
+        Called by the worker finishing the file with the file object opened
+        for the config entry at entryIndex. Returns ChunkedLines for the
+        csmodule to merge, or fileObject to measure the file whole if the
+        chunks can't be used.
+        '''
+        if fileObject is None or None in self._results:
+            return fileObject
+        reader = ChunkReader(fileObject)
+        if reader.encoding is None or reader.file_size() != self.fileSize:
+            return fileObject
+        segments = []
+        for encoding, entrySegments in self._results:
+            if encoding != reader.encoding:
+                return fileObject
+            segments.extend(entrySegments[entryIndex])
+        position = 0
+        for segment in segments:
+            if segment[0] != position:
+                return fileObject
+            position = segment[1]
+        if position != self.fileSize:
+            return fileObject
+        return ChunkedLines(reader, segments)
+
+
+class ChunkedLines( object ):
+    '''
+    Given to a csmodule in place of the file's lines to merge chunks.
+    segments holds the results of each segment in file order, as
+    (start, end, ...) with what the csmodule returned for it. Lines for
+    a segment can be read again to survey it from another state.
+    '''
+    def __init__(self, reader, segments):
+        self.segments = segments
+        self._reader = reader
+
+    def read_lines(self, start, end):
+        return self._reader.read_lines(start, end)
+
+
+class ChunkReader( object ):
+    '''
+    Reads lines from byte ranges of a file opened by utils.open_chardet.
+    encoding is None if the file can't be read in chunks.
+    '''
+    def __init__(self, fileObject):
+        self._file = getattr(fileObject, 'buffer', None)
+        self.encoding = None
+        encoding = getattr(fileObject, 'encoding', None)
+        if self._file is not None and encoding is not None:
+            encoding = codecs.lookup(encoding).name
+            if encoding in ChunkEncodings:
+                self.encoding = encoding
+
+    def file_size(self):
+        return os.fstat(self._file.fileno()).st_size
+
+    def segments(self, start, end):
+        '''
+        Generator of (start, end, lines) for segments of the lines that
+        start from byte offsets start up to end
+        '''
+        start = self.line_start(start)
+        end = self.line_start(end)
+        self._file.seek(start)
+        position = start
+        segmentStart = start
+        pending = b''
+        while position < end:
+            data = self._file.read(min(SEGMENT_BYTES, end - position))
+            if not data:
+                break
+            position += len(data)
+            pending += data
+            segmentEnd = pending.rfind(b'\n') + 1 if position < end else len(pending)
+            if segmentEnd:
+                yield (segmentStart, segmentStart + segmentEnd,
+                        self._decode(pending[:segmentEnd], segmentStart))
+                segmentStart += segmentEnd
+                pending = pending[segmentEnd:]
+        if pending:
+            yield segmentStart, segmentStart + len(pending), self._decode(pending, segmentStart)
+
+    def read_lines(self, start, end):
+        self._file.seek(start)
+        return self._decode(self._file.read(end - start), start)
+
+    def line_start(self, offset):
+        '''
+        Offset of the first line that starts at or after offset
+        '''
+        if offset <= 0:
+            return 0
+        self._file.seek(offset - 1)
+        position = offset - 1
+        while True:
+            data = self._file.read(SEGMENT_BYTES)
+            if not data:
+                return position
+            newline = data.find(b'\n')
+            if newline >= 0:
+                return position + newline + 1
+            position += len(data)
+
+    def _decode(self, data, start):
+        '''
+        Lines as text mode reads them, with universal newlines; a byte
+        order mark is only dropped from the start of the file
+        '''
+        encoding = self.encoding
+        if encoding == 'utf-8-sig' and start > 0:
+            encoding = 'utf-8'
+        return io.TextIOWrapper(io.BytesIO(data), encoding=encoding, errors="surrogateescape").readlines()
@@ -12,15 +12,21 @@
 import os
 import sys
 import locale
+import traceback
 import multiprocessing
 from numbers import Number
 
 from framework import job
 from framework import writer
+from framework import writerproc
+from framework import shards
 from framework import filetype
 from framework import basemodule
 from framework import configstack
 from framework import cmdlineargs
+from framework import aggregates
+from framework import checkpoint
+from framework import history
 from framework import utils
 from framework import trace
 from framework.uistrings import *
@@ -31,8 +37,36 @@ from framework.uistrings import *
 
 
 # Factory method for running a Surveyor job
-def run_job(cmdArgs, outputStream, printWidth=None):
-    return SurveyorCmdLine().run(cmdArgs, outputStream, printWidth)
+# A process running many jobs can give workerpool.ResidentJobs it keeps
+def run_job(cmdArgs, outputStream, printWidth=None, residentJobs=None):
+    return SurveyorCmdLine(residentJobs).run(cmdArgs, outputStream, printWidth)
+
+
+# Exit status returned to the shell
+SHELL_SUCCESS = 0
+SHELL_FAILURE = 1
+
+def run_from_shell(cmdArgs, outputStream, printWidth=None, residentJobs=None):
+    '''
+    Run a Surveyor job for a shell command, returning the exit status
+    Used both by surveyor.py and by the daemon (daemon.py) for its clients
+    '''
+    result = SHELL_FAILURE
+    try:
+        if run_job(cmdArgs, outputStream, printWidth, residentJobs):
+            result = SHELL_SUCCESS
+    except:
+        print("\nA system error occurred while running Surveyor:\n")
+        traceback.print_exc()
+    finally:
+        # We should not have child processes alive at this point, other
+        # than workers kept for the next job, but in case there was a
+        # problem, kill them to prevent hangs
+        for child in multiprocessing.active_children():
+            if residentJobs is None or not residentJobs.keeps(child):
+                child.terminate()
+                print("BAD EXIT -- {0} active".format(child.name))
+    return result
 
 
 # Default values for application display
@@ -42,6 +76,9 @@ CONSOLE_OUT_WIDTH = 78
 MAX_ERRORS_TO_DISPLAY = 15
 MAX_ERRORS_DEBUG = 200
 
+# Aggregate rows passed to the writer at a time
+AGGREGATE_WRITE_BATCH = 10000
+
 
 class SurveyorCmdLine( object ):
     '''
@@ -54,6 +91,7 @@ class SurveyorCmdLine( object ):
     # The following lists have dependencies on csmodule defined names, to provide
     # convienence for display and writing of key output
     ItemColumnOrder = [
+            'commit.num', 'commit.id', 'commit.date', 'commit.files',
             'dir1', 'dir2', 'dir3', 'dir4', 'dir5', 'dir6', 'dir7',
             'fileName',
             'fileType',
@@ -84,16 +122,23 @@ class SurveyorCmdLine( object ):
             'file.fullName',
             'fileAbsPath',
             ]
-    SummaryPrefixToExclude = set(['dir', 'fileName'])
+    SummaryPrefixToExclude = set(['dir', 'fileName', 'commit'])
     SummaryToInclude = set([
             'fileType', 'file.nbnc', 'file.comment', 'file.machine', 'dupe.nbnc', 'file.bytes',
             'file.content', 'file.dead', 'routine.complexity', 'search.total'])
+    HistoryTotalsToExclude = set([
+            'commit.num', 'commit.files', 'dir.files' ])
     DupeMeasureOutput = set([
             'fileType', 'fileName', 'fileAbsPath', 'dir', 'tag', 'nbnc.crc',
             'dupe.nbnc', 'dupe.fileName', 'dupe.firstPath', 'dupe.dir' ])
 
+    # Application state saved with job checkpoints, along with the writer's
+    CheckpointState = [
+            '_totals', '_numFilesMeasured', '_numFilesProcessed', '_numMeasures',
+            '_errorList', '_dupeFileSurveys' ]
+
 
-    def __init__(self):
+    def __init__(self, residentJobs=None):
         utils.timing_start()
         utils.timing_set('LAST_DISPLAY_TIME')
 
@@ -104,7 +149,9 @@ class SurveyorCmdLine( object ):
         #self.set_tracing(2, modes=[])
 
         # Objects we will create and delegate to
+        self._residentJobs = residentJobs
         self._args = None
+        self._configStack = None
         self._job = None
         self._writer = None
         self._out = None
@@ -118,12 +165,20 @@ class SurveyorCmdLine( object ):
         self._outFileName = DEFAULT_OUT_FILE
         self._outFileDir = utils.CURRENT_FOLDER
         self._outFileOverride = False
+        self._outProcess = False
+        self._outShards = False
 
         self._dupeTracking = False
         self._dupeThreshold = 0
         self._aggregateNames = {}
         self._aggregateThresholdKey = None
         self._aggregateThreshold = 1
+        self._aggregateMemoryMB = aggregates.DEFAULT_MEMORY_MB
+
+        self._checkpointMinutes = None
+        self._checkpointResume = False
+
+        self._historyTotals = False
 
         self._summaryOnly = False
         self._printMaxWidth = CONSOLE_OUT_WIDTH
@@ -140,8 +195,9 @@ class SurveyorCmdLine( object ):
         self._profileNameFilter = ''
 
         # Other internal state
-        self._aggregates = {}
+        self._aggregates = None
         self._dupeFileSurveys = {}
+        self._historyCommitTotals = {}
 
         self._totals = {}
         self._lastDisplayLen = 0
@@ -204,8 +260,17 @@ class SurveyorCmdLine( object ):
     def _execute_job(self):
         self._setup_job()
         self._initialize_output()
+        if self._checkpointResume:
+            self._resume_checkpoint(self._jobOpt.checkpoint.resumeState['app'])
         self._job.run()
         self._write_aggregates()
+        self._write_history_totals()
+
+        # Close output here, so errors finishing it (e.g., in a writer
+        # process) are handled like any other job error
+        self._writer.close_files()
+        if self._jobOpt.checkpoint is not None:
+            self._jobOpt.checkpoint.remove()
 
 
     def _parse_command_line(self, cmdArgs):
@@ -214,6 +279,8 @@ class SurveyorCmdLine( object ):
         helpText = None
         try:
             helpText = self._args.parse_args()
+            if helpText is None:
+                self._setup_checkpoint()
         except KeyboardInterrupt:
             self._keyboardInterrupt()
         except Exception as e:
@@ -236,16 +303,66 @@ class SurveyorCmdLine( object ):
         Creates the ConfigStack and Job objects for this job
         Assummes internal state already set by command line parsing
         '''
-        configStack = configstack.ConfigStack(
+        self._configStack = configstack.ConfigStack(
                 self._args.configCustom,
                 self._args.configOverrides,
-                self._args.config_option_list()
+                self._args.config_option_list(),
+                self._args.checkRegexes,
+                self._args.configCachePath,
+                self._residentJobs and self._residentJobs.configs
                 )
         self._job = job.Job(
-                configStack,
+                self._configStack,
                 self._jobOpt,
                 self.file_measured_callback,
-                self.status_callback)
+                self.status_callback,
+                self.checkpoint_callback,
+                self._residentJobs and self._residentJobs.job_pool(self._jobOpt))
+        if self._aggregateNames:
+            self._aggregates = aggregates.Aggregates(
+                    self._aggregateMemoryMB, self._outFileDir)
+
+
+    def _setup_checkpoint(self):
+        '''
+        Checkpoints are kept next to the default output file, and are only
+        resumed by a job with the same output, and paths given the same way
+        since files measured are tracked by path.
+        A job that isn't resuming removes any checkpoint left by an earlier
+        run, so it can't be mistaken for one of this job's
+        '''
+        if self._checkpointMinutes is None:
+            return
+        if (self._outFileName is None or self._outShards or
+                self._aggregateNames or self._jobOpt.configInfoOnly or
+                self._jobOpt.historyRange is not None):
+            raise utils.InputException(STR_ErrorCheckpointOptions)
+        jobKey = (
+            [(path, os.path.abspath(path)) for path in self._jobOpt.pathsToMeasure],
+            self._jobOpt.deltaPath and os.path.abspath(self._jobOpt.deltaPath),
+            self._jobOpt.deltaRevs,
+            self._outType,
+            os.path.abspath(os.path.join(self._outFileDir, self._outFileName)))
+        self._jobOpt.checkpoint = checkpoint.JobCheckpoint(
+                os.path.abspath(os.path.join(self._outFileDir,
+                                    self._outFileName + checkpoint.FILE_EXT)),
+                self._checkpointMinutes, jobKey)
+        if self._checkpointResume:
+            self._jobOpt.checkpoint.load()
+        else:
+            self._jobOpt.checkpoint.remove()
+
+
+    def _checkpoint_saved(self):
+        return self._jobOpt.checkpoint is not None and self._jobOpt.checkpoint.saved
+
+    def _resume_checkpoint(self, appState):
+        '''
+        Pick up output files and totals as they were at the checkpoint
+        '''
+        self._writer.resume(appState['files'])
+        for name in self.CheckpointState:
+            setattr(self, name, appState[name])
 
 
     def _initialize_output(self):
@@ -266,21 +383,60 @@ class SurveyorCmdLine( object ):
             CMDARG_OUTPUT_TYPE_TAB:  '\t',
             CMDARG_OUTPUT_TYPE_PARA: '\xB6',
             CMDARG_OUTPUT_TYPE_XML:  'xml',
+            CMDARG_OUTPUT_TYPE_COLUMNAR: 'columnar',
+            CMDARG_OUTPUT_TYPE_COLUMNAR_ZLIB: 'columnar-zlib',
             }
-        self._writer = writer.get_writer(
-                typeLookup[self._outType], self.status_callback,
-                self._outFileDir, self._outFileName, self._outFileOverride,
-                self.ItemColumnOrder)
+        typeStr = typeLookup[self._outType]
+        if self._use_output_shards(typeStr):
+            # Workers are started as the job runs, so they pick up the shards
+            # from the job options; the summary and aggregates need analysis
+            # results, so workers still send them in those cases
+            self._writer = shards.ShardMerger(
+                    typeStr, self.status_callback,
+                    self._outFileDir, self._outFileName, self._outFileOverride,
+                    self.ItemColumnOrder,
+                    bool(self._aggregateNames) or self._detailed or trace.level() > 1)
+            self._jobOpt.outputShards = self._writer.spec
+        else:
+            get_writer = writer.get_writer
+            if self._outProcess and self._outFileName is not None:
+                get_writer = writerproc.WriterProcess
+            self._writer = get_writer(
+                    typeStr, self.status_callback,
+                    self._outFileDir, self._outFileName, self._outFileOverride,
+                    self.ItemColumnOrder)
         if self._writer.using_console():
             self._quiet = True
 
 
+    def _use_output_shards(self, typeStr):
+        '''
+        Shards aren't used for console output, when rows depend on the
+        order the application sees files in (dupe filtering), or for history
+        measures, where the job replays rows for files it didn't send
+        '''
+        return (self._outShards and
+                self._outFileName is not None and
+                not self._summaryOnly and
+                not self._dupeTracking and
+                self._jobOpt.historyRange is None and
+                shards.supports_type(typeStr))
+
+
     def _cleanup(self):
         if self._writer is not None:
+            if self._checkpoint_saved():
+                self._writer.keep_for_resume()
             self._writer.close_files()
+        if self._aggregates is not None:
+            self._aggregates.close()
+        if self._configStack is not None:
+            self._configStack.close()
         self._display_profile_info()
         if self._keyboardInterrupt is not None:
             self._print(STR_UserInterrupt)
+            if self._checkpoint_saved():
+                self._print(STR_CheckpointSaved.format(self._jobOpt.checkpoint.path))
         if self._finalException is not None:
             import traceback
             # We don't use our tracing or print output here
@@ -311,11 +467,15 @@ class SurveyorCmdLine( object ):
                 if self._dupeTracking:
                     self._filter_dupes(filePath, measures, analysisResults)
 
-                # Send results to metrics writer
+                # Send results to metrics writer, unless workers have
+                # written them to output shards
                 fileMeasured = True
                 self._numMeasures += max(1, len(analysisResults))
-                if not self._summaryOnly:
-                    self._writer.write_items(measures, analysisResults)
+                if not self._summaryOnly and self._jobOpt.outputShards is None:
+                    if self._historyTotals:
+                        self._add_history_totals(measures)
+                    else:
+                        self._writer.write_items(measures, analysisResults)
 
                 # Capture summary metrics and aggregates
                 self._stash_summary_metrics(filePath, measures, analysisResults)
@@ -339,6 +499,17 @@ class SurveyorCmdLine( object ):
                 self._print_clear(self._format_progress_message(line + "\n"))
 
 
+    def checkpoint_callback(self):
+        '''
+        Job callback for the application state to save with a checkpoint
+        Called on the out thread between calls to file_measured_callback,
+        so our state and output match the files measured so far
+        '''
+        appState = dict((name, getattr(self, name)) for name in self.CheckpointState)
+        appState['files'] = self._writer.checkpoint()
+        return appState
+
+
     #-------------------------------------------------------------------------
     #  Metrics Results
 
@@ -500,7 +671,6 @@ class SurveyorCmdLine( object ):
         # For each set of aggregates we go through results and add
         # them to the appropriate aggregate set
         for aggKey, aggNames in self._aggregateNames.items():
-            aggregateDict = self._aggregates.setdefault(aggKey, {})
             trace.file(2, "Aggregating {0} items in {1}".format(len(analysisResults), aggKey))
             for result in analysisResults:
                 # aggKey has the name for the value from results that we
@@ -510,8 +680,6 @@ class SurveyorCmdLine( object ):
                 except KeyError as e:
                     raise utils.InputException(STR_AggregateKeyError.format(str(e)))
                 else:
-                    aggregate = aggregateDict.setdefault(newKey, {'aggregate.count':0})
-
                     # Sepcific names can be provided to aggregate, or can do all
                     namesToAggregate = aggNames
                     if isinstance(aggNames, str):
@@ -519,61 +687,22 @@ class SurveyorCmdLine( object ):
                             namesToAggregate = list(result.keys())
 
                     # Take each value from the result and aggregate according to type
-                    for itemName in namesToAggregate:
-                        self._aggregate_update(itemName, result[itemName], aggregate)
-
-                    # Count the item
-                    aggregate['aggregate.count'] += 1
-
-                    # Update the aggregate
-                    aggregateDict[newKey] = aggregate
-
-            # The dictionary for this aggKey has been updated, so stash it
-            self._aggregates[aggKey] = aggregateDict
-
-
-    def _aggregate_update(self, itemName, item, aggregate):
-        '''
-        Updates an aggreate dictionary in place, based on type of newItem
-        '''
-        # Numbers are added
-        if isinstance(item, Number):
-            currentValue = aggregate.get(itemName, 0)
-            try:
-                aggregate[itemName] = currentValue + item
-            except TypeError:
-                # If a number and string are confused, treat as a string
-                aggregate[itemName] = str(item)
-
-        # Lists are extended
-        elif isinstance(item, list):
-            currentList = aggregate.get(itemName, [])
-            currentList.extend(item)
-            aggregate[itemName] = currentList
-
-        # Dicts are opened and updated recursively
-        elif isinstance(item, dict):
-            currentDict = aggregate.get(itemName, {})
-            for key, value in item.items():
-                self._aggregate_update(key, value, currentDict)
-            aggregate[itemName] = currentDict
-
-        # Otherwise we overwrite as string
-        else:
-            aggregate[itemName] = str(item)
+                    self._aggregates.update(aggKey, newKey, result, namesToAggregate)
 
 
     def _write_aggregates(self):
         '''
         For each set of aggregates, we create an output file with aggregates
         that exceed threshold.
+        Aggregates may have been spilled to disk, so rows are handed to the
+        writer in batches rather than all at once.
         HACK - We use the output writer by creating a dummy OUT file tag
         '''
         for keyName in list(self._aggregateNames.keys()):
             fileName = str(keyName).replace('.', '')
-            hackOutTagMeasure = {'tag_write_aggregates': 'OUT:' + fileName}
             analysisRows = []
-            for valueRow in list(self._aggregates[keyName].values()):
+            rowsWritten = False
+            for valueRow in self._aggregates.rows(keyName):
                 writeRow = self._aggregateThresholdKey is None
                 if not writeRow:
                     try:
@@ -582,8 +711,51 @@ class SurveyorCmdLine( object ):
                         raise utils.InputException(STR_AggregateThresholdKeyError.format(str(e)))
                 if writeRow:
                     analysisRows.append(valueRow)
-            trace.msg(1, "Aggregate: {0}".format(analysisRows))
-            self._writer.write_items(hackOutTagMeasure, analysisRows)
+                    if len(analysisRows) >= AGGREGATE_WRITE_BATCH:
+                        self._write_aggregate_rows(fileName, analysisRows)
+                        analysisRows = []
+                        rowsWritten = True
+            if analysisRows or not rowsWritten:
+                self._write_aggregate_rows(fileName, analysisRows)
+
+
+    def _write_aggregate_rows(self, fileName, analysisRows):
+        # The writer removes the tag from the measures it is passed
+        hackOutTagMeasure = {'tag_write_aggregates': 'OUT:' + fileName}
+        trace.msg(1, "Aggregate: {0}".format(analysisRows))
+        self._writer.write_items(hackOutTagMeasure, analysisRows)
+
+
+    def _add_history_totals(self, measures):
+        '''
+        For history totals (-lt), sum numeric measures by commit, in place
+        of writing rows for each file
+        '''
+        commitNum = measures[history.COMMIT_NUM]
+        commitTotals = self._historyCommitTotals.get(commitNum)
+        if commitTotals is None:
+            commitTotals = self._historyCommitTotals[commitNum] = {
+                    history.COMMIT_NUM: commitNum,
+                    history.COMMIT_ID: measures[history.COMMIT_ID],
+                    history.COMMIT_DATE: measures[history.COMMIT_DATE],
+                    history.COMMIT_FILES: 0 }
+        commitTotals[history.COMMIT_FILES] += 1
+        for measureName, measure in measures.items():
+            if isinstance(measure, Number) and measureName not in self.HistoryTotalsToExclude:
+                commitTotals[measureName] = commitTotals.get(measureName, 0) + measure
+
+    def _write_history_totals(self):
+        '''
+        Rows of totals in commit order, all with the same measures
+        '''
+        measureNames = set()
+        for commitTotals in self._historyCommitTotals.values():
+            measureNames.update(commitTotals)
+        for commitNum in sorted(self._historyCommitTotals):
+            commitTotals = self._historyCommitTotals[commitNum]
+            for measureName in measureNames:
+                commitTotals.setdefault(measureName, 0)
+            self._writer.write_items(commitTotals, [])
 
 
     #-------------------------------------------------------------------------
@@ -653,6 +825,16 @@ class SurveyorCmdLine( object ):
                     [os.path.abspath(path) for path in self._jobOpt.pathsToMeasure])))
         if self._jobOpt.deltaPath is not None:
             self._print(STR_DeltaFolder.format(os.path.abspath(self._jobOpt.deltaPath)))
+        if self._jobOpt.deltaRevs is not None:
+            self._print(STR_DeltaRevisions.format(*self._jobOpt.deltaRevs))
+        if self._jobOpt.historyRange is not None:
+            self._print(STR_HistoryRevisions.format(self._jobOpt.historyRange))
+        if self._jobOpt.measureCachePath is not None:
+            self._print(STR_MeasureCache.format(self._jobOpt.measureCachePath))
+        if self._args.configCachePath is not None:
+            self._print(STR_ConfigCache.format(self._args.configCachePath))
+        if self._checkpointResume:
+            self._print(STR_CheckpointResume.format(self._jobOpt.checkpoint.path))
         if self._jobOpt.fileFilters:
             self._print(STR_FileFilter.format(self._jobOpt.fileFilters))
         if self._jobOpt.skipFolders:
@@ -749,7 +931,7 @@ class SurveyorCmdLine( object ):
             self._print(STR_SummaryLargeFile.format(self._args.ignoreSize))
         if self._args.ignoreBinary:
             self._print(STR_SummaryBinaryFile)
-        if self._jobOpt.deltaPath is not None:
+        if self._jobOpt.deltaPath is not None or self._jobOpt.deltaRevs is not None:
             self._print(STR_SummaryDeltaFile)
         # Display sorted measurement results
         # We display the measurements in alphabetical order
@@ -766,6 +948,17 @@ class SurveyorCmdLine( object ):
         # Note total number of dupes if present
         if self._dupeFileSurveys:
             self._print(STR_TotalDupes.format(*self._get_dupe_counts()))
+        # How well the folder walk and workers kept up with each other
+        if self._detailed and self._job is not None:
+            self._print(STR_SummaryWorkFlow.format(
+                    self._job.walkStallSeconds, self._job.workerIdleSeconds))
+        # Time reading config files, and how often the config cache saved it
+        if self._detailed and self._configStack is not None:
+            if self._args.configCachePath is not None or self._residentJobs is not None:
+                self._print(STR_SummaryConfigCache.format(self._configStack.loadSeconds,
+                        self._configStack.cacheHits, self._configStack.cacheMisses))
+            else:
+                self._print(STR_SummaryConfigLoad.format(self._configStack.loadSeconds))
         # Job run time
         if not self._quiet:
             self._print(STR_SummaryRunTime.format(utils.timing_elapsed()))
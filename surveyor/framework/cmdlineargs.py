@@ -12,6 +12,8 @@
 #=============================================================================
 import os
 import sys
+from framework import archivesource
+from framework import gitsource
 from framework import utils
 from framework import trace
 from framework.uistrings import *
@@ -31,9 +33,16 @@ DefaultMetadata = {
 # Default maximum file size to ignore with max size option
 IGNORE_SIZE_DEFAULT = 5000000
 
+# Default minutes between job checkpoints
+CHECKPOINT_MINUTES_DEFAULT = 5
+
 # Put max limits on things that don't strictly need limits,
 # but which can be silly if left unchecked
 MAX_WORKERS = 1024
+MAX_QUEUE_LIMIT = 1000000
+MAX_FILE_TIME_BUDGET = 1000000
+MAX_FILE_CHUNK_MB = 1000000
+MAX_CHECKPOINT_MINUTES = 1000000
 MAX_PATH_DEPTH = 128
 
 # Used with the -a option (skips binary files)
@@ -62,6 +71,8 @@ class SurveyorCmdLineArgs( object ):
         # Config options we need to provide back to the application
         self.configCustom = None
         self.configOverrides = []
+        self.checkRegexes = False
+        self.configCachePath = None
         self.ignoreSize = 0
         self.ignoreBinary = False
 
@@ -119,6 +130,8 @@ class SurveyorCmdLineArgs( object ):
                 # Delta path
                 elif fc in CMDARG_DELTA:
                     self._parse_delta_options()
+                elif fc in CMDARG_HISTORY:
+                    self._parse_history_options()
 
                 # Duplicate processing
                 # We can have an optional integer or string after this option
@@ -164,18 +177,27 @@ class SurveyorCmdLineArgs( object ):
 
                 # Other options
                 elif fc in CMDARG_NUM_WORKERS:
-                    self._app._jobOpt.numWorkers = self._get_next_int(validRange=range(1,MAX_WORKERS))
+                    self._parse_worker_options()
                 elif fc in CMDARG_RECURSION:
                     self._app._jobOpt.recursive = False
                 elif fc in CMDARG_BREAK_ERROR:
                     self._app._jobOpt.breakOnError = True
                 elif fc in CMDARG_AGGREGATES:
                     self._parse_aggregate_options()
+                elif fc in CMDARG_MEASURE_CACHE:
+                    self._parse_measure_cache_options()
+                elif fc in CMDARG_CHECKPOINT:
+                    self._parse_checkpoint_options()
 
                 # Help/invalid parameter request
                 else:
                     return self._parse_help_options()
 
+            if self._app._jobOpt.historyRange is not None and (
+                    self._app._jobOpt.deltaPath is not None or
+                    self._app._jobOpt.deltaRevs is not None):
+                raise utils.InputException(STR_ErrorHistoryOptions)
+
             # Setup the default measurement path if not provided
             if not self._app._jobOpt.pathsToMeasure:
                 self._app._jobOpt.pathsToMeasure.append(utils.CURRENT_FOLDER)
@@ -222,12 +244,12 @@ class SurveyorCmdLineArgs( object ):
         '''
         Ensure the path we've been asked to measure is a valid directory and
         seperate the path from any file filters that was provided
-        If an entry is a valid directory, we'll treat it as a request to
-        measure the folder; if not, we'll treat as a file filter
+        If an entry is a valid directory or archive, we'll treat it as a
+        request to measure the folder; if not, we'll treat as a file filter
         '''
         cmdLinePath = self.args.get_current()
         measurePath = cmdLinePath.rstrip('\\/')
-        if not os.path.isdir(measurePath):
+        if not os.path.isdir(measurePath) and archivesource.archive_format(measurePath) is None:
             filterList = measurePath.split(CMDLINE_SEPARATOR)
             requestedPath = None
             for filterItem in filterList:
@@ -247,7 +269,16 @@ class SurveyorCmdLineArgs( object ):
     def _parse_output_file(self):
         '''
         Is stdout, a dir, or a file being requested for output redirection?
+        Or is output being written from a separate process, or by workers?
         '''
+        if len(self.args.get_current()) > 2:
+            outputOpt = self.args.get_current()[2].lower()
+            if outputOpt in CMDARG_OUTPUT_PROCESS:
+                self._app._outProcess = True
+                return
+            elif outputOpt in CMDARG_OUTPUT_SHARDS:
+                self._app._outShards = True
+                return
         outArg = self._get_next_str()
         if os.path.isdir(outArg):
             self._app._outFileDir = outArg
@@ -267,6 +298,11 @@ class SurveyorCmdLineArgs( object ):
             if configOpt in CMDARG_CONFIG_INFO:
                 self._app._jobOpt.configInfoOnly = True
                 self.configCustom = self._get_next_str(optional=True, default=self.configCustom)
+            elif configOpt in CMDARG_CONFIG_REGEX_CHECK:
+                self.checkRegexes = True
+            elif configOpt in CMDARG_CONFIG_CACHE:
+                self.configCachePath = os.path.abspath(
+                        self._get_next_str(optional=True, default=DEFAULT_CONFIG_CACHE_FILE))
             # Allow config file entry to be entered on command line
             elif configOpt in CMDARG_CONFIG_CUSTOM:
                 self.args.move_next()
@@ -281,11 +317,24 @@ class SurveyorCmdLineArgs( object ):
             configOpt = self.args.get_current()[2].lower()
             if configOpt in CMDARG_DELTA_DELETE:
                 self._inclDeleted = True
+            elif configOpt in CMDARG_DELTA_GIT:
+                self._app._jobOpt.deltaPath = None
+                self._app._jobOpt.deltaRevs = gitsource.parse_revisions(self._get_next_str())
+                return
+        self._app._jobOpt.deltaRevs = None
         self._app._jobOpt.deltaPath = self._get_next_str()
         if not os.path.isdir(self._app._jobOpt.deltaPath):
             raise utils.OutputException(STR_ErrorBadPath.format(self._app._jobOpt.deltaPath))
 
 
+    def _parse_history_options(self):
+        historyOpt = None
+        if len(self.args.get_current()) > 2:
+            historyOpt = self.args.get_current()[2].lower()
+        self._app._historyTotals = (historyOpt == CMDARG_HISTORY_TOTALS)
+        self._app._jobOpt.historyRange = self._get_next_str()
+
+
     def _parse_help_options(self):
         '''
         Decide what to display for help text
@@ -384,11 +433,64 @@ class SurveyorCmdLineArgs( object ):
                 self._app._ignoreNonCode = True
 
 
+    def _parse_worker_options(self):
+        '''
+        Number of workers, limits on the work queued ahead of them, the
+        seconds a worker can spend measuring a file, or the size of file
+        that is split across them
+        '''
+        workerOpt = None
+        if len(self.args.get_current()) > 2:
+            workerOpt = self.args.get_current()[2].lower()
+        if workerOpt == CMDARG_WORK_QUEUE_LIMIT:
+            self._app._jobOpt.maxQueuedPackages = self._get_next_int(validRange=range(1,MAX_QUEUE_LIMIT))
+            self._app._jobOpt.maxQueuedMB = self._get_next_int(optional=True,
+                    default=self._app._jobOpt.maxQueuedMB, validRange=range(1,MAX_QUEUE_LIMIT))
+        elif workerOpt == CMDARG_FILE_TIME_BUDGET:
+            self._app._jobOpt.fileTimeBudget = self._get_next_int(validRange=range(1,MAX_FILE_TIME_BUDGET))
+        elif workerOpt == CMDARG_FILE_CHUNKS:
+            self._app._jobOpt.fileChunkMB = self._get_next_int(validRange=range(0,MAX_FILE_CHUNK_MB))
+        else:
+            self._app._jobOpt.numWorkers = self._get_next_int(validRange=range(1,MAX_WORKERS))
+
+
+    def _parse_measure_cache_options(self):
+        '''
+        Use, rebuild, or bypass the measure cache
+        '''
+        cacheOpt = None
+        if len(self.args.get_current()) > 2:
+            cacheOpt = self.args.get_current()[2].lower()
+        if cacheOpt == CMDARG_MEASURE_CACHE_BYPASS:
+            self._app._jobOpt.measureCachePath = None
+            self._app._jobOpt.measureCacheRebuild = False
+        else:
+            self._app._jobOpt.measureCachePath = os.path.abspath(
+                    self._get_next_str(optional=True, default=DEFAULT_CACHE_FILE))
+            self._app._jobOpt.measureCacheRebuild = (cacheOpt == CMDARG_MEASURE_CACHE_REBUILD)
+
+
+    def _parse_checkpoint_options(self):
+        '''
+        Save checkpoints every so many minutes, and resume from the last one
+        '''
+        checkpointOpt = None
+        if len(self.args.get_current()) > 2:
+            checkpointOpt = self.args.get_current()[2].lower()
+        self._app._checkpointResume = (checkpointOpt == CMDARG_CHECKPOINT_RESUME)
+        self._app._checkpointMinutes = self._get_next_int(optional=True,
+                default=CHECKPOINT_MINUTES_DEFAULT, validRange=range(1,MAX_CHECKPOINT_MINUTES))
+
+
     def _parse_aggregate_options(self):
         '''
         Aggregate key and values are required
         There is also an optional threshold for writing the values
+        The memory option sets the MB aggregates can use before spilling to disk
         '''
+        if self.args.get_current()[2:].lower() == CMDARG_AGGREGATES_MEMORY:
+            self._app._aggregateMemoryMB = self._get_next_int()
+            return
         keyName = self._get_next_str()
         keyValueListStr = self._get_next_param()
         if keyValueListStr.lower() == 'all':
@@ -0,0 +1,391 @@
+#=============================================================================
+'''
+    Columnar output file format
+
+    Surveyor output can be many millions of rows, with new measure columns
+    showing up partway through a job as different config files come into
+    play. The columnar format buffers rows into row groups held as typed
+    column arrays, and appends each group to the file when it fills.
+    Each row group carries its own schema, so new columns simply appear in
+    later groups -- nothing that has already been written is ever rewritten.
+
+    File layout (all integers little-endian):
+
+        MAGIC
+        row group*      GROUP_MAGIC, u32 header length, JSON header,
+                        then one chunk per column
+        footer          JSON footer, u32 footer length, MAGIC
+
+    A row group header lists the number of rows and, for each column, its
+    name, type, and the byte lengths of its (optionally zlib compressed)
+    chunk. The footer holds the offset of every row group and the schema
+    for the whole file. If a job is killed before the footer is written the
+    row groups can still be read by scanning from the front of the file.
+
+    Column chunks are a validity bitmap (omitted if there are no missing
+    values) followed by the values:
+
+        int     int64 array
+        float   float64 array
+        str     uint32 offsets array (rows + 1) then UTF-8 bytes
+
+    read_columns() and read_rows() load files back for downstream analysis,
+    and can limit decoding to the columns that are asked for.
+'''
+#=============================================================================
+# Copyright 2004-2010, Matt Peloquin and Construx. This file is part of Code
+# Surveyor, covered under GNU GPL v3 and is distributed WITHOUT ANY WARRANTY.
+#=============================================================================
+import os
+import sys
+import mmap
+import json
+import array
+import struct
+import zlib
+import itertools
+import fnmatch
+
+MAGIC = b'SURVCOL1'
+GROUP_MAGIC = b'RG'
+FILE_EXT = 'scol'
+
+TYPE_INT = 'int'
+TYPE_FLOAT = 'float'
+TYPE_STR = 'str'
+
+# Rows buffered before a group is flushed to the file
+DEFAULT_GROUP_ROWS = 16384
+
+# Chunks smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 64
+COMPRESS_LEVEL = 1
+
+_LENGTH = struct.Struct('<I')
+_INT64_MIN = -2**63
+_INT64_MAX = 2**63 - 1
+_SWAP_BYTES = sys.byteorder != 'little'
+
+
+class ColumnarError(Exception):
+    pass
+
+
+#=============================================================================
+class ColumnarWriter( object ):
+    '''
+    Appends rows to a binary output stream in row groups. Rows are dicts
+    of column name to value; a column missing from a row is null.
+    The caller owns the stream -- finish() writes the last row group and
+    the footer, but does not close it.
+    To append to a file that was left unfinished, pass the state from
+    checkpoint() as resumeState, with the stream positioned at its end.
+    '''
+    def __init__(self, outStream, compress=False, groupRows=DEFAULT_GROUP_ROWS,
+                    resumeState=None):
+        self._out = outStream
+        self._compress = compress
+        self._groupRows = groupRows
+        self._offset = 0
+
+        # Columns buffered for the current row group are lists of values
+        # padded with None for rows that didn't have the column
+        self._columns = {}
+        self._numRows = 0
+
+        # Column names and types for the whole file, in order of appearance
+        # A column whose type varies between groups is listed as str
+        self._schema = {}
+        self._groupOffsets = []
+        self._totalRows = 0
+
+        if resumeState is None:
+            self._write(MAGIC)
+        else:
+            self._offset = resumeState['offset']
+            self._schema = dict(resumeState['schema'])
+            self._groupOffsets = list(resumeState['groups'])
+            self._totalRows = resumeState['rows']
+
+    def write_row(self, row):
+        columns = self._columns
+        numRows = self._numRows
+        for name, value in row.items():
+            try:
+                columns[name].append(value)
+            except KeyError:
+                columns[name] = [None] * numRows + [value]
+        self._numRows = numRows = numRows + 1
+
+        # Pad columns this row didn't have
+        if len(row) < len(columns):
+            for values in columns.values():
+                if len(values) < numRows:
+                    values.append(None)
+
+        if numRows >= self._groupRows:
+            self.flush()
+
+    def flush(self):
+        '''
+        Write any buffered rows as a row group
+        '''
+        if not self._numRows:
+            return
+        header = {'rows': self._numRows, 'cols': []}
+        chunks = []
+        for name, values in self._columns.items():
+            colType, hasNulls, data = _encode_column(values)
+            rawLen = len(data)
+            if self._compress and rawLen >= MIN_COMPRESS_BYTES:
+                data = zlib.compress(data, COMPRESS_LEVEL)
+            header['cols'].append([name, colType, len(data), rawLen, hasNulls])
+            chunks.append(data)
+            knownType = self._schema.get(name)
+            if knownType is None:
+                self._schema[name] = colType
+            elif knownType != colType:
+                self._schema[name] = _promote_type(knownType, colType)
+
+        self._groupOffsets.append(self._offset)
+        headerBytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+        self._write(GROUP_MAGIC + _LENGTH.pack(len(headerBytes)) + headerBytes)
+        for data in chunks:
+            self._write(data)
+
+        self._totalRows += self._numRows
+        self._columns = {}
+        self._numRows = 0
+
+    def checkpoint(self):
+        '''
+        Write buffered rows and return the state needed to carry on
+        appending to the file after them
+        '''
+        self.flush()
+        self._out.flush()
+        return {
+            'offset': self._offset,
+            'schema': list(self._schema.items()),
+            'groups': list(self._groupOffsets),
+            'rows': self._totalRows,
+            }
+
+    def finish(self):
+        self.flush()
+        footer = {
+            'rows': self._totalRows,
+            'groups': self._groupOffsets,
+            'schema': list(self._schema.items()),
+            }
+        footerBytes = json.dumps(footer, separators=(',', ':')).encode('utf-8')
+        self._write(footerBytes + _LENGTH.pack(len(footerBytes)) + MAGIC)
+        self._out.flush()
+
+    def _write(self, data):
+        self._out.write(data)
+        self._offset += len(data)
+
+
+def _encode_column(values):
+    '''
+    Pick the narrowest type that holds all values in the column and
+    return the type name, whether there are nulls, and the encoded chunk
+    '''
+    numRows = len(values)
+    validity = b''
+    hasNulls = None in values
+    if hasNulls:
+        bitmap = bytearray((numRows + 7) // 8)
+        for rowNum, value in enumerate(values):
+            if value is not None:
+                bitmap[rowNum >> 3] |= 1 << (rowNum & 7)
+        validity = bytes(bitmap)
+
+    colType = _column_type(values)
+    if colType == TYPE_STR:
+        encoded = [b'' if value is None else str(value).encode('utf-8', 'surrogateescape')
+                        for value in values]
+        offsets = array.array('I', itertools.accumulate(map(len, encoded), initial=0))
+        if _SWAP_BYTES:
+            offsets.byteswap()
+        return colType, hasNulls, validity + offsets.tobytes() + b''.join(encoded)
+
+    typeCode = 'q' if colType == TYPE_INT else 'd'
+    nums = array.array(typeCode, [0 if value is None else value for value in values])
+    if _SWAP_BYTES:
+        nums.byteswap()
+    return colType, hasNulls, validity + nums.tobytes()
+
+
+def _column_type(values):
+    types = set(map(type, values))
+    types.discard(type(None))
+    if types <= {int, bool}:
+        for value in values:
+            if value is not None and not _INT64_MIN <= value <= _INT64_MAX:
+                return TYPE_STR
+        return TYPE_INT
+    if types <= {int, bool, float}:
+        return TYPE_FLOAT
+    return TYPE_STR
+
+
+def _promote_type(typeA, typeB):
+    if TYPE_STR in (typeA, typeB):
+        return TYPE_STR
+    return TYPE_FLOAT
+
+
+#=============================================================================
+#  Reading
+
+class ColumnarReader( object ):
+    '''
+    Reads a columnar file. Groups are located with the footer if the file
+    was finished, otherwise by scanning the row groups from the front.
+    '''
+    def __init__(self, path):
+        self._data = b''
+        if os.path.getsize(path) > 0:
+            with open(path, 'rb') as inFile:
+                self._data = mmap.mmap(inFile.fileno(), 0, access=mmap.ACCESS_READ)
+        if not self._at(0, MAGIC):
+            raise ColumnarError("Not a Surveyor columnar file: {0}".format(path))
+        self.schema = {}
+        self.numRows = 0
+        self._groups = []
+        self._read_groups()
+
+    def columns(self):
+        return list(self.schema.keys())
+
+    def read_columns(self, columns=None):
+        '''
+        Return dict of column name to list of values for the given column
+        names or fnmatch patterns (e.g. 'routine.*'), or all columns.
+        Values are None for rows that didn't have a column.
+        '''
+        names = self._select(columns)
+        result = {name: [] for name in names}
+        for numRows, groupCols in self._groups:
+            for name in names:
+                try:
+                    result[name].extend(self._decode(numRows, *groupCols[name]))
+                except KeyError:
+                    result[name].extend([None] * numRows)
+        return result
+
+    def read_rows(self, columns=None):
+        '''
+        Generator of row dicts, leaving out columns that are null in a row
+        '''
+        names = self._select(columns)
+        for numRows, groupCols in self._groups:
+            colNames = [name for name in names if name in groupCols]
+            colValues = [self._decode(numRows, *groupCols[name]) for name in colNames]
+            for rowValues in zip(*colValues):
+                yield {name: value for name, value in zip(colNames, rowValues)
+                            if value is not None}
+
+    def _select(self, columns):
+        if columns is None:
+            return self.columns()
+        names = []
+        for pattern in columns:
+            for name in self.schema:
+                if name not in names and fnmatch.fnmatchcase(name, pattern):
+                    names.append(name)
+        return names
+
+    def _read_groups(self):
+        data = self._data
+        offsets = None
+        if (len(data) >= len(MAGIC) * 2 + _LENGTH.size and
+                self._at(len(data) - len(MAGIC), MAGIC)):
+            footerEnd = len(data) - len(MAGIC) - _LENGTH.size
+            footerLen, = _LENGTH.unpack_from(data, footerEnd)
+            footer = json.loads(data[footerEnd - footerLen:footerEnd].decode('utf-8'))
+            offsets = footer['groups']
+            dataEnd = footerEnd - footerLen
+        else:
+            dataEnd = len(data)
+
+        groupIter = offsets if offsets is not None else self._scan_offsets(dataEnd)
+        for offset in groupIter:
+            self._groups.append(self._read_group_header(offset)[0])
+            self.numRows += self._groups[-1][0]
+
+    def _scan_offsets(self, dataEnd):
+        offset = len(MAGIC)
+        while offset < dataEnd and self._at(offset, GROUP_MAGIC):
+            try:
+                _group, nextOffset = self._read_group_header(offset)
+            except (ValueError, struct.error):
+                break
+            if nextOffset > dataEnd:
+                break
+            yield offset
+            offset = nextOffset
+
+    def _read_group_header(self, offset):
+        if not self._at(offset, GROUP_MAGIC):
+            raise ColumnarError("Bad row group offset: {0}".format(offset))
+        offset += len(GROUP_MAGIC)
+        headerLen, = _LENGTH.unpack_from(self._data, offset)
+        offset += _LENGTH.size
+        header = json.loads(self._data[offset:offset + headerLen].decode('utf-8'))
+        offset += headerLen
+        groupCols = {}
+        for name, colType, dataLen, rawLen, hasNulls in header['cols']:
+            groupCols[name] = (colType, offset, dataLen, rawLen, hasNulls)
+            offset += dataLen
+            knownType = self.schema.get(name)
+            if knownType is None:
+                self.schema[name] = colType
+            elif knownType != colType:
+                self.schema[name] = _promote_type(knownType, colType)
+        return (header['rows'], groupCols), offset
+
+    def _at(self, offset, marker):
+        return self._data[offset:offset + len(marker)] == marker
+
+    def _decode(self, numRows, colType, offset, dataLen, rawLen, hasNulls):
+        data = self._data[offset:offset + dataLen]
+        if dataLen != rawLen:
+            data = zlib.decompress(data)
+
+        validity = None
+        if hasNulls:
+            validityLen = (numRows + 7) // 8
+            validity = data[:validityLen]
+            data = data[validityLen:]
+
+        if colType == TYPE_STR:
+            offsets = array.array('I')
+            offsets.frombytes(data[:(numRows + 1) * 4])
+            if _SWAP_BYTES:
+                offsets.byteswap()
+            text = data[(numRows + 1) * 4:]
+            values = [text[start:end].decode('utf-8', 'surrogateescape')
+                        for start, end in zip(offsets, offsets[1:])]
+        else:
+            values = array.array('q' if colType == TYPE_INT else 'd')
+            values.frombytes(data)
+            if _SWAP_BYTES:
+                values.byteswap()
+            values = values.tolist()
+
+        if validity is not None:
+            for rowNum in range(numRows):
+                if not validity[rowNum >> 3] & (1 << (rowNum & 7)):
+                    values[rowNum] = None
+        return values
+
+
+def read_columns(path, columns=None):
+    return ColumnarReader(path).read_columns(columns)
+
+def read_rows(path, columns=None):
+    return ColumnarReader(path).read_rows(columns)
+
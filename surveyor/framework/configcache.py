@@ -0,0 +1,225 @@
+#=============================================================================
+'''
+    Surveyor Config Cache
+
+    Persistent store of config files that have been read, used to make
+    jobs over folder trees with many config files start faster.
+
+    Reading a config file parses each line, expands CONSTANTs, reads any
+    INCLUDEs, instantiates a csmodule for each entry (executing its config
+    options and compiling its regexes), has the module process parameter
+    lines, and validates the entries against each other. The cache stores
+    the ConfigEntrys that result, pickled with their csmodule instances,
+    so a config file read in an earlier job is rebuilt by unpickling it
+    rather than reading it again.
+
+    Entries are stored by the config file's path and a key for the options
+    the ConfigStack reads with (the application's default config options
+    and regex checking). They are used if the content of the config file
+    and of every INCLUDE read for it is unchanged, and the source code of
+    the csmodules for the entries, and of the framework modules that read
+    config files, is unchanged.
+
+    Only config files on disk are cached; config files in source trees are
+    read once per job by ConfigStack.
+
+    A process that runs one job after another (a surveyor daemon's job
+    runner) also keeps the entries for config files it has read in
+    ResidentConfigs, so a later job uses the same entries, with their
+    csmodule instances, if the config file and its INCLUDEs are unchanged.
+    The code for those entries is what the process has loaded, so changes
+    to csmodule sources take a restart of the process.
+'''
+#=============================================================================
+# Copyright 2004-2012, Matt Peloquin and Construx. This file is part of Code
+# Surveyor, covered under GNU GPL v3 and is distributed WITHOUT ANY WARRANTY.
+#=============================================================================
+import sys
+import pickle
+import sqlite3
+import hashlib
+import importlib
+
+from framework import measurecache
+from framework import trace
+
+# Seconds to wait on the database lock held by another job
+CACHE_LOCK_TIMEOUT = 60
+
+# Config files kept by ResidentConfigs before it starts over, so files
+# from many folder trees don't pile up in a long-running process
+RESIDENT_MAX_CONFIGS = 2000
+
+# Framework modules whose code reads and validates config files; changes to
+# these invalidate the cache along with changes to the csmodules
+CONFIG_SUPPORT_MODULES = ('framework.configreader', 'framework.configentry',
+                          'framework.fileext', 'framework.regexcheck')
+
+CACHE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS configs (
+        path TEXT NOT NULL,
+        optionsKey TEXT NOT NULL,
+        filesRead BLOB NOT NULL,
+        sources BLOB NOT NULL,
+        entries BLOB NOT NULL,
+        PRIMARY KEY (path, optionsKey))
+    '''
+
+
+class ConfigCache( object ):
+    '''
+    Used by a ConfigStack to look up config files before reading them, and
+    to store them once read. configOptions and checkRegexes are what the
+    ConfigStack reads config files with.
+    '''
+    def __init__(self, cachePath, configOptions, checkRegexes):
+        self._cachePath = cachePath
+        self._db = sqlite3.connect(cachePath, timeout=CACHE_LOCK_TIMEOUT)
+        # Write-ahead logging without syncing each commit, since config
+        # files are stored as they are read
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(CACHE_SCHEMA)
+        self._db.commit()
+
+        keyHash = hashlib.sha1()
+        keyHash.update(repr((configOptions, checkRegexes, sys.hexversion)).encode(
+                'utf-8', 'surrogateescape'))
+        self._optionsKey = keyHash.hexdigest()
+
+        # Source hashes by module name don't change during a job
+        self._sourceHashes = {}
+
+        self.hits = 0
+        self.misses = 0
+        trace.config(1, "Opened config cache: {0}".format(cachePath))
+
+    def close(self):
+        self._db.close()
+        trace.config(1, "Config cache hits: {0}  misses: {1}".format(self.hits, self.misses))
+
+
+    def lookup(self, configFilePath):
+        '''
+        Returns the ConfigEntrys stored for the config file and the
+        (path, hash) of the files read for them, or (None, None) if there
+        are none or the files or code they came from have changed
+        '''
+        row = self._db.execute(
+                'SELECT filesRead, sources, entries FROM configs WHERE path=? AND optionsKey=?',
+                (configFilePath, self._optionsKey)).fetchone()
+        configEntrys = None
+        filesRead = None
+        if row is not None:
+            filesRead, sources, entries = row
+            filesRead = pickle.loads(filesRead)
+            if (files_unchanged(filesRead) and
+                    self._sources_unchanged(pickle.loads(sources))):
+                configEntrys = pickle.loads(entries)
+        if configEntrys is None:
+            self.misses += 1
+            trace.config(2, "Config cache miss: {0}".format(configFilePath))
+            return None, None
+        self.hits += 1
+        trace.config(1, "Config cache hit: {0}".format(configFilePath))
+        return configEntrys, filesRead
+
+
+    def store(self, configFilePath, filesRead, configEntrys):
+        '''
+        Store entries read from a config file; filesRead are the (path, hash)
+        of the config file and the INCLUDEs read for it (files_read)
+        '''
+        moduleNames = set(CONFIG_SUPPORT_MODULES)
+        for configEntry in configEntrys:
+            moduleNames.update(cls.__module__ for cls in configEntry.module.__class__.__mro__
+                                if cls is not object)
+        sources = [(moduleName, self._source_hash(moduleName)) for moduleName in sorted(moduleNames)]
+        with self._db:
+            self._db.execute('INSERT OR REPLACE INTO configs VALUES (?,?,?,?,?)', (
+                    configFilePath, self._optionsKey,
+                    pickle.dumps(filesRead, pickle.HIGHEST_PROTOCOL),
+                    pickle.dumps(sources, pickle.HIGHEST_PROTOCOL),
+                    pickle.dumps(configEntrys, pickle.HIGHEST_PROTOCOL)))
+        trace.config(2, "Config cache stored: {0}".format(configFilePath))
+
+
+    #-------------------------------------------------------------------------
+
+    def _sources_unchanged(self, sources):
+        for moduleName, sourceHash in sources:
+            try:
+                if self._source_hash(moduleName) != sourceHash:
+                    return False
+            except ImportError:
+                return False
+        return True
+
+    def _source_hash(self, moduleName):
+        sourceHash = self._sourceHashes.get(moduleName)
+        if sourceHash is None:
+            # Frozen executables may not have source available, in which
+            # case the cache is only invalidated by deleting it
+            sourceFile = getattr(importlib.import_module(moduleName), '__file__', None)
+            if sourceFile:
+                try:
+                    sourceHash = measurecache.hash_file(sourceFile)
+                except OSError:
+                    sourceHash = moduleName
+            else:
+                sourceHash = moduleName
+            self._sourceHashes[moduleName] = sourceHash
+        return sourceHash
+
+
+class ResidentConfigs( object ):
+    '''
+    Entries for config files read by earlier jobs in this process, by the
+    config file's path and the options the ConfigStack read it with
+    '''
+    def __init__(self):
+        self._configs = {}
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, configFilePath, configOptions, checkRegexes):
+        '''
+        Returns the ConfigEntrys kept for the config file, or None if there
+        are none or the files read for them have changed
+        '''
+        configKey = (configFilePath, repr((configOptions, checkRegexes)))
+        filesRead, configEntrys = self._configs.get(configKey, (None, None))
+        if configEntrys is not None and not files_unchanged(filesRead):
+            del self._configs[configKey]
+            configEntrys = None
+        if configEntrys is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            trace.config(1, "Resident config: {0}".format(configFilePath))
+        return configEntrys
+
+    def entry_lists(self):
+        return [configEntrys for _filesRead, configEntrys in self._configs.values()]
+
+    def store(self, configFilePath, configOptions, checkRegexes, filesRead, configEntrys):
+        if len(self._configs) >= RESIDENT_MAX_CONFIGS:
+            self._configs.clear()
+        configKey = (configFilePath, repr((configOptions, checkRegexes)))
+        self._configs[configKey] = (filesRead, configEntrys)
+
+
+def files_read(filePathsRead):
+    '''
+    Returns (path, hash) of each of the files read for a config file
+    '''
+    return [(filePath, measurecache.hash_file(filePath)) for filePath in filePathsRead]
+
+def files_unchanged(filesRead):
+    for filePath, fileHash in filesRead:
+        try:
+            if measurecache.hash_file(filePath) != fileHash:
+                return False
+        except OSError:
+            return False
+    return True
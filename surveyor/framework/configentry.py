@@ -58,8 +58,11 @@ class ConfigEntry( object ):
         self.measureFilters = []
         self.fileFilters = []
 
-        # Used for caching optimization
+        # Used for caching optimization; files read are the config file
+        # and any INCLUDEs read with it, set by ConfigReader
         self.configFilePath = configFilePath
+        self.configFilesRead = [configFilePath] if configFilePath else []
+        self.moduleHash = None
 
         # Process line as list
         configValues = line.split() + extraLineContent.split()
@@ -12,6 +12,7 @@ import re
 
 from framework import configentry
 from framework import fileext
+from framework import regexcheck
 from framework import uistrings
 from framework import trace
 from framework import utils
@@ -30,10 +31,18 @@ class ConfigReader( object ):
     '''
     Responsible for reading lines from config files and loading them
     into ConfigEntry objects
+    If checkRegexes is set, regexes in config entry params that are prone
+    to catastrophic backtracking are reported as config errors.
+    Config files, including INCLUDEs, are opened with openFileCallback if
+    provided, e.g., to read them from a git tree.
     '''
-    def __init__(self, loadModuleCallback, extraLineContent=''):
+    def __init__(self, loadModuleCallback, extraLineContent='', checkRegexes=False,
+                    openFileCallback=None):
         self._load_csmodule = loadModuleCallback
         self._extraLineContent = extraLineContent
+        self._checkRegexes = checkRegexes
+        self._open_file = openFileCallback
+        self._filesRead = None
 
         # Regular expressions for parsing the config files
         self._reFlags = re.IGNORECASE | re.VERBOSE
@@ -63,8 +72,11 @@ class ConfigReader( object ):
         '''
         try:
             trace.msg(1, "Config file: {0}".format(filePath))
+            self._filesRead = []
             configEntries = self._read_file(filePath, [])
             self._validate_file(configEntries)
+            for configEntry in configEntries:
+                configEntry.configFilesRead = self._filesRead
             trace.config(2, "Finsihed reading config file: {0}".format(filePath))
             trace.config(3, configEntries)
             return configEntries
@@ -73,7 +85,12 @@ class ConfigReader( object ):
 
 
     def _read_file(self, filePath, configEntries):
-        with open(filePath, 'r', errors="surrogateescape") as configFile:
+        self._filesRead.append(filePath)
+        if self._open_file is not None:
+            configFile = self._open_file(filePath)
+        else:
+            configFile = open(filePath, 'r', errors="surrogateescape")
+        with configFile:
             return self._parse_file(configFile, configEntries)
 
 
@@ -176,6 +193,8 @@ class ConfigReader( object ):
                 configEntry.paramsRaw.append(rawLine)
                 try:
                     paramTuple = configEntry.module.add_param(line, rawLine)
+                    if self._checkRegexes:
+                        self._check_regexes(paramTuple)
                     configEntry.paramsProcessed.append(paramTuple)
                     trace.config(2, "LoadedParam: {0} => {1}".format(
                             configEntry.module.__class__.__name__, paramTuple))
@@ -211,6 +230,19 @@ class ConfigReader( object ):
         return configEntries
 
 
+    def _check_regexes(self, paramTuple):
+        '''
+        csmodules return params as a tuple that includes any compiled regexes
+        '''
+        params = paramTuple if isinstance(paramTuple, tuple) else (paramTuple,)
+        for param in params:
+            if isinstance(param, re.Pattern):
+                risk = regexcheck.backtracking_risk(param)
+                if risk is not None:
+                    raise utils.ConfigError(uistrings.STR_ErrorConfigRegexRisk.format(
+                            param.pattern, risk))
+
+
     def _validate_file(self, configEntries):
         if not configEntries:
             trace.config(2, "  EMPTY")
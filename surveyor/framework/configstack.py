@@ -8,7 +8,9 @@
 # Surveyor, covered under GNU GPL v3 and is distributed WITHOUT ANY WARRANTY.
 #=============================================================================
 import os
+import time
 
+from framework import configcache
 from framework import configentry
 from framework import configreader
 from framework import fileext
@@ -44,26 +46,77 @@ def config_items_for_file(configEntrys, fileName):
     return neededConfigs
 
 
+class ConfigFolder( object ):
+    '''
+    Node for a folder in the ConfigStack's index of the folders config
+    files on the stack came from, with a node for each folder name
+    '''
+    __slots__ = ('children', 'stackIndexes')
+
+    def __init__(self):
+        self.children = {}
+        # Stack positions of config files from the folder, usually one
+        self.stackIndexes = []
+
+
 class ConfigStack( object ):
     '''
     Maintains config file information during Surveyor job run
     The stack stores lists of entries from a config file, indexed using the
     full path. On startup we read in any default config files. We're
     then called during tree traversal to load any other config files.
+    Config files pushed for folders are indexed by folder path in a trie
+    of folder names, so finding the config files that cover a folder is a
+    walk down its path rather than comparisons of path strings.
+    If configCachePath is given, config files read from disk are kept in
+    a config cache there, for later jobs (configcache.py). A process that
+    runs many jobs can also give ResidentConfigs it keeps between them.
     '''
-    def __init__(self, configFileName, configOverrides, defaultConfigOptions=[]):
+    def __init__(self, configFileName, configOverrides, defaultConfigOptions=[],
+                    checkRegexes=False, configCachePath=None, residentConfigs=None):
         trace.config(2, "Creating ConfigStack with {0}".format(configFileName))
         self._modules = CodeSurveyorModules()
-        self._reader = configreader.ConfigReader(self.load_csmodule)
+        self._reader = configreader.ConfigReader(self.load_csmodule,
+                checkRegexes=checkRegexes, openFileCallback=self._open_config_file)
         self._measureRootDir = ''
 
-        # Stack of config files, represented as paths and lists of ConfigEntrys
+        # Source tree config files under the measure root are read from, if any
+        self._sourceTree = None
+
+        # Stack of config files, represented as paths and lists of ConfigEntrys,
+        # along with the ConfigFolder for the folder they were found in, if any
         self._configStack = []
+        self._configFolders = ConfigFolder()
 
         # Cache of config file information
         # Key is path name, value is list entries that represent the config file
         self._configFileCache = {}
 
+        # Config files in source trees can change from one tree to the next,
+        # e.g., git commits, so each path has a list of (tree files read,
+        # entries) for what was read in each; tree files are (path, content
+        # ID) for the config file and any INCLUDEs read from the tree while
+        # reading it
+        self._treeConfigCache = {}
+        self._treeFilesRead = None
+
+        # Config cache that config files read from disk are kept in, if any,
+        # with the paths of files read while reading one to store
+        self._configCache = None
+        if configCachePath is not None:
+            self._configCache = configcache.ConfigCache(
+                    configCachePath, defaultConfigOptions, checkRegexes)
+        self._diskFilesRead = None
+        self._residentConfigs = residentConfigs
+        self._checkRegexes = checkRegexes
+
+        # Time spent loading config files in this job, and how many config
+        # files on disk came from the config cache or ResidentConfigs (hits)
+        # or were read when one of them was in use (misses)
+        self.loadSeconds = 0.0
+        self.cacheHits = 0
+        self.cacheMisses = 0
+
         # List of default config option tags passed by the application
         self._defaultConfigOptions = defaultConfigOptions
 
@@ -95,24 +148,29 @@ class ConfigStack( object ):
         any options defined in the conifig file.
         '''
         trace.config(3, configEntry.__dict__)
+        moduleOptions = self._defaultConfigOptions + configEntry.options
         configEntry.module = self._modules.get_csmodule(
-                configEntry.moduleName,
-                self._defaultConfigOptions + configEntry.options)
+                configEntry.moduleName, moduleOptions)
+        configEntry.moduleHash = self._modules.module_hash(
+                configEntry.moduleName, moduleOptions)
 
         if configEntry.module is None:
             raise utils.ConfigError(uistrings.STR_ErrorFindingModule.format(
                     configEntry.moduleName))
 
 
-    def set_measure_root(self, measureRootDir):
+    def set_measure_root(self, measureRootDir, sourceTree=None):
         '''
         Called before each folder tree is measured to allow path to tbe used
         in error message if no config file is found
+        If the folder tree is a filesource.SourceTree, config files in it are
+        read from there rather than disk
         '''
         self._measureRootDir = measureRootDir
+        self._sourceTree = sourceTree
 
 
-    def get_configuration(self, folder):
+    def get_configuration(self, folder, fileNames=None):
         '''
         Returns two collections:
          1) A set of all file filters active for folder
@@ -121,11 +179,14 @@ class ConfigStack( object ):
         The active configuration is the contents of the config file
         closest to the leaf directory passed in as you look back up the
         parent subdirectory tree, ending with the default job config.
+        If fileNames from the walk's listing of folder are provided, the
+        folder is only checked for a config file if one is listed.
         '''
-        self._pop_to_active(folder)
-        self._push_file(folder)
+        folderNames = self._pop_to_active(folder)
+        if fileNames is None or self._config_file_listed(fileNames):
+            self._push_file(folder, folderNames)
 
-        path, fileFilters, activeConfigItems = self._active_entry()
+        path, fileFilters, activeConfigItems, _configFolder = self._active_entry()
 
         trace.config(4, "Config: {0} -- {1} possible entries".format(path, len(activeConfigItems)))
         return fileFilters, activeConfigItems, path
@@ -136,6 +197,12 @@ class ConfigStack( object ):
         return self._active_entry()[0]
 
 
+    def close(self):
+        if self._configCache is not None:
+            self._configCache.close()
+            self._configCache = None
+
+
     #-------------------------------------------------------------------------
 
     def _setup_config_overrides(self, configOverrides):
@@ -162,69 +229,152 @@ class ConfigStack( object ):
         return activeConfig
 
 
-    def _push_file(self, dirName):
+    def _config_file_listed(self, fileNames):
+        if os.name == 'nt':
+            configName = os.path.normcase(self._configName)
+            return any(os.path.normcase(fileName) == configName for fileName in fileNames)
+        return self._configName in fileNames
+
+
+    def _push_file(self, dirName, folderNames=None):
         '''
         Returns true if a config file was found in dirName and pushed on stack
+        Config files for folders in the walk are indexed by folderNames
         '''
         success = False
         configFilePath = os.path.abspath(os.path.join(dirName, self._configName))
 
-        if not configFilePath in self._configFileCache:
-            if os.path.isfile(configFilePath):
-                self._configFileCache[configFilePath] = self._reader.read_file(configFilePath)
-
-        if configFilePath in self._configFileCache:
-            self._push_entries(configFilePath, self._configFileCache[configFilePath])
+        loadStart = time.perf_counter()
+        if self._sourceTree is not None and self._sourceTree.contains(configFilePath):
+            configEntrys = self._tree_config_file(configFilePath)
+        else:
+            if not configFilePath in self._configFileCache:
+                if os.path.isfile(configFilePath):
+                    self._configFileCache[configFilePath] = self._disk_config_file(configFilePath)
+            configEntrys = self._configFileCache.get(configFilePath)
+        self.loadSeconds += time.perf_counter() - loadStart
+
+        if configEntrys is not None:
+            configFolder = None
+            if folderNames is not None:
+                configFolder = self._configFolders
+                for folderName in folderNames:
+                    childFolder = configFolder.children.get(folderName)
+                    if childFolder is None:
+                        childFolder = configFolder.children[folderName] = ConfigFolder()
+                    configFolder = childFolder
+                configFolder.stackIndexes.append(len(self._configStack))
+            self._push_entries(configFilePath, configEntrys, configFolder)
             trace.config(1, "Config PUSH {0}: {1}".format(
-                    len(self._configFileCache[configFilePath]), configFilePath))
-            if len(self._configFileCache[configFilePath]) == 0:
+                    len(configEntrys), configFilePath))
+            if len(configEntrys) == 0:
                 trace.config(1, "EMPTY CONFIG: {0}".format(configFilePath))
             success = True;
         return success
 
 
+    def _disk_config_file(self, configFilePath):
+        '''
+        Returns entries for a config file on disk, which are the ones kept
+        from an earlier job in this process, or rebuilt from the config
+        cache, if they are there and still valid
+        '''
+        if self._configCache is None and self._residentConfigs is None:
+            return self._reader.read_file(configFilePath)
+        if self._residentConfigs is not None:
+            configEntrys = self._residentConfigs.lookup(
+                    configFilePath, self._defaultConfigOptions, self._checkRegexes)
+            if configEntrys is not None:
+                self.cacheHits += 1
+                return configEntrys
+
+        configEntrys = None
+        if self._configCache is not None:
+            configEntrys, filesRead = self._configCache.lookup(configFilePath)
+        if configEntrys is not None:
+            self.cacheHits += 1
+        else:
+            self.cacheMisses += 1
+            self._diskFilesRead = []
+            try:
+                configEntrys = self._reader.read_file(configFilePath)
+                filesRead = configcache.files_read(self._diskFilesRead)
+            finally:
+                self._diskFilesRead = None
+            if self._configCache is not None:
+                self._configCache.store(configFilePath, filesRead, configEntrys)
+        if self._residentConfigs is not None:
+            self._residentConfigs.store(configFilePath, self._defaultConfigOptions,
+                    self._checkRegexes, filesRead, configEntrys)
+        return configEntrys
+
+
+    def _tree_config_file(self, configFilePath):
+        '''
+        Returns entries for a config file in the source tree, or None if
+        there isn't one. Entries read from an earlier tree are reused if the
+        content of the files read for them is the same in this one, so a
+        config file that doesn't change keeps the same ConfigEntrys.
+        '''
+        configId = self._sourceTree.content_id(configFilePath)
+        if configId is None:
+            return None
+        for treeFiles, configEntrys in self._treeConfigCache.get(configFilePath, []):
+            if treeFiles[0][1] == configId and (len(treeFiles) == 1 or
+                    self._sourceTree.content_ids([path for path, _id in treeFiles[1:]]) ==
+                    [contentId for _path, contentId in treeFiles[1:]]):
+                return configEntrys
+        self._treeFilesRead = []
+        try:
+            configEntrys = self._reader.read_file(configFilePath)
+            self._treeConfigCache.setdefault(configFilePath, []).append(
+                    (self._treeFilesRead, configEntrys))
+        finally:
+            self._treeFilesRead = None
+        return configEntrys
+
+
+    def _open_config_file(self, configFilePath):
+        if self._sourceTree is not None and self._sourceTree.contains(configFilePath):
+            if self._treeFilesRead is not None:
+                self._treeFilesRead.append(
+                        (configFilePath, self._sourceTree.content_id(configFilePath)))
+            return self._sourceTree.open_text(configFilePath)
+        if self._diskFilesRead is not None:
+            self._diskFilesRead.append(configFilePath)
+        return open(configFilePath, 'r', errors="surrogateescape")
+
+
     def _pop_to_active(self, dirToCheck):
         '''
         Removes config entries back up the folder chain, until we get to the
-        active one.
+        active one, and returns the names of the folders in dirToCheck's path.
+        Config files pushed for folders form a chain from a folder to those
+        below it, so the active one is the last one pushed for the lowest
+        folder indexed on the path down to dirToCheck.
+        Folders are compared by name, so a config file in a folder named
+        "ab" doesn't cover a sibling "abc".
         '''
-        configIndex = self._active_entry_index()
+        folderNames = [name for name in os.path.abspath(dirToCheck).split(os.sep) if name]
+        activeIndex = 0
+        configFolder = self._configFolders
+        for folderName in folderNames:
+            configFolder = configFolder.children.get(folderName)
+            if configFolder is None:
+                break
+            if configFolder.stackIndexes:
+                activeIndex = configFolder.stackIndexes[-1]
 
         # DO NOT EVER pop the first position, as it should be a default file
-        while configIndex > 0:
-            # Get active config path and remove file name
-            configDir, _configItems, _configPath = self._configStack[configIndex]
-            configDir = os.path.dirname(configDir)
-            currentDir = os.path.abspath(dirToCheck)
-
-            # Is the config file equal to or "above" current position in path?
-            # Special case the current folder '.' below because commonprefix
-            # returns it, while dirname returns blank for empty path
-            currentDirUnderConfigDir = False
-            sharedPath = os.path.commonprefix([currentDir, configDir])
-            if not sharedPath == '':
-                currentDir = os.path.relpath(currentDir, sharedPath)
-                configDir = os.path.relpath(configDir, sharedPath)
-                while True:
-                    if configDir == currentDir:
-                        currentDirUnderConfigDir = True
-                        break;
-                    if '.' == currentDir:
-                        break
-                    currentDir = os.path.dirname(currentDir)
-                    if not currentDir:
-                        currentDir = '.'
-
-            # If the current config file does not cover the currentDir, pop it
-            if currentDirUnderConfigDir:
-                break
-            else:
-                trace.config(1, "Config POP: {0}".format(self.active_path()))
-                del self._configStack[configIndex]
-                configIndex -= 1
+        while self._active_entry_index() > activeIndex:
+            trace.config(1, "Config POP: {0}".format(self.active_path()))
+            _path, _fileFilters, _configItems, configFolder = self._configStack.pop()
+            if configFolder is not None:
+                configFolder.stackIndexes.pop()
+        return folderNames
 
 
-    def _push_entries(self, path, configEntryList):
+    def _push_entries(self, path, configEntryList, configFolder=None):
 
         # Create list of items based on file filters
         fileFilters = set([])
@@ -236,7 +386,7 @@ class ConfigStack( object ):
                 configObjs.append(configEntry)
                 configItems[fileFilter] = configObjs
 
-        self._configStack.append((path, fileFilters, configItems))
+        self._configStack.append((path, fileFilters, configItems, configFolder))
 
 
     def _active_entry_index(self):
@@ -0,0 +1,332 @@
+#=============================================================================
+'''
+    Surveyor Daemon
+
+    Run by surveyord.py so jobs sent from the command line (rpc.py) start
+    warm, rather than each paying for starting Python, importing the
+    framework, csmodules, chardet and libmagic, reading config files, and
+    starting workers.
+
+    The daemon loads these once, listens on a Unix domain socket, and
+    forks maxJobs job runners that take requests from the socket in turn.
+    A runner runs one job at a time, and keeps for the next one what it
+    can (workerpool.py): a pool of workers that already hold the config
+    entries earlier jobs used, with their csmodule instances, and the
+    entries of each config file read, used again while the config file
+    and its INCLUDEs are unchanged. A runner starts by running a small job
+    of its own with default options, so the first request finds the pool
+    a default job uses started, and the default config's entries in it.
+
+    A job runs the command line app just as surveyor.py would, in the
+    client's folder and environment, with stdout and stderr streams that
+    send output to the client as it is written, including rows written to
+    the console. A ctrl-c sent by the client, or the client going away,
+    interrupts the job as a console ctrl-c would. Once the job is done its
+    exit status is sent back.
+
+    Requests wait for a free runner, and a runner that exits is replaced.
+    Code is what the daemon loaded, so restart it after updating surveyor.
+    The daemon needs Unix domain sockets and fork, so isn't available on
+    Windows.
+'''
+#=============================================================================
+# Copyright 2004-2012, Matt Peloquin and Construx. This file is part of Code
+# Surveyor, covered under GNU GPL v3 and is distributed WITHOUT ANY WARRANTY.
+#=============================================================================
+import io
+import os
+import sys
+import time
+import errno
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+import importlib
+import multiprocessing
+import multiprocessing.connection
+
+import csmodules
+from framework import cmdlineapp
+from framework import configstack
+from framework import rpc
+from framework import utils
+from framework import workerpool
+from framework import trace
+from framework.uistrings import *
+
+RUNNER_PROC_BASENAME = "JobRunner"
+
+DEFAULT_MAX_JOBS = 1
+
+# Seconds to wait before replacing a runner that exited, so a runner that
+# can't start doesn't spin
+RUNNER_RESTART_DELAY = 1.0
+
+# File measured by the job a runner warms up with
+WARM_UP_FILE = ('warmup.py', "import os\n\ndef f(a):\n    return a + 1  # one\n")
+
+
+class SurveyorDaemon( object ):
+    '''
+    Loads surveyor, then runs jobs requested over socketPath in job
+    runners until stopped by ctrl-c or SIGTERM
+    '''
+    def __init__(self, socketPath, maxJobs=DEFAULT_MAX_JOBS, outputStream=sys.stdout):
+        if not hasattr(socket, 'AF_UNIX') or not hasattr(os, 'fork'):
+            raise utils.InputException(STR_DaemonNotSupported)
+        self._socketPath = os.path.abspath(socketPath)
+        self._maxJobs = maxJobs
+        self._out = outputStream
+        self._listener = None
+        self._runners = []
+        self._runnersStarted = 0
+
+
+    def run(self):
+        startTime = time.perf_counter()
+        self._preload()
+        self._listen()
+        self._print(STR_DaemonListening.format(self._socketPath, rpc.DAEMON_SOCKET_ENV_VAR))
+        self._print(STR_DaemonPreloaded.format(time.perf_counter() - startTime, self._maxJobs))
+
+        signal.signal(signal.SIGTERM, _sigterm_handler)
+        try:
+            self._start_runners()
+            while True:
+                multiprocessing.connection.wait([runner.sentinel for runner in self._runners])
+                time.sleep(RUNNER_RESTART_DELAY)
+                self._start_runners()
+        except (KeyboardInterrupt, SystemExit):
+            trace.cc(1, "Daemon stopping")
+        finally:
+            for runner in self._runners:
+                if runner.is_alive():
+                    runner.terminate()
+            for runner in self._runners:
+                runner.join()
+            self._listener.close()
+            os.remove(self._socketPath)
+            self._print(STR_DaemonStopped)
+
+
+    def _preload(self):
+        '''
+        Everything loaded here is shared with runners when they fork.
+        Reading the default config instantiates its csmodules, which also
+        leaves their regexes in the re module's cache
+        '''
+        for csmoduleName in csmodules.__all__:
+            importlib.import_module(csmodules.__name__ + '.' + csmoduleName)
+        utils.preload_file_detection()
+        try:
+            configstack.ConfigStack(CONFIG_FILE_DEFAULT_NAME, None)
+        except utils.ConfigError as e:
+            trace.msg(1, "Default config not preloaded: {0}".format(str(e)))
+
+
+    def _listen(self):
+        '''
+        Take over the socket path if it is left from a daemon that didn't
+        exit cleanly, and only allow connections from our user
+        '''
+        if os.path.exists(self._socketPath):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self._socketPath)
+            except OSError as e:
+                if e.errno not in (errno.ECONNREFUSED, errno.ENOENT):
+                    raise
+                os.remove(self._socketPath)
+            else:
+                raise utils.InputException(STR_DaemonRunning.format(self._socketPath))
+            finally:
+                probe.close()
+
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        oldUmask = os.umask(0o177)
+        try:
+            self._listener.bind(self._socketPath)
+        finally:
+            os.umask(oldUmask)
+        self._listener.listen(socket.SOMAXCONN)
+
+
+    def _start_runners(self):
+        self._runners = [runner for runner in self._runners if runner.is_alive()]
+        while len(self._runners) < self._maxJobs:
+            self._runnersStarted += 1
+            self._out.flush()
+            runner = multiprocessing.Process(
+                    target=_run_jobs, name=RUNNER_PROC_BASENAME + str(self._runnersStarted),
+                    args=(self._listener,))
+            runner.start()
+            self._runners.append(runner)
+            trace.cc(1, "Started {0}".format(runner.name))
+
+
+    def _print(self, message):
+        self._out.write(message)
+        self._out.flush()
+
+
+def _sigterm_handler(signum, frame):
+    '''
+    Exit once, so the cleanup that follows isn't cut short
+    '''
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    sys.exit(0)
+
+
+#-------------------------------------------------------------------------
+#  Job runner
+
+_runnerStopping = False
+
+def _run_jobs(listener):
+    '''
+    Job runner entry point, which takes requests until the daemon stops.
+    Ctrl-c is how jobs are interrupted, so it is handled even if the daemon
+    was started with it ignored (e.g., in the background).
+    '''
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, _runner_sigterm_handler)
+    residentJobs = workerpool.ResidentJobs()
+    try:
+        _warm_up(residentJobs)
+        while not _runnerStopping:
+            connection, _address = listener.accept()
+            with connection:
+                _run_request(connection, residentJobs)
+    except (KeyboardInterrupt, SystemExit):
+        trace.cc(1, "Job runner stopping")
+    finally:
+        residentJobs.close()
+
+
+def _runner_sigterm_handler(signum, frame):
+    '''
+    A job that is running is stopped as a ctrl-c would stop it, so its pool
+    is closed; the runner exits once the job is done
+    '''
+    global _runnerStopping
+    _runnerStopping = True
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    raise KeyboardInterrupt
+
+
+def _warm_up(residentJobs):
+    '''
+    Run a job on a file in a temp folder, which starts the pool a job with
+    default options uses and reads the default config, then send workers
+    the rest of the default config's entries
+    '''
+    warmUpDir = tempfile.mkdtemp()
+    try:
+        treeDir = os.path.join(warmUpDir, 'tree')
+        os.makedirs(treeDir)
+        fileName, content = WARM_UP_FILE
+        with open(os.path.join(treeDir, fileName), 'w') as warmUpFile:
+            warmUpFile.write(content)
+        outputStream = io.StringIO()
+        if not cmdlineapp.run_from_shell([_surveyor_script(), treeDir, '-q', '-o', warmUpDir],
+                                         outputStream, None, residentJobs) == cmdlineapp.SHELL_SUCCESS:
+            trace.msg(1, "Warm up job failed: {0}".format(outputStream.getvalue()))
+        residentJobs.register_configs()
+    finally:
+        shutil.rmtree(warmUpDir, ignore_errors=True)
+
+
+def _run_request(connection, residentJobs):
+    '''
+    Run a request in the client's setting with output streamed back, and
+    send the exit status
+    '''
+    try:
+        request, _data = rpc.recv_message(connection)
+    except Exception as e:
+        trace.msg(1, "Bad daemon request: {0}".format(str(e)))
+        return
+    if request is None:
+        return
+
+    sendLock = multiprocessing.Lock()
+    clientStreams = (
+        rpc.client_text_stream(connection, sendLock, 'stdout',
+                               request['encoding'], request['errors'], request['tty']),
+        rpc.client_text_stream(connection, sendLock, 'stderr',
+                               request['encoding'], 'backslashreplace', True))
+    daemonStreams = (sys.stdout, sys.stderr)
+    jobRunning = [True]
+    interruptLock = threading.Lock()
+    watcher = threading.Thread(target=_watch_client, name="Client",
+                               args=(connection, jobRunning, interruptLock), daemon=True)
+    watcher.start()
+
+    result = cmdlineapp.SHELL_FAILURE
+    try:
+        try:
+            sys.stdout, sys.stderr = clientStreams
+            os.environ.clear()
+            os.environ.update(request['env'])
+            os.chdir(request['cwd'])
+            cmdArgs = [_surveyor_script()] + request['args'][1:]
+            result = cmdlineapp.run_from_shell(cmdArgs, sys.stdout, request['width'], residentJobs)
+        finally:
+            _job_done(jobRunning, interruptLock)
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        sys.stderr.write("\nA system error occurred while running Surveyor:\n{0}\n".format(str(e)))
+    finally:
+        sys.stdout, sys.stderr = daemonStreams
+        for stream in clientStreams:
+            stream.flush()
+
+    try:
+        with sendLock:
+            rpc.send_message(connection, {'exit': result})
+        connection.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    watcher.join()
+
+
+def _surveyor_script():
+    '''
+    Jobs run from the surveyor folder the daemon was started from, wherever
+    the client is
+    '''
+    return os.path.join(utils.surveyor_dir(), 'surveyor.py')
+
+
+def _job_done(jobRunning, interruptLock):
+    '''
+    Stop passing ctrl-c to the job; one the client sent as the job ended
+    is raised here, where it is ignored
+    '''
+    while jobRunning[0]:
+        try:
+            with interruptLock:
+                jobRunning[0] = False
+        except KeyboardInterrupt:
+            pass
+
+
+def _watch_client(connection, jobRunning, interruptLock):
+    '''
+    Pass a ctrl-c from the client to the job as a SIGINT, as a console
+    would; the client going away is treated the same way
+    '''
+    while True:
+        try:
+            message, _data = rpc.recv_message(connection)
+        except Exception:
+            message = None
+        with interruptLock:
+            if not jobRunning[0]:
+                return
+            signal.pthread_kill(threading.main_thread().ident, signal.SIGINT)
+        if message is None:
+            return
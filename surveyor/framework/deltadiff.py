@@ -0,0 +1,290 @@
+#=============================================================================
+'''
+    Surveyor Delta Diff
+
+    Delta measures (-d) survey the lines of a file that are new or changed
+    relative to the same file in the delta folder. These come from a diff
+    of the two files' lines, which is done here. Lines are interned to
+    integers first, so each distinct line is hashed once and the diff
+    compares ints rather than strings.
+
+    Files with the same lines have no changes. Otherwise the diff is a
+    minimal one:
+
+      - Lines the files start and end with in common are dropped
+      - What remains gets a Myers O(ND) diff if it is up to MYERS_MAX_LINES
+        and needs up to MYERS_MAX_EDITS edits, which is minimal
+      - Otherwise it is split on lines that occur once in each file, in
+        the same order in both (as patience diff does), and each gap
+        between those lines is diffed the same way; a gap that can't be
+        split or diffed gets difflib's SequenceMatcher diff
+
+    Delta lines used to come from difflib.unified_diff, whose
+    SequenceMatcher isn't minimal and can be slow on large files with many
+    changes. The minimal diff finds the same changes for most edits, but
+    can find fewer changed lines, and where a change could be placed on
+    different lines (e.g., an added line that repeats the one before it)
+    may not place it the same. So delta measures, and the deleted lines
+    DELTA_INCL_DELETED adds (the old lines each change replaces), can be
+    lower than before. With the DELTA_DIFFLIB option the diff is
+    SequenceMatcher's, and delta lines are the same as they used to be.
+
+    Changed lines are returned as they were when delta lines came from
+    difflib.unified_diff output: for each change, deleted lines (only with
+    DELTA_INCL_DELETED) then added lines, preceded by a blank line for each
+    of the diff's header lines. The first character of each line was cut
+    along with the diff's +/- prefix, which is kept so delta measures don't
+    change.
+'''
+#=============================================================================
+# Copyright 2004-2012, Matt Peloquin and Construx. This file is part of Code
+# Surveyor, covered under GNU GPL v3 and is distributed WITHOUT ANY WARRANTY.
+#=============================================================================
+import os
+import stat
+import bisect
+import difflib
+
+# Largest range of lines (old plus new) given a Myers diff before it is
+# split, and the most edits the diff will look for
+MYERS_MAX_LINES = 4000
+MYERS_MAX_EDITS = 1000
+
+# Size of reads when comparing file content
+COMPARE_READ_SIZE = 64 * 1024
+
+# Lines the unified diff header left after its first two characters were cut
+DELETED_HEADER_LINE = '- \n'
+ADDED_HEADER_LINE = '+ \n'
+
+
+def same_file(filePath1, filePath2):
+    '''
+    Same rules as filecmp.cmp, without its cache of every pair compared:
+    files with the same size and modification time are taken as the same,
+    otherwise the content is compared up to the first difference
+    '''
+    stat1 = os.stat(filePath1)
+    stat2 = os.stat(filePath2)
+    if not (stat.S_ISREG(stat1.st_mode) and stat.S_ISREG(stat2.st_mode)):
+        return False
+    if stat1.st_size != stat2.st_size:
+        return False
+    if stat1.st_mtime == stat2.st_mtime:
+        return True
+    with open(filePath1, 'rb') as file1, open(filePath2, 'rb') as file2:
+        while True:
+            data1 = file1.read(COMPARE_READ_SIZE)
+            if data1 != file2.read(COMPARE_READ_SIZE):
+                return False
+            if not data1:
+                return True
+
+
+def delta_lines(oldLines, newLines, includeDeleted, useDifflib=False):
+    '''
+    Lines added in newLines relative to oldLines, and deleted lines if
+    includeDeleted, in the form described above
+    '''
+    deltaLines = []
+    changes = diff_changes(oldLines, newLines, useDifflib)
+    if changes:
+        if includeDeleted:
+            deltaLines.append(DELETED_HEADER_LINE)
+        deltaLines.append(ADDED_HEADER_LINE)
+        for oldStart, oldEnd, newStart, newEnd in changes:
+            if includeDeleted:
+                deltaLines.extend(line[1:] for line in oldLines[oldStart:oldEnd])
+            deltaLines.extend(line[1:] for line in newLines[newStart:newEnd])
+    return deltaLines
+
+
+def diff_changes(oldLines, newLines, useDifflib=False):
+    '''
+    List of (oldStart, oldEnd, newStart, newEnd) for the ranges of lines
+    that differ, in order, each separated from the next by common lines
+    '''
+    # SequenceMatcher matches all of two equal lists as well
+    if oldLines == newLines:
+        return []
+    lineIds = {}
+    old = [lineIds.setdefault(line, len(lineIds)) for line in oldLines]
+    new = [lineIds.setdefault(line, len(lineIds)) for line in newLines]
+    if useDifflib:
+        return _sequence_matcher(old, new, 0, len(old), 0, len(new))
+
+    changes = []
+    regions = [(0, len(old), 0, len(new))]
+    while regions:
+        oldStart, oldEnd, newStart, newEnd = regions.pop()
+
+        # Drop common lines from either end
+        while oldStart < oldEnd and newStart < newEnd and old[oldStart] == new[newStart]:
+            oldStart += 1
+            newStart += 1
+        while oldStart < oldEnd and newStart < newEnd and old[oldEnd - 1] == new[newEnd - 1]:
+            oldEnd -= 1
+            newEnd -= 1
+        if oldStart == oldEnd and newStart == newEnd:
+            continue
+        if oldStart == oldEnd or newStart == newEnd:
+            _add_change(changes, oldStart, oldEnd, newStart, newEnd)
+            continue
+
+        regionChanges = None
+        if (oldEnd - oldStart) + (newEnd - newStart) <= MYERS_MAX_LINES:
+            regionChanges = _myers(old, new, oldStart, oldEnd, newStart, newEnd)
+        if regionChanges is None:
+
+            # Split on unique common lines; gaps are pushed so they pop in order
+            anchors = _unique_anchors(old, new, oldStart, oldEnd, newStart, newEnd)
+            if anchors:
+                gapEnds = anchors + [(oldEnd, newEnd)]
+                gapStarts = [(oldStart, newStart)] + [
+                        (oldPos + 1, newPos + 1) for oldPos, newPos in anchors]
+                for (gapOldStart, gapNewStart), (gapOldEnd, gapNewEnd) in reversed(
+                        list(zip(gapStarts, gapEnds))):
+                    regions.append((gapOldStart, gapOldEnd, gapNewStart, gapNewEnd))
+                continue
+            regionChanges = _sequence_matcher(old, new, oldStart, oldEnd, newStart, newEnd)
+
+        for change in regionChanges:
+            _add_change(changes, *change)
+    return changes
+
+
+def _add_change(changes, oldStart, oldEnd, newStart, newEnd):
+    '''
+    Changes from neighbouring regions with no common lines between them
+    are one change, as they would be in a diff of the whole file
+    '''
+    if changes and changes[-1][1] == oldStart and changes[-1][3] == newStart:
+        oldStart, _oldEnd, newStart, _newEnd = changes.pop()
+    changes.append((oldStart, oldEnd, newStart, newEnd))
+
+
+def _sequence_matcher(old, new, oldStart, oldEnd, newStart, newEnd):
+    '''
+    Changes from difflib's diff of the ranges; difflib.unified_diff has
+    SequenceMatcher's defaults, including its junk heuristic
+    '''
+    matcher = difflib.SequenceMatcher(None, old[oldStart:oldEnd], new[newStart:newEnd])
+    return [(oldStart + oldFrom, oldStart + oldTo, newStart + newFrom, newStart + newTo)
+            for tag, oldFrom, oldTo, newFrom, newTo in matcher.get_opcodes()
+            if tag != 'equal']
+
+
+def _unique_anchors(old, new, oldStart, oldEnd, newStart, newEnd):
+    '''
+    Positions of lines that occur once in each range, the longest run of
+    them that is in the same order in both
+    '''
+    oldCounts = {}
+    for lineId in old[oldStart:oldEnd]:
+        oldCounts[lineId] = oldCounts.get(lineId, 0) + 1
+    newPositions = {}
+    for newPos in range(newStart, newEnd):
+        lineId = new[newPos]
+        if oldCounts.get(lineId) == 1:
+            newPositions[lineId] = None if lineId in newPositions else newPos
+    pairs = [(oldPos, newPositions[old[oldPos]]) for oldPos in range(oldStart, oldEnd)
+             if newPositions.get(old[oldPos]) is not None]
+    if not pairs:
+        return []
+
+    # Longest increasing run of new positions, by patience sorting
+    pileTops = []
+    pileTopPairs = []
+    previous = [None] * len(pairs)
+    for index, (_oldPos, newPos) in enumerate(pairs):
+        pile = bisect.bisect_left(pileTops, newPos)
+        if pile == len(pileTops):
+            pileTops.append(newPos)
+            pileTopPairs.append(index)
+        else:
+            pileTops[pile] = newPos
+            pileTopPairs[pile] = index
+        previous[index] = pileTopPairs[pile - 1] if pile > 0 else None
+    anchors = []
+    index = pileTopPairs[-1]
+    while index is not None:
+        anchors.append(pairs[index])
+        index = previous[index]
+    anchors.reverse()
+    return anchors
+
+
+def _myers(old, new, oldStart, oldEnd, newStart, newEnd):
+    '''
+    Changes from a minimal diff of the ranges, or None if that needs more
+    than MYERS_MAX_EDITS edits
+    '''
+    oldLen = oldEnd - oldStart
+    newLen = newEnd - newStart
+    maxEdits = min(oldLen + newLen, MYERS_MAX_EDITS)
+    offset = maxEdits + 1
+    furthest = [0] * (2 * maxEdits + 3)
+
+    # Furthest positions on the diagonals -edits-1 to edits+1 before each
+    # number of edits, to walk back through
+    history = []
+    for edits in range(maxEdits + 1):
+        history.append(furthest[offset - edits - 1:offset + edits + 2])
+        for diagonal in range(-edits, edits + 1, 2):
+            if diagonal == -edits or (diagonal != edits and
+                    furthest[offset + diagonal - 1] < furthest[offset + diagonal + 1]):
+                oldPos = furthest[offset + diagonal + 1]
+            else:
+                oldPos = furthest[offset + diagonal - 1] + 1
+            newPos = oldPos - diagonal
+            while (oldPos < oldLen and newPos < newLen and
+                    old[oldStart + oldPos] == new[newStart + newPos]):
+                oldPos += 1
+                newPos += 1
+            furthest[offset + diagonal] = oldPos
+            if oldPos >= oldLen and newPos >= newLen:
+                common = _myers_common(history, edits, oldLen, newLen)
+                return _common_to_changes(common, oldStart, oldLen, newStart, newLen)
+    return None
+
+
+def _myers_common(history, edits, oldPos, newPos):
+    '''
+    Walk back from the end through the furthest positions for each number
+    of edits, returning the positions of common lines in order
+    '''
+    common = []
+    for edits in range(edits, 0, -1):
+        furthest = history[edits]
+        diagonal = oldPos - newPos
+        base = edits + 1
+        if diagonal == -edits or (diagonal != edits and
+                furthest[base + diagonal - 1] < furthest[base + diagonal + 1]):
+            prevDiagonal = diagonal + 1
+            snakeStart = furthest[base + prevDiagonal]
+        else:
+            prevDiagonal = diagonal - 1
+            snakeStart = furthest[base + prevDiagonal] + 1
+        while oldPos > snakeStart:
+            oldPos -= 1
+            newPos -= 1
+            common.append((oldPos, newPos))
+        oldPos = furthest[base + prevDiagonal]
+        newPos = oldPos - prevDiagonal
+    while oldPos > 0:
+        oldPos -= 1
+        newPos -= 1
+        common.append((oldPos, newPos))
+    common.reverse()
+    return common
+
+
+def _common_to_changes(common, oldStart, oldLen, newStart, newLen):
+    changes = []
+    oldNext = newNext = 0
+    for oldPos, newPos in common + [(oldLen, newLen)]:
+        if oldPos > oldNext or newPos > newNext:
+            changes.append((oldStart + oldNext, oldStart + oldPos,
+                            newStart + newNext, newStart + newPos))
+        oldNext, newNext = oldPos + 1, newPos + 1
+    return changes
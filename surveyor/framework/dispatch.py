@@ -0,0 +1,269 @@
+#=============================================================================
+'''
+    Surveyor Job Dispatch
+
+    Encapsulates the channels used between the Job (main thread), its
+    Workers (child processes), and the OutThread (main process thread).
+
+    Each channel has a single reader, so receivers block on their own
+    channel rather than polling and sharing a control queue:
+
+        CONFIG -- One per worker. Job puts each config entry once, as it is
+                registered (see registry.py), and work items refer to it
+                by ID; each worker gets every registration. Workers kept
+                between jobs (workerpool.py) get the start of each job here.
+        TASK -- Job puts work packages, workers get them. A None package
+                tells the worker that gets it that the job's work is done.
+                Workers also put back items they give to idle workers.
+        OUTPUT -- Workers put results and package stats, OutThread gets
+                them. A None from the Job tells OutThread all output is in.
+        JOB -- Workers and OutThread put (command, payload) messages for the
+                Job: errors for break on error, and exceptions.
+        EXIT -- Broadcast event the Job sets to abort workers and OutThread.
+        JOB DONE -- Count of workers kept between jobs that have finished
+                the current one and closed its files.
+
+    Workers waiting on the task channel are counted, so once the Job has sent
+    all work, busy workers can tell when there are idle workers to share with.
+    Work packages are pickled as they are put on the task channel, and the
+    bytes waiting in it are counted so the Job can limit them.
+
+    Blocking gets time out periodically so receivers can check the exit
+    event even when nothing is sent to them.
+'''
+#=============================================================================
+# Copyright 2004-2012, Matt Peloquin and Construx. This file is part of Code
+# Surveyor, covered under GNU GPL v3 and is distributed WITHOUT ANY WARRANTY.
+#=============================================================================
+import pickle
+import multiprocessing
+from multiprocessing.reduction import ForkingPickler
+from queue import Empty
+
+from framework import trace
+
+# Seconds a blocked receiver waits before checking for exit
+EXIT_CHECK_INTERVAL = 0.5
+
+# Marker placed on the task and output channels to indicate work is done
+WORK_DONE = None
+
+
+class Dispatcher( object ):
+    '''
+    Created by the Job and handed to the Workers and OutThread; all
+    channels survive pickling to child processes.
+    '''
+    def __init__(self, numWorkers):
+        self._configQueues = [multiprocessing.Queue() for _worker in range(numWorkers)]
+        self._taskQueue = multiprocessing.Queue()
+        self._outQueue = multiprocessing.Queue()
+        self._jobQueue = multiprocessing.Queue()
+        self._exitEvent = multiprocessing.Event()
+        self._allTasksSentEvent = multiprocessing.Event()
+        self._idleWorkers = multiprocessing.Value('i', 0)
+        self._queuedTaskBytes = multiprocessing.Value('q', 0)
+        self._workersJobDone = multiprocessing.Semaphore(0)
+
+    #-------------------------------------------------------------------------
+    #  Job
+
+    def put_config(self, configId, configEntry):
+        '''
+        Config entries are pickled once here, rather than once per queue
+        '''
+        registration = bytes(ForkingPickler.dumps((configId, configEntry)))
+        for queue in self._configQueues:
+            queue.put(registration)
+
+    def put_job_start(self, jobSettings):
+        '''
+        Start a job on workers kept between jobs; it goes down each config
+        channel ahead of the job's registrations, with no config ID
+        '''
+        trace.cc(2, "JOB START")
+        self._allTasksSentEvent.clear()
+        self.put_config(None, jobSettings)
+
+    def wait_job_done(self, timeout):
+        '''
+        True once another worker has finished the job
+        '''
+        return self._workersJobDone.acquire(True, timeout)
+
+    def put_task(self, workPackage):
+        self._put_package(workPackage)
+
+    def queued_task_bytes(self):
+        '''
+        Bytes of work packages put on the task channel that no worker has
+        taken yet (these are held in the main process and pipe buffers)
+        '''
+        return self._queuedTaskBytes.value
+
+    def all_tasks_sent(self):
+        '''
+        All work has been sent; from here on idle workers can only get work
+        from busy workers
+        '''
+        if not self._allTasksSentEvent.is_set():
+            trace.cc(2, "ALL TASKS SENT")
+            self._allTasksSentEvent.set()
+
+    def put_tasks_done(self, numWorkers):
+        '''
+        One marker for each worker, as each worker gets only one
+        '''
+        trace.cc(2, "TASKS DONE: {0} workers".format(numWorkers))
+        for _worker in range(numWorkers):
+            self._taskQueue.put(WORK_DONE)
+
+    def put_output_done(self):
+        trace.cc(2, "OUTPUT DONE")
+        self._outQueue.put(WORK_DONE)
+
+    def get_job_messages(self):
+        '''
+        Returns list of messages waiting for the Job, without blocking
+        '''
+        messages = []
+        try:
+            while not self._jobQueue.empty():
+                messages.append(self._jobQueue.get_nowait())
+        except Empty:
+            pass
+        return messages
+
+    def exit(self):
+        '''
+        Signal everyone to stop, and wake OutThread if it is waiting
+        Workers notice the exit event after current file or wait interval
+        '''
+        trace.cc(1, "EXIT signaled")
+        self._exitEvent.set()
+        self._outQueue.put(WORK_DONE)
+
+    def close(self):
+        '''
+        Make sure queues are flushed and closed to avoid errors in queue code
+        Anything still waiting to be sent to workers or OutThread when the job
+        closes is abandoned, so the main process doesn't wait on it at exit
+        '''
+        for queue in self._configQueues + [self._taskQueue, self._outQueue, self._jobQueue]:
+            self._drain(queue)
+            queue.close()
+            queue.cancel_join_thread()
+
+    def drain(self):
+        '''
+        While aborting, nobody reads tasks or output; keep the pipes clear
+        so workers that are flushing tasks or output can exit
+        '''
+        if self._exitEvent.is_set():
+            self._drain(self._taskQueue)
+            self._drain(self._outQueue)
+
+    #-------------------------------------------------------------------------
+    #  Workers and OutThread
+
+    def exiting(self):
+        return self._exitEvent.is_set()
+
+    def get_task(self):
+        '''
+        Blocks until a work package is available; returns None if work is
+        done or exit was signaled
+        '''
+        with self._idleWorkers.get_lock():
+            self._idleWorkers.value += 1
+        try:
+            taskBytes = self._get(self._taskQueue)
+        finally:
+            with self._idleWorkers.get_lock():
+                self._idleWorkers.value -= 1
+        if taskBytes is WORK_DONE:
+            return WORK_DONE
+        with self._queuedTaskBytes.get_lock():
+            self._queuedTaskBytes.value -= len(taskBytes)
+        return pickle.loads(taskBytes)
+
+    def get_config(self, workerIndex):
+        '''
+        Blocks until the next config registration for the worker is available,
+        returned as (configId, configEntry), or (None, jobSettings) for a job
+        start; returns None if exit was signaled
+        '''
+        registration = self._get(self._configQueues[workerIndex])
+        if registration is None:
+            return None
+        return pickle.loads(registration)
+
+    def workers_idle(self):
+        '''
+        True if there are workers with nothing to do, and no more work
+        coming from the job
+        '''
+        return self._allTasksSentEvent.is_set() and self._idleWorkers.value > 0
+
+    def put_shared_task(self, workPackage):
+        trace.cc(2, "SHARE WorkPackage - files: {0}".format(len(workPackage)))
+        self._put_package(workPackage)
+
+    def put_output(self, filesOutput, packageStats):
+        self._outQueue.put((filesOutput, packageStats))
+
+    def get_output(self):
+        '''
+        Blocks until output is available, returned as (filesOutput, packageStats)
+        where filesOutput is encoded by transport.ResultEncoder.package
+        Returns None when the job has signaled all output is in, or exit
+        was signaled
+        '''
+        return self._get(self._outQueue)
+
+    def put_job_message(self, command, payload=None):
+        self._jobQueue.put((command, payload))
+
+    def put_job_done(self):
+        self._workersJobDone.release()
+
+    def close_worker(self, workDone):
+        '''
+        Called in worker processes on exit. Messages to the job are always
+        flushed. Shared tasks and output are flushed when the worker is done,
+        as a worker that exits while its queue feeder thread is writing never
+        releases the queue's shared write lock. Otherwise the job is aborting,
+        nobody may be reading, and tasks and output are abandoned.
+        '''
+        for queue in self._configQueues:
+            queue.close()
+            queue.cancel_join_thread()
+        for queue in [self._taskQueue, self._outQueue]:
+            queue.close()
+            if workDone:
+                queue.join_thread()
+            else:
+                queue.cancel_join_thread()
+        self._jobQueue.close()
+        self._jobQueue.join_thread()
+
+    def _put_package(self, workPackage):
+        taskBytes = bytes(ForkingPickler.dumps(workPackage))
+        with self._queuedTaskBytes.get_lock():
+            self._queuedTaskBytes.value += len(taskBytes)
+        self._taskQueue.put(taskBytes)
+
+    def _drain(self, queue):
+        try:
+            while True:
+                _ = queue.get_nowait()
+        except Empty:
+            pass
+
+    def _get(self, queue):
+        while not self._exitEvent.is_set():
+            try:
+                return queue.get(True, EXIT_CHECK_INTERVAL)
+            except Empty:
+                trace.cc(3, "WAITING")
+        return WORK_DONE
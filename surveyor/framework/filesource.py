@@ -0,0 +1,263 @@
+#=============================================================================
+'''
+    Surveyor File Sources
+
+    The folder walk normally lists folders from the file system, and
+    workers open files by path. A SourceTree takes the place of the file
+    system for a path being measured, e.g., the tree of a git revision
+    (gitsource.py), the members of an archive (archivesource.py), or files
+    held in memory by a program using the job directly (MemoryTree):
+
+      - The walk lists folders from the tree, which has the same paths as
+        if its files were on disk under the path being measured
+      - Files in each folder are passed to the job with a SourceFile in
+        place of a delta path, which goes to workers in the file's work
+        item; workers read the file's content from it
+      - ConfigStack reads config files from the tree, so per-folder config
+        files work as they do on disk
+
+    Readers a SourceFile opens in a worker, e.g., an open archive, are kept
+    for the process so they are opened once rather than for every file.
+'''
+#=============================================================================
+# Copyright 2004-2012, Matt Peloquin and Construx. This file is part of Code
+# Surveyor, covered under GNU GPL v3 and is distributed WITHOUT ANY WARRANTY.
+#=============================================================================
+import io
+import os
+import time
+import locale
+import hashlib
+
+from framework import utils
+
+
+class SourceTree( object ):
+    '''
+    Used by the folder walk in place of the file system for the tree of
+    files at rootPath, and by ConfigStack to read config files. Trees
+    provide:
+
+        scan_folder(folderName)  Same as folderwalk.scan_folder
+        folder_files(folderName) Dict of SourceFiles by name for a folder
+                                 that has been listed
+        content_ids(filePaths)   For each path, an ID that is the same
+                                 whenever the file's content is, or None
+                                 if it isn't a file in the tree
+        read_file(filePath)      Content of a file, read in this process
+    '''
+    def __init__(self, rootPath):
+        self.rootPath = rootPath
+        self._absRootPath = os.path.abspath(rootPath)
+
+    def close(self):
+        pass
+
+    def contains(self, filePath):
+        '''
+        Is filePath in the folder tree, rather than on disk?
+        '''
+        relPath = self.rel_path(filePath)
+        return relPath != os.pardir and not relPath.startswith(os.pardir + os.sep)
+
+    def rel_path(self, filePath):
+        return os.path.relpath(os.path.abspath(filePath), self._absRootPath)
+
+    def content_id(self, filePath):
+        return self.content_ids([filePath])[0]
+
+    def open_text(self, filePath):
+        '''
+        Open a file from the tree as open() does in text mode
+        '''
+        content = io.BytesIO(self.read_file(filePath))
+        content.name = filePath
+        return io.TextIOWrapper(content, encoding=locale.getpreferredencoding(False),
+                                errors="surrogateescape")
+
+    def scan_folder(self, folderName):
+        raise utils.AbstractMethod(self)
+
+    def folder_files(self, folderName):
+        raise utils.AbstractMethod(self)
+
+    def content_ids(self, filePaths):
+        raise utils.AbstractMethod(self)
+
+    def read_file(self, filePath):
+        raise utils.AbstractMethod(self)
+
+
+class SourceFile( object ):
+    '''
+    Sent in the work item for a file from a SourceTree in place of a delta
+    path. size is in bytes, and the time property is the file's modified
+    time. memoId is set by the job for files whose output it keeps to
+    replay (history.py).
+    '''
+    __slots__ = ('size', 'memoId')
+
+    def __init__(self, size):
+        self.size = size
+        self.memoId = None
+
+    def is_delta(self):
+        '''
+        Is the file compared with an older version of it?
+        '''
+        return False
+
+    def content_id(self):
+        raise utils.AbstractMethod(self)
+
+    def read(self):
+        '''
+        Content of the file; called in workers
+        '''
+        raise utils.AbstractMethod(self)
+
+
+class ListedTree( SourceTree ):
+    '''
+    A SourceTree whose files are listed when it is created, by path
+    relative to rootPath with / separators. Folders are listed in the
+    order they were added, and files in each folder in the order they
+    were added.
+    '''
+    def __init__(self, rootPath):
+        super(ListedTree, self).__init__(rootPath)
+
+        # Child folder names and SourceFiles by name for each folder, by
+        # its path relative to the root
+        self._folders = { os.curdir: ([], {}) }
+
+    def add_file(self, relPath, sourceFile):
+        '''
+        Add a file, and the folders above it; a file added again with the
+        same path replaces the first
+        '''
+        folderPath, _sep, fileName = relPath.rpartition('/')
+        self.add_folder(folderPath)[1][fileName] = sourceFile
+
+    def add_folder(self, relFolder):
+        folderPath = os.curdir
+        folder = self._folders[folderPath]
+        for folderName in relFolder.split('/'):
+            if not folderName:
+                continue
+            folderPath = os.path.normpath(os.path.join(folderPath, folderName))
+            childFolder = self._folders.get(folderPath)
+            if childFolder is None:
+                childFolder = self._folders[folderPath] = ([], {})
+                folder[0].append(folderName)
+            folder = childFolder
+        return folder
+
+    def scan_folder(self, folderName):
+        folder = self._folders.get(self.rel_path(folderName))
+        if folder is None:
+            return None
+        childFolders, folderFiles = folder
+        return (list(childFolders), set(), list(folderFiles),
+                dict((fileName, sourceFile.size) for fileName, sourceFile in folderFiles.items()))
+
+    def folder_files(self, folderName):
+        folder = self._folders.get(self.rel_path(folderName))
+        return {} if folder is None else dict(folder[1])
+
+    def content_ids(self, filePaths):
+        contentIds = []
+        for filePath in filePaths:
+            sourceFile = self._source_file(filePath)
+            contentIds.append(None if sourceFile is None else sourceFile.content_id())
+        return contentIds
+
+    def read_file(self, filePath):
+        sourceFile = self._source_file(filePath)
+        if sourceFile is None:
+            raise utils.FileMeasureError("No file in {0}: {1}".format(self.rootPath, filePath))
+        return self._read_source_file(sourceFile)
+
+    def _read_source_file(self, sourceFile):
+        return sourceFile.read()
+
+    def _source_file(self, filePath):
+        folderPath, fileName = os.path.split(self.rel_path(filePath))
+        folder = self._folders.get(os.path.normpath(folderPath) if folderPath else os.curdir)
+        return None if folder is None else folder[1].get(fileName)
+
+
+#-----------------------------------------------------------------------------
+#  Files held in memory
+
+class MemoryTree( ListedTree ):
+    '''
+    Files held in memory, for a program using the job directly to measure
+    them without writing them to disk. files is a dict of the content of
+    each file, as bytes or str (written as UTF-8), by its path relative
+    to rootPath with / separators; nothing needs to exist at rootPath.
+    The tree is given to the job in place of a path to measure in
+    job.Options.pathsToMeasure, and files have the time the tree was
+    created unless fileTime is given.
+    '''
+    def __init__(self, rootPath, files, fileTime=None):
+        super(MemoryTree, self).__init__(rootPath)
+        fileTime = time.time() if fileTime is None else fileTime
+        for relPath in sorted(files):
+            content = files[relPath]
+            if isinstance(content, str):
+                content = content.encode('utf-8')
+            self.add_file(relPath.strip('/'), MemoryFile(content, fileTime))
+
+    def __repr__(self):
+        return "MemoryTree({0})".format(self.rootPath)
+
+
+class MemoryFile( SourceFile ):
+    '''
+    Content goes to workers in the work item
+    '''
+    __slots__ = ('content', 'time')
+
+    def __init__(self, content, fileTime):
+        super(MemoryFile, self).__init__(len(content))
+        self.content = content
+        self.time = fileTime
+
+    def __repr__(self):
+        return "MemoryFile({0})".format(self.size)
+
+    def content_id(self):
+        return hashlib.sha1(self.content).hexdigest()
+
+    def read(self):
+        return self.content
+
+
+#-----------------------------------------------------------------------------
+#  Readers kept open in workers
+
+# Readers opened by this process, by key; a forked worker opens its own
+# rather than sharing its parent's files and pipes
+_readers = {}
+_readersPid = None
+
+def process_reader(readerKey, open_reader):
+    '''
+    Returns the reader this process has for readerKey, calling
+    open_reader() to open it the first time; readers have a close method
+    '''
+    global _readersPid
+    if _readersPid != os.getpid():
+        _readers.clear()
+        _readersPid = os.getpid()
+    reader = _readers.get(readerKey)
+    if reader is None:
+        reader = _readers[readerKey] = open_reader()
+    return reader
+
+def close_readers():
+    if _readersPid == os.getpid():
+        for reader in _readers.values():
+            reader.close()
+    _readers.clear()
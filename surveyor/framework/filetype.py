@@ -62,13 +62,13 @@ def is_noncode_ext(filePath):
 # because extension works well in most cases, and this is a more expensive
 # operation since we need to open the file
 NonCodeFileStart = [
-    b'\x7ELF',           # Linux/Unif ELF exe (often don't have file extensions)
+    b'\x7FELF',          # Linux/Unif ELF exe (often don't have file extensions)
     b'PK\x03\x04',       # Many types of zipped file structure
     b'\x1F\x8B\x08',     # Gzip
     ]
 def is_noncode_file(fileObject):
     maxWindowSize = 30
-    fileStart = utils.get_file_start(fileObject, maxWindowSize)
+    fileStart = utils.get_raw_file_start(fileObject, maxWindowSize)
     phraseFound = utils.check_start_phrases(fileStart, NonCodeFileStart)
     trace.file(3, "   NonCodeFileStart({0}): {1} ==> {2}".format(
             phraseFound, fileStart, os.path.basename(fileObject.name)))
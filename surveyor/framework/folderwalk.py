@@ -2,6 +2,26 @@
 '''
     Logic for walking folders, selecting files to be processed,
     and providing the configEntry information for the files.
+
+    Folders are listed with os.scandir on a pool of threads, which read
+    ahead of the folder the walk is on. On network file systems listing
+    folders and getting file sizes is mostly waiting, so this keeps the
+    walk ahead of workers. The file sizes from each listing are passed
+    along with the files so the job doesn't need to stat them again.
+    Config resolution and callbacks stay on the calling thread, in the
+    same order as a sorted, top-down os.walk.
+
+    A walk can list folders from a source tree rather than the file system
+    (filesource.py), e.g., a git revision for delta measures against git
+    revisions, or an archive. The files in each folder are passed to the
+    job with what to read them from, and for delta measures what to compare
+    them with, in place of a delta folder. History measures walk the tree
+    of each commit in turn.
+
+    A walk can resume after a folder from an earlier walk (see
+    checkpoint.py). Folders up to it in walk order are skipped, but the
+    walk still passes through the folders above it to pick up their config
+    files; folder trees that come entirely before it aren't listed at all.
 '''
 #=============================================================================
 # Copyright 2004-2011, Matt Peloquin and Construx. This file is part of Code
@@ -9,12 +29,63 @@
 #=============================================================================
 import os
 import fnmatch
+import concurrent.futures
 
 from framework import configstack
 from framework import fileext
 from framework import utils
 from framework import trace
 
+# Number of threads listing folders, and how many folders ahead of the
+# current folder in walk order they may list
+WALK_THREADS = 8
+WALK_PREFETCH_FOLDERS = 64
+
+
+def scan_folder(folderName):
+    '''
+    List a folder, returning (childFolders, linkedFolders, fileNames, fileSizes)
+    or None if the folder can't be read. Mirrors os.walk, so linked folders
+    are listed as children but are not walked. Called on walk threads.
+    '''
+    childFolders = []
+    linkedFolders = set()
+    fileNames = []
+    fileSizes = {}
+    try:
+        with os.scandir(folderName) as entries:
+            for entry in entries:
+                try:
+                    isFolder = entry.is_dir()
+                except OSError:
+                    isFolder = False
+                if isFolder:
+                    childFolders.append(entry.name)
+                    if entry.is_symlink():
+                        linkedFolders.add(entry.name)
+                else:
+                    fileNames.append(entry.name)
+                    # Leave size out if stat fails; the job will report it
+                    try:
+                        fileSizes[entry.name] = entry.stat().st_size
+                    except OSError:
+                        pass
+    except OSError:
+        return None
+    return childFolders, linkedFolders, fileNames, fileSizes
+
+
+def walk_position(pathToMeasure, folderName):
+    '''
+    Returns a list that compares with those for other folders under
+    pathToMeasure in the order the folders are walked
+    '''
+    relPath = os.path.relpath(folderName, pathToMeasure)
+    if relPath == os.curdir:
+        return []
+    return relPath.split(os.sep)
+
+
 class FolderWalker( object ):
     '''
     One instance is created for each job
@@ -40,56 +111,141 @@ class FolderWalker( object ):
         self._configFilterCache = {}
         self._configEntryCache = {}
 
+        # Source tree being walked in place of the file system, if any
+        self._sourceTree = None
+
 
-    def walk(self, pathToMeasure):
+    def walk(self, pathToMeasure, resumeAfter=None, sourceTree=None):
         '''
         Walk folders while filtering sending updates via callback
         We may be asked to terminate in our callback
+        If resumeAfter is provided, only folders after it are measured
+        If sourceTree is provided, folders are listed from it
         '''
-        self._configStack.set_measure_root(pathToMeasure)
+        self._sourceTree = sourceTree
+        self._configStack.set_measure_root(pathToMeasure, sourceTree)
+        if sourceTree is not None:
+            # Config files can differ from one source tree to the next
+            self._configFilterCache.clear()
+            self._configEntryCache.clear()
+        resumePosition = None
+        if resumeAfter is not None:
+            resumePosition = walk_position(pathToMeasure, resumeAfter)
+
+        # Folders still to walk, with the next one at the end, and the
+        # listings that have been started for them
+        folderStack = [pathToMeasure]
+        folderScans = {}
+        walkPool = concurrent.futures.ThreadPoolExecutor(WALK_THREADS)
+        try:
+            while folderStack:
+                self._prefetch_folders(walkPool, folderStack, folderScans)
+                folderName = folderStack.pop()
+                folderScan = folderScans.pop(folderName).result()
+                if folderScan is None:
+                    trace.file(1, "WARNING - Could not read: {0}".format(folderName))
+                    continue
+                childFolders, linkedFolders, fileNames, fileSizes = folderScan
+
+                # Once past the resume folder, every folder after it is walked
+                folderPosition = None
+                if resumePosition is not None:
+                    folderPosition = walk_position(pathToMeasure, folderName)
+                    if folderPosition > resumePosition:
+                        resumePosition = None
+
+                if resumePosition is None:
+                    if not self._walk_folder(pathToMeasure, folderName, fileNames, fileSizes):
+                        break
+                else:
+                    self._pass_folder(folderName, fileNames)
+                    if not self._expandSubdirs:
+                        break
+
+                # Remove any folders, and sort remaining to ensure consistent walk
+                # order across file systems (for our testing if nothing else)
+                self._remove_skip_dirs(folderName, childFolders)
+                childFolders.sort()
+                for childFolder in reversed(childFolders):
+                    if childFolder in linkedFolders:
+                        continue
+                    if resumePosition is not None:
+                        # Skip trees that are done, keeping the one that
+                        # holds the resume folder and those after it
+                        childPosition = folderPosition + [childFolder]
+                        if childPosition < resumePosition[:len(childPosition)]:
+                            continue
+                    folderStack.append(os.path.join(folderName, childFolder))
+        finally:
+            walkPool.shutdown(wait=True, cancel_futures=True)
+
+
+    def _walk_folder(self, pathToMeasure, folderName, fileNames, fileSizes):
+        '''
+        Filter files in a folder and pass them to the job
+        Returns True if the walk should continue into child folders
+        '''
+        trace.file(2, "Scanning: {0}".format(folderName))
+
+        numUnfilteredFiles = len(fileNames)
+        if numUnfilteredFiles == 0:
+            trace.file(1, "WARNING - No files in: {0}".format(folderName))
 
-        for folderName, childFolders, fileNames in os.walk(pathToMeasure, topdown=True):
-            trace.file(2, "Scanning: {0}".format(folderName))
+        filesAndConfigs = []
 
-            numUnfilteredFiles = len(fileNames)
-            if numUnfilteredFiles == 0:
-                trace.file(1, "WARNING - No files in: {0}".format(folderName))
+        if fileNames and self._valid_folder(folderName):
 
-            filesAndConfigs = []
+            # Get the current set of active config filters
+            fileFilters, activeConfigs, configPath = self._configStack.get_configuration(
+                    folderName, fileNames)
 
-            if fileNames and self._valid_folder(folderName):
+            # Filter out files by options and config items
+            filesToProcess = self._get_files_to_process(folderName, fileNames, fileFilters, configPath)
 
-                # Get the current set of active config filters
-                fileFilters, activeConfigs, configPath = self._configStack.get_configuration(folderName)
+            # Create list of tuples with fileName and configEntrys for each file
+            for fileName, fileFilter in filesToProcess:
+                configEntrys = self._get_configs_for_file(fileName, fileFilter, activeConfigs, configPath)
+                filesAndConfigs.append((fileName, configEntrys))
 
-                # Filter out files by options and config items
-                filesToProcess = self._get_files_to_process(folderName, fileNames, fileFilters, configPath)
+        # For delta measure create a fully qualified delta path name
+        # Note when we split on path to measure, it will start with seperator
+        deltaFolder = None
+        if self._sourceTree is not None:
+            deltaFolder = self._sourceTree.folder_files(folderName)
+        elif self._deltaPath is not None:
+            deltaFolder = self._deltaPath + folderName[len(pathToMeasure):]
 
-                # Create list of tuples with fileName and configEntrys for each file
-                for fileName, fileFilter in filesToProcess:
-                    configEntrys = self._get_configs_for_file(fileName, fileFilter, activeConfigs, configPath)
-                    filesAndConfigs.append((fileName, configEntrys))
+        # Call back to job with files and configs
+        continueProcessing = self._add_files_to_job(
+                    folderName,
+                    deltaFolder,
+                    filesAndConfigs,
+                    numUnfilteredFiles,
+                    fileSizes)
 
-            # For delta measure create a fully qualified delta path name
-            # Note when we split on path to measure, it will start with seperator
-            deltaFolder = None
-            if self._deltaPath is not None:
-                deltaFolder = self._deltaPath + folderName[len(pathToMeasure):]
+        return continueProcessing and self._expandSubdirs
 
-            # Call back to job with files and configs
-            continueProcessing = self._add_files_to_job(
-                        folderName,
-                        deltaFolder,
-                        filesAndConfigs,
-                        numUnfilteredFiles)
 
-            if not continueProcessing or not self._expandSubdirs:
-                break
+    def _pass_folder(self, folderName, fileNames):
+        '''
+        Pass through a folder measured before the resume point, picking
+        up its config file as walking it would
+        '''
+        trace.file(2, "Resume skipping: {0}".format(folderName))
+        if self._sourceTree is not None:
+            self._sourceTree.folder_files(folderName)
+        if fileNames and self._valid_folder(folderName):
+            self._configStack.get_configuration(folderName, fileNames)
+
 
-            # Remove any folders, and sort remaining to ensure consistent walk
-            # order across file systems (for our testing if nothing else)
-            self._remove_skip_dirs(folderName, childFolders)
-            childFolders.sort()
+    def _prefetch_folders(self, walkPool, folderStack, folderScans):
+        '''
+        Start listing the folders that are next in walk order
+        '''
+        scan = scan_folder if self._sourceTree is None else self._sourceTree.scan_folder
+        for folderName in reversed(folderStack[-WALK_PREFETCH_FOLDERS:]):
+            if folderName not in folderScans:
+                folderScans[folderName] = walkPool.submit(scan, folderName)
 
 
     def _valid_folder(self, folderName):
@@ -188,7 +344,7 @@ class FolderWalker( object ):
     def _remove_skip_dirs(self, root, dirs):
         '''
         Decide what children dirs should be skipped
-        Filter out dirs in place (vs a copy), so os.walk will skip
+        Filter out dirs in place (vs a copy), so the walk will skip
         '''
         dirsToRemove = []
         for folderPattern in self._skipFolders:
@@ -0,0 +1,415 @@
+#=============================================================================
+'''
+    Surveyor Git Source
+
+    Delta measures can compare two revisions of a local git repository
+    (-dg) rather than two folder trees, without either being checked out.
+    Files, folders, and config files come from the newer revision's tree in
+    the repository's object database, and the folder walk lists them from
+    there in place of the file system. The repository's working tree, if it
+    has one, isn't read.
+
+    The tree is a filesource.SourceTree. Git objects are read through
+    "git cat-file" processes that stay open for the job, so no other git
+    library is needed and nothing goes over the network. The walk reads
+    one tree object for each folder, along with the folder's tree in the
+    older revision, and compares them by SHA:
+
+      - A folder with the same tree in both revisions is unchanged, along
+        with everything under it, so the older revision isn't read for it
+      - Otherwise files are matched by name to the older tree; a file with
+        the same blob SHA in both is unchanged
+
+    Each file goes to workers with its blob SHA and the SHA of its blob in
+    the older revision (GitFile), in place of a delta path. Unchanged files
+    are measured as unchanged files in a delta folder are, without their
+    blobs being read; for changed files both blobs are read and diffed as
+    the files would be (deltadiff.py), so measures are the same as for -d
+    against checkouts of the two revisions.
+
+    Files have the size of their blob and the date of the newer commit.
+    Symlinks and submodules are skipped. Config files named in INCLUDE
+    that are outside the measured tree are read from disk.
+
+    History measures (-l) walk the tree of each commit in a range in turn,
+    with no older revision; files are measured whole from their blobs,
+    and the job measures each file's blob once (history.py).
+'''
+#=============================================================================
+# Copyright 2004-2012, Matt Peloquin and Construx. This file is part of Code
+# Surveyor, covered under GNU GPL v3 and is distributed WITHOUT ANY WARRANTY.
+#=============================================================================
+import os
+import threading
+import subprocess
+
+from framework import filesource
+from framework import uistrings
+from framework import utils
+from framework import trace
+
+GIT_COMMAND = 'git'
+
+# Separates the revisions given with -dg; with no newer revision, HEAD
+REVISION_RANGE_SEPARATOR = '..'
+DEFAULT_REVISION = 'HEAD'
+
+# Tree entry modes; modes of regular files start with FILE_MODE_PREFIX,
+# others are symlinks or submodules
+TREE_MODE = b'40000'
+FILE_MODE_PREFIX = b'100'
+
+# Most object names sent to "git cat-file --batch-check" before reading
+# its output, so neither side fills its pipe waiting on the other
+CHECK_BATCH_SIZE = 256
+
+
+def parse_revisions(revisionRange):
+    '''
+    Returns (olderRevision, newerRevision) from "older[..newer]"
+    '''
+    oldRev, _separator, newRev = revisionRange.partition(REVISION_RANGE_SEPARATOR)
+    if not oldRev:
+        raise utils.InputException(uistrings.STR_ErrorGitRevisions.format(revisionRange))
+    return oldRev, newRev or DEFAULT_REVISION
+
+
+def run_git(args, cwd=None):
+    '''
+    Run a git command, returning its output
+    '''
+    try:
+        result = subprocess.run([GIT_COMMAND] + args, cwd=cwd,
+                stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        raise utils.InputException(uistrings.STR_ErrorGitCommand.format(
+                ' '.join(args), str(e)))
+    if result.returncode != 0:
+        raise utils.InputException(uistrings.STR_ErrorGitCommand.format(
+                ' '.join(args), os.fsdecode(result.stderr).strip()))
+    return os.fsdecode(result.stdout)
+
+
+class GitRepo( object ):
+    '''
+    The local repository holding a folder; prefix is the folder's path in
+    the repository's trees, with a trailing slash unless it is the top
+    '''
+    def __init__(self, path):
+        gitDir, prefix = run_git(['rev-parse', '--absolute-git-dir', '--show-prefix'],
+                cwd=path).split('\n')[:2]
+        self.gitDir = gitDir
+        self.prefix = prefix
+
+    def git(self, *args):
+        return run_git(['--git-dir', self.gitDir] + list(args))
+
+    def resolve_commit(self, revision):
+        '''
+        SHA of the commit revision names
+        '''
+        try:
+            return self.git('rev-parse', '--verify', '--quiet', revision + '^{commit}').strip()
+        except utils.InputException:
+            raise utils.InputException(uistrings.STR_ErrorGitRevision.format(
+                    revision, self.gitDir))
+
+    def commit_time(self, commit):
+        return int(self.git('show', '--no-patch', '--format=%ct', commit).strip())
+
+    def log_commits(self, revisionRange):
+        '''
+        Commits in revisionRange as git log gives them, oldest first and
+        following only the first parent of merges
+        '''
+        commits = []
+        for line in self.git('log', '--reverse', '--first-parent', '--format=%H %ct',
+                             revisionRange, '--').splitlines():
+            commitSha, commitTime = line.split()
+            commits.append(Commit(commitSha, int(commitTime), len(commits) + 1))
+        return commits
+
+    def folder_tree(self, catFile, commit):
+        '''
+        SHA of the tree for our folder in commit, or None if it has none
+        '''
+        if self.prefix:
+            objectName = commit + ':' + self.prefix.rstrip('/')
+        else:
+            objectName = commit + '^{tree}'
+        objectSha, objectType, _size = catFile.object_info([objectName])[0]
+        return objectSha if objectType == 'tree' else None
+
+
+class CatFile( object ):
+    '''
+    Reads objects from a repository through "git cat-file" processes,
+    which are started the first time they are needed. Requests are made
+    under a lock so walk threads can share one.
+    '''
+    def __init__(self, gitDir):
+        self._gitDir = gitDir
+        self._lock = threading.Lock()
+        self._batch = None
+        self._batchCheck = None
+
+    def read(self, objectName, expectedType):
+        '''
+        Returns the content of an object, which must be of expectedType
+        '''
+        with self._lock:
+            if self._batch is None:
+                self._batch = self._start('--batch')
+            self._batch.stdin.write(os.fsencode(objectName) + b'\n')
+            self._batch.stdin.flush()
+            header = self._batch.stdout.readline().split()
+            if len(header) != 3 or header[1].decode('ascii') != expectedType:
+                if len(header) == 3:
+                    self._batch.stdout.read(int(header[2]) + 1)
+                raise utils.FileMeasureError(uistrings.STR_ErrorGitObject.format(
+                        objectName, self._gitDir))
+            content = self._batch.stdout.read(int(header[2]))
+            self._batch.stdout.read(1)
+        if len(content) != int(header[2]):
+            raise utils.FileMeasureError(uistrings.STR_ErrorGitObject.format(
+                    objectName, self._gitDir))
+        return content
+
+    def object_info(self, objectNames):
+        '''
+        Returns (sha, type, size) for each object, or (None, None, None)
+        for ones that don't exist
+        '''
+        objectInfo = []
+        with self._lock:
+            if self._batchCheck is None:
+                self._batchCheck = self._start('--batch-check')
+            for batchStart in range(0, len(objectNames), CHECK_BATCH_SIZE):
+                batch = objectNames[batchStart:batchStart + CHECK_BATCH_SIZE]
+                self._batchCheck.stdin.write(
+                        b''.join(os.fsencode(objectName) + b'\n' for objectName in batch))
+                self._batchCheck.stdin.flush()
+                for objectName in batch:
+                    info = self._batchCheck.stdout.readline().split()
+                    if len(info) == 3:
+                        objectInfo.append((info[0].decode('ascii'),
+                                           info[1].decode('ascii'), int(info[2])))
+                    elif info and info[-1] == b'missing':
+                        objectInfo.append((None, None, None))
+                    else:
+                        raise utils.FileMeasureError(uistrings.STR_ErrorGitObject.format(
+                                objectName, self._gitDir))
+        return objectInfo
+
+    def tree_entries(self, treeSha):
+        '''
+        List of (mode, name, sha) for a tree object
+        '''
+        entries = []
+        content = self.read(treeSha, 'tree')
+        position = 0
+        while position < len(content):
+            modeEnd = content.index(b' ', position)
+            nameEnd = content.index(b'\0', modeEnd)
+            entries.append((content[position:modeEnd],
+                            os.fsdecode(content[modeEnd + 1:nameEnd]),
+                            content[nameEnd + 1:nameEnd + 21].hex()))
+            position = nameEnd + 21
+        return entries
+
+    def close(self):
+        '''
+        Stop our processes; workers forked while they ran hold their pipes
+        open as well, so they wouldn't see the end of their input
+        '''
+        for process in (self._batch, self._batchCheck):
+            if process is not None:
+                process.stdin.close()
+                process.stdout.close()
+                process.terminate()
+                process.wait()
+        self._batch = None
+        self._batchCheck = None
+
+    def _start(self, batchOption):
+        try:
+            return subprocess.Popen(
+                    [GIT_COMMAND, '--git-dir', self._gitDir, 'cat-file', batchOption],
+                    stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        except OSError as e:
+            raise utils.FileMeasureError(uistrings.STR_ErrorGitCommand.format(
+                    'cat-file ' + batchOption, str(e)))
+
+
+class Commit( object ):
+    '''
+    A commit a tree is walked from; num is its place in a history range
+    '''
+    __slots__ = ('sha', 'time', 'num')
+
+    def __init__(self, sha, time, num=None):
+        self.sha = sha
+        self.time = time
+        self.num = num
+
+    def __repr__(self):
+        return "Commit({0}, {1})".format(self.num, self.sha)
+
+
+def delta_tree(pathToMeasure, oldRev, newRev):
+    '''
+    GitTree for delta measures of newRev against oldRev (-dg)
+    '''
+    repo = GitRepo(pathToMeasure)
+    newCommit = repo.resolve_commit(newRev)
+    oldCommit = repo.resolve_commit(oldRev)
+    return GitTree(pathToMeasure, repo, CatFile(repo.gitDir),
+            Commit(newCommit, repo.commit_time(newCommit)), oldCommit, oldRev)
+
+
+class GitTree( filesource.SourceTree ):
+    '''
+    The files of a path being measured in a commit. Folder paths are
+    those the files would have if the commit was checked out at
+    pathToMeasure. Files are compared with the older commit, if there is
+    one, which oldRev names for output.
+    '''
+    def __init__(self, pathToMeasure, repo, catFile, commit, oldCommit=None, oldRev=None):
+        super(GitTree, self).__init__(pathToMeasure)
+        self._repo = repo
+        self._catFile = catFile
+        self._commit = commit
+        self._oldRev = oldRev
+        trace.msg(1, "Git tree {0} delta {1} in {2}".format(
+                commit.sha, oldCommit, repo.gitDir))
+
+        # Trees for folders the walk has found and not yet listed, in the
+        # newer and older revisions, and GitFiles for folders it has listed
+        self._folderTrees = {
+            os.curdir: (repo.folder_tree(catFile, commit.sha),
+                        repo.folder_tree(catFile, oldCommit) if oldCommit else None) }
+        self._folderFiles = {}
+
+    def close(self):
+        self._catFile.close()
+
+    def scan_folder(self, folderName):
+        '''
+        Same as folderwalk.scan_folder, listing the folder's tree; called
+        on walk threads
+        '''
+        relFolder = os.path.relpath(folderName, self.rootPath)
+        newTree, oldTree = self._folderTrees.pop(relFolder, (None, None))
+        if newTree is None:
+            return None
+
+        # Entries of the older tree by name, unless it is the same tree
+        oldEntries = None
+        if oldTree is not None and oldTree != newTree:
+            oldEntries = dict((name, (mode, sha)) for mode, name, sha in
+                              self._catFile.tree_entries(oldTree))
+
+        childFolders = []
+        fileNames = []
+        fileShas = []
+        deltaShas = []
+        for mode, name, sha in self._catFile.tree_entries(newTree):
+            oldMode, oldSha = (mode, sha) if oldTree == newTree else (None, None)
+            if oldEntries is not None:
+                oldMode, oldSha = oldEntries.get(name, (None, None))
+            if mode == TREE_MODE:
+                childFolders.append(name)
+                self._folderTrees[os.path.normpath(os.path.join(relFolder, name))] = (
+                        sha, oldSha if oldMode == TREE_MODE else None)
+            elif mode.startswith(FILE_MODE_PREFIX):
+                fileNames.append(name)
+                fileShas.append(sha)
+                deltaShas.append(oldSha if oldMode is not None and
+                                 oldMode.startswith(FILE_MODE_PREFIX) else None)
+
+        fileSizes = {}
+        folderFiles = {}
+        repoFolder = self._repo.prefix + ('' if relFolder == os.curdir else
+                relFolder.replace(os.sep, '/') + '/')
+        for fileName, fileSha, deltaSha, (_sha, _type, fileSize) in zip(
+                fileNames, fileShas, deltaShas, self._catFile.object_info(fileShas)):
+            fileSizes[fileName] = fileSize
+            deltaName = None
+            if self._oldRev is not None:
+                deltaName = self._oldRev + ':' + repoFolder + fileName
+            folderFiles[fileName] = GitFile(self._repo.gitDir, fileSha, deltaSha,
+                    fileSize, self._commit, deltaName)
+        self._folderFiles[folderName] = folderFiles
+        return childFolders, set(), fileNames, fileSizes
+
+    def folder_files(self, folderName):
+        '''
+        Dict of GitFiles by file name for a folder that has been listed;
+        given to the job in place of the folder's delta path
+        '''
+        return self._folderFiles.pop(folderName, {})
+
+    def content_ids(self, filePaths):
+        '''
+        Blob SHAs, or None for paths that aren't files in the tree
+        '''
+        return [objectSha if objectType == 'blob' else None for objectSha, objectType, _size in
+                self._catFile.object_info([self._object_name(filePath) for filePath in filePaths])]
+
+    def read_file(self, filePath):
+        return self._catFile.read(self._object_name(filePath), 'blob')
+
+    def _object_name(self, filePath):
+        relPath = self.rel_path(filePath)
+        return self._commit.sha + ':' + self._repo.prefix + relPath.replace(os.sep, '/')
+
+
+class GitFile( filesource.SourceFile ):
+    '''
+    SourceFile for a file from a git tree, read from its blob. deltaSha
+    is the file's blob in the older revision, or None if it is a new file;
+    deltaName names it for output, as git would. Files from a tree with no
+    older revision have no deltaName. Files have the time of their commit.
+    '''
+    __slots__ = ('gitDir', 'blobSha', 'deltaSha', 'commit', 'deltaName')
+
+    def __init__(self, gitDir, blobSha, deltaSha, size, commit, deltaName):
+        super(GitFile, self).__init__(size)
+        self.gitDir = gitDir
+        self.blobSha = blobSha
+        self.deltaSha = deltaSha
+        self.commit = commit
+        self.deltaName = deltaName
+
+    def __str__(self):
+        return self.deltaName or self.blobSha
+
+    def __repr__(self):
+        return "GitFile({0}, {1})".format(self.blobSha, self.deltaName)
+
+    @property
+    def time(self):
+        return self.commit.time
+
+    def is_delta(self):
+        return self.deltaName is not None
+
+    def content_id(self):
+        return self.blobSha
+
+    def is_unchanged(self):
+        return self.blobSha == self.deltaSha
+
+    def read(self):
+        return read_blob(self.gitDir, self.blobSha)
+
+    def read_delta(self):
+        return read_blob(self.gitDir, self.deltaSha)
+
+
+def read_blob(gitDir, blobSha):
+    '''
+    Blobs are read in workers through cat-file processes they keep open
+    '''
+    catFile = filesource.process_reader(gitDir, lambda: CatFile(gitDir))
+    return catFile.read(blobSha, 'blob')
@@ -0,0 +1,164 @@
+#=============================================================================
+'''
+    Surveyor Commit History
+
+    History measures (-l) survey every commit in a range of a local git
+    repository, for trends over time. Commits are walked oldest first, each
+    from its own tree in the repository (gitsource.py), with config files
+    read from that tree, so folder config is what it was in each commit.
+
+    Most files are the same from one commit to the next, so rather than
+    measuring every file of every commit, the job measures each file's
+    content once:
+
+      - Files are keyed by blob SHA and config entries, which is what
+        their measures come from, and by path for csmodules whose output
+        depends on it (OUTPUT_FROM_CONTENT in basemodule.py). ConfigStack
+        keeps the same config entries for a config file while its blob is
+        the same, so config entries stand in for a hash of the config
+        (csmodules don't change during a job)
+      - The first file with a key is sent to workers, and files with the
+        key in later commits, or at other paths, have the output for it
+        replayed rather than being measured again; ones that come in
+        before that output does wait for it
+      - Metadata from a file's path and folder (name, type, dirs, full
+        and absolute path, and files in folder) is set again for each
+        replay (basemodule.update_path_metadata)
+      - Output is kept for replays in compact form (transport.py)
+
+    Output for each file has the commit's place in the range, SHA, and
+    date added to its measures. Since output is replayed, file dates
+    (-md) are those of the first commit in the range with the file's
+    content.
+'''
+#=============================================================================
+# Copyright 2004-2012, Matt Peloquin and Construx. This file is part of Code
+# Surveyor, covered under GNU GPL v3 and is distributed WITHOUT ANY WARRANTY.
+#=============================================================================
+import time
+import threading
+
+from framework import basemodule
+from framework import gitsource
+from framework import transport
+from framework import uistrings
+from framework import utils
+from framework import trace
+
+# Measures added to output for each file
+COMMIT_NUM = 'commit.num'
+COMMIT_ID = 'commit.id'
+COMMIT_DATE = 'commit.date'
+COMMIT_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Files measured in each commit, for history totals
+COMMIT_FILES = 'commit.files'
+
+# Source name memoized output is encoded under
+MEMO_SOURCE = 'history'
+
+
+def commit_measures(commit):
+    return {
+        COMMIT_NUM: commit.num,
+        COMMIT_ID: commit.sha,
+        COMMIT_DATE: time.strftime(COMMIT_DATE_FORMAT, time.localtime(commit.time)),
+        }
+
+
+class CommitHistory( object ):
+    '''
+    Commits in revisionRange of the repository holding pathToMeasure,
+    as git log takes it, e.g., "v1.0..v2.0"; the trees walked for each
+    share one set of cat-file processes
+    '''
+    def __init__(self, pathToMeasure, revisionRange):
+        self._pathToMeasure = pathToMeasure
+        self._repo = gitsource.GitRepo(pathToMeasure)
+        self.commits = self._repo.log_commits(revisionRange)
+        if not self.commits:
+            raise utils.InputException(uistrings.STR_ErrorGitNoCommits.format(
+                    revisionRange, self._repo.gitDir))
+        self._catFile = gitsource.CatFile(self._repo.gitDir)
+        trace.msg(1, "History of {0} commits in {1}".format(
+                len(self.commits), self._repo.gitDir))
+
+    def trees(self):
+        for commit in self.commits:
+            yield gitsource.GitTree(self._pathToMeasure, self._repo, self._catFile, commit)
+
+    def close(self):
+        self._catFile.close()
+
+
+class HistoryMemo( object ):
+    '''
+    Used by the job to decide which files from commit trees are sent to
+    workers, and to pass output for all of them to the application.
+    Files are added on the job's main thread and output comes in on its
+    out thread; the application is called under a lock, so replays can
+    be made from either.
+    '''
+    def __init__(self, file_measured_callback):
+        self._file_measured_callback = file_measured_callback
+        self._lock = threading.Lock()
+        self._encoder = transport.ResultEncoder()
+        self._decoder = transport.ResultDecoder()
+
+        # IDs by file key, and for each ID the encoded output once it is
+        # in, and the files waiting for it as (filePath, commit, numFilesInFolder)
+        self._memoIds = {}
+        self._files = []
+
+    def add_file(self, filePath, gitFile, configEntrys, configIds, numFilesInFolder):
+        '''
+        Returns True if the file needs to be measured, in which case its
+        memoId is set; otherwise output for it is, or will be, replayed
+        '''
+        key = (gitFile.blobSha, configIds)
+        if not all(getattr(configEntry.module, 'OUTPUT_FROM_CONTENT', False)
+                   for configEntry in configEntrys):
+            key += (filePath,)
+        waitingFile = (filePath, gitFile.commit, numFilesInFolder)
+        with self._lock:
+            memoId = self._memoIds.get(key)
+            if memoId is None:
+                memoId = self._memoIds[key] = len(self._files)
+                self._files.append([None, [waitingFile]])
+                gitFile.memoId = memoId
+                return True
+            memoFile = self._files[memoId]
+            if memoFile[0] is None:
+                memoFile[1].append(waitingFile)
+            else:
+                self._replay(waitingFile, memoFile[0], [])
+        return False
+
+    def file_measured(self, fileKey, outputList, errorList):
+        '''
+        Out thread callback with output for a file sent to workers, which
+        is tagged with its memoId; errors are only reported once
+        '''
+        _filePath, memoId = fileKey
+        with self._lock:
+            memoFile = self._files[memoId]
+            encodedOutput = [self._encoder.encode_output(measures, analysisResults)
+                                for measures, analysisResults in outputList]
+            self._decoder.unpack(MEMO_SOURCE, self._encoder.package(None))
+            memoFile[0] = encodedOutput
+            waitingFiles = memoFile[1]
+            memoFile[1] = None
+            for waitingFile in waitingFiles:
+                self._replay(waitingFile, encodedOutput, errorList)
+                errorList = []
+
+    def _replay(self, waitingFile, encodedOutput, errorList):
+        filePath, commit, numFilesInFolder = waitingFile
+        outputList = [self._decoder.decode_output(MEMO_SOURCE, encoded)
+                        for encoded in encodedOutput]
+        if outputList or errorList:
+            commitMeasures = commit_measures(commit)
+            for measures, _analysisResults in outputList:
+                basemodule.update_path_metadata(filePath, numFilesInFolder, measures)
+                measures.update(commitMeasures)
+            self._file_measured_callback(filePath, outputList, errorList)
@@ -4,6 +4,28 @@
 
     Executes a measurement job against a folder tree, using jobworker processes
     to read files and delegate mesurement tasks to Surveyor modules.
+
+    With checkpoints, the job tracks which folders and files have been
+    measured, and periodically saves that progress along with the
+    application's from the output thread (see checkpoint.py).
+
+    Very large files are split into chunks measured by several workers,
+    with results for each chunk sent back to the job in a job message.
+    Once all are in, the job sends an item to finish the file, where the
+    results are merged (see chunks.py).
+
+    History measures walk the tree of each commit in a range, sending
+    workers only files whose content hasn't been measured, and replaying
+    output for the rest (see history.py).
+
+    Paths to measure can be archive files, which are walked as folders
+    (see archivesource.py). A program using the job directly can also
+    give it a filesource.SourceTree in place of a path, e.g., a MemoryTree
+    of files it holds in memory.
+
+    A process that runs many jobs can give each one a worker pool kept
+    between them (workerpool.py), which the job uses in place of starting
+    its own workers.
 '''
 #=============================================================================
 # Copyright 2004-2011, Matt Peloquin and Construx. This file is part of Code
@@ -12,13 +34,23 @@
 import os
 import time
 import multiprocessing
-from queue import Empty, Full
 
+from framework import archivesource
+from framework import checkpoint
+from framework import chunks
+from framework import dispatch
 from framework import jobworker
 from framework import jobout
 from framework import folderwalk
+from framework import filesource
+from framework import gitsource
+from framework import history
 from framework import fileext
 from framework import configstack
+from framework import measurecache
+from framework import registry
+from framework import scheduler
+from framework import uistrings
 from framework import utils
 from framework import trace
 
@@ -27,23 +59,15 @@ from framework import trace
 # are running under the process we execute on
 DEFAULT_NUM_WORKERS = max(1, multiprocessing.cpu_count()-1)
 
+# Limits on work queued for workers beyond what they need to stay busy;
+# past these the folder walk waits for workers (see scheduler.py)
+DEFAULT_MAX_QUEUED_PACKAGES = 256
+DEFAULT_MAX_QUEUED_MB = 32
+
 # Seconds we wait at various points
-MAIN_PROCESSING_SLEEP = 0.1
+STATUS_UPDATE_INTERVAL = 0.1
 WORKER_EXIT_TIMEOUT = 0.5
 JOBOUT_EXIT_TIMEOUT = 1
-TASK_FULL_TIMEOUT = 0.4
-
-# Max number of files and size in bytes that will be sent to a worker
-# Smaller values result in more multiprocessing overhead, while larger
-# values risk not providing a good distribution of files across cores
-# if file/folder sizes vary widely
-QUEUE_PACKAGE_MAX_ITEMS = 256
-QUEUE_PACKAGE_MAX_BYTES = 256000
-
-# Number of unfiltered files before we send a work package
-# This prevents a small work package from not being sent if we are
-# searching through a large number of files we're not measuring
-MAX_FILES_BEFORE_SEND = 256
 
 
 class Options( object ):
@@ -54,6 +78,8 @@ class Options( object ):
         self.pathsToMeasure = []
         self.fileFilters = []
         self.deltaPath = None
+        self.deltaRevs = None
+        self.historyRange = None
         self.includeFolders = []
         self.skipFolders = []
         self.skipFiles = []
@@ -63,6 +89,14 @@ class Options( object ):
         self.configInfoOnly = False
         self.ignoreEmptyDirs = False
         self.profileName = None
+        self.measureCachePath = None
+        self.measureCacheRebuild = False
+        self.outputShards = None
+        self.maxQueuedPackages = DEFAULT_MAX_QUEUED_PACKAGES
+        self.maxQueuedMB = DEFAULT_MAX_QUEUED_MB
+        self.fileTimeBudget = None
+        self.fileChunkMB = chunks.DEFAULT_CHUNK_FILE_MB
+        self.checkpoint = None
 
 
 class Job( object ):
@@ -74,7 +108,8 @@ class Job( object ):
     file occurs on this output thread)
     '''
     def __init__(self, configStack, options,
-                    file_measured_callback, status_callback):
+                    file_measured_callback, status_callback, checkpoint_callback=None,
+                    workerPool=None):
 
         # Options define the life a job and cannot be modified
         self._options = options
@@ -82,6 +117,9 @@ class Job( object ):
         # All UI output is done through the status callback
         self._status_callback = status_callback
 
+        # Provides the application's state to save with checkpoints
+        self._checkpoint_callback = checkpoint_callback
+
         # Keep track of (and allow access to) raw file metrics
         self.numFolders = 0
         self.numFoldersMeasured = 0
@@ -89,21 +127,52 @@ class Job( object ):
         self.numFilteredFiles = 0
         self.numFilesToProcess = 0
 
-        # Queues to communicate with Workers, and the output thread
-        self._taskQueue = multiprocessing.Queue()
-        self._controlQueue = multiprocessing.Queue()
-        self._outQueue = multiprocessing.Queue()
+        # Seconds the folder walk waited on workers to catch up
+        self.walkStallSeconds = 0
+
+        # Decides what files go in work packages sent to workers, and when
+        self._scheduler = scheduler.Scheduler(self._options.numWorkers)
+
+        # With checkpoints, track which files have been measured
+        self._file_measured_callback = file_measured_callback
+        self._walkProgress = None
+        if options.checkpoint is not None:
+            self._walkProgress = checkpoint.WalkProgress(options.checkpoint.resumeState)
+            file_measured_callback = self._file_measured
+
+        # With history measures, output comes in through the memo
+        self._historyMemo = None
+        if options.historyRange is not None:
+            self._historyMemo = history.HistoryMemo(file_measured_callback)
+            file_measured_callback = self._historyMemo.file_measured
+
+        # Channels to communicate with Workers, and the output thread
+        self._workerPool = workerPool
+        if workerPool is None:
+            self._dispatch = dispatch.Dispatcher(self._options.numWorkers)
+        else:
+            self._dispatch = workerPool.dispatch
         self._outThread = jobout.OutThread(
-                self._outQueue, self._controlQueue,
-                self._options.profileName, file_measured_callback)
+                self._dispatch, self._options.profileName,
+                file_measured_callback, self._package_measured)
+
+        # Make sure the measure cache is ready before any workers use it
+        if options.measureCachePath is not None:
+            measurecache.MeasureCache.prepare(
+                    options.measureCachePath, options.measureCacheRebuild)
 
         # Create max number of workers (they will be started later as needed)
+        # Config entries are sent to workers once, and referred to by ID
         assert self._options.numWorkers > 0, "Less than 1 worker requested!"
-        context = (trace.get_context(), self._options.profileName)
-        self._workers = self.Workers(
-                self._controlQueue, self._taskQueue, self._outQueue,
-                context, self._options.numWorkers)
-        trace.msg(1, "Created {0} workers".format(self._workers.num_max()))
+        if workerPool is None:
+            context = (trace.get_context(), self._options.profileName)
+            self._workers = self.Workers(
+                    self._dispatch, context, self._options)
+            trace.msg(1, "Created {0} workers".format(self._workers.num_max()))
+            self._configRegistry = registry.ConfigRegistry(self._dispatch)
+        else:
+            self._workers = workerPool
+            self._configRegistry = workerPool.configRegistry
 
         # Create our object for tracking state of folder walking
         self._pathsToMeasure = options.pathsToMeasure
@@ -117,28 +186,48 @@ class Job( object ):
                 options.skipFiles,
                 self.add_folder_files)
 
-        # Utility object for managing work packages; holds the state of the
-        # work package that is being prepared for sending to queue
-        self._workPackage = self.WorkPackage()
-
         # Other processing state
         self._continueProcessing = True
+        self._taskItemsSent = 0
         self._taskPackagesSent = 0
-        self._filesSinceLastSend = 0
+
+        # Work items and chunks for files being measured in chunks, by
+        # their sequence number
+        self._chunkedFiles = {}
+
+        # Position of the folder walk, as the index of the path being
+        # measured, and for resume the folder in it to walk after
+        self._pathIndex = 0
+        self._resumeAfter = None
+        if options.checkpoint is not None and options.checkpoint.resumeState is not None:
+            self._resume(options.checkpoint.resumeState)
 
 
     #-------------------------------------------------------------------------
 
-    def add_folder_files(self, currentDir, deltaPath, filesAndConfigs, numUnfilteredFiles):
+    def add_folder_files(self, currentDir, deltaPath, filesAndConfigs, numUnfilteredFiles,
+                            fileSizes):
         '''
         This is a callback from folderwalk that we use to put a set of filesAndConfigItems
         into one or more WorkPackages to send to jobs. At this point files have already
         been filtered against both job options and the config items.
+        fileSizes has the sizes folderwalk got when listing the folder.
         '''
         trace.cc(2,"add_folder_files for {0} - {1} ({2} files)".format(currentDir, deltaPath, numUnfilteredFiles))
+        if self._walkProgress is None:
+            self._add_folder_files(currentDir, deltaPath, filesAndConfigs, numUnfilteredFiles, fileSizes)
+        else:
+            counters = self._checkpoint_counters()
+            self._walkProgress.start_folder((self._pathIndex, currentDir))
+            self._add_folder_files(currentDir, deltaPath, filesAndConfigs, numUnfilteredFiles, fileSizes)
+            self._walkProgress.end_folder(dict((name, value - counters[name])
+                    for name, value in self._checkpoint_counters().items()))
+        return self._check_command()
+
+    def _add_folder_files(self, currentDir, deltaPath, filesAndConfigs, numUnfilteredFiles,
+                            fileSizes):
         self.numFolders += 1
         self.numUnfilteredFiles += numUnfilteredFiles
-        self._filesSinceLastSend += numUnfilteredFiles
         self.numFilteredFiles += len(filesAndConfigs)
         if self._options.configInfoOnly:
             self._config_info_display(currentDir, filesAndConfigs)
@@ -153,18 +242,21 @@ class Job( object ):
             if head.find(os.path.sep) == -1:
                 self._status_callback("** WARNING ** the top-level folder " + currentDir + " is EMPTY")
         else:
-            self._put_files_in_queue(currentDir, deltaPath, filesAndConfigs)
+            self._put_files_in_queue(currentDir, deltaPath, filesAndConfigs, fileSizes)
             self._status_callback()
-        return self._check_command()
 
     #-------------------------------------------------------------------------
 
     def run(self):
         try:
+            if self._workerPool is not None:
+                self._workerPool.start_job(self._options)
             self._outThread.start()
             self._fill_work_queue()
             self._wait_process_packages()
             self._wait_output_finish()
+            trace.msg(1, "Walk paused {0:.1f}s for workers, workers idle {1:.1f}s".format(
+                    self.walkStallSeconds, self.workerIdleSeconds))
         except KeyboardInterrupt:
             self._keyboardInterrupt()
         except Exception as e:
@@ -175,93 +267,128 @@ class Job( object ):
 
     def _fill_work_queue(self):
         trace.cc(1, "Starting to fill task queue")
-        for pathToMeasure in self._pathsToMeasure:
+        for pathIndex in range(self._pathIndex, len(self._pathsToMeasure)):
+            resumeAfter = self._resumeAfter if pathIndex == self._pathIndex else None
+            self._pathIndex = pathIndex
             if self._check_command():
-                self._folderWalker.walk(pathToMeasure)
-        if self._check_command() and self._workPackage.size_items() > 0:
-            self._send_current_package()
+                self._walk_path(self._pathsToMeasure[pathIndex], resumeAfter)
+        self._scheduler.walk_done()
+
+    def _walk_path(self, pathToMeasure, resumeAfter):
+        '''
+        For delta measures against git revisions, the walk lists the newer
+        revision's tree rather than the folder (gitsource.py), and for
+        history measures the tree of each commit. Archives and source trees
+        given in place of a path are walked from their files.
+        '''
+        isSourceTree = isinstance(pathToMeasure, filesource.SourceTree)
+        isArchive = not isSourceTree and archivesource.archive_format(pathToMeasure) is not None
+        if (isSourceTree or isArchive) and (self._options.deltaPath is not None or
+                self._options.deltaRevs is not None or self._options.historyRange is not None):
+            raise utils.InputException(uistrings.STR_ErrorSourceTreeOptions.format(pathToMeasure))
+
+        if self._options.historyRange is not None:
+            self._walk_history(pathToMeasure)
+            return
+        sourceTree = None
+        if isSourceTree:
+            sourceTree = pathToMeasure
+            pathToMeasure = sourceTree.rootPath
+        elif isArchive:
+            sourceTree = archivesource.ArchiveTree(pathToMeasure)
+        elif self._options.deltaRevs is not None:
+            sourceTree = gitsource.delta_tree(pathToMeasure, *self._options.deltaRevs)
+        try:
+            self._folderWalker.walk(pathToMeasure, resumeAfter, sourceTree)
+        finally:
+            if sourceTree is not None:
+                sourceTree.close()
+
+    def _walk_history(self, pathToMeasure):
+        commitHistory = history.CommitHistory(pathToMeasure, self._options.historyRange)
+        try:
+            for gitTree in commitHistory.trees():
+                if not self._check_command():
+                    break
+                self._folderWalker.walk(pathToMeasure, None, gitTree)
+        finally:
+            commitHistory.close()
 
     def _wait_process_packages(self):
-        trace.cc(1, "Task queue is complete, processing packages")
-        while self._check_command() and self._task_queue_size() > 0:
-            time.sleep(MAIN_PROCESSING_SLEEP)
+        trace.cc(1, "Folder walk is complete, processing packages")
+        while self._check_command():
+            itemsReceived = self._outThread.taskItemsReceived
+            self._send_packages()
+            if self._scheduler.num_pending() == 0 and not self._chunkedFiles:
+                self._dispatch.all_tasks_sent()
+                if self._task_items_outstanding() == 0:
+                    break
+            self._outThread.wait_for_items(itemsReceived + 1, STATUS_UPDATE_INTERVAL)
             self._status_callback()
         if self._check_command():
-            self._send_workers_command('WORK_DONE')
+            self._dispatch.put_tasks_done(self._workers.num_started())
         else:
-            self._send_workers_command('EXIT')
+            self._dispatch.exit()
 
     def _wait_output_finish(self):
-        self._send_output_command('WORK_DONE')
-        while self._check_command() or self._outThread.is_alive():
+        self._dispatch.put_output_done()
+        while self._outThread.is_alive():
             self._outThread.join(JOBOUT_EXIT_TIMEOUT)
             self._status_callback()
-            self._continueProcessing = not bool(self._controlQueue.empty())
+        self._check_command()
 
     def _keyboardInterrupt(self):
         trace.cc(1, "Ctrl-c occurred in MAIN loop")
-        self._send_output_command('EXIT')
+        self._dispatch.exit()
         raise
 
     def _exception(self, e):
         trace.cc(1, "EXCEPTION -- EXITING JOB...")
-        self._send_workers_command('EXIT')
-        self._send_output_command('EXIT')
+        self._dispatch.exit()
         trace.traceback()
         raise e
 
     def _wait_then_exit(self):
         trace.cc(1, "Waiting to exit workers and output thread...")
+        if self._workerPool is not None:
+            self._outThread.join(JOBOUT_EXIT_TIMEOUT)
+            self._workerPool.end_job(self._status_callback)
+            trace.cc(1, "DONE")
+            return
         for worker in self._workers():
             while worker.is_alive():
                 self._status_callback()
+                self._dispatch.drain()
                 worker.join(WORKER_EXIT_TIMEOUT)
                 trace.cc(2, "Worker {0} is_alive: {1}".format(
                         worker.name, worker.is_alive()))
         self._outThread.join(JOBOUT_EXIT_TIMEOUT)
-        self._close_queues()
+        self._dispatch.close()
         trace.cc(1, "TERMINATING")
 
 
+    @property
+    def workerIdleSeconds(self):
+        '''
+        Total seconds workers waited for work packages
+        '''
+        return self._outThread.workerIdleSeconds
+
     #-------------------------------------------------------------------------
     #   Work Package Processing
 
-    class WorkPackage( object ):
-        '''
-        A work package groups a set of files to be sent to a jobworker. The files
-        and the config information necessary to process them are workItems.
-        '''
-        def __init__(self):
-            self.reset()
-        def reset(self):
-            self.itemsToProcess = []
-            self.byteSize = 0
-        def add(self, workItem, byteSize):
-            self.itemsToProcess.append(workItem)
-            self.byteSize += byteSize
-        def size_items(self):
-            return len(self.itemsToProcess)
-        def size_bytes(self):
-            return self.byteSize
-        def items(self):
-            return self.itemsToProcess
-        def ready_to_send(self):
-            return (self.size_items() >= QUEUE_PACKAGE_MAX_ITEMS or
-                    self.size_bytes() >= QUEUE_PACKAGE_MAX_BYTES)
-
-
-    def _task_queue_size(self):
-        remainingPackages = self._taskPackagesSent - self._outThread.taskPackagesReceived
-        assert remainingPackages >=0, "In/Out Queues out of sync"
-        return remainingPackages
-
-
-    def _put_files_in_queue(self, path, deltaPath, filesAndConfigs):
+    def _task_items_outstanding(self):
+        remainingItems = self._taskItemsSent - self._outThread.taskItemsReceived
+        assert remainingItems >=0, "In/Out Queues out of sync"
+        return remainingItems
+
+
+    def _put_files_in_queue(self, path, deltaPath, filesAndConfigs, fileSizes):
         '''
-        Package files from the given folder into workItems that are then grouped
-        into workPackages that are placed into the task queue for jobworkers.
-        Packages are broken up if files number or total size exceeds
-        thresholds to help evenly distribute load across cores
+        Package files from the given folder into workItems that the scheduler
+        groups into workPackages that are placed into the task queue for
+        jobworkers. The scheduler uses file size to estimate the cost of each
+        workItem to help evenly distribute load across cores
         '''
         if not filesAndConfigs:
             return
@@ -269,11 +396,13 @@ class Job( object ):
 
         for fileName, configEntrys in filesAndConfigs:
 
-            # Expensive to check file size here, but it is worth it for
-            # pracelling widely varying file sizes out to cores for CPU intensive
-            # jobs. Profiling shows it is not worth caching this
+            # File size is used for pracelling widely varying file sizes out
+            # to cores for CPU intensive jobs. The walk normally has it from
+            # listing the folder; if not, stat the file here
             try:
-                fileSize = utils.get_file_size(os.path.join(path, fileName))
+                fileSize = fileSizes.get(fileName)
+                if fileSize is None:
+                    fileSize = utils.get_file_size(os.path.join(path, fileName))
             except Exception as e:
                 # It is possible (at least in Windows) for a fileName to exist
                 # in the file system but be invalid for Windows calls. This is
@@ -285,42 +414,170 @@ class Job( object ):
                 trace.msg(1, str(e))
                 continue
 
+            # Files from a source tree each have a SourceFile for their delta
+            fileDeltaPath = deltaPath
+            if isinstance(deltaPath, dict):
+                fileDeltaPath = deltaPath[fileName]
+
+            # Files are numbered in walk order, so output shards can be
+            # merged in the order a single worker would measure them
             trace.cc(3, "WorkItem: {0}, {1}".format(fileSize, fileName))
             self.numFilesToProcess += 1
+            if self._walkProgress is not None and not self._walkProgress.add_file(
+                    os.path.join(path, fileName)):
+                continue
+            configIds = self._configRegistry.config_ids(configEntrys)
+            if self._historyMemo is not None and not self._historyMemo.add_file(
+                    os.path.join(path, fileName), fileDeltaPath, configEntrys, configIds,
+                    len(filesAndConfigs)):
+                continue
             workItem = (path,
-                        deltaPath,
+                        fileDeltaPath,
                         fileName,
-                        configEntrys,
-                        self._options,
-                        len(filesAndConfigs))
-            self._workPackage.add(workItem, fileSize)
-
-            if self._workPackage.ready_to_send() or (
-                    self._filesSinceLastSend > MAX_FILES_BEFORE_SEND):
-                self._send_current_package()
+                        configIds,
+                        len(filesAndConfigs),
+                        self.numFilesToProcess,
+                        None,
+                        scheduler.file_cost(fileSize, len(configEntrys)))
+            if self._chunk_file(fileDeltaPath, fileSize, configEntrys):
+                self._put_file_chunks(workItem, fileSize, len(configEntrys))
+            else:
+                self._scheduler.add(workItem, workItem[-1])
+            if self._scheduler.is_full():
+                self._wait_for_workers()
 
             if not self._check_command():
                 break
 
+        self._send_packages()
 
-    def _send_current_package(self):
+
+    def _chunk_file(self, deltaPath, fileSize, configEntrys):
         '''
-        Place package of work on queue, and start a worker
+        Measure a file in chunks if it is big enough to be worth it, and all
+        its config entries can; delta measures and the measure cache work
+        with whole files
         '''
-        self._workers.start_next()
-        trace.cc(2, "PUT WorkPackage - files: {0}, bytes: {1}...".format(
-                self._workPackage.size_items(), self._workPackage.size_bytes()))
-        trace.cc(4, list(self._workPackage.items()))
-        try:
-            self._taskQueue.put(list(self._workPackage.items()), True, TASK_FULL_TIMEOUT)
-        except Full:
-            raise utils.JobException("FATAL ERROR -- FULL TASK QUEUE")
-        else:
+        options = self._options
+        return (options.fileChunkMB and
+                options.numWorkers > 1 and
+                deltaPath is None and
+                options.measureCachePath is None and
+                fileSize >= options.fileChunkMB * 1024 * 1024 and
+                all(configEntry.module.can_survey_chunks(configEntry)
+                    for configEntry in configEntrys))
+
+    def _put_file_chunks(self, workItem, fileSize, numConfigEntrys):
+        '''
+        Hold the work item for the file until its chunks are measured
+        '''
+        fileKey = workItem[5]
+        chunkedFile = chunks.ChunkedFile(fileKey, fileSize, self._options.numWorkers)
+        self._chunkedFiles[fileKey] = (workItem, chunkedFile)
+        trace.cc(1, "Chunks: {0} for {1}".format(len(chunkedFile.chunks), workItem[2]))
+        for chunk in chunkedFile.chunks:
+            chunkCost = scheduler.file_cost(chunk.end - chunk.start, numConfigEntrys)
+            self._scheduler.add(workItem[:6] + (chunk, chunkCost), chunkCost)
+
+    def _chunk_measured(self, fileKey, chunkNum, results):
+        '''
+        Once all chunks are in, send the item to finish the file ahead of
+        other work
+        '''
+        workItem, chunkedFile = self._chunkedFiles[fileKey]
+        if chunkedFile.add_results(chunkNum, results):
+            del self._chunkedFiles[fileKey]
+            finishCost = scheduler.file_cost(0, len(workItem[3]))
+            self._scheduler.add_first(workItem[:6] + (chunkedFile, finishCost), finishCost)
+
+
+    def _wait_for_workers(self):
+        '''
+        Send what the scheduler can't hold, pausing the walk while the task
+        queue is at its limits until workers catch up
+        '''
+        self._send_packages()
+        if not self._scheduler.is_full():
+            return
+        trace.cc(2, "Walk paused: {0} packages, {1} bytes queued".format(
+                self._taskPackagesSent - self._outThread.taskPackagesReceived,
+                self._dispatch.queued_task_bytes()))
+        stallStart = time.perf_counter()
+        while self._scheduler.is_full() and self._check_command():
+            packagesReceived = self._outThread.taskPackagesReceived
+            self._outThread.wait_for_packages(packagesReceived + 1, STATUS_UPDATE_INTERVAL)
+            self._status_callback()
+            self._send_packages()
+        self.walkStallSeconds += time.perf_counter() - stallStart
+
+
+    def _queue_has_room(self, outstandingPackages):
+        return (outstandingPackages < self._options.maxQueuedPackages and
+                self._dispatch.queued_task_bytes() < self._options.maxQueuedMB * 1024 * 1024)
+
+
+    def _send_packages(self):
+        '''
+        Place packages the scheduler has ready on queue, starting a worker
+        for each until all have been started
+        '''
+        packagesOutstanding = self._taskPackagesSent - self._outThread.taskPackagesReceived
+        for workPackage, packageCost in self._scheduler.packages(
+                                            packagesOutstanding, self._queue_has_room):
+            self._workers.start_next()
+            trace.cc(2, "PUT WorkPackage - files: {0}, cost: {1}...".format(
+                    len(workPackage), packageCost))
+            trace.cc(4, workPackage)
+            self._dispatch.put_task(workPackage)
+            self._taskItemsSent += len(workPackage)
             self._taskPackagesSent += 1
-            self._filesSinceLastSend = 0
-            self._workPackage.reset()
 
 
+    #-------------------------------------------------------------------------
+    #   Checkpoints
+
+    # Job counters saved with checkpoints
+    CheckpointCounters = ['numFolders', 'numFoldersMeasured', 'numUnfilteredFiles',
+                          'numFilteredFiles', 'numFilesToProcess']
+
+    def _file_measured(self, filePath, outputList, errorList):
+        if outputList or errorList:
+            self._file_measured_callback(filePath, outputList, errorList)
+        self._walkProgress.file_done(filePath)
+
+    def _package_measured(self, workerName, packageCost, seconds):
+        '''
+        Out thread callback once output from a package has been handed to the
+        application, which is when checkpoints are saved
+        '''
+        self._scheduler.package_measured(workerName, packageCost, seconds)
+        if (self._walkProgress is not None and self._continueProcessing and
+                not self._dispatch.exiting() and self._options.checkpoint.is_due()):
+            self._save_checkpoint()
+
+    def _save_checkpoint(self):
+        '''
+        Save walk progress with the application's state; output up to now
+        has been handed to the application, and the out thread that does
+        that is waiting on us
+        '''
+        saveStart = time.perf_counter()
+        state = self._walkProgress.state()
+        state['app'] = self._checkpoint_callback() if self._checkpoint_callback else None
+        self._options.checkpoint.save(state)
+        trace.msg(1, "Checkpoint after {0}, {1} more files, {2:.2f}s".format(
+                state['position'], len(state['doneFiles']), time.perf_counter() - saveStart))
+
+    def _checkpoint_counters(self):
+        return dict((name, getattr(self, name)) for name in self.CheckpointCounters)
+
+    def _resume(self, resumeState):
+        if resumeState['position'] is not None:
+            self._pathIndex, self._resumeAfter = resumeState['position']
+        for name, value in resumeState['counters'].items():
+            setattr(self, name, value)
+        trace.msg(1, "Resuming after {0}".format(self._resumeAfter))
+
     #-------------------------------------------------------------------------
 
     def _config_info_display(self, currentDir, filesAndConfigs):
@@ -344,74 +601,31 @@ class Job( object ):
 
 
     #-------------------------------------------------------------------------
-    #   Command Queue management
+    #   Job messages
 
     def _check_command(self):
         '''
-        Check the command queue to see if there have been problems while
-        running a job
-        Exceptions received from the command queue are thrown
+        Check messages from workers and the out thread to see if there have
+        been problems while running a job
+        Exceptions received are thrown
         '''
-        myCommand = None
-        otherCommands = []
-        try:
-            while self._continueProcessing:
-                (target, command, payload) = self._controlQueue.get_nowait()
-                trace.cc(4, "check_command - {0}, {1}".format(target, command))
-                if target == 'JOB':
-                    if 'ERROR' == command:
-                        # Error notifications in the control queue are only used to support
-                        # break on error functionality -- the error info itself will be handled
-                        # by the output queue. Jobs with lots of errors can clog up the
-                        # control queue, so we clear these out as we find them
-                        trace.cc(1, "COMMAND: ERROR for file: {0}".format(payload))
-                        if self._options.breakOnError:
-                            self._continueProcessing = False
-                    else:
-                        myCommand = command
-                        break
-                else:
-                    otherCommands.append((target, command, payload))
-        except Empty:
-            pass
-        finally:
-            if 'EXCEPTION' == myCommand:
+        for command, payload in self._dispatch.get_job_messages():
+            trace.cc(4, "check_command - {0}".format(command))
+            if 'ERROR' == command:
+                # Error notifications are only used to support break on error
+                # functionality -- the error info itself will be handled
+                # by the output queue
+                trace.cc(1, "COMMAND: ERROR for file: {0}".format(payload))
+                if self._options.breakOnError:
+                    self._continueProcessing = False
+            elif 'CHUNK' == command:
+                trace.cc(2, "COMMAND: CHUNK {0}".format(payload[:2]))
+                self._chunk_measured(*payload)
+            elif 'EXCEPTION' == command:
                 trace.cc(1, "COMMAND: EXCEPTION RECEIVED")
                 raise payload
-
-            # If everything is okay, or some other exception happened, we want to
-            # make sure we put any queue items we removed back in the queue
-            for (target, command, payload) in otherCommands:
-                trace.cc(3, "putting {0}, {1}".format(target, command))
-                self._controlQueue.put_nowait((target, command, payload))
-
         return self._continueProcessing
 
-
-    def _close_queues(self):
-        # Make sure queues are flushed and closed to avoid errors in queue code
-        queues = [self._taskQueue, self._outQueue, self._controlQueue]
-        for queue in queues:
-            try:
-                while True:
-                    _ = queue.get_nowait()
-                queue.close()
-            except Empty:
-                pass
-
-
-    def _send_workers_command(self, command, payload=None):
-        for worker in self._workers():
-            if worker.is_alive():
-                self._send_command(worker.name, command, payload)
-
-    def _send_output_command(self, command, payload=None):
-        self._send_command(self._outThread.name, command, payload)
-
-    def _send_command(self, target, command, payload):
-        trace.cc(2, "COMMAND:  {0}, {1} {2}".format(target, command, payload))
-        self._controlQueue.put_nowait((target, command, payload))
-
     #-------------------------------------------------------------------------
 
     class Workers( object ):
@@ -420,12 +634,10 @@ class Job( object ):
         of each Worker a bit cleaner and allows for easy lazy job starting
         and tracking of how many workers are active
         '''
-        def __init__(self, controlQueue, inQueue, outQueue,
-                    dbgContext, numWorkers):
+        def __init__(self, dispatcher, dbgContext, options):
             self._workers = [
-                    jobworker.Worker(inQueue, outQueue, controlQueue,
-                            dbgContext, str(num+1))
-                    for num in range(numWorkers) ]
+                    jobworker.Worker(dispatcher, dbgContext, num+1, options)
+                    for num in range(options.numWorkers) ]
             self._workerStartIter = self()
             self._workerStartDone = False
             self._startedWorkers = 0
@@ -1,28 +1,27 @@
 #=============================================================================
 '''
     Surveyor Job Output Thread
+
+    Workers send file output in compact form (transport.py), which is
+    decoded here one file at a time as it is passed to the application.
 '''
 #=============================================================================
 # Copyright 2004-2011, Matt Peloquin and Construx. This file is part of Code
 # Surveyor, covered under GNU GPL v3 and is distributed WITHOUT ANY WARRANTY.
 #=============================================================================
-import time
 import _thread
 import threading
-from queue import Empty, Full
 
 from framework import trace
-from . import utils
-
-OUTPUT_EMPTY_WAIT = 0.02
-CONTROL_QUEUE_TIMEOUT = 0.1
+from framework import transport
 
 class OutThread( threading.Thread ):
     '''
     OutThread runs in main process, monitoring the out queue and passing
     on to Surveyor, providing seralization of results from the queue.
     '''
-    def __init__(self, outQueue, controlQueue, profileName, file_measure_callback):
+    def __init__(self, dispatcher, profileName,
+                    file_measure_callback, package_measured_callback):
         trace.cc(1, "Creating output queue thread")
         threading.Thread.__init__(self, name="Out")
         self._profileName = profileName
@@ -32,15 +31,38 @@ class OutThread( threading.Thread ):
         self.daemon = True
 
         # The main thread owns our queues
-        self._outQueue = outQueue
-        self._controlQueue = controlQueue
+        self._dispatch = dispatcher
         self._file_measure_callback = file_measure_callback
+        self._package_measured_callback = package_measured_callback
+        self._decoder = transport.ResultDecoder()
 
-        # Total task output packages we've received from all processes
+        # Total work items and packages that workers have processed; the job
+        # waits on the condition for this to change. Packages workers share
+        # with each other are not counted, as the job didn't send them
+        self.taskItemsReceived = 0
         self.taskPackagesReceived = 0
+        self._packageReceived = threading.Condition()
+
+        # Total seconds workers report waiting for packages
+        self.workerIdleSeconds = 0
+
 
-        # Flag to track when we receive WORK_DONE from the Job
-        self._workDone = False
+    def wait_for_items(self, numItems, timeout):
+        '''
+        Block the caller until numItems have been received, or timeout
+        '''
+        with self._packageReceived:
+            return self._packageReceived.wait_for(
+                    lambda: self.taskItemsReceived >= numItems, timeout)
+
+
+    def wait_for_packages(self, numPackages, timeout):
+        '''
+        Block the caller until numPackages have been received, or timeout
+        '''
+        with self._packageReceived:
+            return self._packageReceived.wait_for(
+                    lambda: self.taskPackagesReceived >= numPackages, timeout)
 
 
     def run(self):
@@ -58,70 +80,39 @@ class OutThread( threading.Thread ):
             _thread.interrupt_main()
         except Exception as e:
             trace.cc(1, "EXCEPTION occurred while processing output queue")
-            self._controlQueue.put_nowait(('JOB', 'EXCEPTION', e))
+            self._dispatch.put_job_message('EXCEPTION', e)
             trace.traceback(2)
         finally:
             trace.cc(1, "TERMINATING")
 
 
     def _run(self):
-        # We keep processing queue until the job signals it is done and
-        # the queue is empty, or we receive an abort command
-        while self._continue_processing():
-            try:
-                if self._workDone and self._outQueue.empty():
-                    break
-                filesOutput = self._outQueue.get_nowait()
-
-            except Empty:
-                trace.cc(3, "EMPTY OUTPUT")
-                time.sleep(OUTPUT_EMPTY_WAIT)
-            else:
-                self.taskPackagesReceived += 1
-                trace.cc(2, "GOT {0} measures".format(len(filesOutput)))
-
-                # We get a set of output for multiple files with each
-                # outputQueue item. Each file has a set of output
-                # and potential errors that we pack to the app
-                for filePath, outputList, errorList in filesOutput:
-
-                    # Synchronus callback to applicaiton
-                    # Output writing and screen update occurs in this call
-                    self._file_measure_callback(filePath, outputList, errorList)
-
-                    if errorList:
-                        trace.file(1, "ERROR measuring: {0}".format(filePath))
-                        self._controlQueue.put_nowait(('JOB', 'ERROR', filePath))
-
-
-    def _continue_processing(self):
-        continueProcessing = True
-        otherCommands = []
-        myCommand = None
-        try:
-            while True:
-                (target, command, payload) = self._controlQueue.get_nowait()
-                trace.cc(3, "command - {0}, {1}".format(target, command))
-                if target == self.name:
-                    myCommand = command
-                    break
-                else:
-                    otherCommands.append((target, command, payload))
-        except Empty:
-            pass
-        finally:
-            if 'EXIT' == myCommand:
-                trace.cc(1, "COMMAND: EXIT")
-                continueProcessing = False
-            elif 'WORK_DONE' == myCommand:
-                trace.cc(1, "COMMAND: WORK_DONE")
-                self._workDone = True
-            for (target, command, payload) in otherCommands:
-                trace.cc(3, "putting {0}, {1}".format(target, command))
-                try:
-                    self._controlQueue.put((target, command, payload), True, CONTROL_QUEUE_TIMEOUT)
-                except Full:
-                    raise utils.JobException("FATAL EXCEPTION - Control Queue full, can't put")
-        return continueProcessing
-
-
+        # We keep processing queue until the job signals all output is in
+        # or that we should exit; both show up as no output
+        while True:
+            workOutput = self._dispatch.get_output()
+            if workOutput is None:
+                break
+            filesOutput, packageStats = workOutput
+            workerName, numItems, packageCost, seconds, numShared, idleSeconds = packageStats
+            trace.cc(2, "GOT {0} measures from {1}".format(len(filesOutput[-1]), workerName))
+
+            # We get a set of output for multiple files with each
+            # outputQueue item. Each file has a set of output
+            # and potential errors that we pack to the app
+            for filePath, outputList, errorList in self._decoder.files(workerName, filesOutput):
+
+                # Synchronus callback to applicaiton
+                # Output writing and screen update occurs in this call
+                self._file_measure_callback(filePath, outputList, errorList)
+
+                if errorList:
+                    trace.file(1, "ERROR measuring: {0}".format(filePath))
+                    self._dispatch.put_job_message('ERROR', filePath)
+
+            self._package_measured_callback(workerName, packageCost, seconds)
+            self.workerIdleSeconds += idleSeconds
+            with self._packageReceived:
+                self.taskItemsReceived += numItems
+                self.taskPackagesReceived += 1 - numShared
+                self._packageReceived.notify_all()
@@ -3,7 +3,11 @@
     Surveyor Job Worker Process
 
     A work package from the input queue is a set of work items. These
-    consits of a file name and set of config entries for that file.
+    consits of a file name and the IDs of the config entries for that file,
+    along with the file's place in the folder walk and the job's estimate
+    of the cost of measuring the file.
+    Config entries are sent to each worker once, when the job first
+    registers them, and are kept for the life of the worker (registry.py).
 
     For each workitem, the worker designates the given file as the
     "currentFile". It then goes through all the config entries for
@@ -12,9 +16,42 @@
     call to the appropriate module (the file is opened once and cached).
 
     The output from each measure call is placed in a list associated with
-    that file. When the file processing is done this list is cached as
-    part of "currentOutput". Once all workItems in a workPackage are
-    processed, the currentOutput is posted and we start over again.
+    that file. When the file processing is done this list is encoded in
+    compact form (transport.py) and cached as part of "currentOutput".
+    Once all workItems in a workPackage are processed, the currentOutput is
+    posted and we start over again.
+
+    If the job is using output shards (shards.py), the worker writes the
+    rows for each file to its shards, and sends only the measures and the
+    number of rows in currentOutput unless the job asks for everything.
+
+    When the job has sent all of its work and other workers are waiting
+    for more, the back half of the current work package is put back in the
+    input queue for them.
+
+    If the job has a time budget for each file, a FileWatchdog stops a
+    csmodule that runs over it, e.g., with a search regex that is
+    backtracking catastrophically. The file is reported with an error, and
+    any measures from config entries that finished are kept.
+
+    A work item for a chunk of a very large file is surveyed by each config
+    entry's module, and the results go back to the job in a job message
+    rather than as output for the file. The item that finishes the file
+    is measured like any other, with the chunk results in place of the
+    file's lines (chunks.py).
+
+    Files from a source tree, e.g., a git revision for a delta job against
+    it (-dg) or an archive, are read from there rather than the file system
+    (filesource.py). Output
+    for files from a commit history (-l) is tagged with the ID the job
+    keeps the file's output under, and sent even if it is empty, so the
+    job can replay it for later commits (history.py).
+
+    Workers in a pool kept between jobs (workerpool.py) are created
+    without options; they wait for each job to start, take on its options
+    and its application's folder and environment, and once the job's work
+    is done close the job's files and tell the pool, keeping the config
+    entries they have received for the next job.
 '''
 #=============================================================================
 # Copyright 2004-2011, Matt Peloquin and Construx. This file is part of Code
@@ -23,19 +60,26 @@
 import os
 import sys
 import time
+import signal
 import multiprocessing
 from errno import EACCES
-from queue import Empty, Full
 
+from framework import chunks
 from framework import fileext
+from framework import filesource
+from framework import measurecache
+from framework import registry
+from framework import shards
+from framework import transport
 from framework import uistrings
 from framework import trace
 from framework import utils
 
 WORKER_PROC_BASENAME = "Job"
-INPUT_EMPTY_WAIT = 0.01
-CONTROL_QUEUE_TIMEOUT = 0.1
-OUT_PUT_TIMEOUT = 0.4
+
+# Once a file is over budget the alarm repeats at this interval, in case
+# a csmodule catches the exception and keeps going
+WATCHDOG_REPEAT_INTERVAL = 1.0
 
 
 #-------------------------------------------------------------------------
@@ -70,21 +114,29 @@ class Worker( Process ):
     They take items from the input queue, delegate calls to the measurement
     modules, and package measures for the output queue.
     '''
-    def __init__(self, inputQueue, outputQueue, controlQueue,
-                    context, num, jobName=WORKER_PROC_BASENAME):
+    def __init__(self, dispatcher, context, num, options, jobName=WORKER_PROC_BASENAME):
         '''
         Init is called in the parent process
+        num is the 1-based worker number, which also selects the worker's
+        config channel; options are None for workers in a pool
         '''
         multiprocessing.Process.__init__(self, name=jobName + str(num))
-        self._inputQueue = inputQueue
-        self._outputQueue = outputQueue
-        self._controlQueue = controlQueue
+        self._dispatch = dispatcher
+        self._options = options
+        self._configs = registry.WorkerConfigs(dispatcher, num - 1)
+        self._encoder = transport.ResultEncoder()
         self._continueProcessing = True
+        self._workDone = False
         self._currentOutput = []
         self._currentFilePath = None
+        self._currentFileSequence = None
+        self._currentMemoId = None
         self._currentFileIterator = None
         self._currentFileOutput = []
         self._currentFileErrors = []
+        self._measureCache = None
+        self._shards = None
+        self._watchdog = None
         self._dbgContext, self._profileName = context
         trace.cc(2, "Initialized new process: {0}".format(self.name))
 
@@ -97,98 +149,121 @@ class Worker( Process ):
         try:
             trace.set_context(self._dbgContext)
 
-            if self._profileName is not None:
+            if self._options is None:
+                self._run_pooled()
+            elif self._profileName is not None:
                 import cProfile;
                 cProfile.runctx('self._run()', globals(), {'self': self}, self._profileName + self.name)
             else:
                 self._run()
 
-        except Exception as e:
-            self._controlQueue.put_nowait(('JOB', 'EXCEPTION', e))
-            trace.traceback()
         except KeyboardInterrupt:
             trace.cc(1, "Ctrl-c occurred in job worker loop")
         except Exception as e:
             trace.cc(1, "EXCEPTION occurred in job worker loop")
-            self._controlQueue.put_nowait(('JOB', 'EXCEPTION', e))
+            self._dispatch.put_job_message('EXCEPTION', e)
             trace.traceback()
         finally:
-            # We know the input and out queues are empty or that we're bailing
-            # on them, so we cancel_join_thread (don't wait for them to clear)
-            self._inputQueue.close()
-            self._inputQueue.cancel_join_thread()
-            self._outputQueue.close()
-            self._outputQueue.cancel_join_thread()
-            # We may have put items on the control queue, so we join_thread to
-            # make sure what we've put in the pipe is flushed
-            self._controlQueue.close()
-            self._controlQueue.join_thread()
+            self._close_job_files()
+            self._dispatch.close_worker(self._workDone)
             trace.cc(1, "TERMINATING")
 
 
+    def _run_pooled(self):
+        '''
+        Run each job the pool starts until the pool exits; a job that
+        aborts ends the worker, as the pool isn't kept after one
+        '''
+        while True:
+            jobSettings = self._configs.next_job()
+            if jobSettings is None:
+                break
+            self._options, jobDir, jobEnv = jobSettings
+            os.environ.clear()
+            os.environ.update(jobEnv)
+            os.chdir(jobDir)
+
+            # Output schemas are known to the job's out thread, so the
+            # encoder starts over with each job
+            self._encoder = transport.ResultEncoder()
+            self._continueProcessing = True
+            self._run()
+            self._close_job_files()
+            if not self._workDone:
+                break
+            self._dispatch.put_job_done()
+
+
     def _run(self):
         '''
-        Process items from input queue until it's empty and app signals all done
+        Process items from input queue until the job signals all done by
+        sending us an empty package, or signals exit
         '''
         trace.cc(1, "STARTING: Begining to process input queue...")
+        if self._options.outputShards is not None:
+            self._shards = shards.ShardWriter(self._options.outputShards, self.name)
+        self._watchdog = FileWatchdog(self._options.fileTimeBudget)
 
         while self._continueProcessing:
-            try:
-                workPackage = self._inputQueue.get_nowait()
-                trace.cc(2, "GOT WorkPackage - files: {0}".format(len(workPackage)))
-            except Empty:
-                # The input queue can return empty when it really isn't, or
-                # we are in mid job and have burned down the empty queue
-                # Sleeping after these helps performance with many cores, vs
-                # just blocking on inputQueue.get
-                trace.cc(3, "EMPTY INPUT")
-                time.sleep(INPUT_EMPTY_WAIT)
-                self._check_for_stop()
-            else:
-                for workItem in workPackage:
-                    if not self._measure_file(workItem):
-                        self._continueProcessing = False
-                        break
-                self._post_results()
-                self._check_for_stop()
+            waitStart = time.perf_counter()
+            workPackage = self._dispatch.get_task()
+            if workPackage is None:
+                trace.cc(1, "EXIT" if self._dispatch.exiting() else "WORK_DONE")
+                break
+            trace.cc(2, "GOT WorkPackage - files: {0}".format(len(workPackage)))
+            self._process_package(workPackage, time.perf_counter() - waitStart)
+
+        # Unless the job is aborting, make sure our output gets to the job
+        self._workDone = not self._dispatch.exiting()
+
 
+    def _close_job_files(self):
+        if self._measureCache is not None:
+            self._measureCache.close()
+            self._measureCache = None
+        if self._shards is not None:
+            self._shards.close_files()
+            self._shards = None
+        filesource.close_readers()
 
-    def _check_for_stop(self):
+
+    def _process_package(self, workPackage, idleSeconds):
         '''
-        Command queue will normally be empty unless we are terminating.
-        If there are commands, get all that we can until we find our own or empty
-        the queue -- we then put back everything we took off. The command queue
-        should never have a lot in it and this guarantees we can't deadlock.
+        Measure each file in the package, sharing with idle workers, and post
+        the results along with stats the job uses to schedule packages,
+        including how long we waited for the package
         '''
-        otherCommands = []
-        myCommand = None
-        exitNow = False
-        try:
-            while True:
-                (target, command, payload) = self._controlQueue.get_nowait()
-                trace.cc(3, "command - {0}, {1}".format(target, command))
-                if target == self.name:
-                    myCommand = command
-                    break
-                else:
-                    otherCommands.append((target, command, payload))
-        except Empty:
-            pass
-        finally:
-            if 'EXIT' == myCommand:
-                trace.cc(1, "COMMAND: EXIT")
-                self._continueProcessing = False
-                exitNow = True
-            elif 'WORK_DONE' == myCommand:
-                trace.cc(1, "COMMAND: WORK_DONE")
+        startTime = time.perf_counter()
+        numItems = 0
+        packageCost = 0
+        numShared = 0
+        while self._continueProcessing and numItems < len(workPackage):
+            workItem = workPackage[numItems]
+            numItems += 1
+            packageCost += workItem[-1]
+            if not self._measure_file(workItem):
                 self._continueProcessing = False
-            for target, command, payload in otherCommands:
-                trace.cc(3, "putting {0}, {1}".format(target, command))
-                try:
-                    self._controlQueue.put((target, command, payload), True, CONTROL_QUEUE_TIMEOUT)
-                except Full:
-                    raise utils.JobException("FATAL EXCEPTION - Control Queue full, can't put")
-        return exitNow
+            elif len(workPackage) - numItems > 1 and self._dispatch.workers_idle():
+                workPackage = self._share_package(workPackage, numItems)
+                numShared += 1
+        self._post_results((self.name, numItems, packageCost,
+                            time.perf_counter() - startTime, numShared, idleSeconds))
+
+
+    def _share_package(self, workPackage, numItems):
+        '''
+        Split remaining items so the items we keep cost about half of what
+        is left; items are ordered by cost, so we keep the first items
+        '''
+        halfCost = sum(workItem[-1] for workItem in workPackage[numItems:]) / 2
+        keepItems = numItems + 1
+        keepCost = workPackage[numItems][-1]
+        while (keepItems < len(workPackage) - 1 and
+                keepCost + workPackage[keepItems][-1] <= halfCost):
+            keepCost += workPackage[keepItems][-1]
+            keepItems += 1
+        self._dispatch.put_shared_task(workPackage[keepItems:])
+        return workPackage[:keepItems]
 
     #-------------------------------------------------------------------------
     #  File measurement
@@ -213,35 +288,82 @@ class Worker( Process ):
         (   path,
             deltaPath,
             fileName,
-            configItems,
-            options,
-            numFilesInFolder
+            configIds,
+            numFilesInFolder,
+            self._currentFileSequence,
+            chunk,
+            _itemCost
             ) = workItem
+        options = self._options
+
+        configItems = self._configs.config_entrys(configIds)
+        if configItems is None:
+            self._continueProcessing = False
+            return True
 
         self._currentFilePath = os.path.join(path, fileName)
+        if isinstance(chunk, chunks.FileChunk):
+            self._measure_chunk(chunk, configItems)
+            return True
         trace.file(1, "Processing: {0}".format(self._currentFilePath))
 
-        deltaFilePath = None
-        if deltaPath is not None:
+        # Files from a source tree have a SourceFile in place of the delta folder
+        deltaFilePath = deltaPath
+        self._currentMemoId = None
+        if isinstance(deltaPath, str):
             deltaFilePath = os.path.join(deltaPath, fileName)
+        elif isinstance(deltaPath, filesource.SourceFile):
+            self._currentMemoId = deltaPath.memoId
+
+        # Delta measures depend on the delta file, so they aren't cached
+        measureCache = None
+        if options.measureCachePath is not None and deltaFilePath is None:
+            if self._measureCache is None:
+                self._measureCache = measurecache.MeasureCache(options.measureCachePath)
+            measureCache = self._measureCache
+            measureCache.new_file()
 
         continueProcessing = True
+        self._watchdog.start_file()
         try:
-            for configItem in configItems:
-                if self._check_for_stop():
+            for entryIndex, configItem in enumerate(configItems):
+                if self._dispatch.exiting():
+                    self._continueProcessing = False
                     break
 
-                self._open_file(configItem.module, deltaFilePath)
+                # Replay results from the cache if the file is unchanged
+                if measureCache is not None:
+                    entryKey = measureCache.entry_key(configItem)
+                    cachedOutput = measureCache.lookup(
+                            self._currentFilePath, entryKey, numFilesInFolder)
+                    if cachedOutput is not None:
+                        self._currentFileOutput.extend(cachedOutput)
+                        continue
+                    fileState = measureCache.file_state(self._currentFilePath)
+                    outputStart = len(self._currentFileOutput)
 
-                #
-                # Synchronus delegation to the measure module defined in the config file
-                #
-                configItem.module.process_file(
-                        self._currentFilePath,
-                        self._currentFileIterator,
-                        configItem,
-                        numFilesInFolder,
-                        self.file_measured_callback)
+                try:
+                    self._watchdog.arm(configItem)
+                    self._open_file(configItem.module, deltaFilePath)
+                    fileLines = self._currentFileIterator
+                    if chunk is not None:
+                        fileLines = chunk.file_lines(entryIndex, fileLines)
+
+                    #
+                    # Synchronus delegation to the measure module defined in the config file
+                    #
+                    configItem.module.process_file(
+                            self._currentFilePath,
+                            fileLines,
+                            configItem,
+                            numFilesInFolder,
+                            self.file_measured_callback)
+                finally:
+                    self._watchdog.disarm()
+
+                if measureCache is not None:
+                    measureCache.store(self._currentFilePath, entryKey, numFilesInFolder,
+                            fileState, self._currentFileOutput[outputStart:])
 
         except utils.FileMeasureError as e:
             trace.traceback(2)
@@ -263,6 +385,37 @@ class Worker( Process ):
         return continueProcessing
 
 
+    def _measure_chunk(self, chunk, configItems):
+        '''
+        Survey a chunk of the current file for each config entry, and send
+        the results to the job; without results for a chunk, the file is
+        measured whole when it is finished, which reports any errors
+        '''
+        trace.file(1, "Processing chunk {0}: {1}".format(chunk.num, self._currentFilePath))
+        results = None
+        self._watchdog.start_file()
+        try:
+            entryResults = []
+            for configItem in configItems:
+                self._open_file(configItem.module, None)
+                chunkReader = chunks.ChunkReader(self._currentFileIterator)
+                if chunkReader.encoding is None:
+                    break
+                try:
+                    self._watchdog.arm(configItem)
+                    entryResults.append(configItem.module.survey_chunk(
+                            self._currentFilePath, chunkReader, chunk.start, chunk.end, configItem))
+                finally:
+                    self._watchdog.disarm()
+            else:
+                results = (chunkReader.encoding, entryResults)
+        except (utils.FileMeasureError, EnvironmentError) as e:
+            trace.file(1, "Chunk not surveyed: {0}".format(str(e)))
+        finally:
+            self._close_current_file()
+        self._dispatch.put_job_message('CHUNK', (chunk.fileKey, chunk.num, results))
+
+
     def _open_file(self, module, deltaFilePath):
         '''
         Open can be an expensive operation, so for the nominal case of opening a file,
@@ -295,28 +448,100 @@ class Worker( Process ):
         '''
         Cache the output from the measurement callbacks for current file
         '''
-        if self._currentFileOutput or self._currentFileErrors:
-            self._currentOutput.append(
-                    (self._currentFilePath, self._currentFileOutput, self._currentFileErrors))
+        if self._currentMemoId is not None:
+            self._currentOutput.append(self._encoder.encode_file(
+                    (self._currentFilePath, self._currentMemoId),
+                    self._currentFileOutput, self._currentFileErrors))
+        elif self._currentFileOutput or self._currentFileErrors:
+            if self._shards is not None:
+                self._shards.write_file(self._currentFileSequence, self._currentFileOutput)
+                if not self._options.outputShards.sendAnalysis:
+                    # Rows are in the shards; the job only needs the measures
+                    # and how many rows each had
+                    self._currentFileOutput = [(measures, [{}] * len(analysisResults))
+                            for measures, analysisResults in self._currentFileOutput]
+            self._currentOutput.append(self._encoder.encode_file(
+                    self._currentFilePath, self._currentFileOutput, self._currentFileErrors))
             trace.cc(3, "Caching results: {0}".format(self._currentFilePath))
+        elif self._options.checkpoint is not None:
+            # Checkpoints track each file the job sends, so tell it about
+            # files without measures as well
+            self._currentOutput.append(self._encoder.encode_file(
+                    self._currentFilePath, [], []))
         else:
             trace.cc(3, "No measures for: {0}".format(self._currentFilePath))
         self._currentFileOutput = []
         self._currentFileErrors = []
 
 
-    def _post_results(self):
+    def _post_results(self, packageStats):
         '''
         Send any cached results back to main process's out thread
         This is a set of results for config measure of every file
         in the last work package
         '''
-        try:
-            self._outputQueue.put(self._currentOutput, True, OUT_PUT_TIMEOUT)
-            trace.cc(3, "OUT - PUT {0} items".format(len(self._currentOutput)))
-        except Full:
-            raise utils.JobException("FATAL EXCEPTION - Out Queue full, can't put")
-        finally:
-            self._currentOutput = []
+        if self._measureCache is not None:
+            self._measureCache.flush()
+        if self._shards is not None:
+            self._shards.flush()
+        self._dispatch.put_output(self._encoder.package(self._currentOutput), packageStats)
+        trace.cc(3, "OUT - PUT {0} items".format(len(self._currentOutput)))
+        self._currentOutput = []
 
 
+class FileWatchdog( object ):
+    '''
+    Limits the wall-clock seconds a worker spends measuring one file
+    While a csmodule is called, a SIGALRM timer is set for the time left.
+    When it goes off FileTimeoutError is raised in the csmodule, which
+    Python can do between any two bytecodes, and the regex engine checks
+    for signals while matching. As csmodules may catch the exception and
+    raise their own, disarm() raises FileTimeoutError in its place once
+    the file is over budget; without interval timers (Windows) this is
+    the only check, so a file is only stopped after a csmodule returns.
+    '''
+    def __init__(self, budget):
+        self._budget = budget
+        self._deadline = None
+        self._configItem = None
+        self._useTimer = budget is not None and hasattr(signal, 'setitimer')
+        if self._useTimer:
+            signal.signal(signal.SIGALRM, self._alarm)
+
+    def start_file(self):
+        if self._budget is not None:
+            self._deadline = time.monotonic() + self._budget
+
+    def arm(self, configItem):
+        if self._budget is None:
+            return
+        self._configItem = configItem
+        timeLeft = self._deadline - time.monotonic()
+        if timeLeft <= 0:
+            raise self._timeout_error(configItem)
+        if self._useTimer:
+            signal.setitimer(signal.ITIMER_REAL, timeLeft, WATCHDOG_REPEAT_INTERVAL)
+
+    def disarm(self):
+        '''
+        Called from a finally block, so a timeout error replaces whatever
+        exception the csmodule call ended with
+        '''
+        if self._budget is None:
+            return
+        configItem = self._configItem
+        self._configItem = None
+        if self._useTimer:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        if time.monotonic() >= self._deadline:
+            raise self._timeout_error(configItem)
+
+    def _alarm(self, signum, frame):
+        # Ignore an alarm that arrives as we disarm
+        if self._configItem is not None:
+            raise self._timeout_error(self._configItem)
+
+    def _timeout_error(self, configItem):
+        trace.file(1, "Over time budget: {0}".format(str(configItem)))
+        return utils.FileTimeoutError(uistrings.STR_ErrorFileTimeBudget.format(
+                self._budget, str(configItem)))
@@ -0,0 +1,258 @@
+#=============================================================================
+'''
+    Surveyor Measure Cache
+
+    Persistent store of csmodule results, used to make repeat measurement of
+    large, mostly unchanged folder trees incremental.
+
+    Results are stored per file and per config entry. A file's cached
+    results are replayed by the jobworker instead of calling the csmodule
+    when the file path, size, modification time (or content hash) and the
+    config entry key all match what was stored.
+
+    The config entry key covers everything that shapes csmodule output:
+    the module name and option hash (CodeSurveyorModules.module_hash), the
+    verb, measure filter, tags, and parameters from the config line, the
+    content of the config file the entry came from and of any INCLUDEs read
+    with it, and the source code of the csmodule classes (so editing a
+    csmodule invalidates its results).
+
+    A file's size, time and content hash are taken before it is measured,
+    and stored with its results, so a file that changes while it is being
+    measured isn't stored as matching results from its old content.
+
+    The store is a sqlite database shared by all jobworkers; each worker
+    keeps its own connection and commits once per work package.
+'''
+#=============================================================================
+# Copyright 2004-2012, Matt Peloquin and Construx. This file is part of Code
+# Surveyor, covered under GNU GPL v3 and is distributed WITHOUT ANY WARRANTY.
+#=============================================================================
+import os
+import sys
+import pickle
+import sqlite3
+import hashlib
+
+from framework import trace
+from framework import utils
+
+# Seconds a worker will wait on the database lock held by another worker
+CACHE_LOCK_TIMEOUT = 60
+
+# Size of reads when hashing file content
+HASH_READ_SIZE = 1024 * 1024
+
+# Framework modules whose code is used by every csmodule measurement; changes
+# to these invalidate the cache along with changes to the csmodule classes
+MEASURE_SUPPORT_MODULES = ('framework.utils', 'framework.filetype')
+
+CACHE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS measures (
+        path TEXT NOT NULL,
+        entryKey TEXT NOT NULL,
+        fileSize INTEGER NOT NULL,
+        fileTime INTEGER NOT NULL,
+        contentHash TEXT NOT NULL,
+        numSameFiles INTEGER NOT NULL,
+        results BLOB NOT NULL,
+        PRIMARY KEY (path, entryKey))
+    '''
+
+
+class MeasureCache( object ):
+    '''
+    One MeasureCache object is used by each jobworker process. The main
+    process calls prepare() before any workers are started.
+    '''
+    def __init__(self, cachePath):
+        self._cachePath = cachePath
+        self._db = sqlite3.connect(cachePath, timeout=CACHE_LOCK_TIMEOUT)
+        self._pendingWrites = []
+
+        # Keys and hashes are expensive to calculate, so keep them for the
+        # life of the worker (they are small and few)
+        self._entryKeys = {}
+        self._sourceHashes = {}
+        self._configHashes = {}
+
+        # State of the file currently being measured; file is statted and
+        # hashed at most once regardless of how many config entries use it
+        self._currentPath = None
+        self._currentStat = None
+        self._currentHash = None
+
+        self.hits = 0
+        self.misses = 0
+        trace.file(2, "Opened measure cache: {0}".format(cachePath))
+
+    @staticmethod
+    def prepare(cachePath, rebuild=False):
+        '''
+        Create the cache database if needed; rebuilding discards all
+        existing results
+        '''
+        if rebuild and os.path.exists(cachePath):
+            trace.msg(1, "Rebuilding measure cache: {0}".format(cachePath))
+            os.remove(cachePath)
+        db = sqlite3.connect(cachePath, timeout=CACHE_LOCK_TIMEOUT)
+        try:
+            # Write-ahead logging lets workers read while another commits
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute(CACHE_SCHEMA)
+            db.commit()
+        finally:
+            db.close()
+
+    def close(self):
+        self.flush()
+        self._db.close()
+        trace.file(1, "Measure cache hits: {0}  misses: {1}".format(self.hits, self.misses))
+
+
+    #-------------------------------------------------------------------------
+
+    def entry_key(self, configEntry):
+        '''
+        Get the key for a config entry before measuring, as csmodules may
+        modify the entry. Workers keep config entries for the whole job, but
+        as they may be modified the key is memoized on the values that define it
+        '''
+        entryId = (configEntry.moduleHash, configEntry.verb, configEntry.measureFilter,
+                    tuple(configEntry.tags), tuple(configEntry.paramsRaw),
+                    tuple(configEntry.configFilesRead))
+        entryKey = self._entryKeys.get(entryId)
+        if entryKey is None:
+            keyHash = hashlib.sha1()
+            for keyItem in entryId[:-1]:
+                keyHash.update(repr(keyItem).encode('utf-8', 'surrogateescape'))
+            for configFilePath in configEntry.configFilesRead:
+                keyHash.update(self._config_hash(configFilePath).encode('ascii'))
+            keyHash.update(self._source_hash(configEntry.module).encode('ascii'))
+            # Metadata such as absolute paths depends on where we run from
+            keyHash.update(utils.runtime_dir().encode('utf-8', 'surrogateescape'))
+            entryKey = keyHash.hexdigest()
+            self._entryKeys[entryId] = entryKey
+            trace.file(2, "Cache key {0}: {1}".format(entryKey, entryId))
+        return entryKey
+
+
+    def new_file(self):
+        '''
+        Called before the first lookup for each file, so file state is
+        read fresh
+        '''
+        self._currentPath = None
+
+
+    def lookup(self, filePath, entryKey, numSameFiles):
+        '''
+        Returns the list of (measures, analysisResults) stored for the file
+        and config entry, or None if there is no valid cached result
+        '''
+        row = self._db.execute(
+                'SELECT fileSize, fileTime, contentHash, numSameFiles, results '
+                'FROM measures WHERE path=? AND entryKey=?',
+                (filePath, entryKey)).fetchone()
+        results = None
+        if row is not None:
+            fileSize, fileTime, contentHash, cachedSameFiles, cachedResults = row
+            currentSize, currentTime = self._file_stat(filePath)
+            if fileSize == currentSize and cachedSameFiles == numSameFiles:
+                if fileTime == currentTime:
+                    results = pickle.loads(cachedResults)
+                elif contentHash == self._file_hash(filePath):
+                    # File was touched but not changed; remember new time
+                    results = pickle.loads(cachedResults)
+                    self._pendingWrites.append((
+                        filePath, entryKey, fileSize, currentTime,
+                        contentHash, numSameFiles, cachedResults))
+        if results is None:
+            self.misses += 1
+            trace.file(2, "Cache miss: {0}".format(filePath))
+        else:
+            self.hits += 1
+            trace.file(2, "Cache hit: {0}".format(filePath))
+        return results
+
+
+    def file_state(self, filePath):
+        '''
+        Size, time, and content hash of the file, taken before it is
+        measured, to store with its results
+        '''
+        fileSize, fileTime = self._file_stat(filePath)
+        return fileSize, fileTime, self._file_hash(filePath)
+
+
+    def store(self, filePath, entryKey, numSameFiles, fileState, results):
+        '''
+        Results are held until the next flush so writes to the database
+        are batched per work package
+        '''
+        fileSize, fileTime, contentHash = fileState
+        self._pendingWrites.append((
+                filePath, entryKey, fileSize, fileTime, contentHash, numSameFiles,
+                pickle.dumps(results, pickle.HIGHEST_PROTOCOL)))
+
+
+    def flush(self):
+        if self._pendingWrites:
+            trace.file(2, "Cache writing {0} results".format(len(self._pendingWrites)))
+            with self._db:
+                self._db.executemany(
+                    'INSERT OR REPLACE INTO measures VALUES (?,?,?,?,?,?,?)',
+                    self._pendingWrites)
+            self._pendingWrites = []
+
+
+    #-------------------------------------------------------------------------
+
+    def _file_stat(self, filePath):
+        if filePath != self._currentPath:
+            self._currentPath = filePath
+            self._currentHash = None
+            fileStats = os.stat(filePath)
+            self._currentStat = (int(fileStats.st_size), int(fileStats.st_mtime_ns))
+        return self._currentStat
+
+    def _file_hash(self, filePath):
+        self._file_stat(filePath)
+        if self._currentHash is None:
+            self._currentHash = hash_file(filePath)
+        return self._currentHash
+
+
+    def _config_hash(self, configFilePath):
+        configHash = self._configHashes.get(configFilePath)
+        if configHash is None:
+            configHash = hash_file(configFilePath)
+            self._configHashes[configFilePath] = configHash
+        return configHash
+
+    def _source_hash(self, csmodule):
+        moduleClass = csmodule.__class__
+        sourceHash = self._sourceHashes.get(moduleClass)
+        if sourceHash is None:
+            moduleNames = [cls.__module__ for cls in moduleClass.__mro__ if cls is not object]
+            moduleNames.extend(MEASURE_SUPPORT_MODULES)
+            keyHash = hashlib.sha1()
+            for moduleName in moduleNames:
+                # Frozen executables may not have source available, in which
+                # case the cache is only invalidated by a rebuild
+                sourceFile = getattr(sys.modules.get(moduleName), '__file__', None)
+                if sourceFile and os.path.isfile(sourceFile):
+                    keyHash.update(hash_file(sourceFile).encode('ascii'))
+                else:
+                    keyHash.update(moduleName.encode('ascii'))
+            sourceHash = keyHash.hexdigest()
+            self._sourceHashes[moduleClass] = sourceHash
+        return sourceHash
+
+
+def hash_file(filePath):
+    fileHash = hashlib.blake2b(digest_size=16)
+    with open(filePath, 'rb') as fileObject:
+        for block in iter(lambda: fileObject.read(HASH_READ_SIZE), b''):
+            fileHash.update(block)
+    return fileHash.hexdigest()
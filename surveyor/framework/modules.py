@@ -43,6 +43,13 @@ class CodeSurveyorModules( object ):
         return csmodule
 
 
+    def module_hash(self, moduleName, options):
+        '''
+        Identifies a csmodule and the options it was initialized with
+        '''
+        return self._csmod_hash(moduleName, options)
+
+
     def _csmod_hash(self, moduleName, options):
         if options is None:
             return moduleName
@@ -0,0 +1,484 @@
+#=============================================================================
+'''
+    Surveyor Regex Prefilter
+
+    NBNC-based csmodules run a dozen or more regular expressions against
+    every line of a file, and for most lines most of them fail. Running a
+    regex that cannot match costs as much as one that does, so each detector
+    regex is wrapped with a cheap test that rules out lines it cannot match.
+
+    The test is derived from the compiled pattern. The pattern is parsed
+    and the literal strings a match must contain are found; for example
+    any match of the default decision regex must contain one of "if",
+    "else", "for", etc. as a whole word, and any match of the multi-line
+    comment open regex must contain "/*", "<!--", etc.
+
+    Each line string is lowered and split into words once (LineTexts), which
+    all detectors of a csmodule share. A detector then only runs its regex if a
+    required word is in the line's word set or a required literal is in the
+    line; match() only runs if the line starts with a required prefix.
+
+    Results are exactly those of the regexes; a detector is only skipped
+    when its regex could not match. Lines with non-ASCII characters always
+    run the regex, since case-insensitive matching of those doesn't line up
+    with str.lower(). Patterns with no required literals aren't wrapped.
+
+    requirements() provides the same analysis to the NBNC whole-file survey,
+    which uses it to find the few lines in a file comment regexes could match.
+'''
+#=============================================================================
+# Copyright 2004-2012, Matt Peloquin and Construx. This file is part of Code
+# Surveyor, covered under GNU GPL v3 and is distributed WITHOUT ANY WARRANTY.
+#=============================================================================
+import re
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+from framework import trace
+
+
+# Limit on the number of strings tracked for a run of literals, so
+# character classes in a run don't blow up the number of combinations
+MAX_LITERAL_STRINGS = 64
+
+# Splitting a line into words costs about as much as running a regex, so
+# words are only checked when some are this short; longer words are rarely
+# found inside other words, so are checked as substrings. A short whole
+# word is about as selective as a substring one character longer
+MAX_SHORT_WORD = 3
+
+WordRe = re.compile(r'\w+')
+WordChars = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_')
+
+_ZeroWidthOps = (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT)
+_RepeatOps = tuple(getattr(sre_parse, op) for op in
+        ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT') if hasattr(sre_parse, op))
+_GroupOps = tuple(getattr(sre_parse, op) for op in
+        ('SUBPATTERN', 'ATOMIC_GROUP') if hasattr(sre_parse, op))
+_BoundaryAts = (sre_parse.AT_BOUNDARY, sre_parse.AT_BEGINNING,
+        sre_parse.AT_BEGINNING_STRING, sre_parse.AT_END, sre_parse.AT_END_STRING)
+_NonWordCategories = (sre_parse.CATEGORY_SPACE, sre_parse.CATEGORY_NOT_WORD,
+        sre_parse.CATEGORY_LINEBREAK)
+
+
+class Unsupported( Exception ):
+    '''Pattern uses a construct we don't derive requirements for'''
+
+
+def prefilter(regex, lineTexts):
+    '''
+    Return a PrefilteredRe for regex if it has required literals we can
+    test for, otherwise return regex unchanged
+    '''
+    if isinstance(regex, PrefilteredRe) or not isinstance(regex, re.Pattern):
+        return regex
+    if not isinstance(regex.pattern, str) or regex.flags & re.LOCALE:
+        return regex
+    try:
+        analysis = _PatternAnalysis(regex)
+    except (Unsupported, RecursionError, re.error) as e:
+        trace.cc(2, "No prefilter for {0}: {1}".format(regex.pattern, str(e)))
+        return regex
+    if analysis.anchored or (analysis.requirement is None and analysis.prefixes is None):
+        return regex
+    trace.cc(3, "Prefilter {0} => words: {1} literals: {2} prefixes: {3}".format(
+            regex.pattern, analysis.requirement and sorted(analysis.requirement[0]),
+            analysis.requirement and sorted(analysis.requirement[1]),
+            analysis.prefixes and sorted(analysis.prefixes)))
+    return PrefilteredRe(regex, lineTexts, analysis.requirement, analysis.prefixes)
+
+
+def requirements(regex):
+    '''
+    Return (literals, prefixes) for regex, which may be a PrefilteredRe;
+    any match contains one of the literals and starts with one of the
+    prefixes. Whole word requirements are returned as literals. Either is
+    None if the pattern doesn't give us one
+    '''
+    regex = getattr(regex, 'regex', regex)
+    if not isinstance(regex, re.Pattern):
+        return None, None
+    if not isinstance(regex.pattern, str) or regex.flags & re.LOCALE:
+        return None, None
+    try:
+        analysis = _PatternAnalysis(regex)
+    except (Unsupported, RecursionError, re.error):
+        return None, None
+    literals = analysis.prefixes
+    if analysis.requirement is not None:
+        words, requiredLiterals = analysis.requirement
+        literals = set(words) | set(requiredLiterals)
+    return literals, analysis.prefixes
+
+
+class LineTexts( object ):
+    '''
+    Lowered text and word sets of the line string detectors are looking at.
+    Detectors are called in turn on the same string (the raw line, then the
+    stripped line, etc.), so the work is done once for each of these
+    '''
+    def __init__(self):
+        self.update(None)
+
+    def update(self, text):
+        self.text = text
+        self.isAscii = text is not None and text.isascii()
+        self.lowered = text.lower() if self.isAscii else None
+        self._words = None
+        self._loweredWords = None
+
+    def words(self, lowered):
+        if lowered:
+            if self._loweredWords is None:
+                self._loweredWords = frozenset(WordRe.findall(self.lowered))
+            return self._loweredWords
+        else:
+            if self._words is None:
+                self._words = frozenset(WordRe.findall(self.text))
+            return self._words
+
+
+class PrefilteredRe( object ):
+    '''
+    Stands in for a compiled regex, only running it for text the
+    requirements say it could match
+    '''
+    def __init__(self, regex, lineTexts, requirement, prefixes):
+        self.regex = regex
+        self._lineTexts = lineTexts
+        self._ignoreCase = bool(regex.flags & re.IGNORECASE)
+
+        if requirement is None:
+            # Any match starts with one of the prefixes, so contains it
+            requirement = (set(), set(prefixes))
+        words, literals = requirement
+        self._words = frozenset(words) if words else None
+        self._literals = tuple(sorted(literals))
+        self._prefixes = tuple(sorted(prefixes)) if prefixes else None
+
+    def __repr__(self):
+        return "PrefilteredRe({0!r})".format(self.regex)
+
+    @property
+    def pattern(self):
+        return self.regex.pattern
+
+    @property
+    def flags(self):
+        return self.regex.flags
+
+    @property
+    def groups(self):
+        return self.regex.groups
+
+    @property
+    def groupindex(self):
+        return self.regex.groupindex
+
+    def search(self, text, *args):
+        lineTexts = self._lineTexts
+        if text is not lineTexts.text:
+            lineTexts.update(text)
+        if args or not lineTexts.isAscii or self._may_contain(lineTexts):
+            return self.regex.search(text, *args)
+        return None
+
+    def match(self, text, *args):
+        lineTexts = self._lineTexts
+        if text is not lineTexts.text:
+            lineTexts.update(text)
+        if args or not lineTexts.isAscii or self._may_start(lineTexts):
+            return self.regex.match(text, *args)
+        return None
+
+    def fullmatch(self, text, *args):
+        lineTexts = self._lineTexts
+        if text is not lineTexts.text:
+            lineTexts.update(text)
+        if args or not lineTexts.isAscii or self._may_start(lineTexts):
+            return self.regex.fullmatch(text, *args)
+        return None
+
+    def sub(self, repl, text, count=0):
+        lineTexts = self._lineTexts
+        if text is not lineTexts.text:
+            lineTexts.update(text)
+        if not lineTexts.isAscii or self._may_contain(lineTexts):
+            return self.regex.sub(repl, text, count)
+        return text
+
+    def subn(self, repl, text, count=0):
+        return self.regex.subn(repl, text, count)
+
+    def split(self, text, maxsplit=0):
+        return self.regex.split(text, maxsplit)
+
+    def findall(self, text, *args):
+        return self.regex.findall(text, *args)
+
+    def finditer(self, text, *args):
+        return self.regex.finditer(text, *args)
+
+    def _may_contain(self, lineTexts):
+        text = lineTexts.lowered if self._ignoreCase else lineTexts.text
+        if self._words is not None:
+            if not self._words.isdisjoint(lineTexts.words(self._ignoreCase)):
+                return True
+        for literal in self._literals:
+            if literal in text:
+                return True
+        return False
+
+    def _may_start(self, lineTexts):
+        if self._prefixes is None:
+            return self._may_contain(lineTexts)
+        text = lineTexts.lowered if self._ignoreCase else lineTexts.text
+        return text.startswith(self._prefixes)
+
+
+#-------------------------------------------------------------------------
+#  Pattern analysis
+
+class _PatternAnalysis( object ):
+    '''
+    Walks the parsed pattern to find:
+        requirement -- (words, literals); any match contains one of the
+            words as a whole word or one of the literals as a substring
+        prefixes -- any match starts with one of these strings
+        anchored -- the pattern starts with ^, so is already cheap to run
+    Literal strings are lowered for case-insensitive patterns
+    '''
+    def __init__(self, regex):
+        self._lower = bool(regex.flags & re.IGNORECASE)
+        parsed = list(sre_parse.parse(regex.pattern, regex.flags))
+        self.anchored = bool(parsed) and parsed[0] == (sre_parse.AT, sre_parse.AT_BEGINNING)
+        self.requirement = self._require_seq(parsed, False, False)
+        self.prefixes = self._prefixes_seq(parsed)
+
+    # Exact strings -- the set of strings an item or sequence always consumes
+
+    def _exact(self, op, av):
+        if op is sre_parse.LITERAL:
+            if av > 127:
+                raise Unsupported("non-ascii literal")
+            char = chr(av)
+            return {char.lower() if self._lower else char}
+        elif op is sre_parse.IN:
+            chars = set()
+            for itemOp, itemAv in av:
+                if itemOp is not sre_parse.LITERAL:
+                    return None
+                chars |= self._exact(itemOp, itemAv)
+            return chars
+        elif op in _GroupOps:
+            return self._exact_seq(self._group_seq(op, av))
+        elif op is sre_parse.BRANCH:
+            strings = set()
+            for alternative in av[1]:
+                altStrings = self._exact_seq(alternative)
+                if altStrings is None:
+                    return None
+                strings |= altStrings
+            return strings
+        return None
+
+    def _exact_seq(self, seq):
+        strings = {''}
+        for op, av in seq:
+            if op in _ZeroWidthOps:
+                continue
+            itemStrings = self._exact(op, av)
+            if itemStrings is None:
+                return None
+            strings = _concat(strings, itemStrings)
+            if strings is None:
+                return None
+        return strings
+
+    def _group_seq(self, op, av):
+        if op is sre_parse.SUBPATTERN:
+            _group, addFlags, delFlags, seq = av
+            if addFlags or delFlags:
+                raise Unsupported("inline flags")
+            return seq
+        return av
+
+    # Requirements -- strings any match must contain
+
+    def _require_seq(self, seq, leftBounded, rightBounded):
+        '''
+        Candidates are runs of exact items, and requirements from inside
+        groups and repeats; the most selective candidate is used.
+        The bounded flags say whether there is a word boundary at each end
+        of seq in any match
+        '''
+        candidates = []
+        runStrings = None
+        runStart = runEnd = 0
+        for index, (op, av) in enumerate(seq):
+            if op in _ZeroWidthOps:
+                continue
+            itemStrings = self._exact(op, av)
+            if itemStrings is not None:
+                concatStrings = None
+                if runStrings is not None:
+                    concatStrings = _concat(runStrings, itemStrings)
+                    if concatStrings is None:
+                        candidates.append(self._run_requirement(
+                                seq, runStrings, runStart, runEnd, leftBounded, rightBounded))
+                if concatStrings is None:
+                    runStrings, runStart = itemStrings, index
+                else:
+                    runStrings = concatStrings
+                runEnd = index + 1
+                continue
+
+            if runStrings is not None:
+                candidates.append(self._run_requirement(
+                        seq, runStrings, runStart, runEnd, leftBounded, rightBounded))
+                runStrings = None
+            candidates.append(self._require_item(
+                    op, av,
+                    self._bounded_before(seq, index, leftBounded),
+                    self._bounded_after(seq, index + 1, rightBounded)))
+
+        if runStrings is not None:
+            candidates.append(self._run_requirement(
+                    seq, runStrings, runStart, runEnd, leftBounded, rightBounded))
+        return _most_selective(candidates)
+
+    def _require_item(self, op, av, leftBounded, rightBounded):
+        if op in _GroupOps:
+            return self._require_seq(self._group_seq(op, av), leftBounded, rightBounded)
+        elif op is sre_parse.BRANCH:
+            words = set()
+            literals = set()
+            for alternative in av[1]:
+                requirement = self._require_seq(alternative, leftBounded, rightBounded)
+                if requirement is None:
+                    return None
+                words |= requirement[0]
+                literals |= requirement[1]
+            return (words, literals)
+        elif op in _RepeatOps:
+            minCount, _maxCount, seq = av
+            if minCount >= 1:
+                return self._require_seq(seq, False, False)
+        return None
+
+    def _run_requirement(self, seq, strings, start, end, leftBounded, rightBounded):
+        if '' in strings:
+            return None
+        if (min(len(s) for s in strings) <= MAX_SHORT_WORD and
+                self._bounded_before(seq, start, leftBounded) and
+                self._bounded_after(seq, end, rightBounded) and
+                all(WordChars.issuperset(s) for s in strings)):
+            return (set(strings), set())
+        return (set(), set(strings))
+
+    # Word boundaries -- for whole word requirements, the items around a run
+    # must guarantee a boundary, either with \b, ^, $, or a non-word character
+
+    def _bounded_before(self, seq, index, leftBounded):
+        for op, av in reversed(seq[:index]):
+            bounded = self._boundary_item(op, av)
+            if bounded is not None:
+                return bounded
+        return leftBounded
+
+    def _bounded_after(self, seq, index, rightBounded):
+        for op, av in seq[index:]:
+            bounded = self._boundary_item(op, av)
+            if bounded is not None:
+                return bounded
+        return rightBounded
+
+    def _boundary_item(self, op, av):
+        '''
+        True if item guarantees a boundary next to it, False if it doesn't,
+        None if it may be empty (so the boundary depends on what's next)
+        '''
+        if op is sre_parse.AT:
+            return True if av in _BoundaryAts else False
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            return None
+        elif op in _RepeatOps:
+            minCount, _maxCount, seq = av
+            if len(seq) == 1 and self._non_word_item(*seq[0]):
+                return True if minCount >= 1 else None
+            return False
+        return self._non_word_item(op, av)
+
+    def _non_word_item(self, op, av):
+        if op is sre_parse.LITERAL:
+            return chr(av) not in WordChars and av < 128
+        elif op is sre_parse.IN:
+            for itemOp, itemAv in av:
+                if itemOp is sre_parse.LITERAL:
+                    if not self._non_word_item(itemOp, itemAv):
+                        return False
+                elif not (itemOp is sre_parse.CATEGORY and itemAv in _NonWordCategories):
+                    return False
+            return True
+        return False
+
+    # Prefixes -- strings any match starts with
+
+    def _prefixes_seq(self, seq):
+        strings = {''}
+        for op, av in seq:
+            if op in _ZeroWidthOps:
+                continue
+            itemStrings = self._exact(op, av)
+            if itemStrings is None:
+                itemStrings = self._prefixes_item(op, av)
+                if itemStrings is not None:
+                    strings = _concat(strings, itemStrings) or strings
+                break
+            concatStrings = _concat(strings, itemStrings)
+            if concatStrings is None:
+                break
+            strings = concatStrings
+        if '' in strings:
+            return None
+        return strings
+
+    def _prefixes_item(self, op, av):
+        if op in _GroupOps:
+            return self._prefixes_seq(self._group_seq(op, av))
+        elif op is sre_parse.BRANCH:
+            strings = set()
+            for alternative in av[1]:
+                altStrings = self._prefixes_seq(alternative)
+                if altStrings is None:
+                    return None
+                strings |= altStrings
+            return strings
+        return None
+
+
+def _concat(leftStrings, rightStrings):
+    if len(leftStrings) * len(rightStrings) > MAX_LITERAL_STRINGS:
+        return None
+    return {left + right for left in leftStrings for right in rightStrings}
+
+
+def _most_selective(candidates):
+    '''
+    A requirement is as selective as its weakest string; prefer longer
+    strings, then not having to split the line into words, then fewer strings
+    '''
+    best = None
+    bestScore = None
+    for requirement in candidates:
+        if requirement is None:
+            continue
+        words, literals = requirement
+        lengths = ([MAX_SHORT_WORD + 1 for _w in words] +
+                   [len(lit) for lit in literals])
+        score = (min(lengths), not words, -len(lengths))
+        if bestScore is None or score > bestScore:
+            best, bestScore = requirement, score
+    return best
@@ -0,0 +1,327 @@
+#=============================================================================
+'''
+    Surveyor Regex Backtracking Check
+
+    Search terms and other regexes in config files run against every line
+    of the files they apply to. Some patterns make the regex engine
+    backtrack exponentially on a line they almost match, so a single
+    search term can stall a worker on one file for hours.
+
+    backtracking_risk() looks at the parsed pattern for the usual cause:
+    a repeat such as +, *, or {2,} over something that can match the same
+    text in more than one way, so a failing match tries every way of
+    dividing the text between iterations. This is flagged when inside the
+    repeated part (looking around it to the next iteration as well):
+
+      - A variable-length item can run into its own next iteration with
+        nothing required between, as in (a+)+, (\\w+\\s?)*, or (.*)*
+      - The end of a variable-length item could be matched by the next
+        variable-length item instead, along with any fixed items between
+        them, as in (\\d+\\d+)+, (aa?)+, or ( *, *)+
+      - Alternatives can start with the same character, as in (\\w+|\\d+)*
+
+    Alternatives of single characters, such as (a|b), are compiled into a
+    character set so aren't flagged, and possessive repeats don't backtrack.
+    Alternatives that are each fixed-length and can't start with the same
+    character, as in (?:[^"\\]|\\.)*, match only one way wherever they
+    start, so are treated as a fixed-length item.
+    This is a heuristic for the common forms; a pattern that passes can still
+    be slow (e.g., .*a.*a.*a), which the per-file time budget guards against.
+'''
+#=============================================================================
+# Copyright 2004-2012, Matt Peloquin and Construx. This file is part of Code
+# Surveyor, covered under GNU GPL v3 and is distributed WITHOUT ANY WARRANTY.
+#=============================================================================
+import re
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+from framework import uistrings
+
+
+# Repeats with an upper bound this low can't backtrack enough to matter
+MAX_SAFE_REPEAT = 8
+
+# Character ranges larger than this are treated as any character
+MAX_RANGE_CHARS = 256
+
+FIRST_CHARS = 'first'
+LAST_CHARS = 'last'
+
+_BacktrackRepeatOps = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT)
+_RepeatOps = tuple(getattr(sre_parse, op) for op in
+        ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT') if hasattr(sre_parse, op))
+_GroupOps = tuple(getattr(sre_parse, op) for op in
+        ('SUBPATTERN', 'ATOMIC_GROUP') if hasattr(sre_parse, op))
+
+# Sample characters for categories, used to decide overlap with each other
+_CategoryRes = {
+    sre_parse.CATEGORY_DIGIT: re.compile(r'\d'),
+    sre_parse.CATEGORY_WORD: re.compile(r'\w'),
+    sre_parse.CATEGORY_SPACE: re.compile(r'\s'),
+    sre_parse.CATEGORY_LINEBREAK: re.compile(r'\n'),
+    }
+_CategoryOverlaps = {
+    (sre_parse.CATEGORY_DIGIT, sre_parse.CATEGORY_WORD),
+    (sre_parse.CATEGORY_SPACE, sre_parse.CATEGORY_LINEBREAK),
+    }
+
+
+def backtracking_risk(regex):
+    '''
+    Returns a description of why regex (a compiled regex or pattern string)
+    is prone to catastrophic backtracking, or None if it doesn't look to be
+    '''
+    if isinstance(regex, str):
+        pattern, flags = regex, 0
+    else:
+        pattern, flags = getattr(regex, 'pattern', None), getattr(regex, 'flags', 0)
+    if not isinstance(pattern, str):
+        return None
+    try:
+        parsed = sre_parse.parse(pattern, flags & ~re.UNICODE)
+    except Exception:
+        return None
+    return _Checker(parsed.state, flags).check_seq(parsed)
+
+
+class _CharSet( object ):
+    '''
+    Characters an item can match, as far as we can tell
+    A set with anyChar True can match anything other than the excluded
+    characters, as for [^]] or when we can't tell.
+    '''
+    def __init__(self, chars=(), categories=(), anyChar=False, excluded=()):
+        self.chars = set(chars)
+        self.categories = set(categories)
+        self.anyChar = anyChar
+        self.excluded = set(excluded)
+
+    def add(self, other):
+        if self.anyChar and other.anyChar:
+            self.excluded &= other.excluded
+        elif self.anyChar or other.anyChar:
+            self.excluded = (self.excluded if self.anyChar else other.excluded) - (
+                    other.chars if self.anyChar else self.chars)
+            if self.categories or other.categories:
+                self.excluded = set()
+        self.chars |= other.chars
+        self.categories |= other.categories
+        self.anyChar = self.anyChar or other.anyChar
+
+    def overlaps(self, other):
+        if self.anyChar and other.anyChar:
+            return True
+        if self.anyChar or other.anyChar:
+            anySet, otherSet = (self, other) if self.anyChar else (other, self)
+            return bool(otherSet.categories or otherSet.chars - anySet.excluded)
+        if self.chars & other.chars:
+            return True
+        for category in self.categories:
+            for otherCategory in other.categories:
+                if (category == otherCategory or
+                        (category, otherCategory) in _CategoryOverlaps or
+                        (otherCategory, category) in _CategoryOverlaps):
+                    return True
+        return (_category_match(self.categories, other.chars) or
+                _category_match(other.categories, self.chars))
+
+def _group_body(op, av):
+    return av[-1] if op == sre_parse.SUBPATTERN else av
+
+def _category_match(categories, chars):
+    return any(_CategoryRes[category].match(char)
+            for category in categories for char in chars)
+
+
+class _Checker( object ):
+
+    def __init__(self, state, flags):
+        self._state = state
+        self._ignoreCase = bool(flags & re.IGNORECASE)
+
+    def check_seq(self, seq):
+        for op, av in seq:
+            risk = self._check_item(op, av)
+            if risk is not None:
+                return risk
+        return None
+
+    def _check_item(self, op, av):
+        if op in _RepeatOps:
+            _minRepeat, maxRepeat, body = av
+            if op in _BacktrackRepeatOps and maxRepeat > MAX_SAFE_REPEAT:
+                risk = self._ambiguous_body(body)
+                if risk is not None:
+                    return risk
+            return self.check_seq(body)
+        elif op in _GroupOps:
+            return self.check_seq(_group_body(op, av))
+        elif op == sre_parse.BRANCH:
+            for branch in av[1]:
+                risk = self.check_seq(branch)
+                if risk is not None:
+                    return risk
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            return self.check_seq(av[1])
+        elif op == sre_parse.GROUPREF_EXISTS:
+            for branch in av[1:]:
+                if branch is not None:
+                    risk = self.check_seq(branch)
+                    if risk is not None:
+                        return risk
+        return None
+
+    def _ambiguous_body(self, body):
+        '''
+        Look for ways the body of an unbounded repeat can divide the same
+        text differently, with its items laid out as a ring since the end of
+        one iteration is followed by the start of the next
+        '''
+        items = self._flatten(body)
+        widths = [self._width([item]) for item in items]
+        variable = [minWidth != maxWidth and not self._one_way(op, av)
+                    for (minWidth, maxWidth), (op, av) in zip(widths, items)]
+        for op, av in items:
+            if op == sre_parse.BRANCH and self._alternatives_overlap(av[1]):
+                return uistrings.STR_RegexRiskAlternatives
+        for index in range(len(items)):
+            if variable[index]:
+                risk = self._boundary_shifts(items, widths, variable, index)
+                if risk is not None:
+                    return risk
+        return None
+
+    def _flatten(self, seq):
+        '''
+        Items of seq with single groups opened up, so (a+)+ and ((a+))+
+        look alike
+        '''
+        items = list(seq)
+        while len(items) == 1 and items[0][0] == sre_parse.SUBPATTERN:
+            items = list(items[0][1][-1])
+        return items
+
+    def _one_way(self, op, av):
+        '''
+        True for alternatives that are each fixed-length and start with
+        different characters, so can only match one way at any position
+        '''
+        while op in _GroupOps and len(_group_body(op, av)) == 1:
+            op, av = _group_body(op, av)[0]
+        if op != sre_parse.BRANCH:
+            return False
+        for branch in av[1]:
+            minWidth, maxWidth = self._width(branch)
+            if minWidth != maxWidth or minWidth == 0:
+                return False
+        return not self._alternatives_overlap(av[1])
+
+    def _boundary_shifts(self, items, widths, variable, index):
+        '''
+        Going around the ring from the variable-length item at index, see
+        if the characters at its end could be matched by the next variable
+        item (which may be itself in the next iteration), with any fixed
+        items between matching them as well
+        '''
+        required = False
+        endChars = self._char_set([items[index]], LAST_CHARS)
+        for step in range(1, len(items) + 1):
+            nextIndex = (index + step) % len(items)
+            minWidth, maxWidth = widths[nextIndex]
+            if maxWidth == 0:
+                continue
+            nextItem = [items[nextIndex]]
+            if not endChars.overlaps(self._char_set(nextItem, FIRST_CHARS)):
+                if minWidth > 0:
+                    return None
+            elif variable[nextIndex]:
+                if nextIndex == index and not required:
+                    return uistrings.STR_RegexRiskNestedRepeat
+                return uistrings.STR_RegexRiskAdjacentRepeats
+            else:
+                required = True
+                endChars = self._char_set(nextItem, LAST_CHARS)
+        return None
+
+    def _alternatives_overlap(self, branches):
+        firstChars = [self._edge_chars(branch, FIRST_CHARS) for branch in branches]
+        for index, chars in enumerate(firstChars):
+            for otherChars in firstChars[index + 1:]:
+                if chars is not None and otherChars is not None and chars.overlaps(otherChars):
+                    return True
+        return False
+
+    def _edge_chars(self, seq, edge):
+        '''
+        Characters a match of seq can start or end with, or None if the
+        match can be empty
+        '''
+        items = list(seq)
+        if edge == LAST_CHARS:
+            items.reverse()
+        chars = _CharSet()
+        for item in items:
+            chars.add(self._char_set([item], edge))
+            if self._width([item])[0] > 0:
+                return chars
+        return None
+
+    def _char_set(self, seq, edge=None):
+        '''
+        Characters a match of seq can contain, or with edge, can start or
+        end with
+        '''
+        chars = _CharSet()
+        for op, av in seq:
+            if op == sre_parse.LITERAL:
+                chars.add(self._literal(av))
+            elif op == sre_parse.NOT_LITERAL:
+                chars.add(_CharSet(anyChar=True, excluded=self._literal(av).chars))
+            elif op == sre_parse.IN:
+                chars.add(self._in(av))
+            elif op in _RepeatOps:
+                chars.add(self._body_chars(av[2], edge))
+            elif op in _GroupOps:
+                chars.add(self._body_chars(_group_body(op, av), edge))
+            elif op == sre_parse.BRANCH:
+                for branch in av[1]:
+                    chars.add(self._body_chars(branch, edge))
+            elif op not in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+                chars.anyChar = True
+        return chars
+
+    def _body_chars(self, seq, edge):
+        if edge is None:
+            return self._char_set(seq)
+        return self._edge_chars(seq, edge) or _CharSet()
+
+    def _literal(self, code):
+        char = chr(code)
+        if self._ignoreCase:
+            return _CharSet({char.lower(), char.upper()})
+        return _CharSet({char})
+
+    def _in(self, items):
+        chars = _CharSet()
+        negate = False
+        for op, av in items:
+            if op == sre_parse.NEGATE:
+                negate = True
+            elif op == sre_parse.LITERAL:
+                chars.add(self._literal(av))
+            elif op == sre_parse.RANGE and av[1] - av[0] < MAX_RANGE_CHARS:
+                for code in range(av[0], av[1] + 1):
+                    chars.add(self._literal(code))
+            elif op == sre_parse.CATEGORY and av in _CategoryRes:
+                chars.categories.add(av)
+            else:
+                return _CharSet(anyChar=True)
+        if negate:
+            return _CharSet(anyChar=True, excluded=() if chars.categories else chars.chars)
+        return chars
+
+    def _width(self, seq):
+        return sre_parse.SubPattern(self._state, list(seq)).getwidth()
@@ -0,0 +1,115 @@
+#=============================================================================
+'''
+    Surveyor Config Registry
+
+    Config entries hold live csmodule instances with their compiled regexes,
+    which are expensive to pickle. Rather than sending the config entries
+    for a file in every work item, the job registers each config entry the
+    first time a folder walk hands it out. Registration gives the entry a
+    small integer ID and sends the pickled entry once down each worker's
+    config channel (see dispatch.py); work items carry only the IDs.
+
+    Workers keep the entries they have received for the life of the job.
+    An ID a worker hasn't seen yet means the registration is still in its
+    config channel, so the worker reads the channel until it arrives. This
+    also covers items shared between workers, since every worker gets every
+    registration.
+
+    Workers kept between jobs (workerpool.py) keep their entries as well,
+    along with the job's registry, so an entry a later job hands out again
+    (e.g., from a config file it reads unchanged) keeps its ID and isn't
+    sent again. Each job starts with a message down the same channels.
+'''
+#=============================================================================
+# Copyright 2004-2012, Matt Peloquin and Construx. This file is part of Code
+# Surveyor, covered under GNU GPL v3 and is distributed WITHOUT ANY WARRANTY.
+#=============================================================================
+
+from framework import trace
+
+
+class ConfigRegistry( object ):
+    '''
+    Used by the job in the main process to get the IDs for config entries,
+    registering entries with workers as they first show up
+    '''
+    def __init__(self, dispatcher):
+        self._dispatch = dispatcher
+
+        # Config entry IDs keyed on the id() of the entry; the entry is
+        # stored with its ID to make sure its id() isn't reused
+        self._entryIds = {}
+
+        # Folder walking reuses the same config entry lists for many files,
+        # so the ID tuple for each list is cached in the same way
+        self._listIds = {}
+
+    def config_ids(self, configEntrys):
+        try:
+            return self._listIds[id(configEntrys)][1]
+        except KeyError:
+            configIds = tuple(self._register(configEntry) for configEntry in configEntrys)
+            self._listIds[id(configEntrys)] = (configEntrys, configIds)
+            return configIds
+
+    def num_registered(self):
+        return len(self._entryIds)
+
+    def new_job(self):
+        '''
+        Entry lists belong to a job's ConfigStack, so they aren't kept for
+        the next job; the entries in them are
+        '''
+        self._listIds.clear()
+
+    def _register(self, configEntry):
+        try:
+            return self._entryIds[id(configEntry)][1]
+        except KeyError:
+            configId = len(self._entryIds)
+            self._entryIds[id(configEntry)] = (configEntry, configId)
+            trace.cc(2, "Registering config {0}: {1}".format(configId, configEntry))
+            self._dispatch.put_config(configId, configEntry)
+            return configId
+
+
+class WorkerConfigs( object ):
+    '''
+    Used by a worker to look up config entries from the IDs in work items
+    '''
+    def __init__(self, dispatcher, channelNum):
+        self._dispatch = dispatcher
+        self._channelNum = channelNum
+        self._configEntrys = {}
+
+    def config_entrys(self, configIds):
+        '''
+        Returns list of config entries for the IDs, or None if the job
+        is exiting while we wait for a registration
+        '''
+        configEntrys = []
+        for configId in configIds:
+            while configId not in self._configEntrys:
+                if self._get_registration() is None:
+                    return None
+            configEntrys.append(self._configEntrys[configId])
+        return configEntrys
+
+    def next_job(self):
+        '''
+        For workers kept between jobs, blocks until the next job starts and
+        returns its settings, or None if the pool is exiting
+        '''
+        while True:
+            registration = self._get_registration()
+            if registration is None or registration[0] is None:
+                return registration and registration[1]
+
+    def _get_registration(self):
+        registration = self._dispatch.get_config(self._channelNum)
+        if registration is not None and registration[0] is not None:
+            newId, configEntry = registration
+            trace.cc(2, "Received config {0}: {1}".format(newId, configEntry))
+            self._configEntrys[newId] = configEntry
+        return registration
+
@@ -0,0 +1,192 @@
+#=============================================================================
+'''
+    Surveyor Daemon RPC
+
+    Messages between the surveyor command line and a surveyor daemon
+    (daemon.py), over a Unix domain socket. Only the standard library is
+    used here, so surveyor.py can hand a job to the daemon without importing
+    the rest of the framework.
+
+    The client sends one request with its command line, current folder,
+    environment, console width, and the encoding of its stdout. The daemon
+    runs the job with stdout and stderr streams that send what is written
+    to them back in messages (ClientOutput), which the client writes to its
+    own stdout and stderr as they arrive, so output, including rows written
+    to the console, appears as it would for a local run. The only other
+    messages are a ctrl-c from the client, and the exit status the daemon
+    sends once the job is done.
+
+    Each message is a JSON object with bytes of data, preceded by the
+    length of each.
+'''
+#=============================================================================
+# Copyright 2004-2012, Matt Peloquin and Construx. This file is part of Code
+# Surveyor, covered under GNU GPL v3 and is distributed WITHOUT ANY WARRANTY.
+#=============================================================================
+import io
+import os
+import sys
+import json
+import select
+import signal
+import socket
+import struct
+
+# The command line uses the daemon listening at this path, if set
+DAEMON_SOCKET_ENV_VAR = 'SURVEYOR_DAEMON'
+
+# Exit status if the daemon goes away before sending one
+EXIT_DAEMON_LOST = 1
+
+# Sanity limit for message size
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+
+# Output written by a job is sent once this much is buffered, or the
+# job flushes it
+STREAM_BUFFER_BYTES = 64 * 1024
+
+_MessageLengths = struct.Struct('!II')
+
+
+def default_socket_path():
+    import tempfile
+    return os.path.join(tempfile.gettempdir(), "surveyor-{0}.sock".format(os.getuid()))
+
+
+def run_job(socketPath, cmdArgs, printWidth=None):
+    '''
+    Run a job in the daemon listening on socketPath and return its exit
+    status, or None if there is no daemon to run it
+    A first ctrl-c is passed on to the job, which finishes as it would
+    locally; a second one gives up on it. Ctrl-c is held off while a
+    message is read and handled, so messages aren't cut short.
+    '''
+    if not hasattr(socket, 'AF_UNIX') or not hasattr(signal, 'pthread_sigmask'):
+        return None
+    daemon = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        daemon.connect(socketPath)
+    except OSError:
+        daemon.close()
+        return None
+
+    with daemon:
+        send_message(daemon, {
+                'args': cmdArgs,
+                'cwd': os.getcwd(),
+                'env': dict(os.environ),
+                'width': printWidth,
+                'encoding': sys.stdout.encoding,
+                'errors': sys.stdout.errors,
+                'tty': sys.stdout.isatty(),
+                })
+        streams = {'stdout': sys.stdout, 'stderr': sys.stderr}
+        interrupted = False
+        result = None
+        while result is None:
+            try:
+                select.select([daemon], [], [])
+                oldMask = signal.pthread_sigmask(signal.SIG_BLOCK, [signal.SIGINT])
+                try:
+                    message, data = recv_message(daemon)
+                    if message is None:
+                        result = EXIT_DAEMON_LOST
+                    elif 'stream' in message:
+                        _write_output(streams[message['stream']], data)
+                    elif 'exit' in message:
+                        result = message['exit']
+                finally:
+                    signal.pthread_sigmask(signal.SIG_SETMASK, oldMask)
+            except KeyboardInterrupt:
+                if result is not None:
+                    break
+                if interrupted:
+                    return EXIT_DAEMON_LOST
+                interrupted = True
+                send_message(daemon, {'interrupt': True})
+        return result
+
+
+def _write_output(stream, data):
+    '''
+    Output is encoded as the stream's own text would be; streams without
+    bytes underneath (e.g., when captured) get it decoded
+    '''
+    stream.flush()
+    streamBytes = getattr(stream, 'buffer', None)
+    if streamBytes is None:
+        stream.write(data.decode(stream.encoding or 'utf-8', 'replace'))
+        stream.flush()
+    else:
+        streamBytes.write(data)
+        streamBytes.flush()
+
+
+class ClientOutput( io.RawIOBase ):
+    '''
+    Used by the daemon for a client's stdout or stderr, sending each
+    write in a message. Streams for a client share its connection, and
+    the lock for sending on it, which is shared with the job's processes
+    in case they write to them (e.g., tracing). If the client has gone, output is dropped;
+    the daemon stops the job when it notices. A ctrl-c from the client is
+    passed to the job as a SIGINT, which is held off while a message is
+    sent so it can't be cut short.
+    '''
+    def __init__(self, connection, sendLock, streamName):
+        io.RawIOBase.__init__(self)
+        self._connection = connection
+        self._sendLock = sendLock
+        self._streamName = streamName
+        self.name = '<client {0}>'.format(streamName)
+        self.lost = False
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if not self.lost:
+            oldMask = signal.pthread_sigmask(signal.SIG_BLOCK, [signal.SIGINT])
+            try:
+                with self._sendLock:
+                    send_message(self._connection, {'stream': self._streamName}, bytes(data))
+            except OSError:
+                self.lost = True
+            finally:
+                signal.pthread_sigmask(signal.SIG_SETMASK, oldMask)
+        return len(data)
+
+def client_text_stream(connection, sendLock, streamName, encoding, errors, lineBuffering):
+    return io.TextIOWrapper(
+            io.BufferedWriter(ClientOutput(connection, sendLock, streamName), STREAM_BUFFER_BYTES),
+            encoding=encoding, errors=errors, line_buffering=lineBuffering)
+
+
+def send_message(sock, message, data=b''):
+    jsonData = json.dumps(message).encode('utf-8')
+    sock.sendall(_MessageLengths.pack(len(jsonData), len(data)) + jsonData + data)
+
+
+def recv_message(sock):
+    '''
+    Returns (message, data) for the next message, or (None, b'') if the
+    other end closed the connection
+    '''
+    header = sock.recv(_MessageLengths.size)
+    if not header:
+        return None, b''
+    header += _recv_bytes(sock, _MessageLengths.size - len(header))
+    jsonLen, dataLen = _MessageLengths.unpack(header)
+    if jsonLen + dataLen > MAX_MESSAGE_BYTES:
+        raise ValueError("Message too large: {0} bytes".format(jsonLen + dataLen))
+    message = json.loads(_recv_bytes(sock, jsonLen).decode('utf-8'))
+    return message, _recv_bytes(sock, dataLen)
+
+
+def _recv_bytes(sock, numBytes):
+    data = b''
+    while len(data) < numBytes:
+        received = sock.recv(numBytes - len(data))
+        if not received:
+            raise EOFError("Connection closed in message")
+        data += received
+    return data
@@ -0,0 +1,190 @@
+#=============================================================================
+'''
+    Surveyor Work Package Scheduler
+
+    Decides which files go into each work package sent to jobworkers, and
+    when packages are sent.
+
+    Each file is given a cost estimate based on its size and the number of
+    config entries that will measure it. The folder walk is normally much
+    faster than measurement, so rather than filling the task queue in walk
+    order, files are held by the scheduler and only enough packages are
+    queued to keep workers busy. Packages are made from the most expensive
+    files first (longest-processing-time-first), so one huge file found late
+    in the walk doesn't leave a single worker running after the others are
+    done. Smaller files fill in the gaps at the end of the job.
+
+    The target cost for a package adapts to the throughput workers report
+    for each package, so a package takes roughly PACKAGE_TARGET_SECONDS.
+    Once the walk is done, packages shrink as the remaining work is split
+    across workers. Workers that finish early can also steal items from
+    packages other workers are processing (see jobworker.py).
+
+    With a single worker there is nothing to balance, so files are sent in
+    folder walk order.
+
+    The scheduler holds at most PENDING_MAX_ITEMS files. Past that, packages
+    are sent ahead of workers as long as the job says the task queue has
+    room; once it doesn't, the job pauses the folder walk until workers
+    catch up, so memory stays bounded however far the walk gets ahead.
+'''
+#=============================================================================
+# Copyright 2004-2012, Matt Peloquin and Construx. This file is part of Code
+# Surveyor, covered under GNU GPL v3 and is distributed WITHOUT ANY WARRANTY.
+#=============================================================================
+import heapq
+import collections
+
+from framework import trace
+
+# Cost of a file is its size in bytes, plus an estimate of the fixed
+# overhead of opening and processing a file, expressed in bytes
+FILE_COST_OVERHEAD = 2048
+
+# Max number of files that will be sent to a worker in one package
+# Smaller values result in more multiprocessing overhead, while larger
+# values risk not providing a good distribution of files across cores
+PACKAGE_MAX_ITEMS = 256
+
+# Target package cost before any throughput has been observed, and the
+# limits on the target as it adapts to throughput
+PACKAGE_INITIAL_COST = 256000
+PACKAGE_MIN_COST = 16 * 1024
+PACKAGE_MAX_COST = 16 * 1024 * 1024
+
+# Time we want processing of one package to take
+PACKAGE_TARGET_SECONDS = 0.5
+
+# Weight given to the latest package when averaging worker throughput
+THROUGHPUT_SMOOTHING = 0.3
+
+# Number of packages per worker kept in the task queue or being processed
+QUEUED_PACKAGES_PER_WORKER = 2
+
+# Max number of files held; past this the most expensive are sent ahead of
+# workers while the task queue has room, to limit memory use on huge trees
+PENDING_MAX_ITEMS = 100000
+
+# Once the walk is done, the remaining work is split into at least this
+# many packages per worker
+TAIL_PACKAGES_PER_WORKER = 2
+
+
+def file_cost(fileSize, numConfigEntrys):
+    return (fileSize + FILE_COST_OVERHEAD) * max(1, numConfigEntrys)
+
+
+class Scheduler( object ):
+    '''
+    Used by the Job on the main thread; package_measured is called by the
+    OutThread with the stats each worker reports for a package
+    '''
+    def __init__(self, numWorkers):
+        self._numWorkers = numWorkers
+        self._lptOrder = numWorkers > 1
+
+        # Heap of (sortKey, itemCost, workItem); sort key is a sequence number
+        # to break cost ties in walk order, or to keep walk order
+        self._pending = []
+        self._pendingCost = 0
+        self._sequence = 0
+
+        # Items sent ahead of everything else, with their cost
+        self._first = collections.deque()
+        self._walkDone = False
+
+        # Exponentially weighted average of cost per second for each worker
+        self._throughputs = {}
+        self._targetCost = PACKAGE_INITIAL_COST
+
+    #-------------------------------------------------------------------------
+
+    def add(self, workItem, itemCost):
+        self._sequence += 1
+        sortKey = (-itemCost, self._sequence) if self._lptOrder else self._sequence
+        heapq.heappush(self._pending, (sortKey, itemCost, workItem))
+        self._pendingCost += itemCost
+
+    def add_first(self, workItem, itemCost):
+        '''
+        Send an item in the next package, e.g., to finish a file whose
+        chunks have been measured
+        '''
+        self._first.append((itemCost, workItem))
+        self._pendingCost += itemCost
+
+    def walk_done(self):
+        self._walkDone = True
+
+    def num_pending(self):
+        return len(self._pending) + len(self._first)
+
+    def is_full(self):
+        return len(self._pending) > PENDING_MAX_ITEMS
+
+
+    def packages(self, outstandingPackages, queue_has_room):
+        '''
+        Generator for (workPackage, packageCost) tuples that are ready to
+        send, given the number of packages workers already have.
+        When full, packages are also sent while queue_has_room(outstandingPackages)
+        '''
+        targetCost = self._target_cost()
+        maxPackages = self._numWorkers * QUEUED_PACKAGES_PER_WORKER
+        while self.num_pending() and (outstandingPackages < maxPackages or
+                (self.is_full() and queue_has_room(outstandingPackages))):
+            outstandingPackages += 1
+            yield self._next_package(targetCost)
+
+
+    def package_measured(self, workerName, packageCost, seconds):
+        '''
+        Update target package cost with the throughput a worker observed
+        '''
+        if seconds <= 0 or packageCost <= 0:
+            return
+        throughput = packageCost / seconds
+        lastThroughput = self._throughputs.get(workerName)
+        if lastThroughput is not None:
+            throughput = (THROUGHPUT_SMOOTHING * throughput +
+                          (1 - THROUGHPUT_SMOOTHING) * lastThroughput)
+        self._throughputs[workerName] = throughput
+
+        averageThroughput = sum(self._throughputs.values()) / len(self._throughputs)
+        self._targetCost = int(min(PACKAGE_MAX_COST, max(PACKAGE_MIN_COST,
+                                    averageThroughput * PACKAGE_TARGET_SECONDS)))
+        trace.cc(3, "Throughput {0}: {1:.0f}  target: {2}".format(
+                workerName, throughput, self._targetCost))
+
+    #-------------------------------------------------------------------------
+
+    def _target_cost(self):
+        '''
+        Once all files are known, make sure the remaining work is split
+        across workers, so the last packages are small
+        '''
+        targetCost = self._targetCost
+        if self._walkDone and self._lptOrder:
+            tailCost = self._pendingCost // (self._numWorkers * TAIL_PACKAGES_PER_WORKER)
+            targetCost = max(PACKAGE_MIN_COST, min(targetCost, tailCost))
+        return targetCost
+
+    def _next_package(self, targetCost):
+        '''
+        Take the most expensive item, and fill the package with the next most
+        expensive items that fit under the target cost
+        '''
+        if self._first:
+            packageCost, workItem = self._first.popleft()
+        else:
+            _sortKey, packageCost, workItem = heapq.heappop(self._pending)
+        workPackage = [workItem]
+        while (self._pending and len(workPackage) < PACKAGE_MAX_ITEMS and
+                packageCost + self._pending[0][1] <= targetCost):
+            _sortKey, itemCost, workItem = heapq.heappop(self._pending)
+            workPackage.append(workItem)
+            packageCost += itemCost
+        self._pendingCost -= packageCost
+        trace.cc(3, "Package: {0} items, cost {1}, target {2}".format(
+                len(workPackage), packageCost, targetCost))
+        return workPackage, packageCost
@@ -0,0 +1,440 @@
+#=============================================================================
+'''
+    Surveyor Output Shards
+
+    With -os, each worker writes rows for the files it measures to its own
+    shard files, rather than sending the rows to the main process to be
+    written. A worker has a shard for each output file it writes to (the
+    default output file and any from "OUT:" tags), so formatting output is
+    spread across cores along with measurement.
+
+    The job numbers files in folder walk order, which is the order a job
+    with one worker writes them. A shard is a data file with a block of
+    rows for each file, in the order the worker measured them, and an index
+    file listing the sequence number, location, and row schemas of each
+    block. When the job is done, ShardMerger merges the indexes of each
+    output file's shards on sequence number (a k-way merge across workers)
+    and copies the blocks to the output file in that order.
+
+    Delimited files can gain columns partway through a job, which the
+    Delimited writer handles by rewriting the header once the file is
+    closed (_fixup_column_headers). The merge instead works out the columns
+    from the shard indexes before it writes anything, and then writes the
+    file exactly as the Delimited writer would have.
+
+    Rows are kept much as transport.py sends them: a tuple of values, with
+    the tuple of names interned as a schema ID local to each shard.
+    Delimited values are stored already quoted for csv output; columnar
+    values are stored as is and written by the merge.
+
+    Shards are written to a folder in the temp location (see the tempfile
+    module, e.g., TMPDIR), not the output folder, so a job that is killed
+    before the merge doesn't leave them with its output.
+'''
+#=============================================================================
+# Copyright 2004-2012, Matt Peloquin and Construx. This file is part of Code
+# Surveyor, covered under GNU GPL v3 and is distributed WITHOUT ANY WARRANTY.
+#=============================================================================
+import os
+import errno
+import heapq
+import pickle
+import shutil
+import tempfile
+
+from framework import columnar
+from framework import writer
+from framework import uistrings
+from framework import utils
+from framework import trace
+
+SHARD_DIR_PREFIX = '_surveyor_shards'
+DATA_EXT = '.data'
+INDEX_EXT = '.idx'
+
+COLUMNAR_TYPES = ('columnar', 'columnar-zlib')
+
+# Rows written in the main process (aggregates) are in a shard of their
+# own, numbered to come after every file in the job
+MAIN_SHARD_NAME = "Main"
+MAIN_SEQUENCE_START = 2**62
+
+# Delimited output is written by csv.writer with QUOTE_NONNUMERIC, which
+# quotes every value (they are all strings) and ends lines with \r\n
+QUOTE = '"'
+EMPTY_FIELD = '""'
+LINE_END = '\r\n'
+
+
+def supports_type(typeStr):
+    return typeStr != 'xml'
+
+
+def quote_field(value):
+    '''
+    Value formatted the way the Delimited writer's csv.writer writes it
+    '''
+    return QUOTE + utils.safe_ascii_string(value).replace(QUOTE, QUOTE + QUOTE) + QUOTE
+
+
+class ShardSpec( object ):
+    '''
+    What workers need to write shards, passed to them in the job options
+    '''
+    def __init__(self, typeStr, shardDir, outputFile, ignoreMetaOutfiles, sendAnalysis):
+        self.typeStr = typeStr
+        self.shardDir = shardDir
+        self.outputFile = outputFile
+        self.ignoreMetaOutfiles = ignoreMetaOutfiles
+
+        # Whether workers still send analysis results to the main process
+        # (e.g., for aggregates); otherwise only measures are sent
+        self.sendAnalysis = sendAnalysis
+
+
+#=============================================================================
+class ShardWriter( writer.MeasureWriter ):
+    '''
+    Used by a worker to write rows to its shards; output files are picked
+    for each measures dict the same way the writers pick them
+    '''
+    def __init__(self, spec, workerName):
+        super(ShardWriter, self).__init__(None, spec.shardDir, spec.outputFile,
+                spec.ignoreMetaOutfiles)
+        self._quoteValues = spec.typeStr not in COLUMNAR_TYPES
+        self._defFileExt = columnar.FILE_EXT if not self._quoteValues else "csv"
+        self._shardPath = os.path.join(spec.shardDir, workerName)
+        self._fileShards = []
+
+
+    def write_file(self, sequence, fileOutput):
+        '''
+        Write the rows from the output of one file as a block in each
+        shard it goes to; like the application, measures with no items
+        are skipped
+        '''
+        for measures, analysisResults in fileOutput:
+            if measures:
+                self.write_items(measures, analysisResults)
+        for shard in self._fileShards:
+            shard.end_block(sequence)
+        self._fileShards = []
+
+
+    def write_items(self, measures, analysisResults):
+        shard, _fileName, _isNewFile = self._get_output_file(measures)
+        if shard not in self._fileShards:
+            self._fileShards.append(shard)
+        if analysisResults:
+            for result in analysisResults:
+                outputRow = dict(measures)
+                outputRow.update(result)
+                shard.add_row(outputRow)
+        else:
+            shard.add_row(measures)
+
+
+    def flush(self):
+        '''
+        Index the blocks written so far; called before a worker posts
+        results, so the shards are complete for everything the job has seen
+        '''
+        for shard in self._outputFiles.values():
+            shard.flush()
+
+
+    def _open_file(self, fileName):
+        shardPath = "{0}_{1}".format(self._shardPath, len(self._outputFiles))
+        trace.file(2, "Opened output shard: {0} for {1}".format(shardPath, fileName))
+        return _Shard(shardPath, fileName, self._quoteValues)
+
+
+    def _close_file(self, fileName):
+        self._outputFiles[fileName].close()
+
+
+class _Shard( object ):
+    '''
+    A worker's data and index files for one output file
+    '''
+    def __init__(self, shardPath, fileName, quoteValues):
+        self._quoteValues = quoteValues
+        self._dataFile = open(shardPath + DATA_EXT, 'wb')
+        self._indexFile = open(shardPath + INDEX_EXT, 'wb')
+        pickle.dump(fileName, self._indexFile, pickle.HIGHEST_PROTOCOL)
+        self._dataSize = 0
+        self._schemaIds = {}
+        self._newSchemas = []
+        self._entries = []
+        self._blockRows = []
+        self._blockSchemaIds = []
+
+    def add_row(self, row):
+        names = tuple(row)
+        schemaId = self._schemaIds.get(names)
+        if schemaId is None:
+            schemaId = len(self._schemaIds)
+            self._schemaIds[names] = schemaId
+            self._newSchemas.append((schemaId, names))
+        if schemaId not in self._blockSchemaIds:
+            self._blockSchemaIds.append(schemaId)
+        if self._quoteValues:
+            self._blockRows.append((schemaId, tuple([quote_field(value) for value in row.values()])))
+        else:
+            self._blockRows.append((schemaId, tuple(row.values())))
+
+    def end_block(self, sequence):
+        '''
+        Index entries are (sequence, offset, length, schema IDs), with the
+        schema IDs in the order rows in the block first use them
+        '''
+        blockData = pickle.dumps(self._blockRows, pickle.HIGHEST_PROTOCOL)
+        self._dataFile.write(blockData)
+        self._entries.append((sequence, self._dataSize, len(blockData),
+                                tuple(self._blockSchemaIds)))
+        self._dataSize += len(blockData)
+        self._blockRows = []
+        self._blockSchemaIds = []
+
+    def flush(self):
+        if self._entries:
+            self._dataFile.flush()
+            pickle.dump((self._newSchemas, self._entries),
+                    self._indexFile, pickle.HIGHEST_PROTOCOL)
+            self._indexFile.flush()
+            self._newSchemas = []
+            self._entries = []
+
+    def close(self):
+        self.flush()
+        self._dataFile.close()
+        self._indexFile.close()
+
+
+#=============================================================================
+class ShardMerger( writer.MeasureWriter ):
+    '''
+    Stands in for the writer in the main process when workers write shards.
+    Takes the same arguments as writer.get_writer, along with whether
+    workers should still send analysis results; closing it merges the
+    shards into the output files.
+    '''
+    def __init__(self, typeStr, status_callback, outDir, outputFile, ignoreMetaOutfiles,
+                    itemColOrder=[], sendAnalysis=False):
+        super(ShardMerger, self).__init__(status_callback, outDir, outputFile, ignoreMetaOutfiles)
+        assert not self.using_console(), "Output shards used for console output"
+        self._typeStr = typeStr
+        self._itemColOrder = itemColOrder
+        self._shardDir = tempfile.mkdtemp(prefix=SHARD_DIR_PREFIX)
+        self.spec = ShardSpec(typeStr, self._shardDir, outputFile, ignoreMetaOutfiles, sendAnalysis)
+        self._mainShards = ShardWriter(self.spec, MAIN_SHARD_NAME)
+        self._mainSequence = MAIN_SEQUENCE_START
+        trace.file(1, "Writing output shards to: {0}".format(self._shardDir))
+
+
+    def write_items(self, measures, analysisResults):
+        '''
+        Workers write the rows for files to their own shards, so this is
+        only used for rows from the main process, such as aggregates
+        '''
+        self._mainSequence += 1
+        self._mainShards.write_file(self._mainSequence, [(measures, analysisResults)])
+
+
+    def close_files(self):
+        '''
+        Merge the shards into output files, and remove them
+        '''
+        if self._shardDir is None:
+            return
+        try:
+            self._mainShards.close_files()
+            self._merge_shards()
+        finally:
+            shutil.rmtree(self._shardDir, ignore_errors=True)
+            self._shardDir = None
+
+
+    def _merge_shards(self):
+        shardsByFile = {}
+        for shardName in sorted(os.listdir(self._shardDir)):
+            if shardName.endswith(INDEX_EXT):
+                shard = _ShardReader(os.path.join(self._shardDir, shardName[:-len(INDEX_EXT)]))
+                if shard.entries:
+                    shardsByFile.setdefault(shard.fileName, []).append(shard)
+                else:
+                    shard.close()
+
+        # Output files are written in the order they were first used
+        def first_sequence(fileItem):
+            return min(shard.entries[0][0] for shard in fileItem[1])
+
+        for fileName, fileShards in sorted(shardsByFile.items(), key=first_sequence):
+            trace.msg(1, "Merging {0} output shards into {1}".format(len(fileShards), fileName))
+            try:
+                outputFile = self._open_output(fileName)
+                try:
+                    if self._typeStr in COLUMNAR_TYPES:
+                        self._merge_columnar(outputFile, fileShards)
+                    else:
+                        self._merge_delimited(outputFile, fileShards)
+                finally:
+                    outputFile.close()
+            finally:
+                for shard in fileShards:
+                    shard.close()
+
+
+    def _open_output(self, fileName):
+        self._open_file(fileName)
+        filePath = os.path.join(self._outDir, fileName)
+        try:
+            if self._typeStr in COLUMNAR_TYPES:
+                return open(filePath, 'wb')
+            else:
+                return open(filePath, 'w')
+        except IOError as e:
+            if e.errno == errno.EACCES:
+                raise utils.OutputException(uistrings.STR_ErrorOpeningOutputAccess.format(fileName))
+            else:
+                raise utils.OutputException(uistrings.STR_ErrorOpeningOutput.format(fileName, str(e)))
+
+
+    def _merge_delimited(self, outputFile, fileShards):
+        '''
+        The first pass over the merged index works out the columns, in the
+        order the Delimited writer would have added them. Like that writer,
+        each row is padded only to the columns known when it was written.
+        A file that gains columns after its first row has its header
+        rewritten by that writer (_fixup_column_headers), which leaves the
+        header unquoted and copies the rows in text mode; so is this one.
+        '''
+        columns = {}
+        firstRowColumns = None
+        for _sequence, shard, _offset, _length, schemaIds in _merged_entries(fileShards):
+            for schemaId in schemaIds:
+                names = shard.schemas[schemaId]
+                if not columns:
+                    names = writer.first_row_columns(names, self._itemColOrder)
+                for name in names:
+                    if name not in columns:
+                        columns[name] = len(columns)
+                if firstRowColumns is None:
+                    firstRowColumns = len(columns)
+        rewritten = len(columns) > (firstRowColumns or 0)
+
+        delimiter = self._typeStr
+        if rewritten:
+            _write_rows(outputFile, delimiter, [list(columns)], rewritten)
+        else:
+            _write_rows(outputFile, delimiter, [list(map(quote_field, columns))])
+
+        rowLayouts = {}
+        numColumns = 0
+        for _sequence, shard, offset, length, _schemaIds in _merged_entries(fileShards):
+            rows = []
+            for schemaId, values in shard.read_block(offset, length):
+                layout = rowLayouts.get((shard, schemaId))
+                if layout is None:
+                    layout = _row_layout(shard.schemas[schemaId], columns)
+                    rowLayouts[(shard, schemaId)] = layout
+                positions, rowColumns = layout
+                numColumns = max(numColumns, rowColumns)
+                values = values + (EMPTY_FIELD,)
+                fields = [values[pos] for pos in positions]
+                if rowColumns < numColumns:
+                    fields.extend([EMPTY_FIELD] * (numColumns - rowColumns))
+                rows.append(fields)
+            _write_rows(outputFile, delimiter, rows, rewritten)
+
+
+    def _merge_columnar(self, outputFile, fileShards):
+        columnarWriter = columnar.ColumnarWriter(outputFile, self._typeStr == 'columnar-zlib')
+        for _sequence, shard, offset, length, _schemaIds in _merged_entries(fileShards):
+            schemas = shard.schemas
+            for schemaId, values in shard.read_block(offset, length):
+                columnarWriter.write_row(dict(zip(schemas[schemaId], values)))
+        columnarWriter.finish()
+
+
+def _sequence(entry):
+    return entry[0]
+
+def _merged_entries(fileShards):
+    return heapq.merge(*[shard.entries for shard in fileShards], key=_sequence)
+
+def _row_layout(names, columns):
+    '''
+    For rows with the given names, the position in the row's values of each
+    column up to its last one, where a position past the names is for a
+    column the row doesn't have
+    '''
+    rowColumns = max([columns[name] for name in names], default=-1) + 1
+    positions = [len(names)] * rowColumns
+    for pos, name in enumerate(names):
+        positions[columns[name]] = pos
+    return positions, rowColumns
+
+def _write_rows(outputFile, delimiter, rows, rewritten=False):
+    '''
+    If the output encoding can't handle a row, its values are escaped the
+    way the Delimited writer escapes them
+    '''
+    lines = [delimiter.join(fields) for fields in rows]
+    try:
+        outputFile.write(_lines_text(lines, rewritten))
+    except UnicodeEncodeError:
+        for line, fields in zip(lines, rows):
+            try:
+                outputFile.write(_lines_text([line], rewritten))
+            except UnicodeEncodeError:
+                outputFile.write(_lines_text([delimiter.join(map(_ascii_field, fields))], rewritten))
+
+def _lines_text(lines, rewritten):
+    '''
+    Rows copied in text mode by a header rewrite have \r\n and \r read as \n
+    '''
+    if not rewritten:
+        return LINE_END.join(lines) + LINE_END
+    text = writer.NEW_LINE.join(lines) + writer.NEW_LINE
+    if '\r' in text:
+        text = text.replace('\r\n', writer.NEW_LINE).replace('\r', writer.NEW_LINE)
+    return text
+
+def _ascii_field(field):
+    value = ascii(field[1:-1].replace(QUOTE + QUOTE, QUOTE))
+    if value.startswith("'") and value.endswith("'"):
+        value = value[1:-1]
+    return quote_field(value)
+
+
+class _ShardReader( object ):
+    '''
+    Reads a shard's index, with entries sorted on sequence number and
+    tagged with the shard, and reads its blocks of rows
+    '''
+    def __init__(self, shardPath):
+        self.fileName = None
+        self.schemas = {}
+        self.entries = []
+        with open(shardPath + INDEX_EXT, 'rb') as indexFile:
+            try:
+                self.fileName = pickle.load(indexFile)
+                while True:
+                    newSchemas, entries = pickle.load(indexFile)
+                    self.schemas.update(newSchemas)
+                    self.entries.extend((sequence, self, offset, length, schemaIds)
+                                for sequence, offset, length, schemaIds in entries)
+            except (EOFError, pickle.UnpicklingError):
+                # End of the index, or the end of what a stopped worker wrote
+                pass
+        self.entries.sort(key=_sequence)
+        self._dataFile = open(shardPath + DATA_EXT, 'rb')
+
+    def read_block(self, offset, length):
+        self._dataFile.seek(offset)
+        return pickle.loads(self._dataFile.read(length))
+
+    def close(self):
+        self._dataFile.close()
+        self.entries = []
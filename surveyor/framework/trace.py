@@ -44,7 +44,7 @@ MODE_TEMP = 'temp'
 DEFAULT_PRINT_WIDTH = 78
 
 #  The main process sets up context that it can pass to children
-def init_context(level, modes=[], printLen=DEFAULT_PRINT_WIDTH, lock=None, out=sys.stderr, traceback=True):
+def init_context(level, modes=[], printLen=DEFAULT_PRINT_WIDTH, lock=None, out=None, traceback=True):
     global _level, _modes, _printLen, _writer, _tracebackOn
     _level = int(level)
     _modes = list(modes)
@@ -0,0 +1,122 @@
+#=============================================================================
+'''
+    Surveyor Result Transport
+
+    Compact form of file results sent from workers to the OutThread.
+
+    csmodules report measures and analysis results as dicts, and the same
+    names (file.nbnc, search.line, ...) show up in every dict. Rather than
+    pickling every dict, a worker interns the tuple of names from each dict
+    as a schema with a small integer ID, and sends only the values as a tuple.
+    Consecutive analysis rows with the same schema are sent as one run:
+
+        file output     (filePath, [(schemaId, values, analysisRuns), ...], errorList)
+        analysisRuns    ((schemaId, [values, ...]), ...)
+
+    where the schema and values in each output tuple are for the measures.
+    For files from a commit history, filePath is (filePath, memoId), as
+    the job replays their output (history.py).
+
+    Schema IDs are local to each worker. Schemas a worker defines while
+    measuring a package are sent with that package, so the OutThread always
+    has a schema before it sees it used. The OutThread decodes results one
+    file at a time as it hands them to the application, so a package is
+    held in the main process in compact form and callbacks get plain dicts.
+
+    The same encoding is used to send rows to the writer process
+    (writerproc.py).
+'''
+#=============================================================================
+# Copyright 2004-2012, Matt Peloquin and Construx. This file is part of Code
+# Surveyor, covered under GNU GPL v3 and is distributed WITHOUT ANY WARRANTY.
+#=============================================================================
+from itertools import repeat
+
+
+class ResultEncoder( object ):
+    '''
+    Used by a worker to encode the output for each file
+    '''
+    def __init__(self):
+        self._schemaIds = {}
+        self._newSchemas = []
+
+    def encode_file(self, filePath, outputList, errorList):
+        encodedOutput = [self.encode_output(measures, analysisResults)
+                            for measures, analysisResults in outputList]
+        return (filePath, encodedOutput, errorList)
+
+    def encode_output(self, measures, analysisResults):
+        '''
+        Returns (schemaId, values, analysisRuns) for one measures dict
+        and its analysis results
+        '''
+        analysisRuns = []
+        runSchemaId = None
+        for result in analysisResults:
+            schemaId = self._schema_id(result)
+            if schemaId != runSchemaId:
+                runValues = []
+                analysisRuns.append((schemaId, runValues))
+                runSchemaId = schemaId
+            runValues.append(tuple(result.values()))
+        return (self._schema_id(measures), tuple(measures.values()), tuple(analysisRuns))
+
+    def package(self, encodedItems):
+        '''
+        Returns the package of encoded items with any new schemas
+        '''
+        encodedPackage = (self._newSchemas, encodedItems)
+        self._newSchemas = []
+        return encodedPackage
+
+    def _schema_id(self, row):
+        names = tuple(row)
+        schemaId = self._schemaIds.get(names)
+        if schemaId is None:
+            schemaId = len(self._schemaIds)
+            self._schemaIds[names] = schemaId
+            self._newSchemas.append((schemaId, names))
+        return schemaId
+
+
+class ResultDecoder( object ):
+    '''
+    Used by the OutThread to decode packages from all workers; schemas are
+    kept separately for each source of packages
+    '''
+    def __init__(self):
+        self._workerSchemas = {}
+
+    def files(self, workerName, encodedPackage):
+        '''
+        Generator of (filePath, outputList, errorList) for each file in the
+        package, with outputList in the form csmodules reported it
+        '''
+        filesOutput = self.unpack(workerName, encodedPackage)
+        for filePath, encodedOutput, errorList in filesOutput:
+            yield filePath, [self.decode_output(workerName, encoded)
+                                for encoded in encodedOutput], errorList
+
+    def unpack(self, sourceName, encodedPackage):
+        '''
+        Take in the new schemas from a package, and return its encoded items
+        '''
+        newSchemas, encodedItems = encodedPackage
+        schemas = self._workerSchemas.setdefault(sourceName, {})
+        for schemaId, names in newSchemas:
+            schemas[schemaId] = names
+        return encodedItems
+
+    def decode_output(self, sourceName, encodedOutput):
+        '''
+        Returns (measures, analysisResults) from encode_output
+        '''
+        schemas = self._workerSchemas[sourceName]
+        measuresId, measuresValues, analysisRuns = encodedOutput
+        analysisResults = []
+        for schemaId, runValues in analysisRuns:
+            analysisResults.extend(
+                    map(dict, map(zip, repeat(schemas[schemaId]), runValues)))
+        return dict(zip(schemas[measuresId], measuresValues)), analysisResults
+
@@ -18,6 +18,8 @@ CONFIG_FILE_DEFAULT_NAME = "surveyor.code"
 DEFAULT_OUT_FILE = "surveyor"               # Writer will add type extension
 NO_EXTENSION_NAME = ".(NoExt)"              # Appears where we need fileExt
 PROFILE_FILE = "SurveyorProfile"            # For profiler output files
+DEFAULT_CACHE_FILE = "surveyor.cache"       # Measure cache database
+DEFAULT_CONFIG_CACHE_FILE = "surveyor.configcache"  # Config cache database
 
 
 #-------------------------------------------------------------------------
@@ -44,6 +46,10 @@ STR_ErrorMeasuringFile = """
     Error measururing: {0}
        {1}
 """
+STR_ErrorCheckpointOutput = """
+    Output file is missing or was changed after the checkpoint: {0}
+"""
+STR_ErrorFileTimeBudget = "Measuring took over {0} seconds, stopped in {1}"
 STR_ErrorOpeningMeasureFile_Except = """
     Error opening file for measurement: {0}
        {1}
@@ -83,6 +89,10 @@ STR_ErrorConfigParam = """
       Parameter:    {1}
       {2}
 """
+STR_ErrorConfigRegexRisk = "Regex prone to catastrophic backtracking: {0}\n      {1}"
+STR_RegexRiskNestedRepeat = "a repeat inside a repeat with nothing required between iterations"
+STR_RegexRiskAdjacentRepeats = "a variable-length repeat next to an item matching the same characters"
+STR_RegexRiskAlternatives = "repeated alternatives that can start with the same character"
 STR_ErrorConfigConstantsTooDeep = """
     Constant recursuion depth of {0} exceeded:
         {1}
@@ -115,6 +125,11 @@ Copyright 2012, GPL v3 (-? for help)
 STR_Divider = "\n"
 STR_FolderMeasured = " Measuring: {0}\n"
 STR_DeltaFolder = " Delta comparison folder: {0}\n"
+STR_DeltaRevisions = " Delta comparison git revisions: {0}..{1}\n"
+STR_HistoryRevisions = " History of git revisions: {0}\n"
+STR_MeasureCache = " Measure cache: {0}\n"
+STR_ConfigCache = " Config cache: {0}\n"
+STR_CheckpointResume = " Resuming from checkpoint: {0}\n"
 STR_FileFilter = " File filter: {0}\n"
 STR_DirFilter = " Skiping folders: {0}\n"
 STR_IncludeFolders = " Including folders: {0}\n"
@@ -132,6 +147,9 @@ STR_UserInterrupt = """
 
  ===  Measurement aborted by user  ===
 
+"""
+STR_CheckpointSaved = """ Resume from the last checkpoint with -jr: {0}
+
 """
 STR_Error = """
 
@@ -186,11 +204,40 @@ STR_AggregateThresholdKeyError = """
 """
 STR_SummaryDetailedMeasureValue = "   {0}{1}  {2:,}\n"
 STR_SummaryDetailedMeasure =      "   {0}{1}\n"
+STR_SummaryWorkFlow = "\nWalk waited on workers: {0:.1f} seconds, workers waited for work: {1:.1f} seconds\n"
+STR_SummaryConfigLoad = "Config files loaded in {0:.2f} seconds\n"
+STR_SummaryConfigCache = "Config files loaded in {0:.2f} seconds, config cache hits: {1:,}  misses: {2:,}\n"
 STR_SummaryRunTime = "\nRun time: {0:.1f} seconds\n"
 
 
 #-------------------------------------------------------------------------
-#   Help Text and Command Line Parsing
+#   Daemon UI Strings
+
+STR_DaemonListening = " Surveyor daemon listening on: {0}  (set {1} to this path to use it)\n"
+STR_DaemonPreloaded = " Preloaded in {0:.2f} seconds, running up to {1} jobs at a time\n"
+STR_DaemonStopped = " Surveyor daemon stopped\n"
+STR_DaemonRunning = "A surveyor daemon is already listening on: {0}"
+STR_DaemonNotSupported = "The surveyor daemon needs Unix domain sockets and fork"
+STR_HelpText_Daemon = """
+ Surveyor daemon:
+
+    surveyord [socketPath] [maxJobs]
+
+    Keeps surveyor loaded and runs jobs sent to it from the surveyor command
+    line, so short jobs don't pay for starting surveyor each time.
+    Each job runner keeps its workers, the config files jobs read, and
+    csmodule instances for the next job; output is sent back as the job
+    writes it, and a job behaves just as it would when run locally.
+
+    socketPath  Unix domain socket to listen on (default {0})
+    maxJobs     Jobs to run at the same time; others wait (default {1})
+
+    To send jobs to the daemon, set {2} to the socket path:
+
+        {2}={0} surveyor <options>
+
+    If no daemon is listening, surveyor runs the job itself.
+    """
 
 STR_HelpText_Intro = (
 """
@@ -219,6 +266,9 @@ CMDARG_DUPE_PROCESSING = 'e'
 CMDARG_OUTPUT_FILTER = 'f'
 CMDARG_AGGREGATES = 'g'
 CMDARG_INCLUDE_ONLY = 'i'
+CMDARG_CHECKPOINT = 'j'
+CMDARG_MEASURE_CACHE = 'k'
+CMDARG_HISTORY = 'l'
 CMDARG_METADATA = 'm'
 CMDARG_RECURSION = 'n'
 CMDARG_OUTPUT_FILE = 'o'
@@ -229,6 +279,9 @@ CMDARG_SKIP = 's'
 CMDARG_SUMMARY_ONLY = 't'
 CMDARG_DETAILED = 'v'
 CMDARG_NUM_WORKERS = 'w'
+CMDARG_WORK_QUEUE_LIMIT = 'q'
+CMDARG_FILE_TIME_BUDGET = 't'
+CMDARG_FILE_CHUNKS = 'c'
 CMDARG_PROFILE = 'y'
 CMDARG_DEBUG = 'z'
 
@@ -238,9 +291,10 @@ STR_HelpText_Usage = """
     surveyor{0} [options] [pathToMeasure]{1}[fileFilters]...
     """
 STR_HelpText_Options = """
-    [pathToMeasure]   Measure path(s) other than the current one
+    [pathToMeasure]   Measure path(s) or archive(s) other than the current one
     [fileFilters]     File type filters (documented in surveyor.examples)
     -delta <path>     Measure diffs and additions relative to <path> (+)
+    -log <revisions>  Measure each commit in a range of git revisions (+)
     -config <name>    Look for config files called <name> (+)
 
     -a[mode]          Scan all files, ignoring config file settings (+)
@@ -248,6 +302,8 @@ STR_HelpText_Options = """
     -inclPath <filt>  Include only files in paths that match filter (+)
     -nonRecursive     Only scan <pathToMeasure>, do not scan sub-folders
     -breakOnError     Stop scanning if file error is encountered
+    -k[mode] [file]   Reuse results for unchanged files from a cache (+)
+    -j[r] [minutes]   Save checkpoints to resume the job if it is stopped (+)
 
     -exDupe [thresh]  Exclude duplicate files from measure totals (+)
     -m <metadata>     Modify metadata output (e.g., folder reporting depth) (+)
@@ -261,6 +317,9 @@ STR_HelpText_Options = """
     -verbose [len]    Additional summary information on console, up to [len]
     -z[level][modes]  Debug tracing to console (+)
     -workers <num>    Use <num> worker processes (default is NumCores-1)
+    -wq <num> [MB]    Limit work queued ahead of workers to <num> packages/[MB]
+    -wt <seconds>     Stop measuring any file that takes over <seconds>
+    -wc <MB>          Split files of <MB> or more across workers (0 is off)
     -quiet            Don't update console status, useful for piping output
 
     -? [name]         Additional help on [name] for items above ending in (+)
@@ -269,12 +328,15 @@ STR_HelpText_Options = """
     surveyor{0}               (measure files as per surveyor.code config files)
     surveyor{0} -ad -t              (scan all likely code files, no csv output)
     surveyor{0} -c myConfigFile         (run using "myConfigFile" config files)
+    surveyor{0} drop.tgz           (measure files in a zip, tar, or gz archive)
     surveyor{0} -e 100 -o dupes.csv         (same files within 100 bytes duped)
     surveyor{0} -i *test* A{1}*.cs B{1}*.c           (test folders in path A and B)
     """
 
 CMDARG_CONFIG_CUSTOM = 'c'
 CMDARG_CONFIG_INFO = 'i'
+CMDARG_CONFIG_REGEX_CHECK = 'r'
+CMDARG_CONFIG_CACHE = 'k'
 STR_HelpText_Config = """
  Custom config file(s):
 
@@ -298,6 +360,23 @@ STR_HelpText_Config = """
                 file types that would be measured, along with the options
                 from the config file that apply to each location.
 
+ Regex check:
+
+    -cr         Check regexes in config entry parameters, such as search
+                terms, and stop with an error on any that are prone to
+                catastrophic backtracking, e.g., (\\w+\\s?)+
+                Combine with -ci to check config files without measuring.
+
+ Config cache:
+
+    -ck [file]  Keep config files read, parsed, and checked, with their
+                csmodules, in a cache database so later jobs don't read
+                them again. [file] defaults to "surveyor.configcache" in
+                the current folder. A config file is read again if it, an
+                INCLUDE it read, or csmodule code has changed. With -v, the
+                summary shows the time spent loading config files and the
+                cache hits and misses.
+
  Command-line config:
 
     -cc <config>    Allows a one line config entry in <config>, overriding
@@ -316,6 +395,7 @@ STR_HelpText_Config_OptionItemHelp = "   {0:<20} {1}\n"
 
 
 CMDARG_DELTA_DELETE = 'd'
+CMDARG_DELTA_GIT = 'g'
 STR_HelpText_Delta = """
  Delta Measure:
 
@@ -323,7 +403,9 @@ STR_HelpText_Delta = """
     Normally you would make <pathToMeasure> your current version of a folder
     tree and <deltaPath> the older version.
 
-    Unchanged files and lines (per Python difflib) will have 0 values.
+    Unchanged files and lines (per a minimal line diff of each file) will have
+    0 values. Earlier versions used difflib's diff, which can count more
+    changed lines; the DELTA_DIFFLIB config option gives the same counts.
 
     Works on path names to individual files, so any folder changes will
     be seen as new files in <pathToMeasure>.
@@ -338,6 +420,13 @@ STR_HelpText_Delta = """
                     lines will be double counted.
                     Lines from DELETED FILES ARE NOT MEASURED.
 
+    -dg <old>[..<new>]  Measures the <new> revision (HEAD by default) of the
+                    local git repository <pathToMeasure> is in, relative to
+                    the <old> revision. Files and config files are read from
+                    the repository, so neither needs to be checked out.
+                    Unchanged files (same blob) are not read.
+                    File dates are the date of the <new> commit.
+
     Delta measurement only works well for the measure and search
     verbs; behavior with the routines verb is undedefined.
 
@@ -345,6 +434,76 @@ STR_HelpText_Delta = """
     output with your tool of choice and run surveyor on that.
     """
 
+CMDARG_HISTORY_TOTALS = 't'
+STR_HelpText_History = """
+ History Measure:
+
+    Measures every commit in a range of revisions of the local git
+    repository <pathToMeasure> is in, for trends over time. Files and
+    config files are read from each commit's tree in the repository,
+    so nothing is checked out, and config files apply as they were in
+    each commit.
+
+    Each file's content is measured once; for later commits with the
+    same content at the same path, its measures are reused.
+
+    -l <revisions>  Measures each commit in <revisions>, in the form git log
+                    takes, e.g., v1.0..v2.0 for commits after v1.0 up to
+                    v2.0, or HEAD for all commits. Merged branches are not
+                    followed. Output for each file has the commit's place
+                    in the range (commit.num), SHA, and date.
+                    File dates are those of the first commit in the range
+                    with the file's content.
+
+    -lt <revisions> Writes a row of totals for each commit instead of rows
+                    for each file, with the number of files measured in
+                    the commit and the sum of each numeric measure.
+    """
+
+CMDARG_MEASURE_CACHE_REBUILD = 'r'
+CMDARG_MEASURE_CACHE_BYPASS = 'b'
+STR_HelpText_Measure_Cache = """
+ Measure cache:
+
+    Stores the results for each file in a cache database, so measuring the
+    same folder tree again only measures files that have changed.
+
+    Cached results are used when the file's path, size, and modification
+    time (or content) are unchanged, and the config entry, config file, and
+    csmodule code used to measure the file are unchanged.
+    Delta measurements are not cached.
+
+    -k [file]   Use the cache, creating it if needed. [file] defaults to
+                "surveyor.cache" in the current folder.
+
+    -kr [file]  Rebuild the cache; all files are measured and the results
+                replace everything in the cache.
+
+    -kb         Bypass the cache; overrides any earlier -k option.
+    """
+
+CMDARG_CHECKPOINT_RESUME = 'r'
+STR_HelpText_Checkpoint = """
+ Checkpoints:
+
+    Saves the progress of a long job as it goes, so if the job is stopped
+    (ctrl-c, a reboot, a crash) it can be resumed instead of started over.
+
+    Checkpoints record the folders and files measured so far, once their
+    output has been written to output files that are flushed to disk.
+    The checkpoint is saved next to the default output file, with the
+    extension ".checkpoint", and is removed when the job finishes.
+
+    -j [minutes]    Save a checkpoint every [minutes], default is 5
+
+    -jr [minutes]   Resume from the last checkpoint; use the same command line
+                    as the job that saved it, adding r to -j. Folders and files
+                    measured before the checkpoint are skipped, and output files
+                    are appended to from where they were at the checkpoint.
+
+    Not used with output to the console, -os, -g, or -ci.
+    """
+
 CMDARG_SCAN_ALL_METADATA = 'm'
 CMDARG_SCAN_ALL_CODE = 'nd'
 CMDARG_SCAN_ALL_DEEP_CODE = 'd'
@@ -458,6 +617,10 @@ CMDARG_OUTPUT_TYPE_CSV = 'csv'
 CMDARG_OUTPUT_TYPE_TAB = 'tab'
 CMDARG_OUTPUT_TYPE_XML = 'xml'
 CMDARG_OUTPUT_TYPE_PARA = 'paragraph'
+CMDARG_OUTPUT_TYPE_COLUMNAR = 'columnar'
+CMDARG_OUTPUT_TYPE_COLUMNAR_ZLIB = 'columnarz'
+CMDARG_OUTPUT_PROCESS = 'w'
+CMDARG_OUTPUT_SHARDS = 's'
 STR_HelpText_Output = """
  Place measurement results into specific output file:
 
@@ -469,6 +632,16 @@ STR_HelpText_Output = """
     -o <folder>     Open all output files in the given folder, both the default
                     output file as well as any output files designated in the
                     config files
+
+    -ow             Format and write output files in a separate process, which
+                    can speed up jobs that produce many rows (e.g., searches)
+                    on machines with a core to spare. Output is the same.
+                    Not used when output is sent to the console.
+
+    -os             Each worker writes output for the files it measures, which
+                    is merged into the output files at the end of the job, in
+                    the order files were found. Not used for XML output,
+                    output to the console, or with -e.
 """
 
 STR_HelpText_Results = """
@@ -478,6 +651,10 @@ STR_HelpText_Results = """
     -r tab          Tab-delimited output columns
     -r paragraph    Uses paragraph symbol to separarte*
     -r xml          XML output for values
+    -r columnar     Binary columnar output (.scol) with typed values, for
+                    loading into analysis tools without parsing csv; columns
+                    that appear partway through a job need no header fixup
+    -r columnarz    Columnar output with zlib compressed columns
 
     *on windows hold down "Alt" and type "0182" for \\xB6 paragraph symbol "�"
 """
@@ -531,6 +708,7 @@ STR_HelpText_Filter = """
                     fast scanning of all files in a tree.
 """
 
+CMDARG_AGGREGATES_MEMORY = 'm'
 STR_HelpText_Aggregates = """
  Aggregate mapping:
 
@@ -540,6 +718,9 @@ STR_HelpText_Aggregates = """
     
     -g search.line "['search.line','search.match']"
 
+    -gm <MB>    Memory aggregates can use before they are spilled to temporary
+                files in the output folder and merged at the end of the job
+                (default 1024, 0 to keep all aggregates in memory)
 """
 
 
@@ -600,6 +781,7 @@ STR_HelpText_Debug = """
 
 detailedHelpMap = {
     CMDARG_DELTA: STR_HelpText_Delta,
+    CMDARG_HISTORY: STR_HelpText_History,
     CMDARG_CONFIG_CUSTOM: STR_HelpText_Config,
     CMDARG_SCAN_ALL: STR_HelpText_Scan_All,
     CMDARG_SKIP: STR_HelpText_Skip,
@@ -610,7 +792,9 @@ detailedHelpMap = {
     CMDARG_AGGREGATES: STR_HelpText_Aggregates,
     CMDARG_OUTPUT_FILTER: STR_HelpText_Filter,
     CMDARG_DEBUG: STR_HelpText_Debug,
-    CMDARG_DUPE_PROCESSING: STR_HelpText_Dupe_Processing
+    CMDARG_DUPE_PROCESSING: STR_HelpText_Dupe_Processing,
+    CMDARG_MEASURE_CACHE: STR_HelpText_Measure_Cache,
+    CMDARG_CHECKPOINT: STR_HelpText_Checkpoint
     }
 
 STR_ErrorInvalidParameter = """
@@ -646,6 +830,48 @@ STR_ErrorBadPath = """
 
     The path must exist, and the file filter must be a valid name or wildcard.
 """
+STR_ErrorGitRevisions = """
+    Expecting git revisions as <old>[..<new>]: {0}
+"""
+STR_ErrorGitRevision = """
+    Unknown git revision: {0}
+    In repository: {1}
+"""
+STR_ErrorGitCommand = """
+    Error running git {0}
+      {1}
+"""
+STR_ErrorGitObject = "Unable to read git object {0} in {1}"
+STR_ErrorGitNoCommits = """
+    No commits in git revisions: {0}
+    In repository: {1}
+"""
+STR_ErrorHistoryOptions = """
+    History measures (-l) can't be used with delta measures (-d)
+"""
+STR_ErrorArchive = "Unable to read archive {0}: {1}"
+STR_ErrorSourceTreeOptions = """
+    Archives can't be measured with delta (-d) or history (-l) measures: {0}
+"""
+STR_ErrorCheckpointOptions = """
+    Checkpoints can't be used with output to the console, -os, -g, -l, or -ci
+"""
+STR_ErrorCheckpointMissing = """
+    No checkpoint to resume from: {0}
+
+    Checkpoints are removed once a job finishes. If the job was stopped
+    before its first checkpoint, run it again without -jr.
+"""
+STR_ErrorCheckpointRead = """
+    Unable to read checkpoint: {0}
+      {1}
+"""
+STR_ErrorCheckpointMismatch = """
+    Checkpoint was saved by a different job: {0}
+
+    Resume with the same paths (given the same way), delta path, output
+    type, and output file as the job that saved the checkpoint.
+"""
 STR_ErrorConfigFileNameHasPath = """
     Configuration file name cannot include a path
 
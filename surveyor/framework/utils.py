@@ -6,9 +6,11 @@
 # Copyright 2004-2010, Matt Peloquin and Construx. This file is part of Code
 # Surveyor, covered under GNU GPL v3 and is distributed WITHOUT ANY WARRANTY.
 #=============================================================================
+import io
 import os
 import sys
 import time
+import codecs
 import chardet
 import magic
 
@@ -46,6 +48,9 @@ class CsModuleException(SurveyorException):
 class FileMeasureError(SurveyorException):
     pass
 
+class FileTimeoutError(FileMeasureError):
+    pass
+
 class AbstractMethod(SurveyorException):
     def __init__(self, obj):
         self.methodName = sys._getframe(1).f_code.co_name
@@ -88,19 +93,150 @@ def safe_dict_get_float(dictionary, keyName):
     except Exception:
         return 0.0
 
-# In Python3 we have to implement our own magic autodetection
-# of binary/text and charsets
+#-----------------------------------------------------------------------------
+#  File opening with charset detection
+
+# Bytes read from the start of a file to decide if it is text and its encoding
+FILE_SNIFF_BYTES = 16 * 1024
+
+# Bytes libmagic reads to type a file, for versions that can't say
+MAGIC_SNIFF_BYTES = 1024 * 1024
+
+# Byte order marks, and the encoding chardet reports for them
+# UTF-32 must be checked before UTF-16, as their little-endian BOMs overlap
+ByteOrderMarks = [
+    (codecs.BOM_UTF8, 'UTF-8-SIG'),
+    (codecs.BOM_UTF32_LE, 'UTF-32'),
+    (codecs.BOM_UTF32_BE, 'UTF-32'),
+    (codecs.BOM_UTF16_LE, 'UTF-16'),
+    (codecs.BOM_UTF16_BE, 'UTF-16'),
+    ]
+
+# Bytes that chardet will accept as plain ascii text; other control
+# chars make it unsure, so they are left to chardet
+AsciiTextBytes = bytes(range(0x20, 0x7F)) + b'\t\n\r'
+
+# chardet honours charset declarations (XML, HTML meta, Python coding lines)
+# in ascii files, so files that may have one are left to chardet
+CharsetDeclarationBytes = 4096
+CharsetDeclarations = [b'<?xml', b'<meta']
+
+# One libmagic handle per process, as loading the magic database is slow,
+# and the number of bytes it reads from the start of a file to type it
+_magic = None
+_magicBytes = None
+
 def open_chardet(fpath):
-    my_magic = magic.Magic(mime=True, uncompress=True)
-    if not my_magic.from_file(fpath).startswith('text/'):
-        return open(fpath, 'rb')
-
-    # looks like text, use chardet to figure out encoding
-    fh = open(fpath, 'rb')
-    buf = fh.read(16 * 1024)
-    res = chardet.detect(buf)
+    '''
+    Open a file in text mode with the encoding detected from the start of
+    the file, or in binary mode if it doesn't look like text.
+    The file is opened once; the start that is read to detect encoding is
+    kept on the file object (see get_raw_file_start).
+    libmagic decides if the file is text, as it always has, from the same
+    bytes it would read itself. Checks for byte order marks, ascii and UTF-8
+    then decide most encodings, and chardet is only used if they can't.
+    '''
+    return _open_detected(open(fpath, 'rb'))
+
+def open_chardet_bytes(content, name):
+    '''
+    Same as open_chardet for file content that has been read into memory,
+    e.g., a blob from a git repository
+    '''
+    fh = io.BytesIO(content)
+    fh.name = name
+    fh.mode = 'rb'
+    return _open_detected(fh)
+
+def _open_detected(fh):
+    try:
+        magicStart = fh.read(_magic_bytes())
+        fileStart = magicStart[:FILE_SNIFF_BYTES]
+        encoding = _detect_encoding(fileStart, lambda: _magic_handle().from_buffer(magicStart))
+        fh.seek(0)
+        if encoding is not None:
+            fh = io.TextIOWrapper(fh, encoding=encoding, errors="surrogateescape")
+            fh.mode = 'r'
+    except Exception:
+        fh.close()
+        raise
+    fh.rawFileStart = fileStart
+    return fh
+
+def get_raw_file_start(fileObject, maxWin):
+    '''
+    Get up to maxWin bytes from the start of a file as it is on disk; for
+    files from open_chardet, this is at most FILE_SNIFF_BYTES
+    '''
+    fileStart = getattr(fileObject, 'rawFileStart', None)
+    if fileStart is None:
+        return get_file_start(fileObject, maxWin)
+    return fileStart[:maxWin]
+
+def _detect_encoding(fileStart, magic_mime):
+    '''
+    Return the encoding to open a file with, or None for binary
+    '''
+    # libmagic gives empty files a non-text type
+    if not fileStart or not magic_mime().startswith('text/'):
+        return None
+    for bom, bomEncoding in ByteOrderMarks:
+        if fileStart.startswith(bom):
+            return bomEncoding
+    if not fileStart.translate(None, AsciiTextBytes):
+        if not _has_charset_declaration(fileStart):
+            return 'ascii'
+    elif not fileStart.isascii() and _decodes(fileStart, 'utf-8'):
+        return 'utf-8'
+    return _chardet_encoding(fileStart)
+
+def _has_charset_declaration(fileStart):
+    declarationStart = fileStart[:CharsetDeclarationBytes].lower()
+    for declaration in CharsetDeclarations:
+        if declaration in declarationStart:
+            return True
+    firstLines = declarationStart.split(b'\n', 2)[:2]
+    return any(b'coding' in line for line in firstLines)
+
+def _decodes(fileStart, encoding):
+    '''
+    Is the file start valid in the encoding (allowing for a character split
+    at the end)
+    '''
+    try:
+        wholeFile = len(fileStart) < FILE_SNIFF_BYTES
+        codecs.getincrementaldecoder(encoding)().decode(fileStart, wholeFile)
+        return True
+    except (UnicodeDecodeError, LookupError):
+        return False
+
+def preload_file_detection():
+    '''
+    Load libmagic and chardet up front, for processes that will fork many
+    others that use them (daemon.py)
+    '''
+    _magic_handle().from_buffer(b'surveyor')
+    _chardet_encoding(b'surveyor')
+
+def _magic_handle():
+    global _magic
+    if _magic is None:
+        _magic = magic.Magic(mime=True, uncompress=True)
+    return _magic
+
+def _magic_bytes():
+    global _magicBytes
+    if _magicBytes is None:
+        try:
+            _magicBytes = _magic_handle().getparam(magic.MAGIC_PARAM_BYTES_MAX)
+        except (AttributeError, NotImplementedError):
+            _magicBytes = MAGIC_SNIFF_BYTES
+        _magicBytes = max(_magicBytes, FILE_SNIFF_BYTES)
+    return _magicBytes
+
+def _chardet_encoding(fileStart):
+    res = chardet.detect(fileStart)
     # DEBUG - print(res)
-    fh.close()
 
     # Search through detected encodings - they could be a single encoding or
     # a list of dictionaries in
@@ -121,15 +257,11 @@ def open_chardet(fpath):
         encoding_found = res.get('encoding')
         encoding_confidence = res.get('confidence')
 
-    # DEBUG print('Using {0}'.format(use_encoding))
     if encoding_found is None or encoding_confidence < ENCODING_DETECTION_THRESHHOLD:
         # chardet could not figure out encoding, or has very low confidence
         # DEBUG - print('No encoding detected with confidence >= {0} - using binary'.format(ENCODING_DETECTION_THRESHHOLD))
-        fh = open(fpath, 'rb')
-    else:  # use encoding detected
-        # DEBUG - print('Encoding detected {0}'.format(enc))
-        fh = open(fpath, 'r', encoding=encoding_found, errors="surrogateescape")
-    return fh
+        encoding_found = None
+    return encoding_found
 
 #-----------------------------------------------------------------------------
 # String and RE utils
@@ -281,6 +413,16 @@ def match_ranking_label(rankingMap, value):
                 break
     return label
 
+ADLER_MOD = 65521
+def adler32_combine(crc1, crc2, len2):
+    '''
+    Adler-32 of two pieces of data from the checksums of each, where both
+    were started from 0 (not 1) and len2 is the byte length of the second
+    '''
+    a = ((crc1 & 0xffff) + (crc2 & 0xffff)) % ADLER_MOD
+    b = ((crc1 >> 16) + (crc2 >> 16) + len2 * (crc1 & 0xffff)) % ADLER_MOD
+    return (b << 16) | a
+
 #-----------------------------------------------------------------------------
 #  File utils
 
@@ -0,0 +1,172 @@
+#=============================================================================
+'''
+    Surveyor Worker Pool
+
+    For a process that runs one job after another (a surveyor daemon's job
+    runner, see daemon.py), things a job would otherwise set up each time
+    are kept for the next job in ResidentJobs:
+
+      - A WorkerPool of workers started once. Its dispatcher and config
+        registry are used by each job in turn, so the config entries a
+        later job hands out again are already in the workers, with their
+        csmodule instances (registry.py).
+      - The config files jobs have read, with their csmodule instances
+        (configcache.ResidentConfigs), used by each job's ConfigStack.
+
+    A job given a pool (job.Job) starts its workers on the job, passing
+    the options they use and the folder and environment the job runs in.
+    At the end it waits for each worker to finish the job and close its
+    files, rather than for it to exit. A pool isn't kept after a job that
+    aborts (ctrl-c, break on error, or an exception), as its workers could
+    be anywhere in their work; the next job gets a new one.
+
+    Jobs with tracing or profiling, which are set up as workers start, run
+    with their own workers.
+'''
+#=============================================================================
+# Copyright 2004-2012, Matt Peloquin and Construx. This file is part of Code
+# Surveyor, covered under GNU GPL v3 and is distributed WITHOUT ANY WARRANTY.
+#=============================================================================
+import os
+import copy
+
+from framework import configcache
+from framework import dispatch
+from framework import jobworker
+from framework import registry
+from framework import trace
+
+# A pool is replaced once it has this many config entries registered, so
+# entries from config overrides or changed config files don't pile up
+POOL_MAX_CONFIGS = 5000
+
+# Seconds between status callbacks while waiting on workers
+WORKER_WAIT_INTERVAL = 0.1
+WORKER_EXIT_TIMEOUT = 0.5
+
+
+class ResidentJobs( object ):
+    '''
+    What a process running one job after another keeps for the next job
+    '''
+    def __init__(self):
+        self.configs = configcache.ResidentConfigs()
+        self._pool = None
+
+    def job_pool(self, options):
+        '''
+        Returns the pool for a job with these options, started or replaced
+        if need be, or None if the job should start its own workers
+        '''
+        if options.profileName is not None or trace.level() > 0:
+            return None
+        pool = self._pool
+        if pool is not None and (pool.closed or pool.inJob or
+                pool.num_max() != options.numWorkers or
+                pool.configRegistry.num_registered() > POOL_MAX_CONFIGS):
+            pool.close()
+            pool = None
+        if pool is None:
+            pool = self._pool = WorkerPool(options.numWorkers)
+        return pool
+
+    def register_configs(self):
+        '''
+        Send the pool's workers the entries of the config files kept, ahead
+        of jobs that use them
+        '''
+        if self._pool is not None and not self._pool.closed:
+            for configEntrys in self.configs.entry_lists():
+                self._pool.configRegistry.config_ids(configEntrys)
+
+    def keeps(self, process):
+        '''
+        True for processes that are kept between jobs
+        '''
+        return self._pool is not None and not self._pool.closed and process in self._pool()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+
+class WorkerPool( object ):
+    '''
+    Workers started once and used by one job at a time; the job uses the
+    pool in place of job.Job.Workers
+    '''
+    def __init__(self, numWorkers):
+        self.dispatch = dispatch.Dispatcher(numWorkers)
+        self.configRegistry = registry.ConfigRegistry(self.dispatch)
+        self.closed = False
+        self.inJob = False
+        context = (trace.get_context(), None)
+        self._workers = [jobworker.Worker(self.dispatch, context, num+1, None)
+                            for num in range(numWorkers)]
+        for worker in self._workers:
+            worker.start()
+        trace.msg(1, "Started pool of {0} workers".format(numWorkers))
+
+    def __call__(self):
+        return iter(self._workers)
+
+    def start_next(self):
+        return False
+
+    def num_max(self):
+        return len(self._workers)
+
+    def num_started(self):
+        return len(self._workers)
+
+
+    def start_job(self, options):
+        '''
+        Workers get the options they use; paths to measure can be source
+        trees, and a checkpoint's resume state is the job's, so those stay
+        with the job
+        '''
+        workerOptions = copy.copy(options)
+        workerOptions.pathsToMeasure = []
+        if options.checkpoint is not None:
+            workerOptions.checkpoint = copy.copy(options.checkpoint)
+            workerOptions.checkpoint.resumeState = None
+        self.inJob = True
+        self.configRegistry.new_job()
+        self.dispatch.put_job_start((workerOptions, os.getcwd(), dict(os.environ)))
+
+
+    def end_job(self, status_callback):
+        '''
+        Wait for each worker to finish the job; if the job is aborting, or
+        a worker has gone, the pool is closed. A pool left in a job, e.g.,
+        by a ctrl-c while waiting here, is replaced for the next job.
+        '''
+        workersDone = 0
+        while workersDone < len(self._workers) and not self.dispatch.exiting():
+            if self.dispatch.wait_job_done(WORKER_WAIT_INTERVAL):
+                workersDone += 1
+            elif not all(worker.is_alive() for worker in self._workers):
+                trace.msg(1, "Pool worker exited during job")
+                break
+            status_callback()
+        if workersDone < len(self._workers):
+            self.close(status_callback)
+        else:
+            self.inJob = False
+
+
+    def close(self, status_callback=None):
+        if self.closed:
+            return
+        self.closed = True
+        trace.cc(1, "Closing worker pool")
+        self.dispatch.exit()
+        for worker in self._workers:
+            while worker.is_alive():
+                if status_callback is not None:
+                    status_callback()
+                self.dispatch.drain()
+                worker.join(WORKER_EXIT_TIMEOUT)
+        self.dispatch.close()
@@ -3,20 +3,26 @@
     Write the output of Surveyor measures
     Supports various output formats and the creation of multiple files
     based on the config file "OUT:" tag
+
+    For job checkpoints, writers flush their files to disk and provide the
+    state they need to append to them when the job is resumed, at which
+    point anything written after the checkpoint is cut off. Files of a job
+    that will be resumed are closed as they are, without header fixup.
 '''
 #=============================================================================
 # Copyright 2004-2010, Matt Peloquin and Construx. This file is part of Code
 # Surveyor, covered under GNU GPL v3 and is distributed WITHOUT ANY WARRANTY.
 #=============================================================================
 import os
+import re
 import sys
 import csv
 import random
 import shutil
 import string
 import errno
-from xml.dom import minidom
 
+from framework import columnar
 from framework import configentry
 from framework import uistrings
 from framework import utils
@@ -32,6 +38,9 @@ def get_writer(typeStr, status_callback, outDir, outputFile, ignoreMetaOutfiles,
     writer = None
     if typeStr == 'xml':
         writer = Xml(status_callback, outDir, outputFile, ignoreMetaOutfiles)
+    elif typeStr in ('columnar', 'columnar-zlib'):
+        writer = Columnar(status_callback, outDir, outputFile, ignoreMetaOutfiles,
+                            typeStr == 'columnar-zlib')
     else:
         writer = Delimited(typeStr, status_callback, outDir, outputFile, ignoreMetaOutfiles, itemColOrder)
     return writer
@@ -74,6 +83,9 @@ class MeasureWriter( object ):
         # being opended
         self._status_callback = status_callback
 
+        # Leave files as they are at close, to resume from a checkpoint
+        self._keepForResume = False
+
     def using_console(self):
         return self._defFileName == 'stdout'
 
@@ -82,6 +94,36 @@ class MeasureWriter( object ):
             self._close(fileName, self._outputFiles[fileName])
             del self._outputFiles[fileName]
 
+    def checkpoint(self):
+        '''
+        Flush output files to disk, returning a dict with the state of each
+        that resume() takes
+        '''
+        assert not self.using_console(), "Checkpoint of console output"
+        fileStates = {}
+        for fileName in self._outputFiles:
+            fileStates[fileName] = self._checkpoint_file(fileName)
+        return fileStates
+
+    def keep_for_resume(self):
+        '''
+        Close files as they are, for a job that stopped after a checkpoint
+        '''
+        self._keepForResume = True
+
+    def resume(self, fileStates):
+        '''
+        Reopen output files as they were at a checkpoint
+        '''
+        for fileName, fileState in fileStates.items():
+            filePath = os.path.join(self._outDir, fileName)
+            if not os.path.isfile(filePath) or os.path.getsize(filePath) < fileState['size']:
+                raise utils.OutputException(
+                        uistrings.STR_ErrorCheckpointOutput.format(os.path.abspath(filePath)))
+            MeasureWriter._open_file(self, fileName)
+            self._outputFiles[fileName] = self._resume_file(fileName, filePath, fileState)
+            trace.file(2, "Resumed Output File: {0} at {1}".format(filePath, fileState['size']))
+
 
     #-------------------------------------------------------------------------
     # Specialize writer behavior through these methods
@@ -96,6 +138,12 @@ class MeasureWriter( object ):
     def _close_file(self, fileName):
         raise utils.AbstractMethod(self)
 
+    def _checkpoint_file(self, fileName):
+        raise utils.AbstractMethod(self)
+
+    def _resume_file(self, fileName, filePath, fileState):
+        raise utils.AbstractMethod(self)
+
     def _fixup_column_headers(self, filename):
         pass
 
@@ -156,6 +204,19 @@ class MeasureWriter( object ):
         return outFileName
 
 
+def _sync_file(rawFile):
+    '''
+    Flush rawFile to disk, returning its size
+    '''
+    rawFile.flush()
+    os.fsync(rawFile.fileno())
+    return os.fstat(rawFile.fileno()).st_size
+
+def _truncate_file(filePath, size):
+    with open(filePath, 'r+b') as rawFile:
+        rawFile.truncate(size)
+
+
 #=============================================================================
 class Delimited( MeasureWriter ):
     '''
@@ -249,16 +310,43 @@ class Delimited( MeasureWriter ):
         MeasureWriter._open_file(self, fileName)
         filePath = os.path.join(self._outDir, fileName)
         self._rawFiles[fileName] = open(filePath, 'w')
-        outWriter = csv.writer(
-            self._rawFiles[fileName], delimiter=self._delimiter, quoting=csv.QUOTE_NONNUMERIC)
         trace.file(2, "Opened Delimited Output File: {0}".format(filePath))
-        return outWriter
+        return self._csv_writer(self._rawFiles[fileName])
+
+    def _csv_writer(self, rawFile):
+        return csv.writer(rawFile, delimiter=self._delimiter, quoting=csv.QUOTE_NONNUMERIC)
 
     def _close_file(self, fileName):
         self._rawFiles[fileName].close()
-        if self._colMeasureIsDirty[fileName]:
+        if self._colMeasureIsDirty[fileName] and not self._keepForResume:
             self._fixup_column_headers(fileName)
 
+    def _checkpoint_file(self, fileName):
+        '''
+        The header row size is recorded to check it wasn't rewritten by
+        header fixup before the job was resumed
+        '''
+        size = _sync_file(self._rawFiles[fileName])
+        with open(os.path.join(self._outDir, fileName), 'rb') as rawFile:
+            headerSize = len(rawFile.readline())
+        return {
+            'size': size,
+            'headerSize': headerSize,
+            'columns': dict(self._colMeasureTracker[fileName]),
+            'dirty': self._colMeasureIsDirty[fileName],
+            }
+
+    def _resume_file(self, fileName, filePath, fileState):
+        with open(filePath, 'rb') as rawFile:
+            if len(rawFile.readline()) != fileState['headerSize']:
+                raise utils.OutputException(
+                        uistrings.STR_ErrorCheckpointOutput.format(os.path.abspath(filePath)))
+        _truncate_file(filePath, fileState['size'])
+        self._colMeasureTracker[fileName] = dict(fileState['columns'])
+        self._colMeasureIsDirty[fileName] = fileState['dirty']
+        self._rawFiles[fileName] = open(filePath, 'a')
+        return self._csv_writer(self._rawFiles[fileName])
+
     def _write_delimited_string(self, outputFile, listOfValues):
         try:
             outputFile.writerow(listOfValues)
@@ -281,26 +369,9 @@ class Delimited( MeasureWriter ):
         our column index dictionary once at the start of each file using 
         the first row items and an order list if provided
         '''
-        itemNames = [itemName for itemName, _itemValue in firstRow.items()]
-
-        # Split itemNames into two lists of anything that is in our predefined
-        # order list, and anything that is not
-        orderedNames = []
-        unorderedNames = []
-        for itemName in itemNames:
-            if itemName in self._itemColOrder:
-                orderedNames.append(itemName)
-            else:
-                unorderedNames.append(itemName)       
-        
-        # Put orderedNames in the order defined by the itemOrder list, sort the rest,
-        # and then add them to our column dictionary
-        orderedNames = [itemName for itemName in self._itemColOrder if itemName in orderedNames]
-        unorderedNames.sort()              
-
         # The outputFileCols dictionary is modified in place
         outputFileCols = self._colMeasureTracker[outFilename]
-        for itemName in list(orderedNames + unorderedNames):
+        for itemName in first_row_columns(firstRow, self._itemColOrder):
             listPos = len(outputFileCols)
             outputFileCols[itemName] = listPos
       
@@ -385,13 +456,39 @@ class Delimited( MeasureWriter ):
         shutil.move(tempPath, oldPath)
 
 
+def first_row_columns(itemNames, itemColOrder):
+    '''
+    Column order for the first row of a delimited file; names in the
+    itemColOrder list come first in that order, and the rest are sorted
+    '''
+    # Split itemNames into two lists of anything that is in our predefined
+    # order list, and anything that is not
+    orderedNames = []
+    unorderedNames = []
+    for itemName in itemNames:
+        if itemName in itemColOrder:
+            orderedNames.append(itemName)
+        else:
+            unorderedNames.append(itemName)
+
+    # Put orderedNames in the order defined by the itemOrder list, sort the rest
+    orderedNames = [itemName for itemName in itemColOrder if itemName in orderedNames]
+    unorderedNames.sort()
+    return orderedNames + unorderedNames
+
+
 #=============================================================================
 class Xml( MeasureWriter ):
     '''
     Writes an XML file where each node is a file. Per-file measures are
     inlcuded as attributes of the node, while analysis items are added
     as child nodes called item.
+    Elements are serialized straight to a buffered stream as they are
+    written, laid out as minidom's toprettyxml wrote them, one top-level
+    element per file after the XML declaration.
     '''
+    XML_HEADER = '<?xml version="1.0" ?>\n'
+    BUFFER_SIZE = 2**16
 
     def __init__(self, status_callback, outDir, outputFile, ignoreMetaOutfiles):
         super(Xml, self).__init__(status_callback, outDir, outputFile, ignoreMetaOutfiles)
@@ -401,35 +498,128 @@ class Xml( MeasureWriter ):
     def write_items(self, measures, analysisResults):
         outputFile, fileName, isNewFile = self._get_output_file(measures)
 
-        # Create the file element
-        fileNode = minidom.Element("file")
-        for itemName, itemValue in measures.items():
-            fileNode.setAttribute(itemName, utils.safe_ascii_string(itemValue))
-
-        # Create unique analysisResults entries
-        itemNum = 1
-        for item in analysisResults:
-            itemNode = minidom.Element("item" + str(itemNum))
-            for itemName, itemValue in item.items():
-                itemNode.setAttribute(itemName, utils.safe_ascii_string(itemValue))
-            itemNum += 1
-            fileNode.appendChild(itemNode)
-
-        outputFile.write(fileNode.toprettyxml(indent="  "))
+        # Build the file element and its analysis item children,
+        # then hand the whole thing to the stream in one write
+        parts = ['<file', _xml_attributes(measures)]
+        if analysisResults:
+            parts.append('>\n')
+            itemNum = 1
+            for item in analysisResults:
+                parts.append('  <item{0}{1}/>\n'.format(itemNum, _xml_attributes(item)))
+                itemNum += 1
+            parts.append('</file>\n')
+        else:
+            parts.append('/>\n')
+        outputFile.write(''.join(parts))
 
 
     def _open_file(self, filename):
         MeasureWriter._open_file(self, filename)
         filePath = os.path.join(self._outDir, filename)
-        outFile = open(filePath, 'w')
-        doc = minidom.Document()
-        outFile.write(doc.toprettyxml())
+        outFile = open(filePath, 'w', encoding='utf-8', buffering=self.BUFFER_SIZE)
+        outFile.write(self.XML_HEADER)
         trace.file(2, "Opened XML Output File: {0}".format(filePath))
         return outFile
 
 
+    def _checkpoint_file(self, fileName):
+        return {'size': _sync_file(self._outputFiles[fileName])}
+
+
+    def _resume_file(self, fileName, filePath, fileState):
+        _truncate_file(filePath, fileState['size'])
+        return open(filePath, 'a', encoding='utf-8', buffering=self.BUFFER_SIZE)
+
+
     def _close_file(self, fileName):
         self._outputFiles[fileName].close()
 
 
+# Characters escaped in attribute values; whitespace other than space is
+# escaped so it survives attribute value normalization by XML parsers
+_XML_ATTR_ESCAPES = (
+    ('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;'), ('"', '&quot;'),
+    ('\n', '&#10;'), ('\r', '&#13;'), ('\t', '&#9;'),
+    )
+_XML_ATTR_SPECIAL = re.compile(r'[&<>"\n\r\t]')
+
+def _xml_attributes(items):
+    '''
+    Return the items serialized as XML attributes, each with a leading space
+    '''
+    attributes = []
+    for itemName, itemValue in items.items():
+        value = utils.safe_ascii_string(itemValue)
+        if _XML_ATTR_SPECIAL.search(value) is not None:
+            for char, escape in _XML_ATTR_ESCAPES:
+                value = value.replace(char, escape)
+        attributes.append(' {0}="{1}"'.format(itemName, value))
+    return ''.join(attributes)
+
+
+#=============================================================================
+class Columnar( MeasureWriter ):
+    '''
+    Writes rows to columnar files (see columnar.py), which keep measure
+    values in their native types and can be loaded by analysis tools
+    without parsing delimited text.
+    Each row group carries its own columns, so unlike Delimited, measures
+    that show up partway through a job don't require any header fixup.
+    '''
+    def __init__(self, status_callback, outDir, outputFile, ignoreMetaOutfiles, compress):
+        super(Columnar, self).__init__(status_callback, outDir, outputFile, ignoreMetaOutfiles)
+        self._defFileExt = columnar.FILE_EXT
+        self._compress = compress
+        self._rawFiles = {}
+
+        # Columnar output is binary, so console output goes to the
+        # underlying stdout buffer
+        if self.using_console():
+            self._outputFiles[self._defFileName] = columnar.ColumnarWriter(
+                    sys.stdout.buffer, self._compress)
+
+
+    def write_items(self, measures, analysisResults):
+        '''
+        Like Delimited, write a row combining measures with each
+        analysis result, or just the measures if there are none
+        '''
+        outputFile, _fileName, _isNewFile = self._get_output_file(measures)
+        if analysisResults:
+            for result in analysisResults:
+                outputRow = dict(measures)
+                outputRow.update(result)
+                outputFile.write_row(outputRow)
+        else:
+            outputFile.write_row(measures)
+
+
+    def _open_file(self, fileName):
+        MeasureWriter._open_file(self, fileName)
+        filePath = os.path.join(self._outDir, fileName)
+        self._rawFiles[fileName] = open(filePath, 'wb')
+        trace.file(2, "Opened Columnar Output File: {0}".format(filePath))
+        return columnar.ColumnarWriter(self._rawFiles[fileName], self._compress)
+
+
+    def _close_file(self, fileName):
+        self._outputFiles[fileName].finish()
+        if fileName in self._rawFiles:
+            self._rawFiles.pop(fileName).close()
+
+
+    def _checkpoint_file(self, fileName):
+        '''
+        Buffered rows are written as a row group, so the file can be
+        appended to from the end of it
+        '''
+        fileState = self._outputFiles[fileName].checkpoint()
+        fileState['size'] = _sync_file(self._rawFiles[fileName])
+        return fileState
+
 
+    def _resume_file(self, fileName, filePath, fileState):
+        _truncate_file(filePath, fileState['size'])
+        self._rawFiles[fileName] = open(filePath, 'ab')
+        return columnar.ColumnarWriter(self._rawFiles[fileName], self._compress,
+                                        resumeState=fileState)
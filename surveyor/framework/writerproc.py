@@ -0,0 +1,218 @@
+#=============================================================================
+'''
+    Surveyor Writer Process
+
+    Runs the measure writer in its own process, so formatting and writing
+    output doesn't compete for the GIL with the OutThread, the folder walk,
+    and the job loop in the main process.
+
+    WriterProcess stands in for the writer in the main process. Rows passed
+    to write_items are encoded in compact form (transport.py) and sent to the
+    writer process in batches, over a queue with a limited number of batches
+    so a writer that falls behind holds up the main process rather than
+    letting batches pile up in memory. There is one writer process and one
+    queue, so rows are written in the order they were given.
+
+    Status messages from the writer (e.g., output files being opened) and
+    exceptions are sent back on a status queue, which is checked each time
+    a batch is sent and when the writer is closed.
+
+    Job checkpoints and resumes are passed to the writer on the batch queue,
+    so they happen in order with the rows; the writer's checkpoint state is
+    sent back on the status queue.
+'''
+#=============================================================================
+# Copyright 2004-2012, Matt Peloquin and Construx. This file is part of Code
+# Surveyor, covered under GNU GPL v3 and is distributed WITHOUT ANY WARRANTY.
+#=============================================================================
+import signal
+import multiprocessing
+from queue import Empty, Full
+
+from framework import writer
+from framework import jobworker
+from framework import transport
+from framework import utils
+from framework import trace
+
+WRITER_PROC_NAME = "Writer"
+
+# Rows encoded before a batch is sent, and batches the queue will hold
+WRITE_BATCH_ROWS = 2048
+WRITE_QUEUE_BATCHES = 32
+
+# Seconds to wait on the writer before checking it is still running
+WRITER_CHECK_INTERVAL = 0.5
+
+
+class WriterProcess( writer.MeasureWriter ):
+    '''
+    Takes the same arguments as writer.get_writer, except for the status
+    callback, which is only called in the main process.
+    Console output is not supported, as it would mix with display output.
+    '''
+    def __init__(self, typeStr, status_callback, outDir, outputFile, ignoreMetaOutfiles,
+                    itemColOrder=[]):
+        super(WriterProcess, self).__init__(status_callback, outDir, outputFile, ignoreMetaOutfiles)
+        assert not self.using_console(), "Writer process used for console output"
+
+        self._encoder = transport.ResultEncoder()
+        self._batch = []
+        self._batchRows = 0
+
+        self._batchQueue = multiprocessing.Queue(WRITE_QUEUE_BATCHES)
+        self._statusQueue = multiprocessing.Queue()
+        self._process = jobworker.Process(
+                target=_run_writer, name=WRITER_PROC_NAME,
+                args=(trace.get_context(), self._batchQueue, self._statusQueue,
+                        (typeStr, outDir, outputFile, ignoreMetaOutfiles, itemColOrder)))
+        self._process.daemon = True
+        self._process.start()
+        trace.cc(1, "Started writer process")
+
+
+    def write_items(self, measures, analysisResults):
+        self._batch.append(self._encoder.encode_output(measures, analysisResults))
+        self._batchRows += 1 + len(analysisResults)
+
+        # The writer removes OUT: tags from measures as it picks the output
+        # file; do the same here, as callers may look at measures after
+        # writing them
+        self._get_output_filename(measures)
+
+        if self._batchRows >= WRITE_BATCH_ROWS:
+            self._send_batch()
+
+
+    def checkpoint(self):
+        '''
+        Send what is left, and wait for the writer to flush its files
+        '''
+        self._send_batch()
+        self._put(('CHECKPOINT', None))
+        while True:
+            try:
+                command, payload = self._statusQueue.get(True, WRITER_CHECK_INTERVAL)
+            except Empty:
+                if not self._process.is_alive():
+                    raise utils.OutputException("Writer process ended unexpectedly")
+                continue
+            if 'CHECKPOINT' == command:
+                return payload
+            self._handle_status(command, payload)
+
+
+    def keep_for_resume(self):
+        self._put(('KEEP_FOR_RESUME', None))
+
+    def resume(self, fileStates):
+        self._put(('RESUME', fileStates))
+
+
+    def close_files(self):
+        '''
+        Send what is left, and wait for the writer to finish
+        '''
+        if self._process is None:
+            return
+        try:
+            self._send_batch()
+            self._put(None)
+            while self._process.is_alive():
+                self._process.join(WRITER_CHECK_INTERVAL)
+                self._check_status()
+            self._check_status()
+        finally:
+            self._process = None
+            for queue in [self._batchQueue, self._statusQueue]:
+                queue.close()
+                queue.cancel_join_thread()
+
+
+    def _send_batch(self):
+        if self._batch:
+            self._put(('WRITE', self._encoder.package(self._batch)))
+            self._batch = []
+            self._batchRows = 0
+        self._check_status()
+
+
+    def _put(self, item):
+        while True:
+            try:
+                self._batchQueue.put(item, True, WRITER_CHECK_INTERVAL)
+                return
+            except Full:
+                self._check_status()
+                if not self._process.is_alive():
+                    raise utils.OutputException("Writer process ended unexpectedly")
+
+
+    def _check_status(self):
+        '''
+        Pass on status messages from the writer, and raise its exceptions
+        '''
+        try:
+            while True:
+                self._handle_status(*self._statusQueue.get_nowait())
+        except Empty:
+            pass
+
+
+    def _handle_status(self, command, payload):
+        if 'STATUS' == command:
+            self._status_callback(payload)
+        elif 'EXCEPTION' == command:
+            raise payload
+
+
+def _run_writer(dbgContext, batchQueue, statusQueue, writerArgs):
+    '''
+    Writer process entry point. Ctrl-c is left to the main process, which
+    closes the writer once it has cleaned up.
+    After an exception the rest of the batches are drained, so the main
+    process isn't left waiting on a full queue before it sees the exception.
+    '''
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    trace.set_context(dbgContext)
+    typeStr, outDir, outputFile, ignoreMetaOutfiles, itemColOrder = writerArgs
+
+    def status_callback(outputText=None):
+        if outputText:
+            statusQueue.put(('STATUS', outputText))
+
+    measureWriter = None
+    decoder = transport.ResultDecoder()
+    try:
+        measureWriter = writer.get_writer(typeStr, status_callback,
+                outDir, outputFile, ignoreMetaOutfiles, itemColOrder)
+        while True:
+            batchItem = batchQueue.get()
+            if batchItem is None:
+                break
+            command, payload = batchItem
+            if 'WRITE' == command:
+                for encodedOutput in decoder.unpack(WRITER_PROC_NAME, payload):
+                    measures, analysisResults = decoder.decode_output(WRITER_PROC_NAME, encodedOutput)
+                    measureWriter.write_items(measures, analysisResults)
+            elif 'CHECKPOINT' == command:
+                statusQueue.put(('CHECKPOINT', measureWriter.checkpoint()))
+            elif 'KEEP_FOR_RESUME' == command:
+                measureWriter.keep_for_resume()
+            elif 'RESUME' == command:
+                measureWriter.resume(payload)
+    except Exception as e:
+        trace.cc(1, "EXCEPTION occurred in writer process")
+        trace.traceback()
+        statusQueue.put(('EXCEPTION', e))
+        while batchQueue.get() is not None:
+            pass
+    finally:
+        if measureWriter is not None:
+            try:
+                measureWriter.close_files()
+            except Exception as e:
+                statusQueue.put(('EXCEPTION', e))
+        statusQueue.close()
+        statusQueue.join_thread()
+        trace.cc(1, "TERMINATING writer process")
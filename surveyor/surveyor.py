@@ -8,12 +8,11 @@
 # Copyright 2004-2010, Matt Peloquin and Construx. This file is part of Code
 # Surveyor, covered under GNU GPL v3 and is distributed WITHOUT ANY WARRANTY.
 #=============================================================================
+import os
 import sys
 import platform
-import traceback
-import multiprocessing
 
-from framework import cmdlineapp
+from framework import rpc
 from thirdparty import terminalsize
 
 # For Pyinstaller, it is easiest to have fake import of all csmodules
@@ -39,8 +38,10 @@ if __name__ == '__main__':
         if widthHeight:
             printWidth = widthHeight[0] - 1  # Take one off to avoid line overrun
 
-        # This is needed to support multiprocessing for Windows exe
+        # This is needed to support multiprocessing for Windows exe; it is
+        # only imported here so jobs sent to a daemon start quickly
         if currentPlatform in ('Windows'):
+            import multiprocessing
             multiprocessing.freeze_support()           
 
     except Exception:
@@ -48,22 +49,16 @@ if __name__ == '__main__':
         pass 
 
     # Run the measurement job, always returning result to the shell
-    SUCCESS = 0
-    FAILURE = 1
-    result = FAILURE
-    try:
-        if cmdlineapp.run_job(sys.argv, sys.stdout, printWidth):
-            result = SUCCESS
-    except:
-        print("\nA system error occurred while running Surveyor:\n")
-        traceback.print_exc()
-    finally:
-        # We should not have child processes alive at this point, but in
-        # case there was a problem, kill them to prevent hangs
-        for child in multiprocessing.active_children():
-            child.terminate()
-            print("BAD EXIT -- {0} active".format(child.name))
-        sys.exit(result)
+    # If a surveyor daemon is set up, the job is run there (see
+    # framework/daemon.py); the framework is only imported if it isn't
+    result = None
+    daemonSocket = os.environ.get(rpc.DAEMON_SOCKET_ENV_VAR)
+    if daemonSocket:
+        result = rpc.run_job(daemonSocket, sys.argv, printWidth)
+    if result is None:
+        from framework import cmdlineapp
+        result = cmdlineapp.run_from_shell(sys.argv, sys.stdout, printWidth)
+    sys.exit(result)
 
 
 
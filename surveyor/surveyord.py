@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+#=============================================================================
+'''
+    Code Surveyor daemon
+    Runs jobs sent from the surveyor command line, see framework/daemon.py
+
+        surveyord.py [socketPath] [maxJobs]
+'''
+#=============================================================================
+# Copyright 2004-2012, Matt Peloquin and Construx. This file is part of Code
+# Surveyor, covered under GNU GPL v3 and is distributed WITHOUT ANY WARRANTY.
+#=============================================================================
+import sys
+
+from framework import daemon
+from framework import rpc
+from framework import utils
+from framework.uistrings import STR_HelpText_Daemon
+
+#-------------------------------------------------------------------------
+#  Run the daemon until it is stopped, returning status to the shell
+
+if __name__ == '__main__':
+
+    SUCCESS = 0
+    FAILURE = 1
+    args = sys.argv[1:]
+    if args and args[0].startswith('-'):
+        print(STR_HelpText_Daemon.format(rpc.default_socket_path(),
+                daemon.DEFAULT_MAX_JOBS, rpc.DAEMON_SOCKET_ENV_VAR))
+        sys.exit(SUCCESS)
+
+    result = FAILURE
+    try:
+        utils.init_surveyor_dir(sys.argv[0])
+        socketPath = args[0] if args else rpc.default_socket_path()
+        maxJobs = int(args[1]) if len(args) > 1 else daemon.DEFAULT_MAX_JOBS
+        daemon.SurveyorDaemon(socketPath, maxJobs).run()
+        result = SUCCESS
+    except (utils.SurveyorException, ValueError) as e:
+        print("\n{0}\n".format(str(e)))
+    sys.exit(result)
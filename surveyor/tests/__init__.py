@@ -0,0 +1,8 @@
+#=============================================================================
+'''
+    Surveyor framework tests
+
+    Run from the surveyor folder with "python -m pytest tests" or
+    "python -m unittest discover tests"
+'''
+#=============================================================================
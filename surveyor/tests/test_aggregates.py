@@ -0,0 +1,78 @@
+#=============================================================================
+'''
+    Tests for -g aggregates, kept in memory or spilled to disk
+'''
+#=============================================================================
+import random
+import unittest
+from unittest import mock
+
+from framework import aggregates
+
+NAMES = ['dupe.lines', 'dupe.text', 'dupe.files', 'dupe.ratio', 'dupe.detail']
+
+
+def results(rand, numResults):
+    '''
+    Analysis results with repeated keys and values of each type that
+    aggregates handle: numbers add, strings keep the last, lists extend,
+    and dicts are updated recursively
+    '''
+    for resultNum in range(numResults):
+        yield {
+            'dupe.key': 'key{0}'.format(rand.randint(0, 400)),
+            'dupe.lines': rand.randint(1, 50),
+            'dupe.text': 'text{0}'.format(resultNum),
+            'dupe.files': ['file{0}.c'.format(resultNum)],
+            'dupe.ratio': rand.random(),
+            'dupe.detail': {'count': 1, 'last': 'file{0}.c'.format(resultNum)},
+            }
+
+
+def rounded(value):
+    '''
+    Float totals are summed in a different grouping once spilled, so can
+    differ in their last digits
+    '''
+    if isinstance(value, float):
+        return round(value, 6)
+    if isinstance(value, dict):
+        return dict((name, rounded(item)) for name, item in value.items())
+    if isinstance(value, list):
+        return [rounded(item) for item in value]
+    return value
+
+
+class AggregatesTest( unittest.TestCase ):
+
+    def aggregate_rows(self, memoryBudgetMB, numResults=5000):
+        rand = random.Random(11)
+        aggs = aggregates.Aggregates(memoryBudgetMB)
+        self.addCleanup(aggs.close)
+        for result in results(rand, numResults):
+            aggs.update('dupe.key', result['dupe.key'], result, NAMES)
+            aggs.update('dupe.lines', result['dupe.lines'], result, ['dupe.ratio', 'dupe.files'])
+        rows = dict((aggKey, list(aggs.rows(aggKey))) for aggKey in ('dupe.key', 'dupe.lines'))
+        return aggs.numSpills, rows
+
+    def test_spilled_same_as_in_memory(self):
+        numSpills, inMemoryRows = self.aggregate_rows(None)
+        self.assertEqual(numSpills, 0)
+
+        # A budget of a few KB spills every few dozen updates; small batches
+        # and fan-in make runs merge in several passes
+        with mock.patch.object(aggregates, 'SPILL_BATCH_SIZE', 8), \
+                mock.patch.object(aggregates, 'MERGE_FAN_IN', 4):
+            numSpills, spilledRows = self.aggregate_rows(0.01)
+        self.assertGreater(numSpills, 100)
+        self.assertEqual(len(spilledRows['dupe.key']), 401)
+        self.assertEqual(rounded(spilledRows), rounded(inMemoryRows))
+
+    def test_spilled_rows_in_first_seen_order(self):
+        aggs = aggregates.Aggregates(0.001)
+        self.addCleanup(aggs.close)
+        for keyNum in list(range(100)) + list(range(99, -1, -1)):
+            aggs.update('k', keyNum, {'n': 1, 's': str(keyNum)}, ['n', 's'])
+        self.assertGreater(aggs.numSpills, 0)
+        self.assertEqual([(row['s'], row['n'], row['aggregate.count']) for row in aggs.rows('k')],
+                         [(str(keyNum), 2, 2) for keyNum in range(100)])
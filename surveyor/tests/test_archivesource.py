@@ -0,0 +1,202 @@
+#=============================================================================
+'''
+    Tests for measuring archives in place, listing their members and
+    reading them with the archive readers
+'''
+#=============================================================================
+import io
+import os
+import gzip
+import random
+import shutil
+import tarfile
+import zipfile
+import tempfile
+import unittest
+from unittest import mock
+
+from framework import archivesource
+from framework import filesource
+from framework import utils
+
+MEMBERS = {
+    'top.py': b'# top\na = 1\n',
+    'src/main.c': b'/* main */\nint main(void) { return 0; }\n',
+    'src/lib/util.c': b'int util;\n' * 500,
+    'docs/readme.txt': b'',
+    }
+
+WORDS = [b'int', b'return', b'if', b'else', b'x', b'y', b'=', b'+', b';', b'{', b'}', b'\n', b'    ']
+
+
+def random_content(rand, size):
+    parts = []
+    while size > 0:
+        part = rand.choice(WORDS) + b' ' + str(rand.getrandbits(16)).encode()
+        parts.append(part)
+        size -= len(part)
+    return b''.join(parts)
+
+
+class GzipReaderTest( unittest.TestCase ):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.rand = random.Random(3)
+
+        # Small checkpoints and reads, so a few hundred KB has many of them
+        for name, value in (('CHECKPOINT_BYTES', 16 * 1024), ('GZIP_READ_BYTES', 1024)):
+            patcher = mock.patch.object(archivesource, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def write_gzip(self, *streams, padding=b''):
+        gzipPath = os.path.join(self.root, 'content.gz')
+        with open(gzipPath, 'wb') as outFile:
+            for content in streams:
+                outFile.write(gzip.compress(content))
+                outFile.write(padding)
+        return gzipPath
+
+    def open_reader(self, gzipPath):
+        reader = archivesource.GzipReader(gzipPath)
+        self.addCleanup(reader.close)
+        return reader
+
+    def test_reads_out_of_order(self):
+        content = random_content(self.rand, 400 * 1024)
+        reader = self.open_reader(self.write_gzip(content))
+        ranges = []
+        for _range in range(200):
+            offset = self.rand.randrange(len(content))
+            ranges.append((offset, self.rand.randint(0, 20000)))
+        for offset, size in ranges:
+            self.assertEqual(reader.read(offset, size), content[offset:offset + size], (offset, size))
+        self.assertGreater(len(reader._checkpoints), 10)
+        self.assertEqual(reader.read(len(content) - 5, 100), content[-5:])
+
+    def test_restores_checkpoint_before_range(self):
+        content = random_content(self.rand, 300 * 1024)
+        reader = self.open_reader(self.write_gzip(content))
+        self.assertEqual(reader.read(len(content) - 10, 10), content[-10:])
+        checkpointOffsets = list(reader._checkpointOffsets)
+
+        # A range before the last one read starts from the checkpoint
+        # before it, not from the start of the file
+        restored = []
+        restore = reader._restore
+        def restore_spy(checkpoint):
+            restored.append(checkpoint)
+            restore(checkpoint)
+        with mock.patch.object(reader, '_restore', restore_spy):
+            offset = checkpointOffsets[-3] + 100
+            self.assertEqual(reader.read(offset, 5000), content[offset:offset + 5000])
+            self.assertEqual(restored, [len(checkpointOffsets) - 3])
+            offset = checkpointOffsets[2] - 1
+            self.assertEqual(reader.read(offset, 2), content[offset:offset + 2])
+            self.assertEqual(restored[1:], [1])
+
+        # Nothing new is saved reading content again
+        self.assertEqual(reader._checkpointOffsets, checkpointOffsets)
+
+    def test_concatenated_streams(self):
+        first = random_content(self.rand, 50 * 1024)
+        second = random_content(self.rand, 70 * 1024)
+        content = first + second
+        reader = self.open_reader(self.write_gzip(first, second, padding=b'\0' * 10))
+        offset = len(first) - 100
+        self.assertEqual(reader.read(offset, 200), content[offset:offset + 200])
+        self.assertEqual(reader.read(0, len(content) + 10), content)
+        self.assertEqual(reader.read(len(first), 10), second[:10])
+
+    def test_member_past_end(self):
+        gzipPath = self.write_gzip(b'abc')
+        reader = self.open_reader(gzipPath)
+        archiveFile = archivesource.ArchiveFile(gzipPath, archivesource.GZIP_FORMAT, 'content', 1, 5, 0)
+        with self.assertRaises(utils.FileMeasureError):
+            archivesource.read_member(reader, archiveFile)
+
+
+class ArchiveTreeTest( unittest.TestCase ):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def write_tar(self, fileName, mode):
+        archivePath = os.path.join(self.root, fileName)
+        with tarfile.open(archivePath, mode) as tar:
+            for name, content in sorted(MEMBERS.items()):
+                info = tarfile.TarInfo('./' + name)
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+            info = tarfile.TarInfo('../outside.c')
+            info.size = 3
+            tar.addfile(info, io.BytesIO(b'int'))
+            info = tarfile.TarInfo('src/link.c')
+            info.type = tarfile.SYMTYPE
+            info.linkname = 'main.c'
+            tar.addfile(info)
+        return archivePath
+
+    def write_zip(self):
+        archivePath = os.path.join(self.root, 'drop.zip')
+        with zipfile.ZipFile(archivePath, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('empty/', b'')
+            for name, content in sorted(MEMBERS.items()):
+                archive.writestr(name, content)
+            archive.writestr('../outside.c', b'int')
+        return archivePath
+
+    def tree_files(self, tree, folderPath):
+        childFolders, _skipped, fileNames, _sizes = tree.scan_folder(folderPath)
+        files = {}
+        for fileName in fileNames:
+            filePath = os.path.join(folderPath, fileName)
+            files[tree.rel_path(filePath).replace(os.sep, '/')] = tree.read_file(filePath)
+        for folderName in childFolders:
+            files.update(self.tree_files(tree, os.path.join(folderPath, folderName)))
+        return files
+
+    def assertTreeFiles(self, archivePath, expected):
+        tree = archivesource.ArchiveTree(archivePath)
+        self.addCleanup(tree.close)
+        self.assertEqual(self.tree_files(tree, archivePath), expected)
+
+    def test_tar_formats(self):
+        for fileName, mode in (('drop.tar', 'w'), ('drop.tgz', 'w:gz'), ('drop.tar.gz', 'w:gz')):
+            self.assertTreeFiles(self.write_tar(fileName, mode), MEMBERS)
+
+    def test_zip(self):
+        archivePath = self.write_zip()
+        self.assertTreeFiles(archivePath, MEMBERS)
+        tree = archivesource.ArchiveTree(archivePath)
+        self.addCleanup(tree.close)
+        self.assertEqual(tree.scan_folder(os.path.join(archivePath, 'empty')), ([], set(), [], {}))
+
+    def test_gzip_file(self):
+        gzipPath = os.path.join(self.root, 'main.c.gz')
+        with open(gzipPath, 'wb') as outFile:
+            outFile.write(gzip.compress(MEMBERS['src/lib/util.c']))
+        self.assertTreeFiles(gzipPath, {'main.c': MEMBERS['src/lib/util.c']})
+
+    def test_members_read_by_workers(self):
+        archivePath = self.write_tar('drop.tgz', 'w:gz')
+        tree = archivesource.ArchiveTree(archivePath)
+        self.addCleanup(filesource.close_readers)
+        archiveFiles = tree.folder_files(os.path.join(archivePath, 'src', 'lib'))
+        self.assertEqual(list(archiveFiles), ['util.c'])
+        self.assertEqual(archiveFiles['util.c'].read(), MEMBERS['src/lib/util.c'])
+
+    def test_damaged_archive(self):
+        archivePath = os.path.join(self.root, 'drop.zip')
+        with open(archivePath, 'wb') as outFile:
+            outFile.write(b'PK not a zip')
+        with self.assertRaises(utils.InputException):
+            archivesource.ArchiveTree(archivePath)
+
+    def test_member_path(self):
+        self.assertEqual(archivesource.member_path('./a//b/c.py'), 'a/b/c.py')
+        self.assertIsNone(archivesource.member_path('a/../../c.py'))
+        self.assertEqual(archivesource.member_path('./'), '')
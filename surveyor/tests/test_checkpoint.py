@@ -0,0 +1,164 @@
+#=============================================================================
+'''
+    Tests for job checkpoints, saving them and resuming jobs from them
+'''
+#=============================================================================
+import io
+import os
+import csv
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from framework import checkpoint
+from framework import cmdlineapp
+from framework import utils
+
+SURVEYOR_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))), 'surveyor.py')
+OUT_NAME = 'out.csv'
+
+
+class JobCheckpointTest( unittest.TestCase ):
+
+    def setUp(self):
+        self.root = os.path.realpath(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root)
+        self.path = os.path.join(self.root, 'out' + checkpoint.FILE_EXT)
+
+    def test_save_and_load(self):
+        state = {'position': (1, 2), 'files': ['a', 'b']}
+        checkpoint.JobCheckpoint(self.path, 5, 'job').save(state)
+        resumed = checkpoint.JobCheckpoint(self.path, 5, 'job')
+        resumed.load()
+        self.assertEqual(resumed.resumeState, state)
+        self.assertTrue(resumed.saved)
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+
+    def test_load_from_other_job(self):
+        checkpoint.JobCheckpoint(self.path, 5, 'job').save({})
+        with self.assertRaises(utils.InputException):
+            checkpoint.JobCheckpoint(self.path, 5, 'other job').load()
+
+    def test_load_missing(self):
+        with self.assertRaises(utils.InputException):
+            checkpoint.JobCheckpoint(self.path, 5, 'job').load()
+
+    def test_saved_only_by_this_run(self):
+        checkpoint.JobCheckpoint(self.path, 5, 'earlier job').save({})
+        jobCheckpoint = checkpoint.JobCheckpoint(self.path, 5, 'job')
+        self.assertFalse(jobCheckpoint.saved)
+        jobCheckpoint.save({})
+        self.assertTrue(jobCheckpoint.saved)
+        jobCheckpoint.remove()
+        self.assertFalse(jobCheckpoint.saved)
+        self.assertFalse(os.path.exists(self.path))
+
+
+class WalkProgressTest( unittest.TestCase ):
+
+    def test_folders_finish_in_walk_order(self):
+        progress = checkpoint.WalkProgress()
+        progress.start_folder('a')
+        progress.add_file('a/1')
+        progress.end_folder({'files': 1})
+        progress.start_folder('b')
+        progress.add_file('b/1')
+        progress.end_folder({'files': 1})
+
+        progress.file_done('b/1')
+        state = progress.state()
+        self.assertIsNone(state['position'])
+        self.assertEqual(state['doneFiles'], ['b/1'])
+
+        progress.file_done('a/1')
+        state = progress.state()
+        self.assertEqual(state['position'], 'b')
+        self.assertEqual(state['counters'], {'files': 2})
+        self.assertEqual(state['doneFiles'], [])
+
+    def test_resume_skips_files_done(self):
+        progress = checkpoint.WalkProgress(
+                {'position': 'a', 'counters': {'files': 1}, 'doneFiles': ['b/1']})
+        progress.start_folder('b')
+        self.assertFalse(progress.add_file('b/1'))
+        self.assertTrue(progress.add_file('b/2'))
+        progress.end_folder({'files': 1})
+        progress.file_done('b/2')
+        state = progress.state()
+        self.assertEqual(state['position'], 'b')
+        self.assertEqual(state['counters'], {'files': 2})
+
+
+class CheckpointJobTest( unittest.TestCase ):
+    '''
+    Runs jobs with checkpoints in-process, saving one with every package
+    of output the application gets
+    '''
+    def setUp(self):
+        utils.init_surveyor_dir(SURVEYOR_SCRIPT)
+        self.root = os.path.realpath(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root)
+        self.src = os.path.join(self.root, 'src')
+        for folderNum in range(6):
+            folderPath = os.path.join(self.src, 'f{0}'.format(folderNum))
+            os.makedirs(folderPath)
+            for fileNum in range(8):
+                with open(os.path.join(folderPath, 'm{0}.py'.format(fileNum)), 'w') as pyFile:
+                    pyFile.write('# module\n' + 'x = 1\n' * (folderNum + fileNum + 1))
+
+    def run_job(self, outDir, *args):
+        os.makedirs(outDir, exist_ok=True)
+        cmdArgs = ['surveyor.py', self.src, '-q', '-w', '2', '-o', os.path.join(outDir, OUT_NAME)]
+        with mock.patch.object(checkpoint.JobCheckpoint, 'is_due', return_value=True):
+            self.assertTrue(cmdlineapp.run_job(cmdArgs + list(args), io.StringIO()))
+
+    def rows(self, outDir):
+        with open(os.path.join(outDir, OUT_NAME), newline='') as outFile:
+            rows = list(csv.reader(outFile))
+        timeCol = rows[0].index('measure.Time') if 'measure.Time' in rows[0] else None
+        if timeCol is not None:
+            rows = [row[:timeCol] + row[timeCol + 1:] for row in rows]
+        return rows[0], sorted(map(tuple, rows[1:]))
+
+    def test_resume_matches_full_job(self):
+        fullDir = os.path.join(self.root, 'full')
+        self.run_job(fullDir, '-j')
+        self.assertFalse(os.path.exists(os.path.join(fullDir, OUT_NAME + checkpoint.FILE_EXT)))
+
+        # Keep only the first checkpoint, with rows written after it, as if
+        # the job was stopped after saving it
+        resumeDir = os.path.join(self.root, 'resume')
+        save = checkpoint.JobCheckpoint.save
+        saves = []
+        def save_first(jobCheckpoint, state):
+            if not saves:
+                save(jobCheckpoint, state)
+            saves.append(state)
+        with mock.patch.object(checkpoint.JobCheckpoint, 'save', save_first), \
+                mock.patch.object(checkpoint.JobCheckpoint, 'remove'):
+            self.run_job(resumeDir, '-j')
+        self.assertGreater(len(saves), 1)
+        checkpointPath = os.path.join(resumeDir, OUT_NAME + checkpoint.FILE_EXT)
+        self.assertTrue(os.path.exists(checkpointPath))
+
+        self.run_job(resumeDir, '-jr')
+        self.assertFalse(os.path.exists(checkpointPath))
+        self.assertEqual(self.rows(resumeDir), self.rows(fullDir))
+
+    def test_new_job_removes_old_checkpoint(self):
+        outDir = os.path.join(self.root, 'out')
+        os.makedirs(outDir)
+        checkpointPath = os.path.join(outDir, OUT_NAME + checkpoint.FILE_EXT)
+        checkpoint.JobCheckpoint(checkpointPath, 5, 'earlier job').save({})
+
+        app = cmdlineapp.SurveyorCmdLine()
+        app._outFileDir = outDir
+        app._outFileName = OUT_NAME
+        app._checkpointMinutes = 5
+        app._jobOpt.pathsToMeasure = [self.src]
+        app._setup_checkpoint()
+        self.assertFalse(os.path.exists(checkpointPath))
+        self.assertFalse(app._checkpoint_saved())
+
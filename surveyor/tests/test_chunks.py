@@ -0,0 +1,176 @@
+#=============================================================================
+'''
+    Tests for measuring large files in chunks across workers (-wc), which
+    should give the same measures as measuring each file whole
+'''
+#=============================================================================
+import io
+import os
+import csv
+import shutil
+import tempfile
+import unittest
+import collections
+from unittest import mock
+
+from framework import basemodule
+from framework import chunks
+from framework import cmdlineapp
+from framework import job
+from framework import utils
+
+SURVEYOR_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))), 'surveyor.py')
+NUM_WORKERS = 4
+
+# Files are made just over 1 MB, the smallest size -wc splits, and chunks
+# and segments are made small so each file has a chunk for each worker
+# and a few segments in each block of lines placed across chunk edges
+FILE_BYTES = 1024 * 1024 + 16 * 1024
+TEST_CHUNK_BYTES = 64 * 1024
+TEST_SEGMENT_BYTES = 8 * 1024
+BLOCK_LINES = 1500
+
+C_LINES = ['int f(int a)\n', '{\n', '    if (a > 0) { return a; }  // positive\n',
+           '    return -a;\n', '}\n', '\n']
+CS_LINES = ['    public int F(int a)\n', '    {\n', '        if (a > 0) return a; // positive\n',
+            '        return -a;\n', '    }\n', '\n']
+PY_LINES = ['def f(a):\n', '    # comment\n', '    if a:\n', '        return a + 1\n',
+            '    return 0\n', '\n']
+
+
+def chunked_text(filler, block, start=''):
+    '''
+    Lines of filler repeated to about FILE_BYTES, with the lines of block
+    placed across each edge between chunks
+    '''
+    blockChars = sum(len(line) for line in block)
+    lines = [start]
+    size = len(start)
+    for edge in range(1, NUM_WORKERS + 1):
+        target = FILE_BYTES * edge // NUM_WORKERS
+        if edge < NUM_WORKERS:
+            target -= blockChars // 2
+        while size < target:
+            lines.extend(filler)
+            size += sum(len(line) for line in filler)
+        if edge < NUM_WORKERS:
+            lines.extend(block)
+            size += blockChars
+    return ''.join(lines)
+
+
+C_COMMENT = (['int x = 1;  /* comment starts after code\n'] +
+             [' * comment line {0}\n'.format(num) for num in range(BLOCK_LINES)] +
+             [' */  int y = 2;\n'])
+
+FILES = {
+    'comment.c': chunked_text(C_LINES, C_COMMENT).encode('ascii'),
+    'region.cs': chunked_text(CS_LINES,
+            ['    #region Designer generated code\n'] +
+            ['        this.x{0} = {0};\n'.format(num) for num in range(BLOCK_LINES)] +
+            ['    #endregion\n']).encode('ascii'),
+    'generated.c': chunked_text(C_LINES, C_COMMENT,
+            start='/* Generated by gen.py, do not edit */\n').encode('ascii'),
+    'crlf.py': chunked_text(PY_LINES,
+            ['    """\n'] + ['    docstring line\n'] * BLOCK_LINES + ['    """\n']
+            ).replace('\n', '\r\n').encode('ascii'),
+    'bom.py': chunked_text(PY_LINES + ['s = "caf\xe9 \u20ac"  # caf\xe9\n'],
+            ['    """caf\xe9\n'] + ['    docstring line \u20ac\n'] * BLOCK_LINES + ['    """\n']
+            ).encode('utf-8-sig'),
+    'no_newline.c': chunked_text(C_LINES, C_COMMENT).encode('ascii') + b'int last = 0;',
+    'utf16.c': chunked_text(C_LINES, C_COMMENT).encode('utf-16'),
+    }
+
+# Files read in encodings other than ascii or UTF-8 are measured whole
+NOT_CHUNKED = ('utf16.c',)
+
+
+class ChunkedFileTest( unittest.TestCase ):
+
+    @classmethod
+    def setUpClass(cls):
+        utils.init_surveyor_dir(SURVEYOR_SCRIPT)
+        cls.root = os.path.realpath(tempfile.mkdtemp())
+        cls.tree = os.path.join(cls.root, 'tree')
+        os.makedirs(cls.tree)
+        for fileName, content in FILES.items():
+            with open(os.path.join(cls.tree, fileName), 'wb') as treeFile:
+                treeFile.write(content)
+
+        # Chunk results as the job gets them, by file
+        cls.chunkResults = collections.defaultdict(list)
+        chunk_measured = job.Job._chunk_measured
+        def chunk_measured_spy(measureJob, fileKey, chunkNum, results):
+            fileName = measureJob._chunkedFiles[fileKey][0][2]
+            cls.chunkResults[fileName].append(results is not None)
+            return chunk_measured(measureJob, fileKey, chunkNum, results)
+
+        try:
+            cls.wholeRows = cls.run_job('whole', '-wc', '0')
+            with mock.patch.object(chunks, 'MIN_CHUNK_BYTES', TEST_CHUNK_BYTES), \
+                    mock.patch.object(chunks, 'SEGMENT_BYTES', TEST_SEGMENT_BYTES), \
+                    mock.patch.object(job.Job, '_chunk_measured', chunk_measured_spy):
+                cls.chunkedRows = cls.run_job('chunked', '-wc', '1')
+        except Exception:
+            shutil.rmtree(cls.root)
+            raise
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.root)
+
+    @classmethod
+    def run_job(cls, outName, *args):
+        outPath = os.path.join(cls.root, outName + '.csv')
+        cmdArgs = ['surveyor.py', cls.tree, '-q', '-w', str(NUM_WORKERS), '-o', outPath]
+        outputStream = io.StringIO()
+        if not cmdlineapp.run_job(cmdArgs + list(args), outputStream):
+            raise AssertionError(outputStream.getvalue())
+        # Columns are in the order of the first row written, and empty measures
+        # can be left off the end of a row, so rows are compared without them
+        rows = {}
+        with open(outPath, newline='') as outFile:
+            for row in csv.DictReader(outFile):
+                row.pop(basemodule.METADATA_TIMING, None)
+                rows[row[basemodule.METADATA_FULLNAME]] = dict(
+                        (name, value) for name, value in row.items() if value)
+        return rows
+
+    def assertSameAsWhole(self, fileName):
+        self.assertEqual(self.chunkedRows[fileName], self.wholeRows[fileName])
+        chunked = fileName not in NOT_CHUNKED
+        self.assertEqual(self.chunkResults[fileName], [chunked] * NUM_WORKERS)
+
+    def test_all_files_measured(self):
+        self.assertEqual(sorted(self.wholeRows), sorted(FILES))
+        self.assertEqual(sorted(self.chunkedRows), sorted(FILES))
+
+    def test_comment_across_chunks(self):
+        self.assertSameAsWhole('comment.c')
+        self.assertGreater(int(self.wholeRows['comment.c']['file.comment']),
+                           (NUM_WORKERS - 1) * BLOCK_LINES)
+
+    def test_generated_code_block(self):
+        self.assertSameAsWhole('region.cs')
+
+    def test_generated_file(self):
+        self.assertSameAsWhole('generated.c')
+
+    def test_crlf(self):
+        self.assertSameAsWhole('crlf.py')
+
+    def test_bom(self):
+        self.assertSameAsWhole('bom.py')
+
+    def test_no_final_newline(self):
+        self.assertSameAsWhole('no_newline.c')
+
+    def test_other_encoding_measured_whole(self):
+        self.assertSameAsWhole('utf16.c')
+        self.assertEqual(self.wholeRows['utf16.c']['file.nbnc'],
+                         self.wholeRows['comment.c']['file.nbnc'])
+
+
+if __name__ == '__main__':
+    unittest.main()
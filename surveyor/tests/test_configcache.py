@@ -0,0 +1,128 @@
+#=============================================================================
+'''
+    Tests for the config cache, which should rebuild the same entries as
+    reading config files, and read them again when the config file, its
+    INCLUDEs, or the code for its csmodules change
+'''
+#=============================================================================
+import io
+import os
+import re
+import shutil
+import tempfile
+import unittest
+import importlib
+from unittest import mock
+
+from framework import cmdlineapp
+from framework import configstack
+from framework import utils
+
+SURVEYOR_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))), 'surveyor.py')
+CONFIG_NAME = 'surveyor.code'
+CSMODULE_NAME = 'csmodules.NBNC'
+
+
+class ConfigCacheTest( unittest.TestCase ):
+
+    def setUp(self):
+        utils.init_surveyor_dir(SURVEYOR_SCRIPT)
+        self.root = os.path.realpath(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root)
+        self.cachePath = os.path.join(self.root, 'configs.db')
+        self.write(CONFIG_NAME, 'INCLUDE:include.code:\n'
+                                'measure Code * *.c c OPT:IGNORE_SIZE:1000\n')
+        self.write('include.code', 'measure NBNC * *.py python\n')
+
+    def write(self, name, content):
+        filePath = os.path.join(self.root, name)
+        with open(filePath, 'w') as outFile:
+            outFile.write(content)
+        return filePath
+
+    def read_configs(self):
+        '''
+        Returns the config cache (hits, misses) for the config file in the
+        root, and the entries read, with the module class and the values set
+        on each (which the config cache pickles)
+        '''
+        stack = configstack.ConfigStack(CONFIG_NAME, None, configCachePath=self.cachePath)
+        try:
+            # The default config file is loaded with the stack
+            defaultCounts = (stack.cacheHits, stack.cacheMisses)
+            configItems = stack.get_configuration(self.root, [CONFIG_NAME])[1]
+            self.assertEqual(stack.active_path(), os.path.join(self.root, CONFIG_NAME))
+            counts = (stack.cacheHits - defaultCounts[0], stack.cacheMisses - defaultCounts[1])
+        finally:
+            stack.close()
+        entries = []
+        for fileExt in sorted(configItems):
+            for configEntry in configItems[fileExt]:
+                entryValues = dict(vars(configEntry))
+                module = entryValues.pop('module')
+                entries.append((fileExt, type(module), sorted(entryValues.items()),
+                                sorted(module._configOptionDict.keys())))
+        return counts, entries
+
+    def assertHit(self, entries):
+        counts, cachedEntries = self.read_configs()
+        self.assertEqual(counts, (1, 0))
+        self.assertEqual(cachedEntries, entries)
+
+    def assertMiss(self):
+        counts, entries = self.read_configs()
+        self.assertEqual(counts, (0, 1))
+        return entries
+
+    def test_hit_gives_same_entries(self):
+        entries = self.assertMiss()
+        self.assertEqual(len(entries), 2)
+        self.assertHit(entries)
+        self.assertHit(entries)
+
+    def test_config_file_changed(self):
+        self.assertMiss()
+        self.write(CONFIG_NAME, 'INCLUDE:include.code:\n'
+                                'measure Code * *.c;*.h c OPT:IGNORE_SIZE:1000\n')
+        entries = self.assertMiss()
+        self.assertEqual(len(entries), 3)
+        self.assertHit(entries)
+
+    def test_include_changed(self):
+        self.assertMiss()
+        self.write('include.code', 'measure NBNC * *.py;*.pyw python\n')
+        entries = self.assertMiss()
+        self.assertEqual(len(entries), 3)
+        self.assertHit(entries)
+
+    def test_csmodule_source_changed(self):
+        # The cache hashes the source file of the modules the entries'
+        # csmodules come from, so a copy of one is put in its place
+        module = importlib.import_module(CSMODULE_NAME)
+        with open(module.__file__) as sourceFile:
+            source = sourceFile.read()
+        sourcePath = self.write('NBNC.py', source)
+        with mock.patch.object(module, '__file__', sourcePath):
+            entries = self.assertMiss()
+            self.assertHit(entries)
+            self.write('NBNC.py', source + '\n# Changed\n')
+            self.assertEqual(self.assertMiss(), entries)
+            self.assertHit(entries)
+
+    def test_summary_counts(self):
+        self.write('a.py', 'x = 1\n')
+        cmdArgs = ['surveyor.py', self.root, '-v', '-ck', self.cachePath,
+                   '-o', os.path.join(self.root, 'out.csv')]
+        summaries = []
+        for _job in range(2):
+            outputStream = io.StringIO()
+            self.assertTrue(cmdlineapp.run_job(cmdArgs, outputStream))
+            summaries.append(re.search(r'Config files loaded in [\d.]+ seconds, '
+                    r'config cache hits: (\d+)  misses: (\d+)', outputStream.getvalue()).groups())
+        # Both the default config file and the one in the root
+        self.assertEqual(summaries, [('0', '2'), ('2', '0')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+#=============================================================================
+'''
+    Tests for ConfigStack push/pop of folder config files
+'''
+#=============================================================================
+import os
+import shutil
+import tempfile
+import unittest
+
+from framework import configstack
+from framework import utils
+
+SURVEYOR_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))), 'surveyor.py')
+CONFIG_NAME = 'surveyor.code'
+
+
+class ConfigStackTest( unittest.TestCase ):
+
+    def setUp(self):
+        utils.init_surveyor_dir(SURVEYOR_SCRIPT)
+        self.root = os.path.realpath(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root)
+        self.stack = configstack.ConfigStack(CONFIG_NAME, None)
+        self.defaultPath = self.stack.active_path()
+
+    def folder(self, relPath, config=False):
+        folderPath = os.path.join(self.root, relPath)
+        os.makedirs(folderPath, exist_ok=True)
+        with open(os.path.join(folderPath, 'a.py'), 'w') as pyFile:
+            pyFile.write('x = 1\n')
+        if config:
+            with open(os.path.join(folderPath, CONFIG_NAME), 'w') as configFile:
+                configFile.write('measure NBNC * *.py python {0}\n'.format(
+                        relPath.replace(os.sep, '_') or 'root'))
+        return folderPath
+
+    def active(self, folderPath, fileNames=None):
+        if fileNames is None:
+            fileNames = os.listdir(folderPath)
+        return self.stack.get_configuration(folderPath, fileNames)[2]
+
+    def config(self, folderPath):
+        return os.path.join(folderPath, CONFIG_NAME)
+
+    def test_nearest_config_above_folder(self):
+        root = self.folder('', config=True)
+        a = self.folder('a', config=True)
+        ab = self.folder(os.path.join('a', 'b'))
+        c = self.folder('c')
+        self.assertEqual(self.active(root), self.config(root))
+        self.assertEqual(self.active(a), self.config(a))
+        self.assertEqual(self.active(ab), self.config(a))
+        self.assertEqual(self.active(c), self.config(root))
+
+    def test_default_config_without_folder_configs(self):
+        a = self.folder('a')
+        self.assertEqual(self.active(a), self.defaultPath)
+
+    def test_pops_back_to_parent_config(self):
+        root = self.folder('', config=True)
+        deep = self.folder(os.path.join('a', 'b', 'c'), config=True)
+        self.folder(os.path.join('a', 'b'), config=True)
+        self.active(root)
+        self.active(os.path.join(self.root, 'a', 'b'))
+        self.assertEqual(self.active(deep), self.config(deep))
+        self.assertEqual(len(self.stack._configStack), 4)
+        d = self.folder('d')
+        self.assertEqual(self.active(d), self.config(root))
+        self.assertEqual(len(self.stack._configStack), 2)
+
+    def test_sibling_with_prefix_name_not_covered(self):
+        root = self.folder('', config=True)
+        ab = self.folder('ab', config=True)
+        abc = self.folder('abc')
+        self.active(root)
+        self.assertEqual(self.active(ab), self.config(ab))
+        self.assertEqual(self.active(abc), self.config(root))
+
+    def test_folder_not_visited_pushes_nothing(self):
+        self.folder('a', config=True)
+        ab = self.folder(os.path.join('a', 'b'))
+        self.assertEqual(self.active(ab), self.defaultPath)
+
+    def test_config_only_read_if_listed(self):
+        a = self.folder('a', config=True)
+        self.assertEqual(self.active(a, ['a.py']), self.defaultPath)
+        self.assertEqual(self.active(a, ['a.py', CONFIG_NAME]), self.config(a))
+
+    def test_folder_named_like_config_not_pushed(self):
+        a = self.folder('a')
+        os.mkdir(os.path.join(a, CONFIG_NAME))
+        self.assertEqual(self.active(a, ['a.py', CONFIG_NAME]), self.defaultPath)
+
+    def test_default_never_popped(self):
+        otherRoot = os.path.realpath(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, otherRoot)
+        self.folder('a', config=True)
+        self.active(os.path.join(self.root, 'a'))
+        self.assertEqual(self.active(otherRoot, ['x.py']), self.defaultPath)
+        self.assertEqual(len(self.stack._configStack), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
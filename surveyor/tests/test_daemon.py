@@ -0,0 +1,152 @@
+#=============================================================================
+'''
+    Tests for running jobs in the surveyor daemon, which should give the
+    same output and exit status as running them locally, for warm jobs
+    as well as the first one
+'''
+#=============================================================================
+import os
+import re
+import csv
+import sys
+import time
+import shutil
+import signal
+import socket
+import tempfile
+import unittest
+import subprocess
+
+SURVEYOR_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SURVEYOR_SCRIPT = os.path.join(SURVEYOR_DIR, 'surveyor.py')
+DAEMON_SCRIPT = os.path.join(SURVEYOR_DIR, 'surveyord.py')
+DAEMON_ENV_VAR = 'SURVEYOR_DAEMON'
+CONFIG_NAME = 'surveyor.code'
+OUT_NAME = 'out.csv'
+TIME_COLUMN = 'measure.Time'
+DAEMON_TIMEOUT = 60
+
+FILES = {
+    'a.py': "import os\n\n# comment\ndef f(a):\n    return a + 1\n",
+    'b.c': "/* comment */\nint main(void)\n{\n    return 0;\n}\n",
+    os.path.join('sub', 'c.py'): "x = 1\ny = 2\n",
+    os.path.join('sub', 'd.java'): "class D {\n    int x;\n}\n",
+    }
+
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX') and hasattr(os, 'fork'),
+                     "The daemon needs Unix domain sockets and fork")
+class DaemonTest( unittest.TestCase ):
+
+    def setUp(self):
+        self.root = os.path.realpath(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root)
+        self.tree = os.path.join(self.root, 'tree')
+        for relPath, content in FILES.items():
+            self.write(relPath, content)
+        self.write(os.path.join('sub', CONFIG_NAME), 'measure NBNC * *.py python sub\n')
+
+        self.socketPath = os.path.join(self.root, 'surveyor.sock')
+        self.daemon = subprocess.Popen([sys.executable, DAEMON_SCRIPT, self.socketPath],
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.addCleanup(self.stop_daemon)
+        self.wait_for_daemon()
+
+    def write(self, relPath, content):
+        filePath = os.path.join(self.tree, relPath)
+        os.makedirs(os.path.dirname(filePath), exist_ok=True)
+        with open(filePath, 'w') as treeFile:
+            treeFile.write(content)
+
+    def wait_for_daemon(self):
+        deadline = time.time() + DAEMON_TIMEOUT
+        while time.time() < deadline:
+            self.assertIsNone(self.daemon.poll(), "Daemon exited")
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socketPath)
+                return
+            except OSError:
+                time.sleep(0.1)
+            finally:
+                probe.close()
+        self.fail("Daemon didn't start listening")
+
+    def stop_daemon(self):
+        if self.daemon.poll() is None:
+            self.daemon.send_signal(signal.SIGTERM)
+            try:
+                self.daemon.wait(DAEMON_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                self.daemon.kill()
+                self.daemon.wait()
+
+    def surveyor(self, args, useDaemon):
+        env = dict(os.environ)
+        env.pop(DAEMON_ENV_VAR, None)
+        if useDaemon:
+            env[DAEMON_ENV_VAR] = self.socketPath
+        return subprocess.run([sys.executable, SURVEYOR_SCRIPT] + args, cwd=self.root, env=env,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              universal_newlines=True, timeout=DAEMON_TIMEOUT)
+
+    def rows(self, useDaemon):
+        outPath = os.path.join(self.root, OUT_NAME)
+        if os.path.exists(outPath):
+            os.remove(outPath)
+        result = self.surveyor([self.tree, '-o', outPath, '-q'], useDaemon)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        with open(outPath, newline='') as outFile:
+            rows = [row for row in csv.DictReader(outFile)]
+        for row in rows:
+            row.pop(TIME_COLUMN, None)
+        return sorted(rows, key=lambda row: row['fileAbsPath'])
+
+    def console_rows(self, stdout):
+        '''
+        Rows written to the console, without the progress line in front of
+        the first one and the measure time
+        '''
+        lines = [line.split('\r')[-1] for line in stdout.splitlines()]
+        return sorted(re.sub(r',\d+\.\d+(,|$)', r',\1', line)
+                      for line in lines if self.tree in line)
+
+    def test_same_as_local(self):
+        localRows = self.rows(False)
+        self.assertEqual(len(localRows), len(FILES) - 1)
+        self.assertEqual(self.rows(True), localRows)
+        self.assertEqual(self.rows(True), localRows)
+
+    def test_rows_streamed_to_console(self):
+        args = [self.tree, '-o', 'stdout', '-q']
+        local = self.surveyor(args, False)
+        for _job in range(2):
+            result = self.surveyor(args, True)
+            self.assertEqual(result.returncode, local.returncode)
+            self.assertEqual(self.console_rows(result.stdout), self.console_rows(local.stdout))
+        self.assertEqual(len(self.console_rows(local.stdout)), len(FILES) - 1)
+
+    def test_changed_config_file_read_again(self):
+        self.rows(True)
+        self.write(os.path.join('sub', CONFIG_NAME), 'measure NBNC * *.py;*.java * sub\n')
+        rows = self.rows(True)
+        self.assertEqual(rows, self.rows(False))
+        self.assertIn('d.java', [row['file.fullName'] for row in rows])
+
+    def test_same_exit_status(self):
+        missingOut = os.path.join(self.root, 'missing', OUT_NAME)
+        for args in ([self.tree, '-w', 'x'], [self.tree, '-q', '-o', missingOut]):
+            local = self.surveyor(args, False)
+            self.assertNotEqual(local.returncode, 0)
+            self.assertEqual(self.surveyor(args, True).returncode, local.returncode)
+        self.assertEqual(self.rows(True), self.rows(False))
+
+    def test_stops_on_sigterm(self):
+        self.rows(True)
+        self.daemon.send_signal(signal.SIGTERM)
+        self.assertEqual(self.daemon.wait(DAEMON_TIMEOUT), 0)
+        self.assertFalse(os.path.exists(self.socketPath))
+
+
+if __name__ == '__main__':
+    unittest.main()
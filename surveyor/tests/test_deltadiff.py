@@ -0,0 +1,175 @@
+#=============================================================================
+'''
+    Tests for delta line diffs: the minimal diff used by default, and the
+    difflib diffs (DELTA_DIFFLIB) it replaced
+'''
+#=============================================================================
+import os
+import random
+import difflib
+import shutil
+import tempfile
+import unittest
+
+from framework import deltadiff
+
+
+def difflib_delta_lines(oldLines, newLines, includeDeleted):
+    '''
+    Delta lines as they came from difflib.unified_diff
+    '''
+    deltaLines = []
+    for line in difflib.unified_diff(oldLines, newLines):
+        if line.startswith('+') or (includeDeleted and line.startswith('-')):
+            deltaLines.append(line[2:])
+    return deltaLines
+
+
+def edited(rand, lines, vocab, numEdits):
+    lines = list(lines)
+    for _edit in range(numEdits):
+        pos = rand.randint(0, len(lines))
+        choice = rand.random()
+        if choice < 0.4:
+            lines[pos:pos] = [rand.choice(vocab) for _line in range(rand.randint(1, 5))]
+        elif choice < 0.8:
+            del lines[pos:pos + rand.randint(1, 5)]
+        else:
+            lines[pos:pos + 2] = [rand.choice(vocab)]
+    return lines
+
+
+def shuffled_twice(rand, numLines):
+    '''
+    Lines that each occur twice, so none are unique, in random order
+    '''
+    lines = ['line {0}\n'.format(num) for num in range(numLines // 2)] * 2
+    rand.shuffle(lines)
+    return lines
+
+
+def apply_changes(oldLines, newLines, changes):
+    '''
+    Rebuild newLines from oldLines and the changes
+    '''
+    lines = []
+    oldPos = 0
+    for oldStart, oldEnd, newStart, newEnd in changes:
+        lines.extend(oldLines[oldPos:oldStart])
+        lines.extend(newLines[newStart:newEnd])
+        oldPos = oldEnd
+    lines.extend(oldLines[oldPos:])
+    return lines
+
+
+class DifflibDeltaLinesTest( unittest.TestCase ):
+
+    def assertSameAsDifflib(self, oldLines, newLines):
+        for includeDeleted in (False, True):
+            self.assertEqual(deltadiff.delta_lines(oldLines, newLines, includeDeleted, useDifflib=True),
+                             difflib_delta_lines(oldLines, newLines, includeDeleted))
+
+    def test_same_as_difflib(self):
+        rand = random.Random(20)
+        for _case in range(400):
+            vocab = ['line {0}\n'.format(num) for num in range(rand.choice([3, 10, 50, 400]))]
+            oldLines = [rand.choice(vocab) for _line in range(rand.randint(0, rand.choice([10, 300])))]
+            newLines = edited(rand, oldLines, vocab, rand.randint(0, 20))
+            self.assertSameAsDifflib(oldLines, newLines)
+
+    def test_common_start_not_preferred(self):
+        # difflib matches the longest run first, not the common first line
+        self.assertSameAsDifflib(['x\n', 'x\n', 'x\n'], ['x\n', 'y\n', 'x\n', 'x\n'])
+
+    def test_popular_lines(self):
+        # Lines in over 1% of a 200+ line file are junk to difflib
+        rand = random.Random(21)
+        oldLines = ['}\n' if rand.random() < 0.3 else 'code {0}\n'.format(num) for num in range(600)]
+        newLines = edited(rand, oldLines, ['}\n', '{\n', 'new\n'], 40)
+        self.assertSameAsDifflib(oldLines, newLines)
+
+    def test_many_edits_without_unique_lines(self):
+        rand = random.Random(22)
+        oldLines = shuffled_twice(rand, 2000)
+        newLines = shuffled_twice(rand, 2000)
+        self.assertSameAsDifflib(oldLines, newLines)
+
+    def test_no_changes(self):
+        # Popular lines only, which difflib still matches when the lists are equal
+        lines = ['}\n'] * 300
+        self.assertSameAsDifflib(lines, list(lines))
+        for useDifflib in (False, True):
+            self.assertEqual(deltadiff.delta_lines(lines, list(lines), True, useDifflib), [])
+            self.assertEqual(deltadiff.delta_lines([], ['a\n'], False, useDifflib), ['+ \n', '\n'])
+
+
+class MinimalDiffTest( unittest.TestCase ):
+
+    def assertValidChanges(self, oldLines, newLines):
+        changes = deltadiff.diff_changes(oldLines, newLines)
+        self.assertEqual(apply_changes(oldLines, newLines, changes), newLines)
+        for (_oldStart, oldEnd, _newStart, newEnd), (nextOldStart, _oldEnd, nextNewStart, _newEnd) in zip(
+                changes, changes[1:]):
+            self.assertTrue(oldEnd < nextOldStart and newEnd < nextNewStart)
+        return changes
+
+    def changed_lines(self, changes):
+        return sum((oldEnd - oldStart) + (newEnd - newStart)
+                   for oldStart, oldEnd, newStart, newEnd in changes)
+
+    def test_minimal_changes(self):
+        rand = random.Random(23)
+        for _case in range(200):
+            vocab = ['line {0}\n'.format(num) for num in range(rand.choice([3, 10, 50]))]
+            oldLines = [rand.choice(vocab) for _line in range(rand.randint(0, 200))]
+            newLines = edited(rand, oldLines, vocab, rand.randint(0, 20))
+            changes = self.assertValidChanges(oldLines, newLines)
+            matcher = difflib.SequenceMatcher(None, oldLines, newLines, autojunk=False)
+            common = sum(block.size for block in matcher.get_matching_blocks())
+            self.assertLessEqual(self.changed_lines(changes),
+                                 len(oldLines) + len(newLines) - 2 * common)
+
+    def test_beyond_limits(self):
+        # Too many edits for Myers, and no unique lines to split on, so the
+        # region gets difflib's diff rather than being all changed
+        rand = random.Random(24)
+        oldLines = shuffled_twice(rand, 2000)
+        newLines = shuffled_twice(rand, 2000)
+        changes = self.assertValidChanges(oldLines, newLines)
+        self.assertEqual(changes, deltadiff.diff_changes(oldLines, newLines, useDifflib=True))
+        self.assertLess(self.changed_lines(changes), len(oldLines) + len(newLines))
+
+    def test_delta_lines(self):
+        # difflib matches the last two x lines with the first two, so
+        # counts an x line added and one deleted; the minimal diff only adds y
+        oldLines = ['x\n', 'x\n', 'x\n']
+        newLines = ['x\n', 'y\n', 'x\n', 'x\n']
+        self.assertEqual(deltadiff.diff_changes(oldLines, newLines), [(1, 1, 1, 2)])
+        self.assertEqual(deltadiff.diff_changes(oldLines, newLines, useDifflib=True),
+                         [(0, 0, 0, 2), (2, 3, 4, 4)])
+
+    def test_split_on_unique_lines(self):
+        oldLines = ['x\n'] * (deltadiff.MYERS_MAX_LINES // 2) + ['unique\n'] + ['y\n'] * 10
+        newLines = ['x\n'] * 10 + ['unique\n'] + ['z\n'] + ['y\n'] * 10
+        changes = self.assertValidChanges(oldLines, newLines)
+        self.assertEqual(self.changed_lines(changes), len(oldLines) - 21 + 1)
+
+
+class SameFileTest( unittest.TestCase ):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def write(self, name, content, mtime):
+        filePath = os.path.join(self.root, name)
+        with open(filePath, 'wb') as outFile:
+            outFile.write(content)
+        os.utime(filePath, (mtime, mtime))
+        return filePath
+
+    def test_same_file(self):
+        content = b'x' * (deltadiff.COMPARE_READ_SIZE + 10)
+        self.assertTrue(deltadiff.same_file(self.write('a', content, 100), self.write('b', content, 200)))
+        self.assertFalse(deltadiff.same_file(self.write('a', content, 100), self.write('b', content[:-1] + b'y', 200)))
+        self.assertFalse(deltadiff.same_file(self.write('a', content, 100), self.write('b', b'x', 100)))
@@ -0,0 +1,263 @@
+#=============================================================================
+'''
+    Tests for history measures, and replaying output for file content
+    that has already been measured
+'''
+#=============================================================================
+import io
+import os
+import csv
+import shutil
+import tarfile
+import tempfile
+import unittest
+import subprocess
+import collections
+from unittest import mock
+
+from framework import basemodule
+from framework import cmdlineapp
+from framework import gitsource
+from framework import history
+from framework import utils
+
+SURVEYOR_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))), 'surveyor.py')
+OUT_NAME = 'out.csv'
+
+
+class FakeModule( object ):
+    OUTPUT_FROM_CONTENT = True
+
+class PathModule( object ):
+    OUTPUT_FROM_CONTENT = False
+
+class FakeEntry( object ):
+    def __init__(self, module):
+        self.module = module
+
+
+def git_file(blobSha, commitNum):
+    commit = gitsource.Commit('sha{0}'.format(commitNum), 0, commitNum)
+    return gitsource.GitFile('.git', blobSha, None, 10, commit, None)
+
+
+class HistoryMemoTest( unittest.TestCase ):
+
+    def setUp(self):
+        self.output = []
+        self.memo = history.HistoryMemo(
+                lambda filePath, outputList, errorList: self.output.append(
+                    (filePath, outputList, errorList)))
+
+    def add(self, filePath, gitFile, configIds=(1,), numFiles=3, module=FakeModule):
+        return self.memo.add_file(filePath, gitFile, [FakeEntry(module)], configIds, numFiles)
+
+    def measure(self, filePath, gitFile, numFiles=3, errors=()):
+        measures = {'file.nbnc': 5, basemodule.METADATA_FILENAME: '',
+                    basemodule.METADATA_FULLNAME: '', basemodule.METADATA_ABSPATH: '',
+                    basemodule.METADATA_DIRFILES: 0, basemodule.METADATA_DIRFILES_RANK: '',
+                    basemodule.METADATA_DIR + '1': '', basemodule.METADATA_DIR + '2': ''}
+        basemodule.update_path_metadata(filePath, numFiles, measures)
+        self.memo.file_measured((filePath, gitFile.memoId), [(measures, [])], list(errors))
+
+    def test_same_content_at_other_paths(self):
+        first = git_file('blob1', 1)
+        self.assertTrue(self.add(os.path.join('src', 'a', 'm.py'), first))
+        self.assertFalse(self.add(os.path.join('src', 'b', 'n.c'), git_file('blob1', 2), numFiles=40))
+        self.measure(os.path.join('src', 'a', 'm.py'), first)
+        self.assertFalse(self.add(os.path.join('src', 'c', 'm.py'), git_file('blob1', 3), numFiles=1))
+
+        self.assertEqual([filePath for filePath, _output, _errors in self.output],
+                         [os.path.join('src', 'a', 'm.py'), os.path.join('src', 'b', 'n.c'),
+                          os.path.join('src', 'c', 'm.py')])
+        measures = self.output[1][1][0][0]
+        self.assertEqual(measures[basemodule.METADATA_FILENAME], 'n')
+        self.assertEqual(measures[basemodule.METADATA_FULLNAME], 'n.c')
+        self.assertEqual(measures[basemodule.METADATA_DIR + '1'], 'b')
+        self.assertEqual(measures[basemodule.METADATA_DIR + '2'], '')
+        self.assertEqual(measures[basemodule.METADATA_ABSPATH], os.path.abspath(os.path.join('src', 'b', 'n.c')))
+        self.assertEqual(measures[basemodule.METADATA_DIRFILES], 40)
+        self.assertEqual(measures[basemodule.METADATA_DIRFILES_RANK], '31 to 100')
+        self.assertEqual(measures[history.COMMIT_NUM], 2)
+        self.assertNotIn(basemodule.METADATA_FILETYPE, measures)
+        measures = self.output[2][1][0][0]
+        self.assertEqual(measures[basemodule.METADATA_DIRFILES_RANK], '1 to 10')
+        self.assertEqual(measures[history.COMMIT_ID], 'sha3')
+
+    def test_keyed_by_config(self):
+        self.assertTrue(self.add('m.py', git_file('blob1', 1)))
+        self.assertTrue(self.add('m.py', git_file('blob1', 2), configIds=(2,)))
+        self.assertTrue(self.add('m.py', git_file('blob2', 3)))
+        self.assertFalse(self.add('n.py', git_file('blob2', 4), numFiles=9))
+
+    def test_path_used_by_module(self):
+        self.assertTrue(self.add('m.py', git_file('blob1', 1), module=PathModule))
+        self.assertTrue(self.add('n.py', git_file('blob1', 2), module=PathModule))
+        self.assertFalse(self.add('n.py', git_file('blob1', 3), module=PathModule))
+
+    def test_errors_reported_once(self):
+        first = git_file('blob1', 1)
+        self.add('m.py', first)
+        self.add('n.py', git_file('blob1', 2))
+        self.measure('m.py', first, errors=['bad'])
+        self.add('o.py', git_file('blob1', 3))
+        self.assertEqual([errors for _filePath, _output, errors in self.output], [['bad'], [], []])
+
+
+class GitRepoTest( unittest.TestCase ):
+    '''
+    Jobs over a git repository made for each test
+    '''
+    def setUp(self):
+        utils.init_surveyor_dir(SURVEYOR_SCRIPT)
+        self.root = os.path.realpath(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root)
+        self.repo = os.path.join(self.root, 'repo')
+        os.makedirs(self.repo)
+        self.git('init', '-q', '.')
+
+    def git(self, *args):
+        return subprocess.check_output(['git', '-C', self.repo] + list(args), universal_newlines=True)
+
+    def write(self, name, content):
+        filePath = os.path.join(self.repo, name)
+        os.makedirs(os.path.dirname(filePath), exist_ok=True)
+        with open(filePath, 'w') as outFile:
+            outFile.write(content)
+
+    def commit(self, message):
+        self.git('add', '-A')
+        self.git('-c', 'user.name=t', '-c', 'user.email=t@t', 'commit', '-qm', message)
+
+    def checkout(self, gitDir, revision, folder):
+        os.makedirs(folder, exist_ok=True)
+        archive = subprocess.check_output(['git', '--git-dir', gitDir, 'archive', revision])
+        with tarfile.open(fileobj=io.BytesIO(archive)) as tarFile:
+            tarFile.extractall(folder)
+
+    def run_job(self, pathToMeasure, outDir, *args):
+        os.makedirs(outDir)
+        cmdArgs = ['surveyor.py', pathToMeasure, '-q', '-m', 'a', '-m', 'f', '-o', os.path.join(outDir, OUT_NAME)]
+        outputStream = io.StringIO()
+        self.assertTrue(cmdlineapp.run_job(cmdArgs + list(args), outputStream),
+                        outputStream.getvalue())
+        rowsByCommit = collections.defaultdict(list)
+        with open(os.path.join(outDir, OUT_NAME), newline='') as outFile:
+            for row in csv.DictReader(outFile):
+                commitNum = row.pop(history.COMMIT_NUM, None)
+                for name in (history.COMMIT_ID, history.COMMIT_DATE, basemodule.METADATA_TIMING):
+                    row.pop(name, None)
+                rowsByCommit[commitNum].append(sorted((name, value) for name, value in row.items() if value))
+        return {commitNum: sorted(rows) for commitNum, rows in rowsByCommit.items()}
+
+
+@unittest.skipIf(shutil.which('git') is None, "git is not installed")
+class HistoryJobTest( GitRepoTest ):
+    '''
+    A history job has the same output for each commit as measuring a
+    checkout of it, including files copied and moved between folders
+    '''
+    def setUp(self):
+        super(HistoryJobTest, self).setUp()
+        self.write('a/m.py', '# module\nx = 1\n')
+        self.write('a/n.py', 'if x:\n    y = 2\n')
+        self.write('b/o.c', '/* c */\nint x;\n')
+        self.commit('base')
+        self.git('tag', 'base')
+        self.write('a/m.py', '# module\nx = 1\nz = 3\n')
+        self.commit('change')
+        shutil.copy(os.path.join(self.repo, 'a', 'm.py'), os.path.join(self.repo, 'b', 'copy.py'))
+        self.commit('copy')
+        os.makedirs(os.path.join(self.repo, 'c', 'd'))
+        os.rename(os.path.join(self.repo, 'a', 'n.py'), os.path.join(self.repo, 'c', 'd', 'n.py'))
+        self.write('b/new.py', '# new\n')
+        self.commit('move')
+
+    def test_same_as_checkouts(self):
+        # Only new content is measured: 3 files in the first commit, then
+        # b/new.py; the copy, the move, and b/o.c in a bigger folder are replayed
+        add_file = history.HistoryMemo.add_file
+        measuredPaths = []
+        def add_file_spy(memo, filePath, *args):
+            measure = add_file(memo, filePath, *args)
+            if measure:
+                measuredPaths.append(os.path.relpath(filePath, self.repo))
+            return measure
+        with mock.patch.object(history.HistoryMemo, 'add_file', add_file_spy):
+            historyRows = self.run_job(self.repo, os.path.join(self.root, 'history'), '-l', 'base..HEAD')
+        self.assertEqual(sorted(measuredPaths), [os.path.join('a', 'm.py'), os.path.join('a', 'n.py'),
+                                                 os.path.join('b', 'new.py'), os.path.join('b', 'o.c')])
+
+        # Checkouts are made where the history job finds the repository,
+        # so absolute paths match
+        gitDir = os.path.join(self.root, 'repo.git')
+        os.rename(os.path.join(self.repo, '.git'), gitDir)
+        commits = subprocess.check_output(['git', '--git-dir', gitDir, 'rev-list', '--reverse', 'base..HEAD'],
+                                          universal_newlines=True).split()
+        self.assertEqual(len(commits), 3)
+        for commitNum, commitSha in enumerate(commits, 1):
+            shutil.rmtree(self.repo)
+            self.checkout(gitDir, commitSha, self.repo)
+            checkoutRows = self.run_job(self.repo, os.path.join(self.root, str(commitNum)))
+            self.assertEqual(historyRows[str(commitNum)], checkoutRows[None], commitNum)
+
+
+@unittest.skipIf(shutil.which('git') is None, "git is not installed")
+class DeltaGitJobTest( GitRepoTest ):
+    '''
+    A git delta job (-dg) has the same output as a delta job (-d) between
+    checkouts of the two revisions, for files added, changed, deleted, and
+    unchanged, including ones measured with a folder's config file
+    '''
+    def setUp(self):
+        super(DeltaGitJobTest, self).setUp()
+        self.write('a/m.py', '# module\nx = 1\n')
+        self.write('a/same.py', 'if x:\n    y = 2\n')
+        self.write('a/gone.py', 'z = 3\n')
+        self.write('b/surveyor.code', 'measure NBNC * *.c;*.h c_folder\n')
+        self.write('b/o.c', '/* c */\nint x;\n')
+        self.write('b/same.h', 'int y;\n')
+        self.commit('old')
+        self.git('tag', 'old')
+        self.write('a/m.py', '# module\nx = 1\nz = 3\n')
+        os.remove(os.path.join(self.repo, 'a', 'gone.py'))
+        self.write('a/new.py', '# new\nw = 4\n')
+        self.write('b/o.c', '/* c */\nint x;\nint z;\n')
+        self.write('b/new.c', 'int w;\n')
+        self.commit('new')
+        self.git('tag', 'new')
+        # Neither files nor config files are read from HEAD or the work tree
+        self.write('a/m.py', '# later\n')
+        self.write('b/surveyor.code', 'measure NBNC * *.c;*.h c_later\n')
+        self.commit('later')
+
+    def test_same_as_checkouts(self):
+        deltaGitRows = self.run_job(self.repo, os.path.join(self.root, 'git'), '-dg', 'old..new')[None]
+
+        # The newer checkout is made where the git delta job finds the
+        # repository, so absolute paths match
+        gitDir = os.path.join(self.root, 'repo.git')
+        os.rename(os.path.join(self.repo, '.git'), gitDir)
+        shutil.rmtree(self.repo)
+        self.checkout(gitDir, 'new', self.repo)
+        oldDir = os.path.join(self.root, 'old')
+        self.checkout(gitDir, 'old', oldDir)
+        deltaRows = self.run_job(self.repo, os.path.join(self.root, 'delta'), '-d', oldDir)[None]
+
+        # Unchanged files name the file they're the same as, which for a git
+        # delta is the older revision and path in the repository
+        def git_path(row):
+            return sorted((name, 'old:' + os.path.relpath(value, oldDir).replace(os.sep, '/')
+                           if name == basemodule.METADATA_DUPE_PATH else value) for name, value in row)
+        self.assertEqual(deltaGitRows, sorted(git_path(row) for row in deltaRows))
+
+        # a/gone.py isn't measured, and the unchanged files have no measures
+        self.assertEqual(sorted(dict(row)[basemodule.METADATA_FULLNAME] for row in deltaGitRows),
+                         ['m.py', 'new.c', 'new.py', 'o.c', 'same.h', 'same.py'])
+        unchanged = [dict(row) for row in deltaGitRows if basemodule.METADATA_DUPE_PATH in dict(row)]
+        self.assertEqual(sorted(row[basemodule.METADATA_DUPE_PATH] for row in unchanged),
+                         ['old:a/same.py', 'old:b/same.h'])
+        self.assertTrue(all(row['file.nbnc'] == '0' for row in unchanged))
+        self.assertEqual([dict(row)['tag1'] for row in deltaGitRows
+                          if dict(row)[basemodule.METADATA_FULLNAME] == 'o.c'], ['c_folder'])
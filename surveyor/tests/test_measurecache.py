@@ -0,0 +1,85 @@
+#=============================================================================
+'''
+    Tests for the measure cache's keys and stored file state
+'''
+#=============================================================================
+import os
+import shutil
+import tempfile
+import unittest
+
+from framework import configstack
+from framework import measurecache
+from framework import utils
+
+SURVEYOR_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))), 'surveyor.py')
+CONFIG_NAME = 'surveyor.code'
+
+
+class MeasureCacheTest( unittest.TestCase ):
+
+    def setUp(self):
+        utils.init_surveyor_dir(SURVEYOR_SCRIPT)
+        self.root = os.path.realpath(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root)
+        self.cachePath = os.path.join(self.root, 'measures.db')
+        measurecache.MeasureCache.prepare(self.cachePath)
+        self.write(CONFIG_NAME, 'INCLUDE:include.code:\n')
+        self.write('include.code', 'measure NBNC * *.py python\n')
+        self.filePath = self.write('a.py', 'x = 1\n')
+
+    def write(self, name, content):
+        filePath = os.path.join(self.root, name)
+        with open(filePath, 'w') as outFile:
+            outFile.write(content)
+        return filePath
+
+    def entry_key(self):
+        stack = configstack.ConfigStack(CONFIG_NAME, None)
+        configItems = stack.get_configuration(self.root, [CONFIG_NAME])[1]
+        self.assertEqual(stack.active_path(), os.path.join(self.root, CONFIG_NAME))
+        cache = measurecache.MeasureCache(self.cachePath)
+        self.addCleanup(cache.close)
+        return cache.entry_key(next(iter(configItems.values()))[0])
+
+    def test_key_covers_config_files_read(self):
+        entryKey = self.entry_key()
+        self.assertEqual(self.entry_key(), entryKey)
+        self.write('include.code', '# Changed\nmeasure NBNC * *.py python\n')
+        includeChangedKey = self.entry_key()
+        self.assertNotEqual(includeChangedKey, entryKey)
+        self.write(CONFIG_NAME, '# Changed\nINCLUDE:include.code:\n')
+        self.assertNotEqual(self.entry_key(), includeChangedKey)
+
+    def test_store_and_lookup(self):
+        cache = measurecache.MeasureCache(self.cachePath)
+        cache.new_file()
+        self.assertIsNone(cache.lookup(self.filePath, 'key', 1))
+        fileState = cache.file_state(self.filePath)
+        cache.store(self.filePath, 'key', 1, fileState, [('measures', 'analysis')])
+        cache.close()
+
+        cache = measurecache.MeasureCache(self.cachePath)
+        self.addCleanup(cache.close)
+        cache.new_file()
+        self.assertEqual(cache.lookup(self.filePath, 'key', 1), [('measures', 'analysis')])
+        cache.new_file()
+        self.assertIsNone(cache.lookup(self.filePath, 'key', 2))
+
+    def test_file_changed_while_measured(self):
+        # Results are stored with the state from before the file changed,
+        # so they aren't replayed for its new content
+        cache = measurecache.MeasureCache(self.cachePath)
+        cache.new_file()
+        cache.lookup(self.filePath, 'key', 1)
+        fileState = cache.file_state(self.filePath)
+        self.write('a.py', 'y = 2\n')
+        os.utime(self.filePath, ns=(fileState[1] + 10**9, fileState[1] + 10**9))
+        cache.store(self.filePath, 'key', 1, fileState, [('measures', 'analysis')])
+        cache.close()
+
+        cache = measurecache.MeasureCache(self.cachePath)
+        self.addCleanup(cache.close)
+        cache.new_file()
+        self.assertIsNone(cache.lookup(self.filePath, 'key', 1))
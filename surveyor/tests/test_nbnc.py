@@ -0,0 +1,53 @@
+#=============================================================================
+'''
+    Tests for the NBNC module's whole-file survey
+'''
+#=============================================================================
+import os
+import random
+import unittest
+
+from framework import utils
+from csmodules import NBNC
+from csmodules import Code
+
+SURVEYOR_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))), 'surveyor.py')
+
+LINE_PARTS = ['x = 1;', '/*', '*/', '//', '#', '"""', '"/*"', "'*/'", '"a // b"',
+              '<!--', '-->', '   ', '\t', 'if (a) {', '}', 'text', '\\']
+
+
+def random_lines(rand, numLines):
+    return [' '.join(rand.choice(LINE_PARTS) for _part in range(rand.randint(0, 4))) + '\n'
+            for _line in range(numLines)]
+
+
+class WholeFileSurveyTest( unittest.TestCase ):
+
+    def setUp(self):
+        utils.init_surveyor_dir(SURVEYOR_SCRIPT)
+
+    def assertSameCounts(self, options, lines):
+        bulkModule = NBNC.NBNC(options)
+        self.assertTrue(bulkModule._bulk_survey_ok(), options)
+        bulkMeasures = {}
+        bulkModule._survey_bulk(lines, [], bulkMeasures, [])
+        lineModule = NBNC.NBNC(options)
+        lineMeasures = {}
+        lineModule._survey_lines(lines, [], lineMeasures, [])
+        self.assertEqual(bulkModule.counts, lineModule.counts, options)
+        self.assertEqual(bulkMeasures, lineMeasures, options)
+
+    def test_same_as_line_survey(self):
+        rand = random.Random(7)
+        for options in ([], [('BLANK_LINE_XML', None)], [('PYTHON', None)], [('RUBY', None)],
+                        [('COMMENT_CLOSE_CODE', None)]):
+            for _case in range(50):
+                self.assertSameCounts(options, random_lines(rand, rand.randint(0, 60)))
+
+    def test_used_where_lines_are_only_counted(self):
+        self.assertFalse(NBNC.NBNC([('ADD_LINE_SEP', ';')])._bulk_survey_ok())
+        self.assertFalse(NBNC.NBNC([('IGNORE_LINE', 'r"^#"')])._bulk_survey_ok())
+        # Code detects machine and content blocks and measures every code line
+        self.assertFalse(Code.Code([])._bulk_survey_ok())
@@ -0,0 +1,51 @@
+#=============================================================================
+'''
+    Tests for the regex backtracking check run on config file regexes
+'''
+#=============================================================================
+import re
+import unittest
+
+from framework import regexcheck
+from framework import uistrings
+
+
+class BacktrackingRiskTest( unittest.TestCase ):
+
+    def assertRisk(self, pattern, risk, flags=0):
+        self.assertEqual(regexcheck.backtracking_risk(re.compile(pattern, flags)), risk,
+                         pattern)
+
+    def test_nested_repeats(self):
+        for pattern in (r'(a+)+', r'((a+))+', r'(\w+\s?)*', r'(.*)*', r'x(?:\s*)+y',
+                        r'(?:a|b+)*', r'(?:ab|c|)*', r'(a{1,3})+',
+                        r'(?:"[^"]*"|[^"]+)*'):
+            self.assertRisk(pattern, uistrings.STR_RegexRiskNestedRepeat)
+
+    def test_adjacent_repeats(self):
+        for pattern in (r'(\d+\d+)+', r'(aa?)+', r'( *, *)+', r'(\w+\.\w+)+$'):
+            self.assertRisk(pattern, uistrings.STR_RegexRiskAdjacentRepeats)
+
+    def test_overlapping_alternatives(self):
+        for pattern in (r'(\w+|\d+)*', r'(?:[^"\\]|\\.|\\)*',
+                        r'(?:x|\w\w)+'):
+            self.assertRisk(pattern, uistrings.STR_RegexRiskAlternatives)
+
+    def test_ignore_case(self):
+        self.assertRisk(r'(?:a|Bc)*', None)
+        self.assertRisk(r'(?:a|Ac)*', uistrings.STR_RegexRiskAlternatives, re.IGNORECASE)
+
+    def test_one_way_alternatives(self):
+        # Fixed-length alternatives starting with different characters
+        for pattern in (r'(?:[^"\\]|\\.)*', r'"(?:[^"\\]|\\.)*"', r"'(?:\\.|[^'\\])+'",
+                        r'(?:x|yz)*', r'(?:(?:ab|cd))+', r'((?:\\.|[^\\]))*'):
+            self.assertRisk(pattern, None)
+
+    def test_safe_repeats(self):
+        for pattern in (r'[a-z]+', r'\s*=\s*', r'(\w+,)*', r'(a|b)*',
+                        r'(?:a|ab)*', r'(a+){2}', r'^\s*#\s*include\s*[<"](\S+)[>"]'):
+            self.assertRisk(pattern, None)
+
+    def test_bad_pattern(self):
+        self.assertIsNone(regexcheck.backtracking_risk('(a'))
+        self.assertIsNone(regexcheck.backtracking_risk(None))
@@ -0,0 +1,75 @@
+#=============================================================================
+'''
+    Tests for output shards written by workers and merged at the end of a job
+'''
+#=============================================================================
+import os
+import shutil
+import tempfile
+import unittest
+
+from framework import shards
+from framework import writer
+
+FILE_OUTPUT = [
+    [({'file.fullName': 'a.py', 'file.nbnc': '10'}, [])],
+    [({'file.fullName': 'b.py', 'file.nbnc': '2', 'file.comment': '1'}, [])],
+    [({'file.fullName': 'c.py', 'file.nbnc': '3'}, [{'search.line': '1'}, {'search.line': '7'}])],
+    [({'file.fullName': 'd "q".py', 'file.nbnc': '4'}, [{'search.text': 'a\r\nb\rc'}])],
+    ]
+
+# Same columns in every row, so the header isn't rewritten
+SAME_COLUMNS_OUTPUT = [
+    [({'file.fullName': name, 'file.nbnc': str(nbnc), 'search.text': text}, [])]
+    for name, nbnc, text in (('a.py', 1, 'x'), ('b.py', 2, 'a\r\nb'), ('c.py', 3, ''), ('d.py', 4, 'y'))]
+
+
+class ShardMergerTest( unittest.TestCase ):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def out_dir(self, name):
+        outDir = os.path.join(self.root, name)
+        os.makedirs(outDir)
+        return outDir
+
+    def read(self, outDir):
+        with open(os.path.join(outDir, 'out.csv'), newline='') as outFile:
+            return outFile.read()
+
+    def test_same_as_writer(self):
+        for fileOutputs in (FILE_OUTPUT, SAME_COLUMNS_OUTPUT):
+            writerDir = self.out_dir('writer')
+            outWriter = writer.get_writer(',', lambda *args: None, writerDir, 'out.csv', False)
+            for fileOutput in fileOutputs:
+                for measures, analysisResults in fileOutput:
+                    outWriter.write_items(measures, analysisResults)
+            outWriter.close_files()
+
+            # Files measured out of order by two workers
+            mergeDir = self.out_dir('merge')
+            merger = shards.ShardMerger(',', lambda *args: None, mergeDir, 'out.csv', False)
+            workers = [shards.ShardWriter(merger.spec, 'w1'), shards.ShardWriter(merger.spec, 'w2')]
+            for sequence in (2, 1, 4, 3):
+                workers[sequence % 2].write_file(sequence, fileOutputs[sequence - 1])
+            for shardWriter in workers:
+                shardWriter.close_files()
+            merger.close_files()
+            self.assertEqual(self.read(mergeDir), self.read(writerDir))
+            shutil.rmtree(writerDir)
+            shutil.rmtree(mergeDir)
+
+    def test_shards_outside_output_folder(self):
+        outDir = self.out_dir('out')
+        merger = shards.ShardMerger(',', lambda *args: None, outDir, 'out.csv', False)
+        shardDir = merger.spec.shardDir
+        self.assertTrue(os.path.isdir(shardDir))
+        self.assertEqual(os.listdir(outDir), [])
+        shardWriter = shards.ShardWriter(merger.spec, 'w1')
+        shardWriter.write_file(1, FILE_OUTPUT[0])
+        shardWriter.close_files()
+        merger.close_files()
+        self.assertFalse(os.path.exists(shardDir))
+        self.assertEqual(os.listdir(outDir), ['out.csv'])
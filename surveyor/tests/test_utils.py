@@ -0,0 +1,96 @@
+#=============================================================================
+'''
+    Tests for opening files with detected encodings, and checksum helpers
+'''
+#=============================================================================
+import os
+import zlib
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from framework import utils
+
+LATIN1_TEXT = 'a = "caf\xe9"\n'.encode('latin-1')
+
+
+class OpenChardetTest( unittest.TestCase ):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def write(self, name, content):
+        filePath = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(filePath), exist_ok=True)
+        with open(filePath, 'wb') as outFile:
+            outFile.write(content)
+        return filePath
+
+    def opened_mode(self, filePath):
+        with utils.open_chardet(filePath) as fileObject:
+            return fileObject.mode, getattr(fileObject, 'encoding', None)
+
+    def test_fast_checks(self):
+        self.assertEqual(self.opened_mode(self.write('a.py', b'a = 1\n')), ('r', 'ascii'))
+        self.assertEqual(self.opened_mode(self.write('b.py', 'a = "€"\n'.encode('utf-8'))),
+                         ('r', 'utf-8'))
+        self.assertEqual(self.opened_mode(self.write('c.py', b'\xff\xfex\x00\n\x00')),
+                         ('r', 'UTF-16'))
+        self.assertEqual(self.opened_mode(self.write('d.py', b'')), ('rb', None))
+
+    def test_libmagic_decides_text(self):
+        # Content that passes the text checks is still binary if libmagic
+        # doesn't give it a text type, as it always has been
+        for name, content in (('a.js', b'#!/usr/bin/env node\nconsole.log(1);\n'),
+                              ('b.json', b'{"a": 1, "b": [1, 2]}\n'),
+                              ('c.bin', b'\x00\x01\x02\x03' * 100)):
+            self.assertEqual(self.opened_mode(self.write(name, content)), ('rb', None), name)
+
+    def test_libmagic_reads_bytes_in_hand(self):
+        filePath = self.write('a.py', b'a = 1\n')
+        with mock.patch.object(utils._magic_handle(), 'from_file', side_effect=AssertionError):
+            self.assertEqual(self.opened_mode(filePath), ('r', 'ascii'))
+
+    def test_each_file_detected(self):
+        # Files that need chardet get its answer for their own content,
+        # whatever other files in the folder were opened with
+        encodings = {LATIN1_TEXT: 'latin-1', b'a = "\x81\x82"\n': None}
+        with mock.patch.object(utils, '_chardet_encoding', side_effect=encodings.get) as chardet:
+            self.assertEqual(self.opened_mode(self.write('a/1.c', LATIN1_TEXT)), ('r', 'latin-1'))
+            self.assertEqual(self.opened_mode(self.write('a/2.c', b'a = "\x81\x82"\n')), ('rb', None))
+            self.assertEqual(self.opened_mode(self.write('a/3.c', LATIN1_TEXT)), ('r', 'latin-1'))
+            self.assertEqual(chardet.call_count, 3)
+
+    def test_bytes_match_file(self):
+        for name, content in (('a.py', b'a = 1\n'), ('b.js', b'#!/usr/bin/env node\nx;\n')):
+            filePath = self.write(name, content)
+            with utils.open_chardet_bytes(content, filePath) as fileObject:
+                self.assertEqual(fileObject.mode, self.opened_mode(filePath)[0])
+                self.assertEqual(utils.get_raw_file_start(fileObject, 4), content[:4])
+
+
+class Adler32CombineTest( unittest.TestCase ):
+
+    def test_same_as_whole_data(self):
+        # Checksums of pieces started from 0, as Code.py's segment CRCs are
+        rand = random.Random(5)
+        pieces = [b'', b'x', b'\xff' * 70000, bytes(rand.getrandbits(8) for _byte in range(5000))]
+        for data1 in pieces:
+            for data2 in pieces:
+                self.assertEqual(
+                        utils.adler32_combine(zlib.adler32(data1, 0), zlib.adler32(data2, 0), len(data2)),
+                        zlib.adler32(data1 + data2, 0))
+
+    def test_many_pieces(self):
+        rand = random.Random(6)
+        data = bytes(rand.getrandbits(8) for _byte in range(200000))
+        crc = 0
+        position = 0
+        while position < len(data):
+            piece = data[position:position + rand.randint(0, 20000)]
+            crc = utils.adler32_combine(crc, zlib.adler32(piece, 0), len(piece))
+            position += len(piece)
+        self.assertEqual(crc, zlib.adler32(data, 0))
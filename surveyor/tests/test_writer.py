@@ -0,0 +1,105 @@
+#=============================================================================
+'''
+    Tests for output writers
+'''
+#=============================================================================
+import os
+import csv
+import shutil
+import tempfile
+import unittest
+from xml.dom import minidom
+
+from framework import columnar
+from framework import writer
+
+
+def minidom_xml(fileItems):
+    '''
+    XML as the Xml writer wrote it with minidom
+    '''
+    doc = minidom.Document()
+    parts = [doc.toprettyxml()]
+    for measures, analysisResults in fileItems:
+        fileNode = doc.createElement("file")
+        for itemName, itemValue in measures.items():
+            fileNode.setAttribute(itemName, itemValue)
+        for itemNum, item in enumerate(analysisResults, 1):
+            itemNode = doc.createElement("item" + str(itemNum))
+            for itemName, itemValue in item.items():
+                itemNode.setAttribute(itemName, itemValue)
+            fileNode.appendChild(itemNode)
+        parts.append(fileNode.toprettyxml(indent="  "))
+    return ''.join(parts)
+
+
+class XmlWriterTest( unittest.TestCase ):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def test_same_as_minidom(self):
+        fileItems = [
+            ({'file.fullName': 'a.c', 'file.nbnc': '10'}, []),
+            ({'file.fullName': 'b<&>".c', 'tag1': "it's"},
+                [{'search.line': '1', 'search.text': 'if (a < b && c > "d")'},
+                 {'search.line': '2'}]),
+            ({'file.fullName': 'c.py'}, [{'name': 'x'}]),
+            ]
+        xmlWriter = writer.Xml(lambda *args: None, self.root, 'out.xml', False)
+        for measures, analysisResults in fileItems:
+            xmlWriter.write_items(measures, analysisResults)
+        xmlWriter.close_files()
+        with open(os.path.join(self.root, 'out.xml'), encoding='utf-8') as xmlFile:
+            self.assertEqual(xmlFile.read(), minidom_xml(fileItems))
+
+
+class ColumnarWriterTest( unittest.TestCase ):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def write(self, typeStr, fileItems):
+        outDir = os.path.join(self.root, typeStr)
+        os.makedirs(outDir)
+        outWriter = writer.get_writer(typeStr, lambda *args: None, outDir, 'out', False)
+        for measures, analysisResults in fileItems:
+            outWriter.write_items(measures, analysisResults)
+        outWriter.close_files()
+        return outDir
+
+    def file_items(self, numFiles):
+        # Typed values, text that needs quoting in delimited output, a
+        # measure that shows up after the first row group, and analysis rows
+        fileItems = []
+        for fileNum in range(numFiles):
+            measures = {'file.fullName': 'f{0}, "q".c'.format(fileNum), 'file.nbnc': fileNum,
+                        'file.ratio': fileNum / 8}
+            if fileNum > columnar.DEFAULT_GROUP_ROWS:
+                measures['file.late'] = 'line\nbreak'
+            analysisResults = []
+            if fileNum % 1000 == 7:
+                analysisResults = [{'search.line': 3, 'search.text': 'if (a < b)'}, {'search.line': 9}]
+            fileItems.append((measures, analysisResults))
+        return fileItems
+
+    def test_same_rows_as_delimited(self):
+        fileItems = self.file_items(columnar.DEFAULT_GROUP_ROWS + 100)
+        for typeStr in ('columnar', 'columnar-zlib'):
+            columnarRows = list(columnar.read_rows(os.path.join(self.write(typeStr, fileItems), 'out.scol')))
+            self.assertEqual(columnarRows[0]['file.nbnc'], 0)
+            self.assertEqual(columnarRows[1]['file.ratio'], 0.125)
+            with open(os.path.join(self.write(',', fileItems), 'out.csv'), newline='') as csvFile:
+                delimitedRows = [dict((name, value) for name, value in row.items() if value)
+                                 for row in csv.DictReader(csvFile)]
+            self.assertEqual([dict((name, str(value)) for name, value in row.items()) for row in columnarRows],
+                             delimitedRows, typeStr)
+            shutil.rmtree(os.path.join(self.root, ','))
+
+    def test_columns_selected(self):
+        outDir = self.write('columnar', self.file_items(20))
+        columns = columnar.read_columns(os.path.join(outDir, 'out.scol'), ['search.*'])
+        self.assertEqual(sorted(columns), ['search.line', 'search.text'])
+        self.assertEqual(columns['search.line'], [None] * 7 + [3, 9] + [None] * 12)